@@ -52,6 +52,16 @@ class PanelConsumer(AsyncJsonWebsocketConsumer):
             "tipo": "estado_canal",
             "en_vivo": event.get("en_vivo", False),
             "hls_url": event.get("hls_url"),
+            "baja_latencia": event.get("baja_latencia", False),
+        })
+
+    async def lote_estado(self, event):
+        """Cámaras y canal de un lote_notificaciones(), en un solo mensaje."""
+        await self.send_json({
+            "tipo": "lote_estado",
+            "cameras": event.get("cameras", {}),
+            "eliminadas": event.get("eliminadas", []),
+            "canal": event.get("canal"),
         })
 
     # ======================
@@ -60,10 +70,51 @@ class PanelConsumer(AsyncJsonWebsocketConsumer):
 
     async def modo_radio_cambio(self, event):
         """
-        Recibe el evento desde views_radio._notificar_modo_radio()
+        Recibe el evento desde notificaciones_tiempo_real.notificar_modo_radio()
         y lo reenvía al browser del operador.
         """
         await self.send_json({
             "tipo": "modo_radio_cambio",
             "modo_radio": event.get("modo_radio", False),
-        })
\ No newline at end of file
+        })
+
+    # ======================
+    # RETRANSMISIONES
+    # ======================
+
+    async def restream_update(self, event):
+        await self.send_json({
+            "tipo": "restream_update",
+            "platform": event.get("platform"),
+            "action": event.get("action"),
+            "status": event.get("status"),
+            "intento": event.get("intento"),
+            "reintento_en": event.get("reintento_en"),
+            "mensaje": event.get("mensaje", ""),
+        })
+
+    # ======================
+    # TRABAJOS DE CONTROL
+    # ======================
+
+    async def trabajo_control(self, event):
+        """Avance de un trabajo encolado (core/services/trabajos.py)."""
+        await self.send_json({
+            "tipo": "trabajo",
+            "id": event.get("id"),
+            "trabajo": event.get("trabajo"),
+            "estado": event.get("estado"),
+            "mensaje": event.get("mensaje", ""),
+            "resultado": event.get("resultado"),
+        })
+
+    # ======================
+    # TELEMETRÍA FFMPEG
+    # ======================
+
+    async def telemetria_ffmpeg(self, event):
+        """Última muestra de cada proceso (core/services/telemetria.py)."""
+        await self.send_json({
+            "tipo": "telemetria",
+            "procesos": event.get("procesos", []),
+        })
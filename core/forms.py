@@ -11,7 +11,7 @@ class ClienteForm(forms.ModelForm):
 
     class Meta:
         model = Cliente
-        fields = ["nombre", "apellido", "dni", "telefono", "direccion", "dominio"]  # ← solo esto cambia
+        fields = ["nombre", "apellido", "dni", "telefono", "direccion", "dominio", "hls_renditions"]
 
     def __init__(self, *args, **kwargs):
         # Si viene un cliente existente, precargar datos de su User
@@ -20,6 +20,16 @@ class ClienteForm(forms.ModelForm):
             self.fields["username"].initial = self.instance.user.username
             self.fields["email"].initial = self.instance.user.email
 
+    def clean_hls_renditions(self):
+        from core.services.perfil_programa import RENDICIONES, parsear_rendiciones
+
+        texto = self.cleaned_data.get("hls_renditions", "")
+        alturas = parsear_rendiciones(texto)
+        if texto.strip() and not alturas:
+            opciones = ", ".join(str(h) for h in RENDICIONES)
+            raise forms.ValidationError(f"Calidades válidas: {opciones}")
+        return ",".join(str(h) for h in alturas)
+
     def save(self, commit=True):
         cliente = super().save(commit=False)
         if not hasattr(cliente, "user"):
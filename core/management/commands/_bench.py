@@ -0,0 +1,50 @@
+"""
+Utilidades compartidas por los comandos bench_* (Django no toma como
+comando un módulo que empieza con "_").
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from core.models import Cliente
+
+
+def crear_usuarios_bench(prefijo, cantidad):
+    """
+    Crea <prefijo>1..<prefijo>N, cada uno con su Cliente. Si alguno ya
+    existe no se toca ninguno: puede ser una cuenta real, y el comando
+    borra al final los usuarios que recibió de acá.
+    """
+    nombres = [f"{prefijo}{i}" for i in range(1, cantidad + 1)]
+    existentes = sorted(User.objects.filter(username__in=nombres).values_list("username", flat=True))
+    if existentes:
+        muestra = ", ".join(existentes[:5]) + (" ..." if len(existentes) > 5 else "")
+        raise CommandError(
+            f"Ya existen {len(existentes)} usuarios con el prefijo {prefijo!r} ({muestra}): "
+            f"borralos antes de correr el benchmark"
+        )
+
+    creados = []
+    # Todos o ninguno: una falla a mitad de camino no deja usuarios sueltos
+    with transaction.atomic():
+        for i, username in enumerate(nombres, start=1):
+            user = User.objects.create_user(username)   # sin contraseña usable
+            Cliente.objects.create(user=user, nombre="Bench", apellido=str(i), dni=username)
+            creados.append(user)
+    return creados
+
+
+def percentiles(valores, cuantiles=(0.5, 0.9, 0.99)):
+    """{"n", "p50", "p90", ..., "max", "media"} por rango más cercano, o None."""
+    if not valores:
+        return None
+    orden = sorted(valores)
+
+    resumen = {"n": len(orden)}
+    for q in cuantiles:
+        nombre = "p" + format(q * 100, "g").replace(".", "")
+        resumen[nombre] = round(orden[min(len(orden) - 1, int(q * len(orden)))], 4)
+    resumen["max"] = round(orden[-1], 4)
+    resumen["media"] = round(sum(orden) / len(orden), 4)
+    return resumen
@@ -0,0 +1,275 @@
+"""
+Prueba de carga de los hooks de nginx-rtmp.
+
+Un cliente que imita a nginx-rtmp dispara tormentas de on_publish /
+on_done / on_publish de /program_switch contra validar_publicacion,
+stream_finalizado y autorizar_program_switch:
+
+  hora_en_punto   N clientes salen al aire a la vez: on_publish de todas
+                  sus cámaras y el de /program_switch
+  reconexion      corte de red: on_done + on_publish de cada cámara de
+                  cada cliente, todas juntas
+  mixto           las dos anteriores intercaladas
+
+Por hook reporta throughput, latencia p50/p99/p999, consultas SQL por
+llamada y tasa de error (5xx o excepción; los 4xx se cuentan aparte por
+código: un rechazo es una respuesta válida).
+
+Por defecto corre en proceso (django.test.Client, un thread = una
+conexión a la base) y cuenta las consultas de cada llamada. Con --url
+pega por HTTP al worker real; las consultas salen entonces de la
+diferencia de /metrics (streaming_consultas_db_por_request).
+"""
+
+import sys
+import json
+import time
+import random
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from core.models import CanalTransmision, StreamConnection
+from ._bench import crear_usuarios_bench, percentiles
+
+PREFIJO_USUARIO = "benchhook_"
+
+RUTAS = {
+    "validar_publicacion": "/validar-publicacion/",
+    "stream_finalizado": "/stream-finalizado/",
+    "autorizar_program_switch": "/autorizar-program-switch/",
+}
+
+
+# ============================================================
+# CLIENTE NGINX-RTMP FALSO
+# ============================================================
+
+def _campos(call, app, name):
+    """Campos que manda nginx-rtmp en sus notify (on_publish, on_done)."""
+    return {
+        "call": call,
+        "addr": f"10.0.{random.randint(0, 255)}.{random.randint(1, 254)}",
+        "clientid": str(random.randint(1, 10 ** 6)),
+        "app": app,
+        "flashver": "FMLE/3.0 (compatible; FMSc/1.0)",
+        "swfurl": "",
+        "tcurl": f"rtmp://{settings.RTMP_SERVER_HOST_PUBLIC}/{app}",
+        "pageurl": "",
+        "name": name,
+        "type": "live",
+    }
+
+
+class _ClienteProceso:
+    """Llama a las vistas en este proceso y cuenta sus consultas."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def post(self, hook, datos):
+        cliente = getattr(self._local, "cliente", None)
+        if cliente is None:
+            cliente = self._local.cliente = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            respuesta = cliente.post(RUTAS[hook], datos)
+        return respuesta.status_code, consultas[0]
+
+    def consultas_por_llamada(self):
+        return None
+
+
+class _ClienteHTTP:
+    """POST form-urlencoded al worker, como nginx-rtmp."""
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._metricas_inicio = self._consultas()
+
+    def post(self, hook, datos):
+        pedido = urllib.request.Request(
+            self.url + RUTAS[hook],
+            data=urllib.parse.urlencode(datos).encode(),
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(pedido, timeout=self.timeout) as r:
+                return r.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def _consultas(self):
+        """(suma, conteo) de streaming_consultas_db_por_request, o None."""
+        try:
+            with urllib.request.urlopen(self.url + "/metrics", timeout=self.timeout) as r:
+                texto = r.read().decode()
+        except (urllib.error.URLError, OSError):
+            return None
+        valores = {}
+        for linea in texto.splitlines():
+            for sufijo in ("_sum", "_count"):
+                if linea.startswith(f"streaming_consultas_db_por_request{sufijo} "):
+                    valores[sufijo] = float(linea.split()[1])
+        if len(valores) < 2:
+            return None
+        return valores["_sum"], valores["_count"]
+
+    def consultas_por_llamada(self):
+        fin = self._consultas()
+        if self._metricas_inicio is None or fin is None or fin[1] == self._metricas_inicio[1]:
+            return None
+        return round((fin[0] - self._metricas_inicio[0]) / (fin[1] - self._metricas_inicio[1]), 2)
+
+
+# ============================================================
+# ESCENARIOS
+# ============================================================
+
+def _hora_en_punto(usuarios, camaras):
+    llamadas = []
+    for user in usuarios:
+        for cam in range(1, camaras + 1):
+            llamadas.append(("validar_publicacion", _campos("publish", "live", f"{user.username}-cam{cam}")))
+        llamadas.append(("autorizar_program_switch", _campos("publish", "program_switch", user.username)))
+    random.shuffle(llamadas)
+    return [llamadas]
+
+
+def _reconexion(usuarios, camaras):
+    caidas, vueltas = [], []
+    for user in usuarios:
+        for cam in range(1, camaras + 1):
+            stream_key = f"{user.username}-cam{cam}"
+            caidas.append(("stream_finalizado", _campos("done", "live", stream_key)))
+            vueltas.append(("validar_publicacion", _campos("publish", "live", stream_key)))
+    random.shuffle(caidas)
+    random.shuffle(vueltas)
+    # on_done de todos y enseguida los on_publish: dos oleadas seguidas
+    return [caidas, vueltas]
+
+
+def _mixto(usuarios, camaras):
+    mitad = len(usuarios) // 2 or 1
+    oleadas = _reconexion(usuarios[:mitad], camaras)
+    oleadas[-1] += _hora_en_punto(usuarios[mitad:], camaras)[0]
+    random.shuffle(oleadas[-1])
+    return oleadas
+
+
+ESCENARIOS = {
+    "hora_en_punto": _hora_en_punto,
+    "reconexion": _reconexion,
+    "mixto": _mixto,
+}
+
+
+class Command(BaseCommand):
+    help = "Tormentas de hooks de nginx-rtmp contra Django (salida JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escenario", choices=sorted(ESCENARIOS), default="hora_en_punto")
+        parser.add_argument("--clientes", type=int, default=200, help="Clientes (usuarios) de prueba")
+        parser.add_argument("--camaras", type=int, default=2, help="Cámaras por cliente")
+        parser.add_argument("--rondas", type=int, default=3, help="Veces que se repite el escenario")
+        parser.add_argument("--concurrencia", type=int, default=32, help="Llamadas en vuelo a la vez")
+        parser.add_argument("--url", help="Base HTTP del worker (p.ej. http://127.0.0.1:8000); sin esto, en proceso")
+        parser.add_argument("--timeout", type=float, default=10.0, help="Timeout por llamada HTTP")
+        parser.add_argument("--salida", help="Archivo JSON (por defecto stdout)")
+        parser.add_argument("--conservar", action="store_true", help=f"No borrar los usuarios {PREFIJO_USUARIO}* creados")
+
+    def handle(self, *args, **opts):
+        if not opts["url"] and not settings.ALLOWED_HOSTS:
+            raise CommandError("ALLOWED_HOSTS vacío: el cliente en proceso no tiene Host válido")
+
+        # Solo usuarios nuevos: al final se borran (salvo --conservar)
+        usuarios = crear_usuarios_bench(PREFIJO_USUARIO, opts["clientes"])
+        # Canal en vivo: autorizar_program_switch recorre el camino completo
+        CanalTransmision.objects.bulk_create(
+            [CanalTransmision(usuario=user, en_vivo=True) for user in usuarios]
+        )
+
+        cliente = _ClienteHTTP(opts["url"], opts["timeout"]) if opts["url"] else _ClienteProceso()
+        # hook -> [(segundos, status, consultas | None, error)]; claves fijas entre threads
+        resultados = {hook: [] for hook in RUTAS}
+
+        def llamar(hook, datos):
+            inicio = time.perf_counter()
+            try:
+                status, consultas = cliente.post(hook, datos)
+                error = status >= 500
+            except Exception as e:
+                status, consultas, error = type(e).__name__, None, True
+            resultados[hook].append((time.perf_counter() - inicio, status, consultas, error))
+
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=opts["concurrencia"]) as pool:
+                for _ in range(opts["rondas"]):
+                    for oleada in ESCENARIOS[opts["escenario"]](usuarios, opts["camaras"]):
+                        # Cada oleada se dispara entera antes de la siguiente
+                        list(pool.map(lambda c: llamar(*c), oleada))
+            duracion = time.perf_counter() - inicio
+        finally:
+            if not opts["conservar"]:
+                for user in usuarios:
+                    user.delete()
+            else:
+                StreamConnection.objects.filter(user__in=usuarios).delete()
+
+        reporte = {
+            "config": {
+                "escenario": opts["escenario"],
+                "clientes": opts["clientes"],
+                "camaras": opts["camaras"],
+                "rondas": opts["rondas"],
+                "concurrencia": opts["concurrencia"],
+                "modo": "http" if opts["url"] else "proceso",
+            },
+            "duracion_s": round(duracion, 3),
+            "llamadas_por_s": round(sum(len(r) for r in resultados.values()) / duracion, 1),
+            "hooks": {
+                hook: self._resumen(filas, duracion)
+                for hook, filas in sorted(resultados.items()) if filas
+            },
+            "consultas_por_llamada_metrics": cliente.consultas_por_llamada(),
+        }
+
+        texto = json.dumps(reporte, indent=2)
+        if opts["salida"]:
+            with open(opts["salida"], "w") as f:
+                f.write(texto + "\n")
+            self.stdout.write(f"Reporte en {opts['salida']}")
+        else:
+            sys.stdout.write(texto + "\n")
+
+    @staticmethod
+    def _resumen(filas, duracion):
+        codigos = defaultdict(int)
+        for _, status, _, _ in filas:
+            codigos[str(status)] += 1
+        consultas = [c for _, _, c, _ in filas if c is not None]
+        errores = sum(1 for *_, error in filas if error)
+        return {
+            "llamadas": len(filas),
+            "por_s": round(len(filas) / duracion, 1),
+            "latencia_s": percentiles([s for s, *_ in filas], (0.5, 0.99, 0.999)),
+            "consultas_por_llamada": percentiles(consultas, (0.5, 0.99)),
+            "tasa_error": round(errores / len(filas), 4),
+            "codigos": dict(codigos),
+        }
@@ -0,0 +1,247 @@
+"""
+Benchmark del switch de cámara.
+
+Publica fuentes sintéticas (testsrc2 + tono) en el RTMP local para N
+usuarios de prueba con M cámaras cada uno, hace cortes con
+poner_camara_al_aire y mide por corte:
+
+  switch_s            duración de poner_camara_al_aire (el "al aire")
+  primer_segmento_s   hasta que program/<usuario>.m3u8 lista un segmento
+                      nuevo, escrito después del corte
+  cpu_s               CPU de los FFmpeg gestionados (y de este proceso)
+                      durante el corte, descontando el consumo de base
+                      (todos los usuarios al aire, sin cortes)
+
+Necesita el stack corriendo (nginx-rtmp con sus hooks apuntando a Django)
+y conviene correrlo con MEDIA_SUPERVISOR_SOCKET, así los FFmpeg quedan en
+el daemon y no dentro de este comando. La salida es JSON para comparar
+motores (PROGRAM_SWITCH_ENGINE) y perfiles de encoder en el VPS.
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.models import StreamConnection
+from core.services.estado_transmision import poner_camara_al_aire, detener_transmision_usuario
+from core.services.ffmpeg_manager import camara_autorizada
+from core.services.procesos import pids_registrados
+from ._bench import crear_usuarios_bench, percentiles
+
+PREFIJO_USUARIO = "bench_"
+TICKS = os.sysconf("SC_CLK_TCK")
+
+
+# ============================================================
+# FUENTES SINTÉTICAS
+# ============================================================
+
+def _publicar(stream_key, resolucion, fps, frecuencia):
+    url = f"rtmp://{settings.RTMP_SERVER_HOST_INTERNAL}:{settings.RTMP_SERVER_PORT_INTERNAL}/live/{stream_key}"
+    cmd = [
+        settings.FFMPEG_BIN_PATH,
+        "-re",
+        "-f", "lavfi", "-i", f"testsrc2=size={resolucion}:rate={fps}",
+        "-f", "lavfi", "-i", f"sine=frequency={frecuencia}:sample_rate=48000",
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency",
+        "-g", str(fps), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        "-f", "flv", url,
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _esperar_camaras(user, camaras, timeout):
+    """Espera a que el hook on_publish registre las M cámaras y las autoriza."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        conexiones = list(StreamConnection.objects.filter(user=user, cam_index__lte=camaras))
+        if len(conexiones) == camaras:
+            for conn in conexiones:
+                if conn.status == StreamConnection.Status.PENDING:
+                    conn.status = StreamConnection.Status.READY
+                    conn.authorized = True
+                    conn.save()
+                    camara_autorizada(user, conn.stream_key)
+            return
+        time.sleep(0.2)
+    raise CommandError(f"{user.username}: nginx no registró las {camaras} cámaras en {timeout}s")
+
+
+# ============================================================
+# MEDICIÓN
+# ============================================================
+
+def _cpu_segundos(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return 0.0
+    # campos[11] = utime, campos[12] = stime
+    return (int(campos[11]) + int(campos[12])) / TICKS
+
+
+def _cpu_total():
+    return sum(_cpu_segundos(pid) for pid in pids_registrados() | {os.getpid()})
+
+
+def _segmentos(username):
+    """Nombres de segmento del programa (la primera variante si es master ABR)."""
+    playlist = os.path.join(settings.HLS_PATH, "program", f"{username}.m3u8")
+    try:
+        with open(playlist) as f:
+            lineas = [l.strip() for l in f if l.strip()]
+    except OSError:
+        return []
+
+    if any(l.startswith("#EXT-X-STREAM-INF") for l in lineas):
+        variante = next((l for l in lineas if not l.startswith("#")), None)
+        if variante is None:
+            return []
+        try:
+            with open(os.path.join(os.path.dirname(playlist), variante)) as f:
+                lineas = [l.strip() for l in f if l.strip()]
+        except OSError:
+            return []
+
+    return [l for l in lineas if not l.startswith("#")]
+
+
+def _esperar_segmento_nuevo(username, previos, timeout):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if any(s not in previos for s in _segmentos(username)):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia del switch de cámara con fuentes RTMP sintéticas (salida JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=1, help="Usuarios de prueba en paralelo")
+        parser.add_argument("--camaras", type=int, default=2, help="Cámaras sintéticas por usuario")
+        parser.add_argument("--cortes", type=int, default=10, help="Cortes por usuario")
+        parser.add_argument("--intervalo", type=float, default=6.0, help="Segundos entre cortes")
+        parser.add_argument("--resolucion", default="1280x720")
+        parser.add_argument("--fps", type=int, default=30)
+        parser.add_argument("--timeout", type=float, default=20.0, help="Espera máxima de cámaras y segmentos")
+        parser.add_argument("--salida", help="Archivo JSON (por defecto stdout)")
+        parser.add_argument("--conservar", action="store_true", help="No borrar los usuarios bench_* creados")
+
+    def handle(self, *args, **opts):
+        if opts["camaras"] < 2:
+            raise CommandError("Hacen falta al menos 2 cámaras para cortar entre ellas")
+
+        # Solo usuarios nuevos: al final se borran (salvo --conservar)
+        usuarios = crear_usuarios_bench(PREFIJO_USUARIO, opts["usuarios"])
+        publicadores = []
+
+        try:
+            for n, user in enumerate(usuarios):
+                for cam in range(1, opts["camaras"] + 1):
+                    publicadores.append(_publicar(
+                        f"{user.username}-cam{cam}", opts["resolucion"], opts["fps"],
+                        frecuencia=220 * cam + n,
+                    ))
+            for user in usuarios:
+                _esperar_camaras(user, opts["camaras"], opts["timeout"])
+
+            # Calentamiento: la cámara 1 al aire levanta HLS maestro y feeders
+            for user in usuarios:
+                previos = set(_segmentos(user.username))
+                poner_camara_al_aire(user, 1)
+                if not _esperar_segmento_nuevo(user.username, previos, opts["timeout"]):
+                    raise CommandError(f"{user.username}: el programa no generó segmentos")
+            time.sleep(opts["intervalo"])
+
+            # Consumo de base: todo al aire, sin cortes
+            cpu_inicio, t_inicio = _cpu_total(), time.monotonic()
+            time.sleep(opts["intervalo"])
+            base_cpu_por_s = (_cpu_total() - cpu_inicio) / (time.monotonic() - t_inicio)
+
+            with ThreadPoolExecutor(max_workers=len(usuarios)) as pool:
+                cortes = [
+                    c for lista in pool.map(lambda u: self._cortar(u, opts, base_cpu_por_s), usuarios)
+                    for c in lista
+                ]
+        finally:
+            for proc in publicadores:
+                proc.terminate()
+            for proc in publicadores:
+                try:
+                    proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            for user in usuarios:
+                detener_transmision_usuario(user)
+                if not opts["conservar"]:
+                    user.delete()
+
+        reporte = {
+            "config": {
+                "usuarios": opts["usuarios"],
+                "camaras": opts["camaras"],
+                "cortes": opts["cortes"],
+                "intervalo": opts["intervalo"],
+                "resolucion": opts["resolucion"],
+                "fps": opts["fps"],
+                "motor": settings.PROGRAM_SWITCH_ENGINE,
+                "abr": settings.PROGRAM_HLS_ABR,
+                "supervisor": bool(settings.MEDIA_SUPERVISOR_SOCKET),
+                "cpu_base_por_s": round(base_cpu_por_s, 3),
+            },
+            "switch_s": percentiles([c["switch_s"] for c in cortes]),
+            "primer_segmento_s": percentiles([c["primer_segmento_s"] for c in cortes if c["primer_segmento_s"] is not None]),
+            "cpu_s_por_switch": percentiles([c["cpu_s"] for c in cortes]),
+            "sin_segmento": sum(1 for c in cortes if c["primer_segmento_s"] is None),
+            "cortes": cortes,
+        }
+
+        texto = json.dumps(reporte, indent=2)
+        if opts["salida"]:
+            with open(opts["salida"], "w") as f:
+                f.write(texto + "\n")
+            self.stdout.write(f"Reporte en {opts['salida']}")
+        else:
+            sys.stdout.write(texto + "\n")
+
+    def _cortar(self, user, opts, base_cpu_por_s):
+        cortes = []
+        try:
+            for k in range(opts["cortes"]):
+                # La 1 quedó al aire en el calentamiento
+                cam = (k + 1) % opts["camaras"] + 1
+                previos = set(_segmentos(user.username))
+                cpu0, t0 = _cpu_total(), time.monotonic()
+
+                poner_camara_al_aire(user, cam)
+                switch_s = time.monotonic() - t0
+
+                hay_segmento = _esperar_segmento_nuevo(user.username, previos, opts["timeout"])
+                primer_segmento_s = time.monotonic() - t0 if hay_segmento else None
+
+                # El resto del intervalo entra en la ventana de CPU (overlap, retiros)
+                time.sleep(max(0.0, opts["intervalo"] - (time.monotonic() - t0)))
+                ventana = time.monotonic() - t0
+                cpu_s = max(0.0, _cpu_total() - cpu0 - base_cpu_por_s * ventana)
+
+                cortes.append({
+                    "usuario": user.username,
+                    "camara": cam,
+                    "switch_s": round(switch_s, 4),
+                    "primer_segmento_s": round(primer_segmento_s, 4) if hay_segmento else None,
+                    "cpu_s": round(cpu_s, 3),
+                })
+        finally:
+            close_old_connections()
+        return cortes
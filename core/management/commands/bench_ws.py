@@ -0,0 +1,328 @@
+"""
+Benchmark del fan-out por WebSocket (PanelConsumer + channel layer).
+
+Abre miles de conexiones autenticadas a ws/panel/ contra un daphne local
+(N operadores × P pestañas, cada una con su cookie de sesión), dispara
+cambios de estado con las funciones de notificaciones_tiempo_real desde
+este proceso y mide:
+
+  conexion_s        tiempo hasta el 101 Switching Protocols
+  entrega_s         desde la llamada a notificar_* hasta que cada pestaña
+                    recibe el mensaje (misma máquina, mismo reloj)
+  mensajes_por_s    mensajes entregados a pestañas por segundo
+  memoria           RSS de daphne y used_memory de Redis por conexión
+
+El cliente WebSocket es mínimo (asyncio, sin dependencias): handshake,
+frames de texto, ping/pong y close. La salida es JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import struct
+import asyncio
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import StreamConnection
+from core.services import notificaciones_tiempo_real as notificaciones
+from ._bench import crear_usuarios_bench, percentiles
+
+PREFIJO_USUARIO = "benchws_"
+
+# tipo de cambio -> (función que lo dispara, "tipo" que llega al browser)
+CAMBIOS = {
+    "camara": (lambda user, k: notificaciones.notificar_camara_actualizada(user, 1), "camara_actualizada"),
+    "radio": (lambda user, k: notificaciones.notificar_modo_radio(user.id, k % 2 == 0), "modo_radio_cambio"),
+    "trabajo": (
+        lambda user, k: notificaciones.notificar_trabajo(
+            user.id, {"id": f"bench-{k}", "trabajo": "bench", "estado": "ok", "mensaje": "", "resultado": None}
+        ),
+        "trabajo",
+    ),
+}
+
+
+# ============================================================
+# CLIENTE WEBSOCKET MÍNIMO
+# ============================================================
+
+class ConexionWS:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def abrir(cls, host, port, path, cookie, origin):
+        reader, writer = await asyncio.open_connection(host, port)
+        clave = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {clave}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            f"Origin: {origin}\r\n"
+            f"Cookie: {cookie}\r\n"
+            "\r\n"
+        ).encode())
+        cabecera = await reader.readuntil(b"\r\n\r\n")
+        if b" 101 " not in cabecera.split(b"\r\n", 1)[0]:
+            writer.close()
+            raise ConnectionError(cabecera.split(b"\r\n", 1)[0].decode(errors="replace"))
+        return cls(reader, writer)
+
+    def _enviar(self, opcode, datos=b""):
+        # Los frames del cliente van enmascarados (RFC 6455)
+        mascara = os.urandom(4)
+        enmascarado = bytes(b ^ mascara[i % 4] for i, b in enumerate(datos))
+        self.writer.write(bytes([0x80 | opcode, 0x80 | len(datos)]) + mascara + enmascarado)
+
+    async def recibir(self):
+        """Siguiente mensaje de texto, o None si el servidor cerró."""
+        while True:
+            b1, b2 = await self.reader.readexactly(2)
+            opcode, largo = b1 & 0x0F, b2 & 0x7F
+            if largo == 126:
+                largo = struct.unpack("!H", await self.reader.readexactly(2))[0]
+            elif largo == 127:
+                largo = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+            datos = await self.reader.readexactly(largo)
+
+            if opcode == 0x1:
+                return datos.decode()
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._enviar(0xA, datos)
+
+    async def cerrar(self):
+        try:
+            self._enviar(0x8, struct.pack("!H", 1000))
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+        self.writer.close()
+
+
+# ============================================================
+# MEDICIÓN
+# ============================================================
+
+def _sesion(user):
+    """Cookie de sesión logueada, como la que deja login()."""
+    sesion = SessionStore()
+    sesion[SESSION_KEY] = str(user.pk)
+    sesion[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    sesion[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    sesion.save()
+    return f"{settings.SESSION_COOKIE_NAME}={sesion.session_key}", sesion
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _pid_daphne():
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"daphne" in f.read():
+                    return int(pid)
+        except OSError:
+            continue
+    return None
+
+
+def _memoria_redis():
+    try:
+        import redis
+        host, port = settings.CHANNEL_LAYERS["default"]["CONFIG"]["hosts"][0]
+        return redis.Redis(host=host, port=port).info("memory")["used_memory"]
+    except Exception:
+        return None
+
+
+def _por_conexion(antes, despues, conexiones):
+    if antes is None or despues is None or not conexiones:
+        return None
+    return round((despues - antes) / conexiones, 2)
+
+
+class Command(BaseCommand):
+    help = "Mide el fan-out de notificaciones por WebSocket con miles de pestañas (salida JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/panel/", help="URL del WebSocket del panel")
+        parser.add_argument("--origin", help="Origin (por defecto http://<primer ALLOWED_HOSTS>)")
+        parser.add_argument("--operadores", type=int, default=100, help="Usuarios de prueba")
+        parser.add_argument("--pestanas", type=int, default=10, help="Conexiones por usuario")
+        parser.add_argument("--cambio", choices=sorted(CAMBIOS), default="camara")
+        parser.add_argument("--cambios", type=int, default=20, help="Cambios por usuario")
+        parser.add_argument("--intervalo", type=float, default=0.5, help="Segundos entre rondas de cambios")
+        parser.add_argument("--hilos", type=int, default=16, help="Threads que llaman a notificar_*")
+        parser.add_argument("--abrir-a-la-vez", type=int, default=200, help="Handshakes en vuelo a la vez")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Espera máxima de la entrega")
+        parser.add_argument("--pid-daphne", type=int, help="PID de daphne para la memoria (por defecto se busca)")
+        parser.add_argument("--salida", help="Archivo JSON (por defecto stdout)")
+
+    def handle(self, *args, **opts):
+        url = urllib.parse.urlparse(opts["url"])
+        if url.scheme != "ws":
+            raise CommandError("Solo ws:// (daphne local, sin TLS)")
+        origin = opts["origin"] or f"http://{settings.ALLOWED_HOSTS[0]}"
+
+        # Solo usuarios nuevos: al final se borran
+        usuarios = crear_usuarios_bench(PREFIJO_USUARIO, opts["operadores"])
+        sesiones = []
+        try:
+            for user in usuarios:
+                # notificar_camara_actualizada lee la conexión de la base
+                StreamConnection.objects.create(
+                    user=user, cam_index=1, stream_key=f"{user.username}-cam1",
+                    status=StreamConnection.Status.READY, authorized=True,
+                )
+                sesiones.append(_sesion(user))
+
+            reporte = asyncio.run(self._correr(url, origin, usuarios, [c for c, _ in sesiones], opts))
+        finally:
+            for _, sesion in sesiones:
+                sesion.delete()
+            for user in usuarios:
+                user.delete()
+
+        texto = json.dumps(reporte, indent=2)
+        if opts["salida"]:
+            with open(opts["salida"], "w") as f:
+                f.write(texto + "\n")
+            self.stdout.write(f"Reporte en {opts['salida']}")
+        else:
+            sys.stdout.write(texto + "\n")
+
+    async def _correr(self, url, origin, usuarios, cookies, opts):
+        disparar, tipo = CAMBIOS[opts["cambio"]]
+        pid_daphne = opts["pid_daphne"] or _pid_daphne()
+        rss_antes, redis_antes = _rss_kb(pid_daphne), _memoria_redis()
+
+        # ---------- Conexiones ----------
+        semaforo = asyncio.Semaphore(opts["abrir_a_la_vez"])
+        tiempos_conexion, fallidas = [], []
+
+        async def abrir(cookie):
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    conexion = await ConexionWS.abrir(
+                        url.hostname, url.port or 80, url.path or "/", cookie, origin
+                    )
+                except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                    fallidas.append(str(e))
+                    return None
+                tiempos_conexion.append(time.perf_counter() - inicio)
+                return conexion
+
+        pestanas = [(i, cookie) for i, cookie in enumerate(cookies) for _ in range(opts["pestanas"])]
+        conexiones = await asyncio.gather(*(abrir(cookie) for _, cookie in pestanas))
+
+        abiertas = [(i, c) for (i, _), c in zip(pestanas, conexiones) if c is not None]
+        if not abiertas:
+            raise CommandError(f"No se abrió ninguna conexión: {fallidas[:3]}")
+
+        await asyncio.sleep(1)
+        rss_despues, redis_despues = _rss_kb(pid_daphne), _memoria_redis()
+
+        # ---------- Cambios y entrega ----------
+        envios = [[] for _ in usuarios]          # por usuario: time.time() de cada cambio
+        entregas = []
+        ultima = [0.0]
+        esperados = sum(1 for _ in abiertas) * opts["cambios"]
+        listo = asyncio.Event()
+
+        async def escuchar(indice, conexion):
+            recibidos = 0
+            while recibidos < opts["cambios"]:
+                try:
+                    texto = await conexion.recibir()
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if texto is None:
+                    return
+                ahora = time.time()
+                if json.loads(texto).get("tipo") != tipo:
+                    continue
+                # Mensajes de un grupo llegan en orden: el n-ésimo es el n-ésimo envío
+                entregas.append(ahora - envios[indice][recibidos])
+                ultima[0] = ahora
+                recibidos += 1
+                if len(entregas) == esperados:
+                    listo.set()
+
+        oyentes = [asyncio.create_task(escuchar(i, c)) for i, c in abiertas]
+
+        loop = asyncio.get_running_loop()
+        inicio = time.time()
+        with ThreadPoolExecutor(max_workers=opts["hilos"]) as pool:
+            def enviar(indice, k):
+                envios[indice].append(time.time())
+                disparar(usuarios[indice], k)
+
+            for k in range(opts["cambios"]):
+                # Un cambio por usuario y ronda: el k-ésimo envío antes del k+1
+                await asyncio.gather(*(
+                    loop.run_in_executor(pool, enviar, i, k) for i in range(len(usuarios))
+                ))
+                await asyncio.sleep(opts["intervalo"])
+
+        try:
+            await asyncio.wait_for(listo.wait(), opts["timeout"])
+        except asyncio.TimeoutError:
+            pass
+        # Throughput hasta la última entrega, no hasta el fin de la espera
+        fin = max(ultima[0], inicio + 1e-6)
+
+        for oyente in oyentes:
+            oyente.cancel()
+        await asyncio.gather(*(c.cerrar() for _, c in abiertas))
+
+        return {
+            "config": {
+                "operadores": opts["operadores"],
+                "pestanas": opts["pestanas"],
+                "cambio": opts["cambio"],
+                "cambios": opts["cambios"],
+                "intervalo": opts["intervalo"],
+            },
+            "conexiones": {
+                "abiertas": len(abiertas),
+                "fallidas": len(fallidas),
+                "conexion_s": percentiles(tiempos_conexion),
+            },
+            "entrega_s": percentiles(entregas, (0.5, 0.9, 0.99, 0.999)),
+            "mensajes": {
+                "esperados": esperados,
+                "entregados": len(entregas),
+                "perdidos": esperados - len(entregas),
+                "por_s": round(len(entregas) / (fin - inicio), 1),
+            },
+            "memoria": {
+                "pid_daphne": pid_daphne,
+                "daphne_kb_por_conexion": _por_conexion(rss_antes, rss_despues, len(abiertas)),
+                "redis_bytes_por_conexion": _por_conexion(redis_antes, redis_despues, len(abiertas)),
+            },
+        }
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.supervisor_media import SupervisorMedia
+from core.services.reconciliacion import reconciliar
+from core.services.telemetria import iniciar_telemetria
+from core.services.vigilante_programa import iniciar_vigilante
+from multistream.services.supervisor_retransmisiones import iniciar_supervisor
+
+
+class Command(BaseCommand):
+    help = "Daemon dueño de todos los procesos FFmpeg (ver core/services/supervisor_media.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=settings.MEDIA_SUPERVISOR_SOCKET,
+            help="Ruta del socket Unix (por defecto MEDIA_SUPERVISOR_SOCKET)",
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options["socket"]
+        if not socket_path:
+            raise CommandError("Definí MEDIA_SUPERVISOR_SOCKET o pasá --socket")
+
+        logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s %(message)s")
+        self.stdout.write(f"Supervisor de media en {socket_path}")
+        settings.MEDIA_SUPERVISOR_SOCKET = socket_path
+
+        def al_iniciar():
+            if settings.MEDIA_RECONCILIAR_AL_INICIAR:
+                reconciliar()
+            # Dueño de los procesos → dueño de las reconexiones
+            iniciar_supervisor()
+            iniciar_vigilante()
+            iniciar_telemetria()
+
+        supervisor = SupervisorMedia(
+            socket_path,
+            telemetria_intervalo=settings.TELEMETRIA_INTERVALO,
+            telemetria_muestras=settings.TELEMETRIA_MUESTRAS,
+        )
+        asyncio.run(supervisor.serve(al_iniciar=al_iniciar))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.bitacora import leer_niveles, escribir_niveles, NIVELES_INTERVALO
+
+NIVELES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+class Command(BaseCommand):
+    help = (
+        "Cambia el nivel de log de un módulo en todos los procesos, sin reiniciar "
+        "(p.ej. nivel_log core.services.notificaciones_tiempo_real DEBUG)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("logger", nargs="?", help="Nombre del logger (sin argumentos: lista los overrides)")
+        parser.add_argument("nivel", nargs="?", type=str.upper, choices=NIVELES)
+        parser.add_argument("--quitar", action="store_true", help="Vuelve el logger a su nivel de LOGGING")
+
+    def handle(self, *args, **opts):
+        ruta = settings.LOG_NIVELES_ARCHIVO
+        niveles = leer_niveles(ruta)
+
+        if opts["logger"]:
+            if opts["quitar"]:
+                if niveles.pop(opts["logger"], None) is None:
+                    raise CommandError(f"{opts['logger']} no tiene override")
+            elif opts["nivel"]:
+                niveles[opts["logger"]] = opts["nivel"]
+            else:
+                raise CommandError("Falta el nivel (o --quitar)")
+            escribir_niveles(ruta, niveles)
+            self.stdout.write(f"Se aplica en ≤ {NIVELES_INTERVALO:.0f}s en cada proceso ({ruta})")
+
+        if not niveles:
+            self.stdout.write("Sin overrides: rigen los niveles de LOGGING")
+        for nombre, nivel in sorted(niveles.items()):
+            self.stdout.write(f"{nombre}: {nivel}")
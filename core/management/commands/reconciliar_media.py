@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.services.reconciliacion import reconciliar
+
+
+class Command(BaseCommand):
+    help = "Adopta o mata los FFmpeg sobrevivientes y corrige el estado en la base"
+
+    def handle(self, *args, **options):
+        resultado = reconciliar()
+        self.stdout.write(
+            f"{resultado['adoptados']} procesos adoptados, {resultado['detenidos']} detenidos"
+        )
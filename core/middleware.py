@@ -0,0 +1,27 @@
+"""
+Middleware del proyecto.
+"""
+
+from django.db import connection
+
+from core.services.metricas import CONSULTAS_POR_REQUEST
+
+
+class ConsultasDBMiddleware:
+    """Cuenta las consultas SQL de cada request (/metrics)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            response = self.get_response(request)
+
+        CONSULTAS_POR_REQUEST.observar(consultas[0])
+        return response
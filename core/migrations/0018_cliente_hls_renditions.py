@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_cliente_dominio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='hls_renditions',
+            field=models.CharField(blank=True, default='', help_text='Alturas separadas por coma (1080,720,480,360). Vacío = PROGRAM_HLS_RENDITIONS de settings.', max_length=50, verbose_name='Calidades HLS'),
+        ),
+    ]
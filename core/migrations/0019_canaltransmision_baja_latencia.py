@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_cliente_hls_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canaltransmision',
+            name='baja_latencia',
+            field=models.BooleanField(default=False, help_text='HLS del programa en segmentos fMP4/CMAF de 1 s (≈2-4 s de latencia).'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:19
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_canaltransmision_baja_latencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoControl',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(max_length=40)),
+                ('params', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('en_cola', 'En cola'), ('corriendo', 'Corriendo'), ('ok', 'Terminado'), ('error', 'Error')], default='en_cola', max_length=10)),
+                ('mensaje', models.CharField(blank=True, max_length=255)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, help_text='host:pid del proceso que lo corre', max_length=100)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_control', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['creado_en'],
+                'indexes': [models.Index(fields=['usuario', 'estado'], name='core_trabaj_usuario_80f584_idx')],
+            },
+        ),
+    ]
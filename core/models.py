@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -38,6 +40,15 @@ class Cliente(models.Model):
     notif_chat_mentions = models.BooleanField(default=True, verbose_name="Menciones en Chat")
     notif_marketing = models.BooleanField(default=False, verbose_name="Novedades y Ofertas")
 
+    # --- HLS ADAPTATIVO (ABR) ---
+    hls_renditions = models.CharField(
+        max_length=50,
+        blank=True,
+        default="",
+        verbose_name="Calidades HLS",
+        help_text="Alturas separadas por coma (1080,720,480,360). Vacío = PROGRAM_HLS_RENDITIONS de settings."
+    )
+
 
     def __str__(self):
         return f"{self.nombre} {self.apellido} ({self.user.email})"
@@ -107,6 +118,12 @@ class CanalTransmision(models.Model):
         help_text='Ruta absoluta a imagen JPG. Vacío = usar RADIO_IMAGE_PATH de settings.'
     )
 
+    # --- BAJA LATENCIA (NUEVO) ---
+    baja_latencia = models.BooleanField(
+        default=False,
+        help_text='HLS del programa en segmentos fMP4/CMAF de 1 s (≈2-4 s de latencia).'
+    )
+
     def get_imagen_radio(self):
         from django.conf import settings
         return self.radio_imagen_path or getattr(settings, 'RADIO_IMAGE_PATH', '')
@@ -121,4 +138,40 @@ class CanalTransmision(models.Model):
 
     def __str__(self):
         estado = "EN VIVO" if self.en_vivo else "OFFLINE"
-        return f"{self.usuario.username} - {estado}"
\ No newline at end of file
+        return f"{self.usuario.username} - {estado}"
+
+
+class TrabajoControl(models.Model):
+    """
+    Trabajo de control encolado (core/services/trabajos.py). La cola vive
+    en la base: cualquier worker ve el estado y el orden por usuario.
+    """
+    class Estado(models.TextChoices):
+        EN_COLA = "en_cola", "En cola"
+        CORRIENDO = "corriendo", "Corriendo"
+        OK = "ok", "Terminado"
+        ERROR = "error", "Error"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name="trabajos_control")
+    tipo = models.CharField(max_length=40)
+    params = models.JSONField(default=dict)
+
+    estado = models.CharField(max_length=10, choices=Estado.choices, default=Estado.EN_COLA)
+    mensaje = models.CharField(max_length=255, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="host:pid del proceso que lo corre"
+    )
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["creado_en"]
+        indexes = [models.Index(fields=["usuario", "estado"])]
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.tipo} ({self.estado})"
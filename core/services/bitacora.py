@@ -0,0 +1,192 @@
+"""
+BITÁCORA (LOGGING FUERA DEL CAMINO CALIENTE)
+============================================
+Los loggers de la app no escriben a stdout ni al archivo desde el thread
+que atiende el request: encolan el registro y un thread de fondo lo
+formatea y lo escribe.
+
+  logger.debug("Cámara %s → %s", idx, estado)
+        │  (nivel apagado: no se crea ni formatea nada)
+        ▼
+  ColaHandler ──► cola acotada ──► ColaListener ──► console / file
+
+Reglas para el camino caliente:
+  - argumentos con %s, nunca f-strings: el mensaje se arma en el thread
+    de fondo y solo si el nivel está prendido
+  - pasar valores (username, cam_index), no modelos: el formateo corre
+    en otro thread, sin conexión a la base
+  - si la cola se llena (colector lento) el registro se descarta y se
+    cuenta en streaming_logs_descartados_total; el request nunca espera
+
+Niveles por módulo en caliente (LOG_NIVELES_ARCHIVO, ver `manage.py
+nivel_log`): el listener relee el archivo cada NIVELES_INTERVALO
+segundos, así el cambio llega a todos los workers y al media_supervisor
+sin reiniciarlos.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+from core.services.metricas import LOGS_DESCARTADOS
+
+NIVELES_INTERVALO = 2.0
+COLA_MAXIMA = 10000
+
+
+def cola_acotada():
+    """Cola del ColaHandler (LOGGING["handlers"]["cola"]["queue"])."""
+    return queue.Queue(COLA_MAXIMA)
+
+
+class ColaHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que no formatea en el thread que loguea y nunca bloquea.
+    El listener arranca con el primer registro (después de dictConfig).
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self._lock_arranque = threading.Lock()
+        self._en_marcha = False
+
+    def prepare(self, record):
+        # El traceback sí se renderiza acá: sus frames siguen cambiando
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _FORMATO_EXC.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if not self._en_marcha:
+            self._arrancar()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DESCARTADOS.inc(logging.getLevelName(record.levelno))
+
+    def _arrancar(self):
+        with self._lock_arranque:
+            if self._en_marcha:
+                return
+            listener = getattr(self, "listener", None)
+            if listener is not None and not listener.en_marcha:
+                listener.start()
+                atexit.register(listener.stop)
+            self._en_marcha = True
+
+
+class ColaListener(logging.handlers.QueueListener):
+    """QueueListener que además aplica los niveles de LOG_NIVELES_ARCHIVO."""
+
+    en_marcha = False
+
+    def __init__(self, cola, *handlers, respect_handler_level=False):
+        super().__init__(cola, *handlers, respect_handler_level=respect_handler_level)
+        self._mtime = None
+        self._proxima_revision = 0.0
+        self._originales = {}   # logger -> nivel antes del override
+
+    def start(self):
+        super().start()
+        self.en_marcha = True
+
+    def stop(self):
+        if self.en_marcha:
+            self.en_marcha = False
+            super().stop()
+
+    def dequeue(self, block):
+        # Con o sin registros, cada NIVELES_INTERVALO mira si cambiaron los niveles
+        while True:
+            if time.monotonic() >= self._proxima_revision:
+                self._proxima_revision = time.monotonic() + NIVELES_INTERVALO
+                self._revisar_niveles()
+            try:
+                return self.queue.get(block, NIVELES_INTERVALO)
+            except queue.Empty:
+                if not block:
+                    raise
+
+    def _revisar_niveles(self):
+        try:
+            from django.conf import settings
+            ruta = settings.LOG_NIVELES_ARCHIVO
+        except Exception:
+            return
+        try:
+            mtime = os.stat(ruta).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            aplicar_niveles(leer_niveles(ruta), self._originales)
+        except Exception as e:
+            # Un archivo a medio escribir o con un nivel inválido no tira el listener
+            logging.getLogger(__name__).warning("Niveles de log no aplicados (%s): %s", ruta, e)
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro, con los campos de extra={...}."""
+
+    def format(self, record):
+        datos = {
+            "ts": self.formatTime(record, self.datefmt),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "funcion": record.funcName,
+            "mensaje": record.getMessage(),
+        }
+        for campo, valor in record.__dict__.items():
+            if campo not in _CAMPOS_RECORD:
+                datos[campo] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos["excepcion"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+_FORMATO_EXC = logging.Formatter()
+_CAMPOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+# ============================================================
+# NIVELES POR MÓDULO
+# ============================================================
+
+def leer_niveles(ruta):
+    """{logger: "DEBUG" | "INFO" | ...} del archivo, {} si no existe."""
+    try:
+        with open(ruta) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def escribir_niveles(ruta, niveles):
+    """Escritura atómica: los listeners nunca leen un archivo a medias."""
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(niveles, f, indent=2, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def aplicar_niveles(niveles, originales):
+    """Aplica los overrides; los loggers que salieron del archivo vuelven a su nivel."""
+    for nombre in list(originales):
+        if nombre not in niveles:
+            logging.getLogger(nombre).setLevel(originales.pop(nombre))
+
+    for nombre, nivel in niveles.items():
+        logger = logging.getLogger(nombre)
+        originales.setdefault(nombre, logger.level)
+        logger.setLevel(str(nivel).upper())
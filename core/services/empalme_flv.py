@@ -0,0 +1,351 @@
+"""
+EMPALME FLV (MOTOR MEZZANINE)
+=============================
+Un proceso de larga vida por canal arma /program_switch empalmando en
+COPY las mezzanines de las cámaras, sin spawn ni handshake por corte:
+
+  /mezzanine/cam1 ──► ffmpeg -c copy -f flv pipe ──┐
+  /mezzanine/cam2 ──► ffmpeg -c copy -f flv pipe ──┼──► empalme ──► ffmpeg -c copy ──► /program_switch/<usuario>
+  /mezzanine/camN ──► ffmpeg -c copy -f flv pipe ──┘  (tags FLV)
+
+Todas las fuentes se leen todo el tiempo y el empalme reenvía los tags
+de la activa. Un corte entra en el próximo keyframe de la nueva fuente
+(las mezzanines tienen GOP de 1 s): desde ahí sus tags salen corridos
+para seguir la línea de tiempo del programa, sin hueco ni retroceso, y
+la publicación RTMP del programa nunca se corta.
+
+Comandos por stdin, uno por línea:
+  c <stream_key>   corta a esa fuente (la suma si no estaba)
+  + <stream_key>   suma una fuente
+  - <stream_key>   quita una fuente
+  q                salida limpia
+
+Solo usa la biblioteca estándar: la tabla de procesos lo lanza como
+script (python empalme_flv.py ...), fuera de Django (ver mezzanine.py).
+"""
+
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+
+AUDIO = 8
+VIDEO = 9
+
+CABECERA_FLV = b"FLV\x01\x05\x00\x00\x00\x09" + b"\x00\x00\x00\x00"
+
+# Entre el último tag de la fuente saliente y el keyframe entrante: un cuadro a 30 fps
+PASO_MS = 33
+# Una fuente que se cae (la mezzanine se reinició) se vuelve a abrir
+REINTENTO_SEGUNDOS = 1.0
+
+
+class Tag:
+    """Tag FLV: tipo (8 audio, 9 video, 18 script), timestamp en ms y cuerpo."""
+
+    __slots__ = ("tipo", "ts", "datos")
+
+    def __init__(self, tipo, ts, datos):
+        self.tipo = tipo
+        self.ts = ts
+        self.datos = datos
+
+    @property
+    def es_cabecera(self):
+        """Configuración del decoder: AVC sequence header o AAC AudioSpecificConfig."""
+        if len(self.datos) < 2 or self.datos[1] != 0:
+            return False
+        if self.tipo == VIDEO:
+            return self.datos[0] & 0x0F == 7
+        if self.tipo == AUDIO:
+            return self.datos[0] >> 4 == 10
+        return False
+
+    @property
+    def es_keyframe(self):
+        return self.tipo == VIDEO and bool(self.datos) and self.datos[0] >> 4 == 1 and not self.es_cabecera
+
+    def serializar(self, ts):
+        ts &= 0xFFFFFFFF
+        tamano = len(self.datos)
+        cabecera = (
+            bytes([self.tipo])
+            + tamano.to_bytes(3, "big")
+            + (ts & 0xFFFFFF).to_bytes(3, "big")
+            + bytes([ts >> 24])
+            + b"\x00\x00\x00"
+        )
+        return cabecera + self.datos + (11 + tamano).to_bytes(4, "big")
+
+
+def _leer(flujo, n):
+    datos = b""
+    while len(datos) < n:
+        parte = flujo.read(n - len(datos))
+        if not parte:
+            return None
+        datos += parte
+    return datos
+
+
+def leer_tags(flujo):
+    """Tags de un FLV leído de un archivo binario (header incluido); termina en EOF."""
+    cabecera = _leer(flujo, 9)
+    if cabecera is None or cabecera[:3] != b"FLV":
+        return
+    # Resto del header (si lo hay) + PreviousTagSize0
+    if _leer(flujo, int.from_bytes(cabecera[5:9], "big") - 9 + 4) is None:
+        return
+
+    while True:
+        h = _leer(flujo, 11)
+        if h is None:
+            return
+        tamano = int.from_bytes(h[1:4], "big")
+        ts = int.from_bytes(h[4:7], "big") | h[7] << 24
+        datos = _leer(flujo, tamano)
+        if datos is None or _leer(flujo, 4) is None:
+            return
+        yield Tag(h[0] & 0x1F, ts, datos)
+
+
+# ============================================================
+# EMPALME
+# ============================================================
+
+class Empalme:
+    """
+    Reenvía a `salida` los tags de la fuente activa con la línea de tiempo
+    del programa. Thread-safe: cada fuente llama a recibir() desde su thread.
+    """
+
+    def __init__(self, salida, activa=None):
+        self.salida = salida
+        self.activa = None
+        # La primera fuente también entra en keyframe
+        self.pendiente = activa
+        self._lock = threading.Lock()
+        self._cabeceras = {}   # fuente -> {tipo: Tag}
+        self._enviadas = {}    # tipo -> cuerpo de la última cabecera escrita
+        self._ultimo = {AUDIO: 0, VIDEO: 0}
+        self._offset = 0
+        self._desde = 0        # ts (de la fuente) del keyframe de entrada
+
+        self._escribir_bytes(CABECERA_FLV)
+
+    def cortar(self, fuente):
+        with self._lock:
+            self.pendiente = None if fuente == self.activa else fuente
+
+    def reconectada(self, fuente):
+        """La fuente volvió a abrir su mezzanine: sus timestamps arrancan de nuevo."""
+        with self._lock:
+            self._cabeceras.pop(fuente, None)
+            if fuente == self.activa:
+                # Se vuelve a entrar en su próximo keyframe con un offset nuevo
+                self.pendiente = fuente
+
+    def quitar(self, fuente):
+        with self._lock:
+            self._cabeceras.pop(fuente, None)
+            if self.pendiente == fuente:
+                self.pendiente = None
+
+    def recibir(self, fuente, tag):
+        with self._lock:
+            if tag.es_cabecera:
+                self._cabeceras.setdefault(fuente, {})[tag.tipo] = tag
+                if fuente == self.activa:
+                    self._escribir_cabecera(tag)
+                return
+
+            if tag.tipo not in (AUDIO, VIDEO):
+                return  # onMetaData de cada fuente: el programa no lo necesita
+
+            if fuente == self.pendiente and tag.es_keyframe:
+                self._entrar(fuente, tag.ts)
+
+            # Audio de la fuente nueva anterior al keyframe de entrada (o de
+            # la activa que se reconectó y todavía no dio keyframe): afuera
+            if fuente != self.activa or fuente == self.pendiente or tag.ts < self._desde:
+                return
+            self._escribir(tag, tag.ts + self._offset)
+
+    def _entrar(self, fuente, ts):
+        base = max(self._ultimo.values()) + PASO_MS if self.activa is not None else 0
+        self.activa = fuente
+        self.pendiente = None
+        self._offset = base - ts
+        self._desde = ts
+        for cabecera in self._cabeceras.get(fuente, {}).values():
+            self._escribir_cabecera(cabecera)
+
+    def _escribir_cabecera(self, tag):
+        # Las mezzanines comparten perfil: casi siempre es la misma y no se repite
+        if self._enviadas.get(tag.tipo) == tag.datos:
+            return
+        self._enviadas[tag.tipo] = tag.datos
+        self._escribir(tag, self._ultimo[tag.tipo])
+
+    def _escribir(self, tag, ts):
+        ts = max(ts, self._ultimo[tag.tipo])   # nunca hacia atrás
+        self._ultimo[tag.tipo] = ts
+        self._escribir_bytes(tag.serializar(ts))
+
+    def _escribir_bytes(self, datos):
+        self.salida.write(datos)
+        self.salida.flush()
+
+
+# ============================================================
+# FUENTES
+# ============================================================
+
+class Fuente(threading.Thread):
+    """Lee una mezzanine en COPY y le pasa sus tags al empalme."""
+
+    def __init__(self, clave, url, ffmpeg, empalme, terminar):
+        super().__init__(name=f"fuente-{clave}", daemon=True)
+        self.clave = clave
+        self.url = url
+        self.ffmpeg = ffmpeg
+        self.empalme = empalme
+        self.terminar = terminar
+        self.vigente = True
+        self.proceso = None
+
+    def run(self):
+        while self.vigente and not self.terminar.is_set():
+            self.empalme.reconectada(self.clave)
+            self.proceso = subprocess.Popen(
+                [
+                    self.ffmpeg, "-hide_banner", "-loglevel", "error",
+                    "-i", self.url,
+                    "-map", "0:v:0", "-map", "0:a:0",
+                    "-c", "copy",
+                    "-f", "flv", "pipe:1",
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+            )
+            try:
+                for tag in leer_tags(self.proceso.stdout):
+                    if not self.vigente:
+                        break
+                    self.empalme.recibir(self.clave, tag)
+            except OSError:
+                # Se cerró la salida: el publicador del programa terminó
+                self.terminar.set()
+            finally:
+                self._cerrar()
+
+            if self.vigente:
+                time.sleep(REINTENTO_SEGUNDOS)
+
+    def _cerrar(self):
+        proceso = self.proceso
+        if proceso is not None and proceso.poll() is None:
+            proceso.kill()
+            proceso.wait()
+
+    def detener(self):
+        self.vigente = False
+        self._cerrar()
+
+
+# ============================================================
+# PROCESO
+# ============================================================
+
+def _leer_comandos(entrada, empalme, sumar, quitar, terminar):
+    for linea in entrada:
+        orden, _, clave = linea.strip().partition(" ")
+        if orden == "q":
+            break
+        if not clave:
+            continue
+        if orden == "c":
+            sumar(clave)
+            empalme.cortar(clave)
+        elif orden == "+":
+            sumar(clave)
+        elif orden == "-":
+            quitar(clave)
+    terminar.set()
+
+
+def argumentos(argv=None):
+    """Línea de comando del empalmador (también la lee la reconciliación de arranque)."""
+    parser = argparse.ArgumentParser(description="Empalme en COPY de las mezzanines de un canal")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--origen", required=True, help="rtmp://host:puerto/<app mezzanine>")
+    parser.add_argument("--salida", required=True, help="rtmp://host:puerto/program_switch/<usuario>")
+    parser.add_argument("--progress", help="-progress del FFmpeg que publica (telemetría)")
+    parser.add_argument("--activa", required=True)
+    parser.add_argument("fuentes", nargs="*")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+
+    progreso = ["-progress", args.progress, "-stats_period", "2"] if args.progress else []
+    escritor = subprocess.Popen(
+        [
+            args.ffmpeg, "-hide_banner", "-loglevel", "warning", *progreso,
+            "-f", "flv", "-i", "pipe:0",
+            "-map", "0:v:0", "-map", "0:a:0",
+            "-c", "copy",
+            "-f", "flv", args.salida,
+        ],
+        stdin=subprocess.PIPE,
+    )
+
+    terminar = threading.Event()
+    empalme = Empalme(escritor.stdin, args.activa)
+    fuentes = {}
+
+    def sumar(clave):
+        if clave not in fuentes:
+            fuente = Fuente(clave, f"{args.origen}/{clave}", args.ffmpeg, empalme, terminar)
+            fuentes[clave] = fuente
+            fuente.start()
+
+    def quitar(clave):
+        fuente = fuentes.pop(clave, None)
+        if fuente:
+            fuente.detener()
+        empalme.quitar(clave)
+
+    for clave in dict.fromkeys([args.activa, *args.fuentes]):
+        sumar(clave)
+
+    threading.Thread(
+        target=_leer_comandos, args=(sys.stdin, empalme, sumar, quitar, terminar), daemon=True
+    ).start()
+    threading.Thread(target=lambda: (escritor.wait(), terminar.set()), daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: terminar.set())
+
+    try:
+        while not terminar.wait(1):
+            pass
+    finally:
+        for fuente in list(fuentes.values()):
+            fuente.detener()
+        try:
+            escritor.stdin.close()
+        except OSError:
+            pass
+        try:
+            escritor.wait(5)
+        except subprocess.TimeoutExpired:
+            escritor.kill()
+            escritor.wait()
+
+    return escritor.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,72 @@
+import logging
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
 import os
 from core.models import StreamConnection, CanalTransmision
 from core.services.ffmpeg_manager import (
     start_program_hls,
     switch_program_camera,
     stop_program_hls,
+    camara_cerrada,
+    liberar_camaras_desautorizadas,
 )
 from core.services.notificaciones_tiempo_real import (
     notificar_actualizacion_camara,
     notificar_camara_actualizada,
     notificar_camara_eliminada,
     notificar_estado_canal,
+    lote_notificaciones,
+    agrupar_notificaciones,
 )
 from core.services.limpieza_hls import limpiar_hls_usuario
+from core.services.planificador import PLANIFICADOR
+from core.services.trabajos import trabajo
+from core.services.metricas import SWITCH_SEGUNDOS, medir
+
+logger = logging.getLogger(__name__)
+
+
+# ===============================
+# FIN DE TRANSMISIÓN DIFERIDO (DEBOUNCE)
+# ===============================
+def _clave_fin(user_id):
+    return ("fin_transmision", user_id)
+
+
+def programar_fin_transmision(user):
+    """
+    Se llama cuando una cámara se desconecta. En vez de esperar dentro del
+    hook de nginx, agenda el chequeo: si pasado el debounce sigue sin haber
+    cámara ON_AIR, se finaliza la transmisión. Reprogramar lo reinicia.
+    """
+    PLANIFICADOR.programar(
+        _clave_fin(user.id),
+        settings.STREAM_FIN_DEBOUNCE_SEGUNDOS,
+        _finalizar_si_nada_al_aire,
+        user.id,
+    )
+
+
+def cancelar_fin_transmision(user):
+    """Una cámara pasó a ON_AIR: el fin agendado ya no corresponde."""
+    if PLANIFICADOR.cancelar(_clave_fin(user.id)):
+        logger.debug("Fin de transmisión cancelado para %s", user.username)
+
+
+def _finalizar_si_nada_al_aire(user_id):
+    # Se vuelve a mirar la base: otro worker pudo poner una cámara al aire
+    hay_on_air = StreamConnection.objects.filter(
+        user_id=user_id,
+        status=StreamConnection.Status.ON_AIR,
+    ).exists()
+    if hay_on_air:
+        return
+
+    from django.contrib.auth.models import User
+    user = User.objects.filter(pk=user_id).first()
+    if user:
+        detener_transmision_usuario(user)
 
 
 # ===============================
@@ -25,7 +78,7 @@ def detener_transmision_usuario(user):
     Se llama SOLO cuando el usuario aprieta 'Detener transmisión'.
     """
 
-    print(f"[DEBUG] FINALIZANDO transmisión de {user.username}")
+    logger.debug("FINALIZANDO transmisión de %s", user.username)
 
     # 1️⃣ Detener FFmpeg (HLS + feeder)
     stop_program_hls(user)
@@ -37,35 +90,40 @@ def detener_transmision_usuario(user):
     # 2️⃣ Limpiar HLS del usuario
     limpiar_hls_usuario(user.username)
 
-    # 3️⃣ Bajar todas las cámaras a READY
-    camaras = StreamConnection.objects.filter(
-        user=user,
-        status=StreamConnection.Status.ON_AIR
-    )
+    # Cámaras y canal en una transacción; el panel recibe UN mensaje al commit
+    with transaction.atomic(), lote_notificaciones():
+        # 3️⃣ Bajar todas las cámaras a READY
+        camaras = StreamConnection.objects.filter(
+            user=user,
+            status=StreamConnection.Status.ON_AIR
+        )
 
-    indices = list(camaras.values_list("cam_index", flat=True))
-    camaras.update(
-        status=StreamConnection.Status.READY,
-        authorized=False
-    )
+        indices = list(camaras.values_list("cam_index", flat=True))
+        camaras.update(
+            status=StreamConnection.Status.READY,
+            authorized=False
+        )
 
-    for idx in indices:
-        notificar_actualizacion_camara(user, idx)
+        for idx in indices:
+            notificar_actualizacion_camara(user, idx)
 
-    # 4️⃣ Apagar canal (y resetear modo_radio)
-    canal, _ = CanalTransmision.objects.get_or_create(usuario=user)
-    canal.en_vivo = False
-    canal.inicio_transmision = None
-    canal.url_hls = ""
-    canal.modo_radio = False
-    canal.save(update_fields=["en_vivo", "inicio_transmision", "url_hls", "modo_radio"])
+        # 4️⃣ Apagar canal (y resetear modo_radio)
+        canal, _ = CanalTransmision.objects.get_or_create(usuario=user)
+        canal.en_vivo = False
+        canal.inicio_transmision = None
+        canal.url_hls = ""
+        canal.modo_radio = False
+        canal.save(update_fields=["en_vivo", "inicio_transmision", "url_hls", "modo_radio"])
 
-    # 5️⃣ Notificar frontend
-    notificar_estado_canal(user)
+        # 5️⃣ Notificar frontend
+        notificar_estado_canal(user)
+
+    liberar_camaras_desautorizadas(user)
 
-    print(f"[DEBUG] Transmisión FINALIZADA correctamente para {user.username}")
+    logger.debug("Transmisión FINALIZADA correctamente para %s", user.username)
 
 
+@medir(SWITCH_SEGUNDOS)
 def poner_camara_al_aire(user, cam_index):
     """
     Pone una cámara al aire.
@@ -82,46 +140,51 @@ def poner_camara_al_aire(user, cam_index):
     except StreamConnection.DoesNotExist:
         raise ValueError("La cámara no está lista para salir al aire")
 
-    # 🔴 PASO 1: Bajar TODAS las cámaras ON_AIR a READY
-    # Obtenemos la lista ANTES de actualizar para poder notificar
-    camaras_anteriores = list(
+    # Pasos 1-3 en una transacción: el panel recibe las cámaras que bajan y
+    # la que sube en UN mensaje al commit, antes de tocar FFmpeg
+    with transaction.atomic(), lote_notificaciones():
+        # 🔴 PASO 1: Bajar TODAS las cámaras ON_AIR a READY
+        # Obtenemos la lista ANTES de actualizar para poder notificar
+        camaras_anteriores = list(
+            StreamConnection.objects.filter(
+                user=user,
+                status=StreamConnection.Status.ON_AIR
+            ).values_list('cam_index', flat=True)
+        )
+
+        # Actualizamos todas a READY
         StreamConnection.objects.filter(
             user=user,
             status=StreamConnection.Status.ON_AIR
-        ).values_list('cam_index', flat=True)
-    )
-    
-    # Actualizamos todas a READY
-    StreamConnection.objects.filter(
-        user=user,
-        status=StreamConnection.Status.ON_AIR
-    ).update(status=StreamConnection.Status.READY)
-    
-    # 🔔 Notificar cada cámara que bajó de estado
-    for prev_cam_index in camaras_anteriores:
-        print(f"[DEBUG] Bajando cámara {prev_cam_index} de ON_AIR a READY")
-        notificar_camara_actualizada(user, prev_cam_index)
-
-    # 🟢 PASO 2: Subir la nueva cámara a ON_AIR
-    conn.status = StreamConnection.Status.ON_AIR
-    conn.save()
-    
-    # 🔔 Notificar la nueva cámara ON_AIR
-    print(f"[DEBUG] Subiendo cámara {cam_index} a ON_AIR")
-    notificar_camara_actualizada(user, cam_index)
-
-    # 🎬 PASO 3: Crear / actualizar canal
-    canal, created = CanalTransmision.objects.get_or_create(
-        usuario=user,
-        defaults={
-            "en_vivo": True,
-            "inicio_transmision": timezone.now(),
-        }
-    )
-    if not canal.en_vivo:
-        canal.en_vivo = True
-        canal.inicio_transmision = timezone.now()
-        canal.save()
+        ).update(status=StreamConnection.Status.READY)
+
+        # 🔔 Notificar cada cámara que bajó de estado
+        for prev_cam_index in camaras_anteriores:
+            logger.debug("Bajando cámara %s de ON_AIR a READY", prev_cam_index)
+            notificar_camara_actualizada(user, prev_cam_index)
+
+        # 🟢 PASO 2: Subir la nueva cámara a ON_AIR
+        conn.status = StreamConnection.Status.ON_AIR
+        conn.save()
+
+        # 🔔 Notificar la nueva cámara ON_AIR
+        logger.debug("Subiendo cámara %s a ON_AIR", cam_index)
+        notificar_camara_actualizada(user, cam_index)
+
+        # 🎬 PASO 3: Crear / actualizar canal
+        canal, created = CanalTransmision.objects.get_or_create(
+            usuario=user,
+            defaults={
+                "en_vivo": True,
+                "inicio_transmision": timezone.now(),
+            }
+        )
+        if not canal.en_vivo:
+            canal.en_vivo = True
+            canal.inicio_transmision = timezone.now()
+            canal.save()
+
+    cancelar_fin_transmision(user)
 
     # 🔄 PASO 4: Cambiar fuente de video
     # Primero feeder
@@ -131,6 +194,13 @@ def poner_camara_al_aire(user, cam_index):
     start_program_hls(user)
 
 
+@trabajo("switch")
+def _trabajo_switch(user, avance, cam_index):
+    avance(f"Poniendo al aire la cámara {cam_index}")
+    poner_camara_al_aire(user, cam_index)
+    return {"cam_index": cam_index}
+
+
 # ===============================
 # CERRAR UNA CÁMARA ESPECÍFICA
 # ===============================
@@ -151,10 +221,14 @@ def cerrar_camara_usuario(user, cam_index):
     conn.delete()
     notificar_camara_eliminada(user, cam_index)
 
+    # La cámara deja de ser entrada del motor de switch
+    camara_cerrada(user, conn.stream_key)
+
 
 # ===============================
 # LIMPIAR CONEXIONES HUERFANAS
 # ===============================
+@agrupar_notificaciones
 def limpiar_conexiones_huerfanas(usuario=None, segundos_timeout=120):
     """
     Limpia cámaras que dejaron de enviar keepalive.
@@ -175,12 +249,12 @@ def limpiar_conexiones_huerfanas(usuario=None, segundos_timeout=120):
         conexiones = conexiones.filter(user=usuario)
 
     for c in conexiones:
-        print(f"[DEBUG] Eliminando conexión huérfana: {c.user.username} cam{c.cam_index}")
+        logger.debug("Eliminando conexión huérfana: %s cam%s", c.user.username, c.cam_index)
         notificar_camara_eliminada(c.user, c.cam_index)
 
     cantidad = conexiones.count()
     conexiones.delete()
-    print(f"[DEBUG] Total conexiones huérfanas eliminadas: {cantidad}")
+    logger.debug("Total conexiones huérfanas eliminadas: %s", cantidad)
     return cantidad
 
 
@@ -217,6 +291,7 @@ def reconciliar_estado_canal(user):
             notificar_estado_canal(user)
 
 
+@agrupar_notificaciones
 def notificar_estado_inicial_usuario(user):
     """
     Reenvía el estado real de todas las cámaras y del canal.
@@ -241,7 +316,7 @@ def iniciar_transmision_usuario(user):
     if canal.en_vivo:
         return  # ya está en vivo, no reiniciar nada
 
-    print(f"[DEBUG] INICIANDO transmisión de {user.username}")
+    logger.debug("INICIANDO transmisión de %s", user.username)
 
     start_program_hls(user)
 
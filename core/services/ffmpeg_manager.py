@@ -7,16 +7,75 @@ FFMPEG MANAGER - V_SWITCH_STABLE_720P
 ✔ HLS maestro en COPY (sin doble encode)
 ✔ Aguanta muchos switches seguidos
 ✔ Optimizado para VPS 1 núcleo / 4GB RAM
+
+Motores de switch (settings.PROGRAM_SWITCH_ENGINE):
+  "switcher"    → un encoder persistente por canal, corte por comando (default)
+  "passthrough" → si la cámara ya llega en el perfil del programa, remux en
+                  COPY (corta en keyframe); si no, cae al switcher
+  "mezzanine"   → cada cámara READY se normaliza una vez; un empalmador
+                  persistente corta entre mezzanines en COPY por comando
+                  (ver mezzanine.py)
+  "feeder"      → legacy: un feeder nuevo por corte con overlap de 2 s
+
+HLS maestro: COPY de una sola calidad, o escalera ABR (settings.PROGRAM_HLS_ABR)
+con master playlist y una rendición por altura configurada en el Cliente.
+Además copia el programa al relay interno de las retransmisiones (UDP local).
+Empaquetado por canal: MPEG-TS de 2 s, o baja latencia (CanalTransmision.baja_latencia)
+con segmentos fMP4/CMAF de 1 s = 1 GOP del programa.
+
+La playlist del programa NUNCA se reinicia: el HLS maestro se relanza con
+append_list (sigue la numeración y marca #EXT-X-DISCONTINUITY) y nunca
+escribe #EXT-X-ENDLIST, así un cambio de fuente (radio ↔ video, crash,
+reinicio) es una discontinuidad para el reproductor y no un stream muerto.
 """
 
 import os
-import subprocess
 import time
-import threading
+import logging
 from django.conf import settings
 
-PROGRAM_HLS_PROCESSES = {}
-PROGRAM_FEEDER_PROCESSES = {}
+from core.services import perfil_programa
+from core.services.planificador import PLANIFICADOR
+from core.services.program_switcher import (
+    SWITCHER_PROCESSES,
+    ProgramSwitcher,
+    get_switcher,
+    seleccionar_o_reconstruir,
+    reconstruir_switcher,
+    stop_switcher,
+)
+from core.services.sonda_entrada import (
+    entrada_compatible,
+    sonda_cacheada,
+    precalentar_sonda,
+    olvidar_sonda,
+)
+from core.services.mezzanine import (
+    iniciar_mezzanine,
+    mezzanine_activa,
+    mezzanines_del_usuario,
+    detener_mezzanine,
+    detener_mezzanines_sobrantes,
+    iniciar_empalme,
+    cortar_empalme,
+    sumar_al_empalme,
+    quitar_del_empalme,
+    detener_empalme,
+)
+
+from core.services.procesos import (
+    RegistroProcesos,
+    esta_vivo,
+    detener,
+    detener_varios,
+    retirar_despues,
+)
+
+logger = logging.getLogger(__name__)
+
+PROGRAM_HLS_PROCESSES = RegistroProcesos("hls")
+PROGRAM_FEEDER_PROCESSES = RegistroProcesos("feeder")
+PROGRAM_RELAY_PROCESSES = RegistroProcesos("relay")
 
 
 # ============================================================
@@ -25,10 +84,8 @@ PROGRAM_FEEDER_PROCESSES = {}
 
 def start_program_hls(user):
 
-    if user.id in PROGRAM_HLS_PROCESSES:
-        proc = PROGRAM_HLS_PROCESSES[user.id]
-        if proc.poll() is None:
-            return
+    if esta_vivo(PROGRAM_HLS_PROCESSES.get(user.id)):
+        return
 
     FFMPEG_BIN = settings.FFMPEG_BIN_PATH
     RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
@@ -38,50 +95,473 @@ def start_program_hls(user):
     program_dir = os.path.join(HLS_PATH, "program")
     os.makedirs(program_dir, exist_ok=True)
 
+    alturas = _escalera_hls(user)
+    if alturas != [perfil_programa.ALTO]:
+        cmd = _comando_hls_abr(user, program_dir, alturas)
+        PROGRAM_HLS_PROCESSES.lanzar(user.id, cmd, f"/tmp/hls_{user.username}.log")
+        return
+
+    empaquetado, extension = _empaquetado_hls(user, f"{user.username}_init.mp4")
     playlist = os.path.join(program_dir, f"{user.username}.m3u8")
-    segments = os.path.join(program_dir, f"{user.username}_%05d.ts")
+    segments = os.path.join(program_dir, f"{user.username}_%05d.{extension}")
 
     cmd = [
         FFMPEG_BIN,
         "-fflags", "+genpts+discardcorrupt",
         "-use_wallclock_as_timestamps", "1",
         "-i", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}",
+        *_salida_relay(user),
+        "-map", "0:v:0",
+        "-map", "0:a:0",
         "-c", "copy",
         "-f", "hls",
-        "-hls_time", "2",
-        "-hls_list_size", "10",
-        "-hls_flags", "delete_segments+program_date_time+independent_segments",
+        *empaquetado,
         "-hls_segment_filename", segments,
         playlist,
     ]
 
-    log = open(f"/tmp/hls_{user.username}.log", "w")
-    proc = subprocess.Popen(cmd, stdout=log, stderr=log)
-    PROGRAM_HLS_PROCESSES[user.id] = proc
+    PROGRAM_HLS_PROCESSES.lanzar(user.id, cmd, f"/tmp/hls_{user.username}.log")
+
+
+def _salida_relay(user):
+    """
+    Segunda salida del HLS maestro: el programa en MPEG-TS por UDP local
+    hacia el relay de retransmisiones (sin costo si nadie escucha).
+    """
+    return [
+        "-map", "0:v:0",
+        "-map", "0:a:0",
+        "-c", "copy",
+        "-f", "mpegts",
+        f"udp://127.0.0.1:{puerto_relay(user.id)}?pkt_size=1316",
+    ]
+
+
+def reiniciar_program_hls(user):
+    """
+    Relanza SOLO el HLS maestro (cambió la fuente o el empaquetado).
+    Por append_list la playlist sigue donde estaba, con una discontinuidad.
+    """
+    detener(PROGRAM_HLS_PROCESSES.pop(user.id))
+    start_program_hls(user)
+
+
+def _empaquetado_hls(user, init_filename):
+    """
+    Opciones del muxer HLS según el canal y extensión de los segmentos.
+    Baja latencia: fMP4/CMAF de 1 s (el GOP del programa es de 1 s, así
+    que cada segmento empieza en keyframe) y una ventana corta para que
+    el reproductor arranque pegado al borde en vivo.
+    """
+    from core.models import CanalTransmision
+
+    baja_latencia = CanalTransmision.objects.filter(
+        usuario=user
+    ).values_list("baja_latencia", flat=True).first()
+
+    # append_list + omit_endlist: la playlist sobrevive a los relanzamientos
+    flags = "delete_segments+program_date_time+independent_segments+append_list+omit_endlist"
+
+    if baja_latencia:
+        return [
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", init_filename,
+            "-hls_time", "1",
+            "-hls_list_size", "4",
+            "-hls_flags", flags,
+        ], "m4s"
+
+    return [
+        "-hls_time", "2",
+        "-hls_list_size", "10",
+        "-hls_flags", flags,
+    ], "ts"
 
 
 # ============================================================
-# KILL CON OVERLAP
+# HLS ABR (UNA DECODIFICACIÓN, ESCALERA DE RENDICIONES)
 # ============================================================
 
-def _kill_after_delay(proc, delay):
-    def kill():
-        time.sleep(delay)
-        if proc.poll() is None:
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except Exception:
-                proc.kill()
-    threading.Thread(target=kill, daemon=True).start()
+def _escalera_hls(user):
+    """
+    Alturas del HLS maestro, de mayor a menor. [ALTO] = modo COPY.
+    Nunca hay rendiciones por encima de la fuente: el programa sale en
+    ALTO y una cámara más chica no gana nada escalada hacia arriba.
+    """
+    if not settings.PROGRAM_HLS_ABR:
+        return [perfil_programa.ALTO]
+
+    from core.models import Cliente
+
+    propias = Cliente.objects.filter(user=user).values_list("hls_renditions", flat=True).first()
+    alturas = perfil_programa.parsear_rendiciones(propias or settings.PROGRAM_HLS_RENDITIONS)
+
+    tope = _altura_fuente(user)
+    alturas = [h for h in alturas if h <= tope]
+    return alturas or [perfil_programa.ALTO]
+
+
+def _altura_fuente(user):
+    """
+    Altura útil del programa: ALTO, o la de la cámara más alta si todas
+    las sondeadas llegan más chicas. Sin sondas todavía rige ALTO (y se
+    lanzan para el próximo arranque).
+    """
+    alturas = []
+    for stream_key in _entradas_programa(user):
+        info = sonda_cacheada(stream_key)
+        if info is None:
+            precalentar_sonda(stream_key)
+            continue
+        alturas.append(int(info.get("video", {}).get("height") or 0))
+
+    if not alturas or not max(alturas):
+        return perfil_programa.ALTO
+    return min(perfil_programa.ALTO, max(alturas))
+
+
+def _filtro_escalera(alturas_encode):
+    """
+    filter_complex para las rendiciones que se codifican (todas por
+    debajo de ALTO). Las bajadas van en cascada (720 → 480 → 360), así
+    cada escalado parte de la imagen más chica disponible.
+    """
+    cadenas = []
+    origen = "[0:v:0]"
+    for i, h in enumerate(alturas_encode):
+        ancho = perfil_programa.RENDICIONES[h][0]
+        if i == len(alturas_encode) - 1:
+            cadenas.append(f"{origen}scale={ancho}:{h}[v{h}]")
+        else:
+            cadenas.append(f"{origen}scale={ancho}:{h},split=2[v{h}][c{h}]")
+            origen = f"[c{h}]"
+
+    return ";".join(cadenas)
+
+
+def _comando_hls_abr(user, program_dir, alturas):
+    """
+    Master playlist program/<username>.m3u8 + una media playlist por
+    rendición. La de ALTO (si está) va en COPY: el programa ya sale en
+    720p; las demás comparten la decodificación y alinean sus keyframes
+    con los del programa para que el reproductor cambie sin cortes.
+    """
+    FFMPEG_BIN = settings.FFMPEG_BIN_PATH
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+
+    alturas_encode = [h for h in alturas if h != perfil_programa.ALTO]
+
+    cmd = [
+        FFMPEG_BIN,
+        "-fflags", "+genpts+discardcorrupt",
+        "-use_wallclock_as_timestamps", "1",
+        "-i", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}",
+    ]
+    if alturas_encode:
+        cmd += ["-filter_complex", _filtro_escalera(alturas_encode)]
+
+    # El relay va antes: la última salida del comando es siempre la playlist
+    cmd += _salida_relay(user)
+
+    codecs = []
+    streams = []
+    for i, h in enumerate(alturas):
+        if h == perfil_programa.ALTO:
+            cmd += ["-map", "0:v:0"]
+            codecs += [f"-c:v:{i}", "copy"]
+        else:
+            _, bitrate, maxrate, bufsize = perfil_programa.RENDICIONES[h]
+            cmd += ["-map", f"[v{h}]"]
+            codecs += [
+                f"-c:v:{i}", "libx264",
+                f"-preset:v:{i}", "veryfast",
+                f"-tune:v:{i}", "zerolatency",
+                f"-pix_fmt:v:{i}", "yuv420p",
+                f"-b:v:{i}", bitrate,
+                f"-maxrate:v:{i}", maxrate,
+                f"-bufsize:v:{i}", bufsize,
+                # Keyframes donde los tiene el programa → segmentos alineados
+                f"-force_key_frames:v:{i}", "source",
+            ]
+        cmd += ["-map", "0:a:0"]
+        streams.append(f"v:{i},a:{i},name:{h}p")
+
+    empaquetado, extension = _empaquetado_hls(user, f"{user.username}_%v_init.mp4")
+
+    cmd += [
+        *codecs,
+        "-c:a", "copy",
+        "-f", "hls",
+        *empaquetado,
+        "-master_pl_name", f"{user.username}.m3u8",
+        "-var_stream_map", " ".join(streams),
+        "-hls_segment_filename", os.path.join(program_dir, f"{user.username}_%v_%05d.{extension}"),
+        os.path.join(program_dir, f"{user.username}_%v.m3u8"),
+    ]
+    return cmd
 
 
 # ============================================================
-# SWITCH DE CÁMARA (ENCODE DEFINITIVO 720P ESTABLE)
+# RELAY INTERNO PARA RETRANSMISIONES
 # ============================================================
+#
+#   HLS maestro ──UDP mpegts──► relay ──RTMP──► /<RESTREAM_RELAY_APP>/<username>
+#                127.0.0.1:PUERTO_BASE+user_id           └─► tee del canal (todas las plataformas)
+#
+# El socket UDP del relay sigue abierto aunque el HLS maestro se relance
+# (radio ↔ video, baja latencia) o cambie quien publica en
+# /program_switch: la publicación RTMP del relay no se corta y las
+# retransmisiones leen en vivo sin pedir playlists por HTTP. Los
+# timestamps se rehacen con el reloj al llegar, así un relanzamiento
+# del maestro no los hace retroceder.
+
+def puerto_relay(user_id):
+    return settings.RESTREAM_RELAY_PUERTO_BASE + user_id
+
+
+def url_relay(user):
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+    return f"rtmp://{RTMP_HOST}:{RTMP_PORT}/{settings.RESTREAM_RELAY_APP}/{user.username}"
+
+
+def asegurar_relay(user):
+    """Arranca el relay del usuario si no está corriendo (lo piden las retransmisiones)."""
+    if esta_vivo(PROGRAM_RELAY_PROCESSES.get(user.id)):
+        return
+
+    cmd = [
+        settings.FFMPEG_BIN_PATH,
+        "-fflags", "+genpts+discardcorrupt",
+        "-use_wallclock_as_timestamps", "1",
+        "-i", f"udp://127.0.0.1:{puerto_relay(user.id)}?fifo_size=1000000&overrun_nonfatal=1",
+        "-map", "0:v:0",
+        "-map", "0:a:0",
+        "-c", "copy",
+        "-f", "flv",
+        url_relay(user),
+    ]
+
+    PROGRAM_RELAY_PROCESSES.lanzar(user.id, cmd, f"/tmp/relay_{user.username}.log")
+
+
+# ============================================================
+# SWITCH DE CÁMARA
+# ============================================================
+
+def _entradas_programa(user):
+    """stream_keys de todas las cámaras autorizadas que pueden salir al aire."""
+    from core.models import StreamConnection
+
+    return list(
+        StreamConnection.objects.filter(
+            user=user,
+            authorized=True,
+            status__in=[
+                StreamConnection.Status.READY,
+                StreamConnection.Status.ON_AIR,
+            ],
+        ).order_by("cam_index").values_list("stream_key", flat=True)
+    )
+
 
 def switch_program_camera(user, stream_key):
 
+    engine = settings.PROGRAM_SWITCH_ENGINE
+
+    if engine == "feeder":
+        _switch_con_feeder(user, stream_key)
+        return
+
+    if engine == "passthrough" and entrada_compatible(stream_key):
+        stop_switcher(user)
+        _switch_con_copia(user, stream_key)
+        return
+
+    if engine == "mezzanine" and mezzanine_activa(stream_key):
+        if not cortar_empalme(user, stream_key):
+            # Primer corte o el empalmador cayó: /program_switch tiene que quedar libre
+            detener_fuente_programa(user)
+            iniciar_empalme(user, mezzanines_del_usuario(user), stream_key)
+        return
+
+    # Ni el feeder legacy ni el empalmador pueden convivir con el switcher en /program_switch
+    _stop_feeder(user)
+    if engine == "mezzanine":
+        detener_empalme(user)
+
+    entradas = _entradas_programa(user)
+    if stream_key not in entradas:
+        entradas.append(stream_key)
+
+    seleccionar_o_reconstruir(user, entradas, stream_key, _clip_radio(user))
+
+
+def actualizar_entradas_programa(user):
+    """
+    Sincroniza las entradas del switcher con las cámaras autorizadas.
+    Se llama cuando una cámara pasa a READY o se cierra: es el ÚNICO
+    momento en que un switcher sano se reconstruye. Uno registrado pero
+    muerto se recupera desde la cámara ON_AIR.
+    """
+    proceso = SWITCHER_PROCESSES.get(user.id)
+    if proceso is None:
+        return  # el programa no sale por el switcher (feeder, copia, radio)
+
+    if not esta_vivo(proceso):
+        recuperar_switcher(user, proceso)
+        return
+
+    switcher = ProgramSwitcher(user, proceso)
+    entradas = _entradas_programa(user)
+    if tuple(entradas) == switcher.stream_keys:
+        return
+
+    if switcher.stream_key_activa not in entradas:
+        # La cámara al aire se fue: stream_finalizado decide si se corta todo
+        stop_switcher(user)
+        return
+
+    reconstruir_switcher(
+        user, entradas, switcher.stream_key_activa, _clip_radio(user), switcher.modo_radio
+    )
+
+
+def recuperar_switcher(user, caido):
+    """
+    El switcher `caido` terminó o dejó de avanzar: se reconstruye desde
+    la base, con la cámara ON_AIR al aire y las demás cámaras conectadas
+    como entradas. Si murió apenas arrancado, alguna entrada lo está
+    tirando al abrir: vuelve solo con la cámara al aire y el resto se
+    suma en el próximo cambio de entradas o corte.
+    """
+    from core.models import CanalTransmision, StreamConnection
+
+    actual = SWITCHER_PROCESSES.get(user.id)
+    if actual is not None and actual.pid != caido.pid:
+        return None  # otro worker ya lo reconstruyó
+
+    stop_switcher(user)
+
+    canal = CanalTransmision.objects.filter(usuario=user).first()
+    activa = StreamConnection.objects.filter(
+        user=user,
+        authorized=True,
+        status=StreamConnection.Status.ON_AIR,
+    ).values_list("stream_key", flat=True).first()
+
+    if not canal or not canal.en_vivo or not activa:
+        return None
+
+    # En radio solo si el clip iba en este switcher (si no, es del feeder de radio)
+    radio = _clip_radio(user)
+    if canal.modo_radio and not (caido.meta.get("modo_radio") and radio):
+        return None
+
+    entradas = _entradas_programa(user)
+    vivio = time.time() - caido.meta.get("inicio", 0)
+    if vivio < settings.SWITCHER_ARRANQUE_MINIMO and entradas != [activa]:
+        logger.warning(
+            f"[SWITCHER] {user.username}: cayó a los {vivio:.0f}s de arrancar, "
+            f"se reconstruye solo con {activa}"
+        )
+        entradas = [activa]
+
+    return reconstruir_switcher(user, entradas, activa, radio, canal.modo_radio)
+
+
+def _clip_radio(user):
+    """Clip de radio del canal si ya está en cache: entra al switcher como una entrada más."""
+    from core.models import CanalTransmision
+    from core.services.radio_manager import clip_cacheado
+
+    canal = CanalTransmision.objects.filter(usuario=user).first()
+    return clip_cacheado(canal.get_imagen_radio()) if canal else None
+
+
+def radio_por_switcher(user, stream_key, modo_radio):
+    """
+    Radio ↔ video como un corte del switcher al aire (audio de stream_key).
+    Si el switcher se armó sin el clip, se reconstruye con él: misma
+    salida, el HLS maestro sigue. False si el programa no sale por el
+    switcher: la radio va por su feeder.
+    """
+    from core.services.radio_manager import clip_radio, imagen_del_canal
+
+    switcher = get_switcher(user)
+    if switcher is None:
+        return False
+
+    stream_key = stream_key or switcher.stream_key_activa
+    if not stream_key:
+        return False
+    if switcher.cambiar_modo_radio(modo_radio, stream_key):
+        return True
+
+    # Se codifica acá si hace falta, igual que el feeder de radio
+    radio = clip_radio(imagen_del_canal(user)) if modo_radio else _clip_radio(user)
+    entradas = _entradas_programa(user)
+    if stream_key not in entradas:
+        entradas.append(stream_key)
+    reconstruir_switcher(user, entradas, stream_key, radio, modo_radio)
+    return True
+
+
+def camara_autorizada(user, stream_key):
+    """
+    Hook: la cámara pasó a READY. La mezzanine y la reconstrucción del
+    switcher (que espera la salida del viejo) corren en el planificador:
+    el request vuelve enseguida.
+    """
+    PLANIFICADOR.programar(("camara", stream_key), 0, _preparar_camara, user.id, stream_key)
+
+
+def camara_cerrada(user, stream_key):
+    """Hook: la cámara se desconectó o fue cerrada desde el panel (ver camara_autorizada)."""
+    olvidar_sonda(stream_key)
+    # Misma clave: si la cámara se autorizó y se cerró enseguida, gana el cierre
+    PLANIFICADOR.programar(("camara", stream_key), 0, _retirar_camara, user.id, stream_key)
+
+
+def _preparar_camara(user_id, stream_key):
+    user = _usuario(user_id)
+    if user is None:
+        return
+    engine = settings.PROGRAM_SWITCH_ENGINE
+    # La sonda también acota la escalera ABR (_altura_fuente)
+    if engine == "passthrough" or settings.PROGRAM_HLS_ABR:
+        precalentar_sonda(stream_key)
+    elif engine == "mezzanine" and iniciar_mezzanine(user, stream_key):
+        sumar_al_empalme(user, stream_key)
+    actualizar_entradas_programa(user)
+
+
+def _retirar_camara(user_id, stream_key):
+    user = _usuario(user_id)
+    if user is None:
+        return
+    quitar_del_empalme(user, stream_key)
+    detener_mezzanine(stream_key)
+    actualizar_entradas_programa(user)
+
+
+def _usuario(user_id):
+    from django.contrib.auth.models import User
+    return User.objects.filter(pk=user_id).first()
+
+
+def liberar_camaras_desautorizadas(user):
+    """Hook: fin de transmisión, las cámaras perdieron la autorización."""
+    detener_mezzanines_sobrantes(user, _entradas_programa(user))
+
+
+# ============================================================
+# FEEDER LEGACY (ENCODE DEFINITIVO 720P ESTABLE)
+# ============================================================
+
+def _switch_con_feeder(user, stream_key):
+
     old = PROGRAM_FEEDER_PROCESSES.get(user.id)
 
     FFMPEG_BIN = settings.FFMPEG_BIN_PATH
@@ -91,11 +571,6 @@ def switch_program_camera(user, stream_key):
     input_rtmp = f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}"
     output_rtmp = f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}"
 
-    letterbox = (
-        "scale=1280:720:force_original_aspect_ratio=decrease,"
-        "pad=1280:720:(ow-iw)/2:(oh-ih)/2:black"
-    )
-
     cmd = [
         FFMPEG_BIN,
 
@@ -104,31 +579,12 @@ def switch_program_camera(user, stream_key):
         "-i", input_rtmp,
 
         # ================= VIDEO =================
-        "-vf", letterbox,
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-profile:v", "high",
-        "-level", "4.1",
-        "-tune", "zerolatency",
-        "-pix_fmt", "yuv420p",
-        "-r", "30",
-
-        # 🔥 CLAVE PARA ESTABILIDAD DE SWITCH
-        "-g", "30",
-        "-keyint_min", "30",
-        "-sc_threshold", "0",
+        "-vf", perfil_programa.LETTERBOX,
+        *perfil_programa.ARGS_VIDEO,
         "-force_key_frames", "expr:gte(t,0)",
 
-        # Calidad real 720p
-        "-b:v", "4200k",
-        "-maxrate", "4500k",
-        "-bufsize", "9000k",
-
         # ================= AUDIO =================
-        "-c:a", "aac",
-        "-b:a", "128k",
-        "-ar", "44100",
-        "-ac", "2",
+        *perfil_programa.ARGS_AUDIO,
         "-af", "aresample=async=1:first_pts=0",
 
         "-map", "0:v:0",
@@ -138,29 +594,76 @@ def switch_program_camera(user, stream_key):
         output_rtmp,
     ]
 
-    log = open(f"/tmp/feeder_{user.username}.log", "w")
-    proc = subprocess.Popen(cmd, stdout=log, stderr=log)
-
-    PROGRAM_FEEDER_PROCESSES[user.id] = proc
+    PROGRAM_FEEDER_PROCESSES.lanzar(user.id, cmd, f"/tmp/feeder_{user.username}.log")
 
     # Overlap 2 segundos para switch suave
-    if old and old.poll() is None:
-        _kill_after_delay(old, 2)
+    if esta_vivo(old):
+        retirar_despues(old, 2)
 
 
 # ============================================================
-# STOP
+# PASSTHROUGH (COPY, SIN ENCODE)
 # ============================================================
 
-def stop_program_hls(user):
+def _switch_con_copia(user, stream_key):
+    """
+    Remux puro /live → /program_switch. FFmpeg en stream copy descarta
+    los paquetes previos al primer keyframe, así que el corte siempre
+    entra en un keyframe de la cámara nueva. Sin overlap: nginx-rtmp
+    rechaza un segundo publicador en /program_switch, así que el viejo
+    sale antes de lanzar el nuevo.
+    """
+    _stop_feeder(user)
 
-    feeder = PROGRAM_FEEDER_PROCESSES.get(user.id)
-    if feeder and feeder.poll() is None:
-        feeder.terminate()
+    FFMPEG_BIN = settings.FFMPEG_BIN_PATH
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+
+    cmd = [
+        FFMPEG_BIN,
+        "-fflags", "+genpts",
+        "-i", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}",
+        "-map", "0:v:0",
+        "-map", "0:a:0",
+        "-c", "copy",
+        "-f", "flv",
+        f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}",
+    ]
+
+    PROGRAM_FEEDER_PROCESSES.lanzar(user.id, cmd, f"/tmp/feeder_{user.username}.log")
 
-    hls = PROGRAM_HLS_PROCESSES.get(user.id)
-    if hls and hls.poll() is None:
-        hls.terminate()
 
-    PROGRAM_FEEDER_PROCESSES.pop(user.id, None)
-    PROGRAM_HLS_PROCESSES.pop(user.id, None)
\ No newline at end of file
+def _stop_feeder(user):
+    # Espera a que salga: el próximo publicador necesita el slot de nginx
+    detener(PROGRAM_FEEDER_PROCESSES.pop(user.id))
+
+
+def detener_fuente_programa(user):
+    """Libera /program_switch: corta feeder legacy, switcher y empalmador."""
+    detener_varios(
+        [PROGRAM_FEEDER_PROCESSES.pop(user.id), SWITCHER_PROCESSES.pop(user.id)],
+        salida="q",
+    )
+    detener_empalme(user)
+
+
+# ============================================================
+# STOP
+# ============================================================
+
+def stop_program_hls(user):
+    """
+    Corta feeder, switcher, empalmador, HLS maestro y relay en paralelo y
+    SIN bloquear: el escalamiento SIGTERM → SIGKILL y el reap siguen en el loop.
+    """
+    detener_varios(
+        [
+            PROGRAM_FEEDER_PROCESSES.pop(user.id),
+            SWITCHER_PROCESSES.pop(user.id),
+            PROGRAM_HLS_PROCESSES.pop(user.id),
+            PROGRAM_RELAY_PROCESSES.pop(user.id),
+        ],
+        salida="q",
+        esperar=False,
+    )
+    detener_empalme(user, esperar=False)
\ No newline at end of file
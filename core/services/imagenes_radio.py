@@ -0,0 +1,312 @@
+"""
+IMÁGENES DE RADIO
+=================
+Las imágenes que suben los usuarios se normalizan UNA vez, fuera del
+request, a lo que consume el feeder de radio:
+
+  subida (PNG/WebP/JPEG, cualquier tamaño)
+      └─► worker ─► radio_images/<sha256>.jpg        1280x720 letterbox, 4:2:0
+                  └► radio_images/<sha256>_mini.jpg  320x180 para el panel
+
+Almacenamiento direccionado por contenido: el nombre es el hash de la
+subida, así que dos usuarios (o dos subidas) con la misma imagen
+comparten archivos y la segunda no cuesta nada.
+
+Como los archivos se comparten, asignar una imagen y liberar la anterior
+van bajo un flock de radio_images/ (entre workers): el que libera no
+puede borrar una imagen que otro canal está por asignarse.
+
+Mientras se procesa, la subida espera en radio_images/entrantes/ con el
+nombre <user_id>_<sha256>.<pid>.<ext>; cualquier worker ve así qué
+usuarios tienen una imagen pendiente, y el pid dice qué proceso la tiene
+en su cola. Si ese proceso muere con la cola a medias, el próximo que
+arranca las reclama (reanudar_imagenes_pendientes).
+"""
+
+import os
+import time
+import glob
+import fcntl
+import queue
+import hashlib
+import tempfile
+import threading
+import subprocess
+import logging
+import contextlib
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.services import perfil_programa
+
+logger = logging.getLogger(__name__)
+
+MINIATURA_ANCHO = 320
+MINIATURA_ALTO = 180
+
+# Subidas a medio escribir (.subiendo_*) de un proceso que murió
+SUBIDA_ABANDONADA_SEGUNDOS = 3600
+
+_COLA = queue.Queue()
+_WORKER = None
+_WORKER_LOCK = threading.Lock()
+
+
+def _directorio():
+    return os.path.join(settings.MEDIA_ROOT, "radio_images")
+
+
+def _entrantes():
+    return os.path.join(_directorio(), "entrantes")
+
+
+def ruta_imagen(digest):
+    return os.path.join(_directorio(), f"{digest}.jpg")
+
+
+def ruta_miniatura(digest):
+    return os.path.join(_directorio(), f"{digest}_mini.jpg")
+
+
+@contextlib.contextmanager
+def _bloqueo():
+    """Exclusión entre procesos para asignar y liberar imágenes compartidas."""
+    os.makedirs(_directorio(), exist_ok=True)
+    with open(os.path.join(_directorio(), ".bloqueo"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def url_preview(imagen_path):
+    """URL para el panel: la miniatura si existe, si no la imagen (subidas viejas)."""
+    nombre = os.path.basename(imagen_path)
+    digest, extension = os.path.splitext(nombre)
+    if extension == ".jpg" and os.path.isfile(ruta_miniatura(digest)):
+        nombre = os.path.basename(ruta_miniatura(digest))
+    return f"{settings.MEDIA_URL}radio_images/{nombre}"
+
+
+# ============================================================
+# SUBIDA
+# ============================================================
+
+def recibir_imagen(user, archivo):
+    """
+    Guarda la subida y encola su normalización.
+    Devuelve True si la imagen ya estaba normalizada (deduplicada) y
+    quedó asignada en el acto; False si queda procesándose.
+    """
+    os.makedirs(_entrantes(), exist_ok=True)
+
+    extension = archivo.name.rsplit(".", 1)[-1].lower()
+    # Nombre único por subida: dos subidas a la vez (mismo usuario, otra
+    # pestaña u otro worker) no se pisan. El punto inicial la deja fuera
+    # de imagen_pendiente hasta que termina de escribirse.
+    fd, temporal = tempfile.mkstemp(prefix=".subiendo_", suffix=f".{extension}", dir=_entrantes())
+
+    h = hashlib.sha256()
+    with os.fdopen(fd, "wb") as f:
+        for chunk in archivo.chunks():
+            h.update(chunk)
+            f.write(chunk)
+    digest = h.hexdigest()
+
+    if _asignar(user.id, digest):
+        os.remove(temporal)
+        logger.info(f"[RADIO] Imagen de {user.username} deduplicada ({digest[:12]})")
+        return True
+
+    pendiente = _ruta_pendiente(user.id, digest, extension)
+    os.replace(temporal, pendiente)
+
+    _encolar(user.id, digest, pendiente)
+    return False
+
+
+def imagen_pendiente(user):
+    return bool(glob.glob(os.path.join(_entrantes(), f"{user.id}_*")))
+
+
+def _ruta_pendiente(user_id, digest, extension):
+    return os.path.join(_entrantes(), f"{user_id}_{digest}.{os.getpid()}.{extension}")
+
+
+def _encolar(user_id, digest, pendiente):
+    _iniciar_worker()
+    _COLA.put((user_id, digest, pendiente))
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reanudar_imagenes_pendientes():
+    """
+    Al arrancar: las pendientes de un proceso muerto se reclaman y se
+    vuelven a encolar (una por usuario, la más nueva; las anteriores ya
+    no se iban a ver). Las subidas abandonadas a medio escribir se borran.
+    """
+    try:
+        nombres = os.listdir(_entrantes())
+    except FileNotFoundError:
+        return
+
+    ahora = time.time()
+    huerfanas = {}   # user_id -> [(mtime, ruta, digest, extension)]
+
+    for nombre in nombres:
+        ruta = os.path.join(_entrantes(), nombre)
+
+        if nombre.startswith(".subiendo_"):
+            try:
+                if ahora - os.path.getmtime(ruta) > SUBIDA_ABANDONADA_SEGUNDOS:
+                    os.remove(ruta)
+            except OSError:
+                pass
+            continue
+
+        # <user_id>_<sha256>.<pid>.<ext> (o <user_id>_<sha256>.<ext>, sin dueño)
+        user_id, _, resto = nombre.partition("_")
+        partes = resto.split(".")
+        if not user_id.isdigit() or len(partes) not in (2, 3):
+            continue
+        dueno = int(partes[1]) if len(partes) == 3 and partes[1].isdigit() else None
+        if dueno is not None and dueno != os.getpid() and _proceso_vivo(dueno):
+            continue  # sigue en la cola de otro worker
+
+        try:
+            mtime = os.path.getmtime(ruta)
+        except OSError:
+            continue
+        huerfanas.setdefault(int(user_id), []).append((mtime, ruta, partes[0], partes[-1]))
+
+    for user_id, pendientes in huerfanas.items():
+        pendientes.sort()
+        *viejas, (_, ruta, digest, extension) = pendientes
+        for _, vieja, _, _ in viejas:
+            try:
+                os.remove(vieja)
+            except OSError:
+                pass
+
+        # El rename es el reclamo: si otro worker que arrancaba a la vez
+        # ganó, el archivo ya no está y no se encola dos veces
+        propia = _ruta_pendiente(user_id, digest, extension)
+        try:
+            os.rename(ruta, propia)
+        except FileNotFoundError:
+            continue
+        logger.info(f"[RADIO] Imagen pendiente de user {user_id} reanudada ({digest[:12]})")
+        _encolar(user_id, digest, propia)
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+def _iniciar_worker():
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None or not _WORKER.is_alive():
+            _WORKER = threading.Thread(target=_procesar_cola, name="imagenes-radio", daemon=True)
+            _WORKER.start()
+
+
+def _procesar_cola():
+    while True:
+        user_id, digest, origen = _COLA.get()
+        try:
+            # Si otro canal libera la imagen entre normalizar y asignar,
+            # _asignar no la encuentra y se vuelve a normalizar
+            while not _asignar(user_id, digest):
+                normalizar(origen, digest)
+        except Exception as e:
+            logger.error(f"[RADIO] No se pudo normalizar la imagen de user {user_id}: {e}")
+        finally:
+            try:
+                os.remove(origen)
+            except OSError:
+                pass
+            # Hilo propio: la conexión a la base no la cierra ningún request
+            close_old_connections()
+            _COLA.task_done()
+
+
+def normalizar(origen, digest):
+    """Imagen 1280x720 lista para el encoder + miniatura, en una sola pasada de FFmpeg."""
+    imagen = ruta_imagen(digest)
+    miniatura = ruta_miniatura(digest)
+
+    filtro = (
+        f"[0:v]{perfil_programa.LETTERBOX},setsar=1,format=yuvj420p,split=2[img][mini];"
+        f"[mini]scale={MINIATURA_ANCHO}:{MINIATURA_ALTO}[minis]"
+    )
+
+    cmd = [
+        settings.FFMPEG_BIN_PATH,
+        "-y",
+        "-i", origen,
+        "-filter_complex", filtro,
+        "-map", "[img]", "-frames:v", "1", "-q:v", "2", f"{imagen}.tmp.jpg",
+        "-map", "[minis]", "-frames:v", "1", "-q:v", "5", f"{miniatura}.tmp.jpg",
+    ]
+
+    resultado = subprocess.run(cmd, capture_output=True, timeout=60)
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr.decode(errors="replace")[-300:])
+
+    # La miniatura primero: la imagen es la que marca "ya normalizada"
+    os.replace(f"{miniatura}.tmp.jpg", miniatura)
+    os.replace(f"{imagen}.tmp.jpg", imagen)
+    logger.info(f"[RADIO] Imagen normalizada {digest[:12]}")
+
+
+def _asignar(user_id, digest):
+    """
+    Asigna la imagen normalizada al canal. False si no existe (todavía no
+    se normalizó o alguien la acaba de liberar): no se asigna nada.
+    """
+    from core.models import CanalTransmision
+    from core.services.radio_manager import precalentar_clip_radio
+
+    imagen = ruta_imagen(digest)
+    with _bloqueo():
+        if not os.path.isfile(imagen):
+            return False
+        canal, _ = CanalTransmision.objects.get_or_create(usuario_id=user_id)
+        anterior = canal.radio_imagen_path
+        canal.radio_imagen_path = imagen
+        canal.save(update_fields=["radio_imagen_path"])
+
+    if anterior and anterior != imagen:
+        liberar_imagen(anterior)
+
+    precalentar_clip_radio(imagen)
+    return True
+
+
+def liberar_imagen(imagen_path):
+    """Borra la imagen (y su miniatura) si ningún canal la sigue usando."""
+    from core.models import CanalTransmision
+
+    if os.path.dirname(imagen_path) != _directorio():
+        return  # no es una subida (p.ej. la imagen por defecto de settings)
+
+    digest = os.path.splitext(os.path.basename(imagen_path))[0]
+    with _bloqueo():
+        if CanalTransmision.objects.filter(radio_imagen_path=imagen_path).exists():
+            return
+        for ruta in (imagen_path, ruta_miniatura(digest)):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
@@ -1,7 +1,10 @@
 import os
 import glob
+import logging
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 def limpiar_hls_usuario(username):
     """
@@ -17,6 +20,9 @@ def limpiar_hls_usuario(username):
     patrones = [
         f"{username}.m3u8",
         f"{username}_*.ts",
+        f"{username}_*.m3u8",
+        f"{username}_*.m4s",
+        f"{username}_*.mp4",
     ]
 
     eliminados = 0
@@ -28,6 +34,6 @@ def limpiar_hls_usuario(username):
                 os.remove(archivo)
                 eliminados += 1
             except Exception as e:
-                print(f"[WARN] No se pudo borrar {archivo}: {e}")
+                logger.warning("No se pudo borrar %s: %s", archivo, e)
 
-    print(f"[DEBUG] HLS limpiado para {username}: {eliminados} archivos")
+    logger.debug("HLS limpiado para %s: %s archivos", username, eliminados)
@@ -0,0 +1,261 @@
+"""
+MÉTRICAS (FORMATO PROMETHEUS)
+=============================
+Contadores e histogramas del plano de control, expuestos en /metrics:
+
+  SWITCH_SEGUNDOS.observar(0.84)
+  HOOK_SEGUNDOS.observar(0.012, "validar_publicacion")
+  WS_MENSAJES.inc("estado_camaras")
+
+Pensado para quedar prendido en producción: cada thread escribe en su
+propio shard (threading.local), así un inc() o un observar() no toma
+ningún lock ni compite con los otros threads del worker. Solo la
+lectura de /metrics recorre y suma todos los shards.
+
+Los valores son del proceso que los sirve: con N workers daphne cada
+uno expone los suyos (Prometheus los suma por instancia). Lo que vale
+para todo el sistema (procesos FFmpeg vivos, fallas de retransmisión)
+se calcula al leer, con recolectores (ver registrar_recolector).
+"""
+
+import time
+import bisect
+import functools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latencias de control: de hooks de milisegundos a switches de segundos
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Metrica:
+    """Base: shards por thread, etiquetas como tupla de valores."""
+
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()   # solo al crear el shard de un thread
+        _METRICAS.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # El shard sobrevive al thread: un contador nunca retrocede
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _etiquetas(self, valores, **extra):
+        return _formatear(dict(zip(self.etiquetas, valores), **extra))
+
+    def _cabecera(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+
+    tipo = "counter"
+
+    def inc(self, *etiquetas, valor=1):
+        shard = self._shard()
+        shard[etiquetas] = shard.get(etiquetas, 0) + valor
+
+    def exponer(self):
+        total = {}
+        for shard in list(self._shards):
+            for etiquetas, valor in list(shard.items()):
+                total[etiquetas] = total.get(etiquetas, 0) + valor
+
+        lineas = self._cabecera()
+        for etiquetas, valor in sorted(total.items()):
+            lineas.append(f"{self.nombre}{self._etiquetas(etiquetas)} {valor}")
+        return lineas
+
+
+class Histograma(_Metrica):
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, *etiquetas):
+        shard = self._shard()
+        serie = shard.get(etiquetas)
+        if serie is None:
+            # [conteo por bucket (+Inf al final), suma]
+            serie = shard[etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect.bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+    def exponer(self):
+        total = {}
+        for shard in list(self._shards):
+            for etiquetas, (conteos, suma) in list(shard.items()):
+                acumulado = total.setdefault(etiquetas, [[0] * len(conteos), 0.0])
+                for i, n in enumerate(conteos):
+                    acumulado[0][i] += n
+                acumulado[1] += suma
+
+        limites = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        lineas = self._cabecera()
+        for etiquetas, (conteos, suma) in sorted(total.items()):
+            acumulado = 0
+            for limite, n in zip(limites, conteos):
+                acumulado += n
+                lineas.append(f"{self.nombre}_bucket{self._etiquetas(etiquetas, le=limite)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{self._etiquetas(etiquetas)} {suma}")
+            lineas.append(f"{self.nombre}_count{self._etiquetas(etiquetas)} {acumulado}")
+        return lineas
+
+
+def _formatear(etiquetas):
+    """{"hook": "x"} -> '{hook="x"}' (vacío sin etiquetas)."""
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{k}="{_escapar(str(v))}"' for k, v in etiquetas.items())
+    return "{" + pares + "}"
+
+
+def _escapar(texto):
+    return texto.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ============================================================
+# REGISTRO
+# ============================================================
+
+_METRICAS = []
+_RECOLECTORES = []
+
+
+def registrar_recolector(funcion):
+    """
+    funcion() -> [(nombre, tipo, ayuda, [(etiquetas dict, valor)])], se
+    llama en cada lectura de /metrics (valores que no viven en memoria).
+    """
+    _RECOLECTORES.append(funcion)
+    return funcion
+
+
+def medir(histograma, *etiquetas):
+    """Decorador: observa en el histograma la duración de cada llamada."""
+    def decorar(funcion):
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                histograma.observar(time.perf_counter() - inicio, *etiquetas)
+        return envuelta
+    return decorar
+
+
+def exponer():
+    """Texto del formato de exposición de Prometheus (0.0.4)."""
+    lineas = []
+    for metrica in _METRICAS:
+        lineas += metrica.exponer()
+
+    for recolector in _RECOLECTORES:
+        try:
+            series = recolector()
+        except Exception:
+            # Un recolector caído (supervisor o base) no tira el resto
+            logger.exception(f"[METRICAS] Falló el recolector {recolector.__name__}")
+            continue
+        for nombre, tipo, ayuda, muestras in series:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_formatear(etiquetas)} {valor}")
+
+    return "\n".join(lineas) + "\n"
+
+
+# ============================================================
+# MÉTRICAS DEL PLANO DE CONTROL
+# ============================================================
+
+SWITCH_SEGUNDOS = Histograma(
+    "streaming_switch_segundos",
+    "Duración de poner_camara_al_aire (switch de cámara)",
+)
+
+HOOK_SEGUNDOS = Histograma(
+    "streaming_hook_segundos",
+    "Duración de los hooks de nginx-rtmp",
+    etiquetas=("hook",),
+)
+
+WS_MENSAJES = Contador(
+    "streaming_ws_mensajes_total",
+    "Mensajes enviados a los paneles por WebSocket, por tipo",
+    etiquetas=("tipo",),
+)
+
+LOGS_DESCARTADOS = Contador(
+    "streaming_logs_descartados_total",
+    "Registros de log descartados con la cola de la bitácora llena, por nivel",
+    etiquetas=("nivel",),
+)
+
+CONSULTAS_POR_REQUEST = Histograma(
+    "streaming_consultas_db_por_request",
+    "Consultas SQL ejecutadas por request HTTP",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+
+
+# ============================================================
+# RECOLECTORES (se calculan al leer)
+# ============================================================
+
+@registrar_recolector
+def _procesos_ffmpeg():
+    from core.services.procesos import telemetria
+
+    por_rol = {}
+    for proceso in telemetria(ultimas=1):
+        por_rol[proceso["rol"]] = por_rol.get(proceso["rol"], 0) + 1
+    return [(
+        "streaming_procesos_ffmpeg",
+        "gauge",
+        "Procesos FFmpeg vivos por rol",
+        [({"rol": rol}, n) for rol, n in sorted(por_rol.items())],
+    )]
+
+
+@registrar_recolector
+def _fallas_retransmision():
+    # Desde la base: cuenta igual sin importar qué proceso detectó la falla
+    # (worker en modo local, daemon media_supervisor en modo supervisor).
+    # Es gauge, no counter: son las filas que hay hoy y baja cuando se
+    # borran retransmisiones (o sus usuarios); rate() la leería como reinicio
+    from django.db.models import Count
+    from multistream.models import EstadoRetransmision, IntentoRetransmision
+
+    caidas = (
+        IntentoRetransmision.objects.values_list("retransmision__plataforma")
+        .annotate(n=Count("id")).order_by()
+    )
+    errores = (
+        EstadoRetransmision.objects.filter(estado="error")
+        .values_list("plataforma").annotate(n=Count("id")).order_by()
+    )
+    return [(
+        "streaming_retransmision_fallas",
+        "gauge",
+        "Fallas de retransmisión registradas en la base: caídas reintentadas y errores definitivos",
+        [({"plataforma": p, "tipo": "caida"}, n) for p, n in caidas]
+        + [({"plataforma": p, "tipo": "error"}, n) for p, n in errores],
+    )]
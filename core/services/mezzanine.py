@@ -0,0 +1,198 @@
+"""
+MEZZANINE MANAGER
+=================
+Motor "mezzanine": cada cámara autorizada se normaliza UNA vez, apenas
+pasa a READY, a un stream intermedio con GOP y timebase fijos:
+
+  /live/<stream_key> ──► x264 720p30 GOP 1 s + AAC 44.1k ──► /mezzanine/<stream_key>
+
+El programa lo arma un empalmador por canal (empalme_flv.py) que lee
+todas las mezzanines del usuario y publica /program_switch en COPY. Un
+corte es un comando por stdin: sin spawn, sin handshake RTMP nuevo y sin
+overlap de publicadores; entra en el próximo keyframe (≤ 1 s).
+
+Control de admisión: nunca hay más mezzanines vivas que
+settings.MEZZANINE_MAX_PROCESOS. El cupo lo cuenta la tabla de procesos
+al lanzar (ver TablaProcesos.op_spawn), así que vale para todos los
+workers. Una cámara sin cupo sale al aire por el switcher normal.
+"""
+
+import os
+import sys
+import uuid
+import logging
+from django.conf import settings
+
+from core.services import perfil_programa, empalme_flv
+from core.services.procesos import RegistroProcesos, esta_vivo, detener
+
+logger = logging.getLogger(__name__)
+
+# stream_key -> proceso; meta = {"user_id": int}
+MEZZANINE_PROCESSES = RegistroProcesos("mezzanine")
+
+# user.id -> empalmador; meta = {"fuentes": [...], "activa": stream_key, "progress": ...}
+EMPALME_PROCESSES = RegistroProcesos("empalme")
+
+
+def mezzanine_activa(stream_key):
+    return esta_vivo(MEZZANINE_PROCESSES.get(stream_key))
+
+
+def mezzanines_del_usuario(user):
+    return [
+        stream_key
+        for stream_key, proc in MEZZANINE_PROCESSES.items()
+        if proc.meta.get("user_id") == user.id and esta_vivo(proc)
+    ]
+
+
+def iniciar_mezzanine(user, stream_key):
+    """
+    Arranca la normalización de la cámara si hay cupo.
+    Devuelve True si la mezzanine quedó (o ya estaba) corriendo.
+    """
+    FFMPEG_BIN = settings.FFMPEG_BIN_PATH
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+    APP = settings.RTMP_MEZZANINE_APP
+
+    cmd = [
+        FFMPEG_BIN,
+        "-fflags", "+genpts",
+        "-use_wallclock_as_timestamps", "1",
+        "-i", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}",
+
+        # ================= VIDEO =================
+        "-vf", f"{perfil_programa.LETTERBOX},fps={perfil_programa.FPS},setsar=1",
+        *perfil_programa.ARGS_VIDEO,
+        # Keyframe exacto cada segundo → todos los empalmes caen alineados
+        "-force_key_frames", "expr:gte(t,n_forced*1)",
+        "-fps_mode", "cfr",
+
+        # ================= AUDIO =================
+        *perfil_programa.ARGS_AUDIO,
+        "-af", "aresample=async=1:first_pts=0",
+
+        "-map", "0:v:0",
+        "-map", "0:a:0",
+
+        "-f", "flv",
+        f"rtmp://{RTMP_HOST}:{RTMP_PORT}/{APP}/{stream_key}",
+    ]
+
+    # La tabla cuenta el cupo y devuelve la que ya corría para esta cámara
+    proc = MEZZANINE_PROCESSES.lanzar(
+        stream_key,
+        cmd,
+        f"/tmp/mezzanine_{stream_key}.log",
+        meta={"user_id": user.id},
+        cupo=settings.MEZZANINE_MAX_PROCESOS,
+    )
+
+    if proc is None:
+        logger.warning(
+            f"[MEZZANINE] Sin cupo para {stream_key} "
+            f"({settings.MEZZANINE_MAX_PROCESOS} activas); usa el switcher"
+        )
+        return False
+
+    logger.info(f"[MEZZANINE] Normalizando {stream_key} (PID: {proc.pid})")
+    return True
+
+
+def detener_mezzanine(stream_key):
+    proc = MEZZANINE_PROCESSES.pop(stream_key)
+    if esta_vivo(proc):
+        logger.info(f"[MEZZANINE] Deteniendo {stream_key}")
+        detener(proc, esperar=False)
+
+
+def detener_mezzanines_sobrantes(user, stream_keys_validas):
+    """Detiene las mezzanines del usuario cuyas cámaras ya no están autorizadas."""
+    for stream_key, proc in MEZZANINE_PROCESSES.items():
+        if proc.meta.get("user_id") == user.id and stream_key not in stream_keys_validas:
+            detener_mezzanine(stream_key)
+
+
+# ============================================================
+# EMPALMADOR DEL PROGRAMA
+# ============================================================
+
+def iniciar_empalme(user, fuentes, activa):
+    """
+    Arranca el empalmador del canal con `activa` al aire. /program_switch
+    tiene que estar libre (el caller detiene switcher y feeders antes).
+    """
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+
+    fuentes = list(dict.fromkeys([activa, *fuentes]))
+    # Lo escribe el FFmpeg que publica: la telemetría y el vigía lo leen de meta
+    progreso = f"/tmp/empalme_{user.username}.{uuid.uuid4().hex[:8]}.progress"
+
+    cmd = [
+        sys.executable, os.path.abspath(empalme_flv.__file__),
+        "--ffmpeg", settings.FFMPEG_BIN_PATH,
+        "--origen", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/{settings.RTMP_MEZZANINE_APP}",
+        "--salida", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}",
+        "--progress", progreso,
+        "--activa", activa,
+        *fuentes,
+    ]
+
+    logger.info(f"[MEZZANINE] Empalmador de {user.username} | fuentes={fuentes} activa={activa}")
+    return EMPALME_PROCESSES.lanzar(
+        user.id,
+        cmd,
+        f"/tmp/empalme_{user.username}.log",
+        stdin=True,
+        meta={"fuentes": fuentes, "activa": activa, "progress": progreso},
+    )
+
+
+def _comando_empalme(user, comando):
+    proceso = EMPALME_PROCESSES.get(user.id)
+    if not esta_vivo(proceso):
+        return None
+    try:
+        proceso.enviar(f"{comando}\n")
+    except Exception as e:
+        logger.warning(f"[MEZZANINE] Empalmador de {user.username} no acepta '{comando}': {e}")
+        return None
+    return proceso
+
+
+def cortar_empalme(user, stream_key):
+    """
+    Corta el programa a la mezzanine de stream_key por comando.
+    False si no hay empalmador vivo (hay que arrancarlo).
+    """
+    proceso = _comando_empalme(user, f"c {stream_key}")
+    if proceso is None:
+        return False
+
+    fuentes = list(dict.fromkeys([*proceso.meta.get("fuentes", []), stream_key]))
+    EMPALME_PROCESSES.actualizar_meta(user.id, activa=stream_key, fuentes=fuentes)
+    logger.info(f"[MEZZANINE] Corte a {stream_key} para {user.username}")
+    return True
+
+
+def sumar_al_empalme(user, stream_key):
+    """Una mezzanine nueva queda conectada al empalmador, lista para el corte."""
+    proceso = _comando_empalme(user, f"+ {stream_key}")
+    if proceso is not None:
+        fuentes = list(dict.fromkeys([*proceso.meta.get("fuentes", []), stream_key]))
+        EMPALME_PROCESSES.actualizar_meta(user.id, fuentes=fuentes)
+
+
+def quitar_del_empalme(user, stream_key):
+    proceso = _comando_empalme(user, f"- {stream_key}")
+    if proceso is not None:
+        fuentes = [k for k in proceso.meta.get("fuentes", []) if k != stream_key]
+        EMPALME_PROCESSES.actualizar_meta(user.id, fuentes=fuentes)
+
+
+def detener_empalme(user, esperar=True):
+    # 'q' = salida limpia: cierra las fuentes y el FLV del programa
+    detener(EMPALME_PROCESSES.pop(user.id), timeout=2, esperar=esperar, salida="q\n")
@@ -1,7 +1,118 @@
+import functools
+import threading
+import logging
+from contextlib import contextmanager
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.conf import settings
+from django.db import transaction
 from core.models import StreamConnection, CanalTransmision
+from core.services.metricas import WS_MENSAJES
+
+logger = logging.getLogger(__name__)
+
+
+def _enviar(grupo, evento):
+    """group_send al panel; cuenta el mensaje por tipo (/metrics)."""
+    async_to_sync(get_channel_layer().group_send)(grupo, evento)
+    WS_MENSAJES.inc(evento["type"])
+
+
+# ===============================
+# LOTE DE NOTIFICACIONES
+# ===============================
+# Dentro de un lote, los cambios de cámaras y canal no se envían en el
+# momento: se anotan por usuario y al salir del lote más externo (después
+# del commit, si hay transacción) van en UN mensaje "lote_estado" por
+# usuario, con UNA consulta de cámaras. Apagar diez cámaras pasa de veinte
+# consultas + group_send a una consulta y un viaje a Redis.
+_LOTE = threading.local()
+
+
+@contextmanager
+def lote_notificaciones():
+    profundidad = getattr(_LOTE, "profundidad", 0)
+    if profundidad == 0:
+        _LOTE.pendientes = {}
+    _LOTE.profundidad = profundidad + 1
+    try:
+        yield
+    finally:
+        _LOTE.profundidad = profundidad
+        if profundidad == 0:
+            pendientes, _LOTE.pendientes = _LOTE.pendientes, None
+            if pendientes:
+                # Con rollback no se envía nada: el panel no ve estados que no existieron
+                transaction.on_commit(functools.partial(_enviar_lote, pendientes))
+
+
+def agrupar_notificaciones(funcion):
+    """Decorador: la función corre dentro de un lote_notificaciones()."""
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        with lote_notificaciones():
+            return funcion(*args, **kwargs)
+    return envuelta
+
+
+def _anotar(user_id):
+    """Cambios pendientes del usuario si hay un lote abierto, si no None."""
+    pendientes = getattr(_LOTE, "pendientes", None)
+    if pendientes is None:
+        return None
+    return pendientes.setdefault(user_id, {"camaras": {}, "todas": False, "canal": False})
+
+
+def _estado_camara(c):
+    return {
+        "status": c.status,
+        "authorized": c.authorized,
+        "hls_url": hls_url_for_connection(c),
+    }
+
+
+def _estado_canal(canal):
+    return {
+        "en_vivo": canal.en_vivo if canal else False,
+        "hls_url": canal.url_hls if canal else None,
+        "baja_latencia": canal.baja_latencia if canal else False,
+    }
+
+
+def _enviar_lote(pendientes):
+    for user_id, cambios in pendientes.items():
+        # cam_index -> "actualizar" / "eliminar": gana el último cambio
+        actualizar = [i for i, op in cambios["camaras"].items() if op == "actualizar"]
+        eliminadas = [i for i, op in cambios["camaras"].items() if op == "eliminar"]
+
+        camaras = {}
+        if cambios["todas"] or actualizar:
+            conexiones = StreamConnection.objects.filter(user_id=user_id)
+            if not cambios["todas"]:
+                conexiones = conexiones.filter(cam_index__in=actualizar)
+            camaras = {
+                str(c.cam_index): _estado_camara(c)
+                for c in conexiones if c.cam_index not in eliminadas
+            }
+
+        canal = None
+        if cambios["canal"]:
+            canal = _estado_canal(CanalTransmision.objects.filter(usuario_id=user_id).first())
+
+        try:
+            _enviar(
+                f"usuario_{user_id}",
+                {
+                    "type": "lote_estado",
+                    "cameras": camaras,
+                    "eliminadas": eliminadas,
+                    "canal": canal,
+                },
+            )
+            logger.debug("Lote enviado a user %s: %s cámaras, %s eliminadas, canal=%s", user_id, len(camaras), len(eliminadas), canal is not None)
+        except Exception as e:
+            logger.error("No se pudo notificar lote de user %s: %s", user_id, e)
+
 
 # ===============================
 # URL HLS según estado
@@ -18,11 +129,19 @@ def hls_url_for_connection(conn):
     else:
         url = None
         
-    print(f"[DEBUG] HLS URL generada para {conn.stream_key} ({conn.status}): {url}")
+    logger.debug("HLS URL generada para %s (%s): %s", conn.stream_key, conn.status, url)
     return url
 
 # ... (El resto del archivo sigue igual) ...
 def notificar_actualizacion_camara(user, cam_index=None):
+    cambios = _anotar(user.id)
+    if cambios is not None:
+        if cam_index is None:
+            cambios["todas"] = True
+        else:
+            cambios["camaras"][cam_index] = "actualizar"
+        return
+
     conexiones = StreamConnection.objects.filter(user=user)
     data = {}
 
@@ -37,35 +156,38 @@ def notificar_actualizacion_camara(user, cam_index=None):
             }
 
     if not data:
-        print(f"[DEBUG] No hay datos de cámaras para notificar a {user.username}")
+        logger.debug("No hay datos de cámaras para notificar a %s", user.username)
         return
 
     try:
-        layer = get_channel_layer()
-        async_to_sync(layer.group_send)(
+        _enviar(
             f"usuario_{user.id}",
             {
                 "type": "estado_camaras",
                 "cameras": data,
             },
         )
-        print(f"[DEBUG] Notificación enviada a usuario {user.username}: {data}")
+        logger.debug("Notificación enviada a usuario %s: %s", user.username, data)
     except Exception as e:
-        print(f"[ERROR] No se pudo notificar cámaras de {user.username}: {e}")
+        logger.error("No se pudo notificar cámaras de %s: %s", user.username, e)
 
 
 def notificar_camara_actualizada(user, cam_index):
+    cambios = _anotar(user.id)
+    if cambios is not None:
+        cambios["camaras"][cam_index] = "actualizar"
+        return
+
     try:
         c = StreamConnection.objects.get(user=user, cam_index=cam_index)
     except StreamConnection.DoesNotExist:
-        print(f"[DEBUG] Cámara {cam_index} no existe para {user.username}")
+        logger.debug("Cámara %s no existe para %s", cam_index, user.username)
         return
 
     hls_url = hls_url_for_connection(c)
 
     try:
-        layer = get_channel_layer()
-        async_to_sync(layer.group_send)(
+        _enviar(
             f"usuario_{user.id}",
             {
                 "type": "camara_actualizada",
@@ -75,38 +197,107 @@ def notificar_camara_actualizada(user, cam_index):
                 "hls_url": hls_url,
             },
         )
-        print(f"[DEBUG] Cámara {cam_index} actualizada enviada a {user.username}")
+        logger.debug("Cámara %s actualizada enviada a %s", cam_index, user.username)
     except Exception as e:
-        print(f"[ERROR] No se pudo notificar cámara {cam_index} de {user.username}: {e}")
+        logger.error("No se pudo notificar cámara %s de %s: %s", cam_index, user.username, e)
 
 
 def notificar_camara_eliminada(user, cam_index):
+    cambios = _anotar(user.id)
+    if cambios is not None:
+        cambios["camaras"][cam_index] = "eliminar"
+        return
+
     try:
-        layer = get_channel_layer()
-        async_to_sync(layer.group_send)(
+        _enviar(
             f"usuario_{user.id}",
             {
                 "type": "camara_eliminada",
                 "cam_index": cam_index,
             },
         )
-        print(f"[DEBUG] Notificación cámara eliminada {cam_index} enviada a {user.username}")
+        logger.debug("Notificación cámara eliminada %s enviada a %s", cam_index, user.username)
     except Exception as e:
-        print(f"[ERROR] No se pudo notificar eliminación de cámara {cam_index} de {user.username}: {e}")
+        logger.error("No se pudo notificar eliminación de cámara %s de %s: %s", cam_index, user.username, e)
 
 
 def notificar_estado_canal(user):
+    cambios = _anotar(user.id)
+    if cambios is not None:
+        cambios["canal"] = True
+        return
+
     canal = CanalTransmision.objects.filter(usuario=user).first()
     try:
-        layer = get_channel_layer()
-        async_to_sync(layer.group_send)(
+        _enviar(
             f"usuario_{user.id}",
             {
                 "type": "estado_canal",
                 "en_vivo": canal.en_vivo if canal else False,
                 "hls_url": canal.url_hls if canal else None,
+                "baja_latencia": canal.baja_latencia if canal else False,
+            },
+        )
+        logger.debug("Notificación estado canal enviada a %s", user.username)
+    except Exception as e:
+        logger.error("No se pudo notificar estado canal de %s: %s", user.username, e)
+
+def notificar_modo_radio(user_id, modo_radio):
+    try:
+        _enviar(
+            f"usuario_{user_id}",
+            {
+                "type": "modo_radio_cambio",
+                "modo_radio": modo_radio,
+            },
+        )
+    except Exception as e:
+        logger.error("No se pudo notificar modo radio de user %s: %s", user_id, e)
+
+
+def notificar_trabajo(user_id, trabajo):
+    """Estado de un trabajo de control (core/services/trabajos.py)."""
+    try:
+        _enviar(
+            f"usuario_{user_id}",
+            {
+                "type": "trabajo_control",
+                **trabajo,
+            },
+        )
+    except Exception as e:
+        logger.error("No se pudo notificar trabajo %s de user %s: %s", trabajo.get('id'), user_id, e)
+
+
+def notificar_retransmision(user_id, plataforma, action, status=None, **extra):
+    """
+    Cambio de estado de una retransmisión (multistream_panel.js →
+    handleRestreamUpdate). action: started / stopped / error / status_update.
+    """
+    try:
+        _enviar(
+            f"usuario_{user_id}",
+            {
+                "type": "restream_update",
+                "platform": plataforma,
+                "action": action,
+                "status": status,
+                **extra,
+            },
+        )
+    except Exception as e:
+        logger.error("No se pudo notificar retransmisión %s de user %s: %s", plataforma, user_id, e)
+
+
+def notificar_telemetria(user_id, procesos):
+    """Última muestra de cada FFmpeg del usuario (core/services/telemetria.py)."""
+    try:
+        _enviar(
+            f"usuario_{user_id}",
+            {
+                "type": "telemetria_ffmpeg",
+                "procesos": procesos,
             },
         )
-        print(f"[DEBUG] Notificación estado canal enviada a {user.username}")
     except Exception as e:
-        print(f"[ERROR] No se pudo notificar estado canal de {user.username}: {e}")
\ No newline at end of file
+        logger.error("No se pudo notificar telemetría de user %s: %s", user_id, e)
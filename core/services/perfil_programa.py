@@ -0,0 +1,73 @@
+"""
+PERFIL DEL PROGRAMA
+===================
+Formato único de la salida /program_switch/<username>:
+
+  ✔ H.264 high@4.1, 1280x720, 30 fps, GOP fijo de 1 s
+  ✔ AAC 128k, 44.1 kHz, estéreo
+
+Todos los motores que publican en /program_switch (feeder, switcher)
+usan estos mismos parámetros para que el HLS maestro pueda seguir en COPY.
+"""
+
+ANCHO = 1280
+ALTO = 720
+FPS = 30
+GOP = 30
+
+AUDIO_RATE = 44100
+AUDIO_CANALES = 2
+
+LETTERBOX = (
+    f"scale={ANCHO}:{ALTO}:force_original_aspect_ratio=decrease,"
+    f"pad={ANCHO}:{ALTO}:(ow-iw)/2:(oh-ih)/2:black"
+)
+
+# ================= VIDEO =================
+ARGS_VIDEO = [
+    "-c:v", "libx264",
+    "-preset", "veryfast",
+    "-profile:v", "high",
+    "-level", "4.1",
+    "-tune", "zerolatency",
+    "-pix_fmt", "yuv420p",
+    "-r", str(FPS),
+
+    # 🔥 CLAVE PARA ESTABILIDAD DE SWITCH
+    "-g", str(GOP),
+    "-keyint_min", str(GOP),
+    "-sc_threshold", "0",
+
+    # Calidad real 720p
+    "-b:v", "4200k",
+    "-maxrate", "4500k",
+    "-bufsize", "9000k",
+]
+
+# ================= AUDIO =================
+ARGS_AUDIO = [
+    "-c:a", "aac",
+    "-b:a", "128k",
+    "-ar", str(AUDIO_RATE),
+    "-ac", str(AUDIO_CANALES),
+]
+
+# ================= ESCALERA ABR =================
+# altura -> (ancho, bitrate, maxrate, bufsize). La rendición de ALTO
+# sale en COPY del programa; el resto se codifica desde UNA decodificación.
+RENDICIONES = {
+    1080: (1920, "6000k", "6400k", "12000k"),
+    720: (ANCHO, "4200k", "4500k", "9000k"),
+    480: (854, "1400k", "1500k", "3000k"),
+    360: (640, "800k", "856k", "1600k"),
+}
+
+
+def parsear_rendiciones(texto):
+    """'720,480,360' → [720, 480, 360] (solo alturas conocidas, de mayor a menor)."""
+    alturas = set()
+    for parte in (texto or "").split(","):
+        parte = parte.strip().lower().rstrip("p")
+        if parte.isdigit() and int(parte) in RENDICIONES:
+            alturas.add(int(parte))
+    return sorted(alturas, reverse=True)
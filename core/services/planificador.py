@@ -0,0 +1,91 @@
+"""
+PLANIFICADOR DIFERIDO
+=====================
+Tareas "ejecutar dentro de N segundos" cancelables y con clave:
+
+  PLANIFICADOR.programar(("fin", user.id), 2.0, funcion, user.id)
+  PLANIFICADOR.cancelar(("fin", user.id))
+
+Reprogramar una clave reemplaza la tarea pendiente (debounce). Un único
+thread lleva el reloj y las tareas vencidas corren en un pool chico, así
+una ráfaga de hooks de nginx no ocupa un thread por request.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PlanificadorDiferido:
+
+    def __init__(self, max_workers=2, nombre="planificador"):
+        self.nombre = nombre
+        self._heap = []                 # (vence, seq, clave)
+        self._pendientes = {}           # clave -> (seq, funcion, args)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=nombre)
+        self._thread = None
+
+    def programar(self, clave, demora, funcion, *args):
+        with self._cond:
+            seq = next(self._seq)
+            self._pendientes[clave] = (seq, funcion, args)
+            heapq.heappush(self._heap, (time.monotonic() + demora, seq, clave))
+            self._iniciar()
+            self._cond.notify()
+
+    def cancelar(self, clave):
+        """True si había una tarea pendiente con esa clave."""
+        with self._cond:
+            return self._pendientes.pop(clave, None) is not None
+
+    def pendiente(self, clave):
+        with self._cond:
+            return clave in self._pendientes
+
+    def _iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._reloj, name=f"{self.nombre}-reloj", daemon=True)
+            self._thread.start()
+
+    def _reloj(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+
+                vence, seq, clave = self._heap[0]
+                espera = vence - time.monotonic()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+
+                heapq.heappop(self._heap)
+                tarea = self._pendientes.get(clave)
+                # Cancelada o reprogramada: la entrada del heap quedó vieja
+                if tarea is None or tarea[0] != seq:
+                    continue
+                del self._pendientes[clave]
+
+            _, funcion, args = tarea
+            self._pool.submit(self._ejecutar, clave, funcion, args)
+
+    @staticmethod
+    def _ejecutar(clave, funcion, args):
+        try:
+            funcion(*args)
+        except Exception:
+            logger.exception(f"[PLANIFICADOR] Falló la tarea {clave}")
+        finally:
+            # Los threads del pool viven más que la tarea (ver trabajos._drenar)
+            close_old_connections()
+
+
+PLANIFICADOR = PlanificadorDiferido()
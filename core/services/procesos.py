@@ -0,0 +1,267 @@
+"""
+PROCESOS - FACHADA ÚNICA PARA TODOS LOS FFMPEG
+==============================================
+
+Todos los managers (HLS maestro, feeders, switcher, mezzanine, radio,
+retransmisiones) lanzan y consultan sus FFmpeg a través de un
+RegistroProcesos. Según settings.MEDIA_SUPERVISOR_SOCKET:
+
+  ""          → modo local: una TablaProcesos asyncio en un thread del
+                worker (un solo worker daphne)
+  "/ruta.sock" → modo supervisor: la TablaProcesos vive en el daemon
+                 `manage.py media_supervisor` y cualquier worker la ve
+
+En ambos modos el ciclo de vida es el mismo (ver tabla_procesos.py).
+Los handles Proceso exponen la interfaz de Popen usada en el proyecto:
+pid, poll(), terminate(), kill(), wait(timeout), además de enviar(texto)
+para escribir por stdin y meta, un dict JSON libre que viaja con el
+proceso (p.ej. las entradas del switcher) para que cualquier worker
+pueda reconstruir su estado. La tabla agrega -progress a cada FFmpeg y
+guarda su serie de telemetría (ver telemetria()).
+Un poll() que dio "vivo" no se vuelve a consultar durante POLL_VIGENCIA.
+"""
+
+import json
+import time
+import socket
+import asyncio
+import threading
+import subprocess
+import logging
+from django.conf import settings
+
+from core.services.tabla_procesos import TablaProcesos
+
+logger = logging.getLogger(__name__)
+
+# Un "sigue vivo" recién consultado vale este lapso: los loops de
+# supervisión preguntan por el mismo handle varias veces por vuelta y
+# cada poll() es un RPC en modo supervisor
+POLL_VIGENCIA = 0.5
+
+
+class SupervisorNoDisponible(Exception):
+    pass
+
+
+# ============================================================
+# RPC AL SUPERVISOR
+# ============================================================
+
+def _rpc(op, limite=5, **params):
+    pedido = json.dumps({"op": op, **params}).encode() + b"\n"
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(limite)
+            s.connect(settings.MEDIA_SUPERVISOR_SOCKET)
+            s.sendall(pedido)
+            buffer = b""
+            while not buffer.endswith(b"\n"):
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+    except OSError as e:
+        raise SupervisorNoDisponible(f"Supervisor de media no disponible: {e}")
+
+    respuesta = json.loads(buffer or b"{}")
+    if not respuesta.get("ok"):
+        raise SupervisorNoDisponible(respuesta.get("error", "respuesta inválida"))
+    return respuesta
+
+
+def modo_supervisor():
+    return bool(settings.MEDIA_SUPERVISOR_SOCKET)
+
+
+# ============================================================
+# MODO LOCAL (LOOP ASYNCIO EN UN THREAD)
+# ============================================================
+
+_LOCAL = None
+_LOCAL_LOCK = threading.Lock()
+
+
+def loop_local():
+    """Event loop del modo local; se crea la primera vez que se usa."""
+    return _tabla_local()[0]
+
+
+def _tabla_local():
+    global _LOCAL
+    with _LOCAL_LOCK:
+        if _LOCAL is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="procesos-ffmpeg", daemon=True).start()
+            _LOCAL = (loop, TablaProcesos(
+                telemetria_intervalo=settings.TELEMETRIA_INTERVALO,
+                telemetria_muestras=settings.TELEMETRIA_MUESTRAS,
+            ))
+    return _LOCAL
+
+
+def _local(op, limite=5, **params):
+    loop, tabla = _tabla_local()
+    futuro = asyncio.run_coroutine_threadsafe(getattr(tabla, f"op_{op}")(**params), loop)
+    return {"ok": True, **futuro.result(limite)}
+
+
+def _llamar(op, limite=5, **params):
+    """Ejecuta una operación de la TablaProcesos; `limite` = segundos máximos de espera."""
+    if modo_supervisor():
+        return _rpc(op, limite=limite, **params)
+    return _local(op, limite=limite, **params)
+
+
+# ============================================================
+# HANDLES
+# ============================================================
+
+class Proceso:
+
+    def __init__(self, pid, returncode=None, meta=None):
+        self.pid = pid
+        self._returncode = returncode
+        self.meta = meta or {}
+        # Los handles salen de una respuesta de la tabla: su estado es de recién
+        self._consultado = time.monotonic()
+
+    def poll(self):
+        if self._returncode is None and time.monotonic() - self._consultado >= POLL_VIGENCIA:
+            self._returncode = _llamar("poll", pid=self.pid).get("returncode")
+            self._consultado = time.monotonic()
+        return self._returncode
+
+    def terminate(self):
+        self._senal("TERM")
+
+    def kill(self):
+        self._senal("KILL")
+
+    def _senal(self, sig):
+        _llamar("signal", pid=self.pid, sig=sig)
+        # Ya no vale el "sigue vivo" de antes de la señal
+        self._consultado = float("-inf")
+
+    def wait(self, timeout=None):
+        espera = timeout if timeout is not None else 3600
+        respuesta = _llamar("wait", limite=espera + 5, pid=self.pid, espera=espera)
+        if respuesta.get("timeout"):
+            raise subprocess.TimeoutExpired(f"pid {self.pid}", timeout)
+        self._returncode = respuesta.get("returncode")
+        return self._returncode
+
+    def enviar(self, texto):
+        _llamar("send", pid=self.pid, data=texto)
+
+
+# ============================================================
+# REGISTRO
+# ============================================================
+
+class RegistroProcesos:
+    """
+    Mapa clave → proceso de un rol ("hls", "feeder", "radio"...).
+    El estado real vive en la TablaProcesos (local o del daemon): este
+    objeto solo traduce las consultas.
+    """
+
+    def __init__(self, rol):
+        self.rol = rol
+
+    def lanzar(self, clave, cmd, log_path, stdin=False, meta=None, cupo=None):
+        """
+        Lanza cmd y lo registra bajo clave. El proceso que hubiera antes
+        con esa clave NO se detiene: el caller decide (overlap, etc.).
+
+        Con cupo=N la tabla admite el lanzamiento: si la clave ya tiene un
+        proceso vivo lo devuelve sin lanzar otro, y si el rol ya tiene N
+        vivos devuelve None. Lo decide la tabla, así que el cupo es uno
+        solo para todos los workers.
+        """
+        respuesta = _llamar(
+            "spawn", rol=self.rol, clave=str(clave), cmd=cmd, log=log_path,
+            stdin=stdin, meta=meta or {}, cupo=cupo,
+        )
+        if respuesta.get("pid") is None:
+            return None
+        # meta de la tabla: incluye el archivo -progress que agregó
+        return Proceso(respuesta["pid"], meta=respuesta.get("meta", meta))
+
+    def _proceso(self, respuesta, default):
+        if respuesta.get("pid") is None:
+            return default
+        return Proceso(respuesta["pid"], respuesta.get("returncode"), respuesta.get("meta"))
+
+    def get(self, clave, default=None):
+        return self._proceso(_llamar("get", rol=self.rol, clave=str(clave)), default)
+
+    def pop(self, clave, default=None):
+        """Olvida la clave y devuelve su proceso (sigue corriendo si estaba vivo)."""
+        return self._proceso(_llamar("pop", rol=self.rol, clave=str(clave)), default)
+
+    def actualizar_meta(self, clave, **cambios):
+        _llamar("meta", rol=self.rol, clave=str(clave), cambios=cambios)
+
+    def renombrar(self, clave, nueva):
+        _llamar("renombrar", rol=self.rol, clave=str(clave), nueva=str(nueva))
+
+    def items(self):
+        respuesta = _llamar("list", rol=self.rol)
+        return [
+            (clave, Proceso(pid, returncode, meta))
+            for clave, pid, returncode, meta in respuesta.get("procesos", [])
+        ]
+
+    def adoptar(self, clave, pid, meta=None):
+        """Toma un FFmpeg que sobrevivió a un reinicio (no es hijo de la tabla)."""
+        _llamar("adoptar", rol=self.rol, clave=str(clave), pid=pid, meta=meta or {})
+        return Proceso(pid, meta=meta)
+
+    def __contains__(self, clave):
+        return self.get(clave) is not None
+
+
+def pids_registrados():
+    """PIDs vivos que ya tiene la tabla, de cualquier rol."""
+    return set(_llamar("pids").get("pids", []))
+
+
+def telemetria(rol=None, ultimas=None):
+    """
+    [{rol, clave, pid, meta, muestras}] de los procesos vivos. Cada muestra:
+    t, frame, fps, speed, bitrate_kbps, drop_frames, dup_frames,
+    total_size, out_time_us (ver progreso_ffmpeg.muestra).
+    """
+    return _llamar("telemetria", rol=rol, ultimas=ultimas).get("procesos", [])
+
+
+def esta_vivo(proceso):
+    return proceso is not None and proceso.poll() is None
+
+
+def detener_varios(procesos, timeout=5, esperar=True, salida=None):
+    """
+    Detiene en paralelo: ['salida' por stdin] → SIGTERM → SIGKILL, con
+    `timeout` por escalón. Con esperar=False no bloquea al caller: el
+    escalamiento y el reap siguen en el loop.
+    """
+    pids = [p.pid for p in procesos if p is not None]
+    if not pids:
+        return
+    _llamar(
+        "detener",
+        limite=(3 * timeout + 5) if esperar else 5,
+        pids=pids, timeout=timeout, salida=salida, esperar=esperar,
+    )
+
+
+def detener(proceso, timeout=5, esperar=True, salida=None):
+    detener_varios([proceso], timeout=timeout, esperar=esperar, salida=salida)
+
+
+def retirar_despues(proceso, demora, timeout=5):
+    """Detiene el proceso dentro de `demora` segundos, sin threads ni bloqueo."""
+    if proceso is not None:
+        _llamar("retirar", pid=proceso.pid, demora=demora, timeout=timeout)
@@ -0,0 +1,260 @@
+"""
+PROGRAM SWITCHER - UN ENCODER PERSISTENTE POR CANAL
+===================================================
+
+Un solo FFmpeg de larga vida por usuario en vivo:
+
+  [cam1 /live] ──┐
+  [cam2 /live] ──┼──► streamselect / astreamselect ──► x264 + aac ──► /program_switch/username
+  [camN /live] ──┘
+
+✔ Todas las cámaras READY quedan conectadas como entradas
+✔ El corte es un comando al filtro (tecla 'c' de FFmpeg por stdin): milisegundos
+✔ Sin spawn, sin handshake RTMP nuevo y sin dos encoders en paralelo
+
+El proceso solo se reconstruye cuando cambia el conjunto de entradas
+(cámara autorizada o cerrada), nunca en un corte normal.
+
+Una entrada fuera del aire no puede frenar ni tirar el programa:
+  - cada entrada RTMP lleva -rw_timeout: una cámara que deja de mandar
+    datos da error (= EOF) en SWITCHER_ENTRADA_TIMEOUT segundos en vez
+    de dejar al selector esperándola para siempre
+  - tras el EOF la entrada se rellena (tpad repite el último cuadro,
+    apad pone silencio): el filtro sigue y el proceso no termina
+  - si igual muere o se cuelga, vigilante_programa.py lo reconstruye
+    desde la cámara ON_AIR (ver ffmpeg_manager.recuperar_switcher)
+
+Modo radio: si el clip de la imagen del canal está en cache, entra como
+una entrada más de video (loop a tiempo real, sin audio). Pasar a radio
+es un corte: el video va al clip y el audio sigue en la cámara; volver
+es otro corte. El programa no cambia de publicador ni de perfil y el
+HLS maestro no se entera.
+"""
+
+import time
+import logging
+from django.conf import settings
+
+from core.services import perfil_programa
+from core.services.procesos import RegistroProcesos, esta_vivo, detener
+
+logger = logging.getLogger(__name__)
+
+# user.id -> proceso; meta = {"stream_keys": [...], "activa": stream_key, "inicio": epoch,
+#                             "radio": clip | None, "modo_radio": bool}
+SWITCHER_PROCESSES = RegistroProcesos("switcher")
+
+
+class ProgramSwitcher:
+
+    FILTRO_VIDEO = "streamselect@vsel"
+    FILTRO_AUDIO = "astreamselect@asel"
+
+    def __init__(self, user, process):
+        self.user = user
+        self.process = process
+
+    @property
+    def stream_keys(self):
+        return tuple(self.process.meta.get("stream_keys", ()))
+
+    @property
+    def stream_key_activa(self):
+        return self.process.meta.get("activa")
+
+    @property
+    def radio(self):
+        return self.process.meta.get("radio")
+
+    @property
+    def modo_radio(self):
+        return bool(self.process.meta.get("modo_radio"))
+
+    # ============================================================
+    # COMANDO
+    # ============================================================
+
+    @classmethod
+    def build_ffmpeg_command(cls, user, stream_keys, stream_key_activa, radio=None, modo_radio=False):
+        FFMPEG_BIN = settings.FFMPEG_BIN_PATH
+        RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+        RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+
+        # Microsegundos: una entrada sin datos falla en vez de colgar el grafo
+        rw_timeout = str(int(settings.SWITCHER_ENTRADA_TIMEOUT * 1_000_000))
+
+        cmd = [FFMPEG_BIN]
+
+        for stream_key in stream_keys:
+            cmd += [
+                "-fflags", "+genpts",
+                "-use_wallclock_as_timestamps", "1",
+                "-rw_timeout", rw_timeout,
+                "-i", f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}",
+            ]
+
+        if radio:
+            # El clip nunca termina (loop): no necesita relleno ni timeout
+            cmd += ["-re", "-stream_loop", "-1", "-i", radio]
+
+        # Cada entrada se normaliza ANTES del selector para que el
+        # encoder reciba siempre el mismo formato sin importar la cámara.
+        # tpad / apad: una entrada que terminó sigue entregando (último
+        # cuadro, silencio) y el selector no se queda sin ella.
+        cadenas = []
+        for i in range(len(stream_keys)):
+            cadenas.append(
+                f"[{i}:v:0]{perfil_programa.LETTERBOX},"
+                f"fps={perfil_programa.FPS},format=yuv420p,setsar=1,"
+                f"tpad=stop=-1:stop_mode=clone[v{i}]"
+            )
+            cadenas.append(
+                f"[{i}:a:0]aresample={perfil_programa.AUDIO_RATE}:async=1:first_pts=0,"
+                f"aformat=channel_layouts=stereo,apad[a{i}]"
+            )
+
+        n = len(stream_keys)
+        activo = list(stream_keys).index(stream_key_activa)
+        entradas_v = "".join(f"[v{i}]" for i in range(n))
+        entradas_a = "".join(f"[a{i}]" for i in range(n))
+
+        # El clip ya está en el perfil (1280x720): solo se iguala el fps.
+        # Es la entrada de video n; el audio no tiene entrada n.
+        video_activo = activo
+        if radio:
+            cadenas.append(f"[{n}:v:0]fps={perfil_programa.FPS},format=yuv420p,setsar=1[v{n}]")
+            entradas_v += f"[v{n}]"
+            if modo_radio:
+                video_activo = n
+
+        cadenas.append(f"{entradas_v}{cls.FILTRO_VIDEO}=inputs={n + bool(radio)}:map={video_activo}[vout]")
+        cadenas.append(f"{entradas_a}{cls.FILTRO_AUDIO}=inputs={n}:map={activo}[aout]")
+
+        cmd += [
+            "-filter_complex", ";".join(cadenas),
+            "-map", "[vout]",
+            "-map", "[aout]",
+            *perfil_programa.ARGS_VIDEO,
+            *perfil_programa.ARGS_AUDIO,
+            "-f", "flv",
+            f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}",
+        ]
+        return cmd
+
+    # ============================================================
+    # CICLO DE VIDA
+    # ============================================================
+
+    @classmethod
+    def start(cls, user, stream_keys, stream_key_activa, radio=None, modo_radio=False):
+        modo_radio = bool(radio and modo_radio)
+        cmd = cls.build_ffmpeg_command(user, stream_keys, stream_key_activa, radio, modo_radio)
+
+        logger.info(
+            f"[SWITCHER] Iniciando switcher de {user.username} "
+            f"| entradas={list(stream_keys)} activa={stream_key_activa} "
+            f"radio={'al aire' if modo_radio else 'lista' if radio else 'no'}"
+        )
+
+        # stdin en PIPE: por ahí viajan los comandos de corte
+        process = SWITCHER_PROCESSES.lanzar(
+            user.id,
+            cmd,
+            f"/tmp/switcher_{user.username}.log",
+            stdin=True,
+            meta={
+                "stream_keys": list(stream_keys),
+                "activa": stream_key_activa,
+                "inicio": time.time(),
+                "radio": radio,
+                "modo_radio": modo_radio,
+            },
+        )
+        return cls(user, process)
+
+    def seleccionar(self, stream_key):
+        """
+        Corta a otra entrada ya conectada (en modo radio, solo el audio).
+        Devuelve False si la cámara no es una entrada de este switcher
+        o si el proceso no acepta el comando (hay que reconstruir).
+        """
+        return self._cortar(stream_key, self.modo_radio)
+
+    def cambiar_modo_radio(self, modo_radio, stream_key):
+        """
+        Radio ↔ video con la cámara stream_key en el audio. Devuelve False
+        si este switcher no tiene el clip de radio o no acepta el comando.
+        """
+        if modo_radio and not self.radio:
+            return False
+        return self._cortar(stream_key, modo_radio)
+
+    def _cortar(self, stream_key, modo_radio):
+        if stream_key not in self.stream_keys or not self.is_running():
+            return False
+
+        indice = self.stream_keys.index(stream_key)
+        video = len(self.stream_keys) if modo_radio else indice
+        comandos = (
+            f"c{self.FILTRO_VIDEO} -1 map {video}\n"
+            f"c{self.FILTRO_AUDIO} -1 map {indice}\n"
+        )
+
+        try:
+            self.process.enviar(comandos)
+        except Exception as e:
+            logger.warning(f"[SWITCHER] No se pudo enviar corte a {self.user.username}: {e}")
+            return False
+
+        SWITCHER_PROCESSES.actualizar_meta(self.user.id, activa=stream_key, modo_radio=modo_radio)
+        self.process.meta.update(activa=stream_key, modo_radio=modo_radio)
+        logger.info(
+            f"[SWITCHER] Corte a {stream_key} (entrada {indice}"
+            f"{', video radio' if modo_radio else ''}) para {self.user.username}"
+        )
+        return True
+
+    def stop(self, esperar=True):
+        # 'q' = salida limpia de FFmpeg (cierra el FLV correctamente)
+        detener(self.process, timeout=2, esperar=esperar, salida="q")
+
+    def is_running(self):
+        return esta_vivo(self.process)
+
+
+# ============================================================
+# API DEL MÓDULO
+# ============================================================
+
+def seleccionar_o_reconstruir(user, stream_keys, stream_key_activa, radio=None):
+    """
+    Corta a stream_key_activa reutilizando el switcher vivo si ya la tiene
+    como entrada; si no, lo reconstruye con el nuevo conjunto de entradas
+    (y el mismo modo radio).
+    """
+    actual = get_switcher(user)
+    if actual and actual.seleccionar(stream_key_activa):
+        return actual
+
+    modo_radio = bool(actual and actual.modo_radio)
+    return reconstruir_switcher(user, stream_keys, stream_key_activa, radio, modo_radio)
+
+
+def reconstruir_switcher(user, stream_keys, stream_key_activa, radio=None, modo_radio=False):
+    stop_switcher(user)
+
+    return ProgramSwitcher.start(user, stream_keys, stream_key_activa, radio, modo_radio)
+
+
+def stop_switcher(user, esperar=True):
+    process = SWITCHER_PROCESSES.pop(user.id)
+    if process:
+        logger.info(f"[SWITCHER] Deteniendo switcher de {user.username}")
+        ProgramSwitcher(user, process).stop(esperar=esperar)
+
+
+def get_switcher(user):
+    process = SWITCHER_PROCESSES.get(user.id)
+    if esta_vivo(process):
+        return ProgramSwitcher(user, process)
+    return None
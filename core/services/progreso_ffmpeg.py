@@ -0,0 +1,135 @@
+"""
+PROGRESO DE FFMPEG
+==================
+Lectura de la salida `-progress <archivo>`: bloques clave=valor que
+FFmpeg escribe cada -stats_period y cierra con "progress=continue"
+(o "progress=end" al terminar):
+
+  frame=1520
+  out_time_us=50633333
+  total_size=31457280
+  speed=1.00x
+  progress=continue
+
+Solo se lee la cola del archivo: crece durante toda la vida del proceso.
+La tabla de procesos agrega -progress a todo FFmpeg que lanza (ver
+tabla_procesos.py) y guarda una serie de muestras por proceso.
+VigiaAvance usa los mismos bloques para detectar un proceso colgado:
+vivo, pero sin que out_time_us ni total_size se muevan.
+"""
+
+import os
+import time
+
+# Suficiente para varios bloques completos
+_COLA_BYTES = 4096
+
+
+def leer_progreso(path):
+    """Último bloque completo como dict de strings, o {} si todavía no hay."""
+    if not path:
+        return {}
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - _COLA_BYTES))
+            cola = f.read().decode(errors="replace")
+    except OSError:
+        return {}
+
+    lineas = cola.splitlines()
+    # El último "progress=" cierra el bloque completo más reciente
+    for fin in range(len(lineas) - 1, -1, -1):
+        if lineas[fin].startswith("progress="):
+            break
+    else:
+        return {}
+
+    bloque = {}
+    for linea in reversed(lineas[:fin + 1]):
+        clave, _, valor = linea.partition("=")
+        if clave == "progress" and bloque:
+            break  # cierre del bloque anterior
+        bloque.setdefault(clave.strip(), valor.strip())
+    return bloque
+
+
+def entero(bloque, clave):
+    """Valor numérico de una clave; 0 si falta o es N/A."""
+    try:
+        return int(bloque.get(clave, 0))
+    except ValueError:
+        return 0
+
+
+def paquetes_escritos(bloque):
+    """True cuando el muxer ya escribió medios (no solo el header)."""
+    return entero(bloque, "out_time_us") > 0 or entero(bloque, "total_size") > 0
+
+
+def decimal(bloque, clave, sufijo=""):
+    """Valor con unidad ("1.01x", "2450.3kbits/s"); 0.0 si falta o es N/A."""
+    valor = bloque.get(clave, "").strip()
+    if sufijo and valor.endswith(sufijo):
+        valor = valor[:-len(sufijo)]
+    try:
+        return float(valor)
+    except ValueError:
+        return 0.0
+
+
+def muestra(bloque, anterior=None, dt=None):
+    """
+    Muestra de telemetría a partir de un bloque. fps, speed y bitrate que
+    reporta FFmpeg son promedios desde el arranque: con la muestra anterior
+    y los segundos transcurridos (dt) se calculan sobre el último intervalo,
+    que es lo que muestra a un feeder cayendo por debajo de tiempo real.
+    """
+    actual = {
+        "frame": entero(bloque, "frame"),
+        "out_time_us": entero(bloque, "out_time_us"),
+        "total_size": entero(bloque, "total_size"),
+        "drop_frames": entero(bloque, "drop_frames"),
+        "dup_frames": entero(bloque, "dup_frames"),
+        "fps": decimal(bloque, "fps"),
+        "speed": decimal(bloque, "speed", "x"),
+        "bitrate_kbps": decimal(bloque, "bitrate", "kbits/s"),
+    }
+
+    if anterior and dt and dt > 0:
+        media_us = actual["out_time_us"] - anterior["out_time_us"]
+        actual["fps"] = round((actual["frame"] - anterior["frame"]) / dt, 2)
+        actual["speed"] = round(media_us / 1e6 / dt, 3)
+        bytes_escritos = actual["total_size"] - anterior["total_size"]
+        if media_us > 0:
+            actual["bitrate_kbps"] = round(bytes_escritos * 8 / (media_us / 1e6) / 1000, 1)
+
+    return actual
+
+
+class VigiaAvance:
+    """
+    Detecta procesos estancados: out_time_us y total_size del -progress
+    quietos más de `segundos`. Recuerda por PID la última marca vista y
+    desde cuándo no cambia (reloj monotónico), así que hay que llamarlo
+    en cada revisión y olvidar() el PID cuando el proceso se retira.
+    """
+
+    def __init__(self):
+        self._marcas = {}   # pid -> ((out_time_us, total_size), monotonic del último cambio)
+
+    def estancado(self, pid, progreso, segundos, ahora=None):
+        if not progreso:
+            return False  # adoptado sin -progress: no hay con qué medir
+        ahora = time.monotonic() if ahora is None else ahora
+        bloque = leer_progreso(progreso)
+        marca = (entero(bloque, "out_time_us"), entero(bloque, "total_size"))
+
+        anterior = self._marcas.get(pid)
+        if anterior is None or anterior[0] != marca:
+            self._marcas[pid] = (marca, ahora)
+            return False
+        return ahora - anterior[1] > segundos
+
+    def olvidar(self, pid):
+        self._marcas.pop(pid, None)
@@ -6,55 +6,138 @@ Modo radio: video con imagen estática + audio RTMP live.
 La imagen se lee desde canal.get_imagen_radio() — cada usuario
 tiene su propia imagen configurada desde Ajustes > Perfil.
 
-Pipeline:
-  [imagen usuario loop] ──┐
-                           ├──► feeder → /program_switch/username → HLS maestro
-  [audio RTMP live]    ──┘
+Con el switcher al aire (program_switcher.py), el clip es una entrada
+más del switcher y radio ↔ video es un corte por stdin: sin cambio de
+publicador en /program_switch y sin relanzar el HLS maestro.
+
+Si el programa sale por otro camino (feeder legacy, copia, empalmador),
+la radio usa su propio feeder:
+  [clip de la imagen, loop, COPY] ──┐
+                                     ├──► feeder → /program_switch/username → HLS maestro
+  [audio RTMP live, AAC]          ──┘
+
+La imagen se codifica UNA vez a un clip H.264 de un GOP (2 s) que se
+cachea por hash del contenido: en el aire el video va en COPY y el
+feeder solo procesa el audio.
 """
 
 import os
+import hashlib
 import tempfile
 import subprocess
-import time
 import threading
 import logging
 from django.conf import settings
 
+from core.services.procesos import RegistroProcesos, esta_vivo, detener, retirar_despues
+from core.services.trabajos import trabajo
+
 logger = logging.getLogger(__name__)
 
-RADIO_FEEDER_PROCESSES = {}
+RADIO_FEEDER_PROCESSES = RegistroProcesos("radio")
 
+RADIO_FPS = 25
+RADIO_GOP = 50  # el clip entero es un GOP: cada vuelta del loop arranca en keyframe
 
-def _kill_after_delay(proc, delay_seconds, label="proceso-radio"):
-    def _do_kill():
-        time.sleep(delay_seconds)
-        if proc.poll() is None:
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except Exception:
-                try:
-                    proc.kill()
-                except Exception:
-                    pass
+_CLIP_LOCK = threading.Lock()
 
-    t = threading.Thread(target=_do_kill, daemon=True)
-    t.start()
 
+# ============================================================
+# CACHE DE CLIPS (IMAGEN → H.264, UNA SOLA VEZ)
+# ============================================================
 
-def start_radio_feeder(user, stream_key):
+def _hash_imagen(imagen_path):
+    h = hashlib.sha256()
+    with open(imagen_path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _ruta_clip(imagen_path):
+    return os.path.join(settings.RADIO_CACHE_DIR, f"{_hash_imagen(imagen_path)}.mp4")
+
+
+def clip_radio(imagen_path):
     """
-    Lanza un feeder FFmpeg con imagen estática + audio RTMP
-    hacia /program_switch.
+    Ruta del clip pre-codificado de la imagen; lo codifica si no está
+    en cache. Dos imágenes con el mismo contenido comparten clip.
+    """
+    os.makedirs(settings.RADIO_CACHE_DIR, exist_ok=True)
 
-    La imagen se lee desde CanalTransmision.get_imagen_radio()
-    que devuelve radio_imagen_path del usuario o el fallback de settings.
+    clip = _ruta_clip(imagen_path)
+
+    with _CLIP_LOCK:
+        if os.path.isfile(clip):
+            return clip
+
+        temporal = f"{clip}.tmp.mp4"
+        cmd = [
+            settings.FFMPEG_BIN_PATH,
+            "-y",
+            "-loop", "1",
+            "-framerate", str(RADIO_FPS),
+            "-i", imagen_path,
+            "-frames:v", str(RADIO_GOP),
+            "-vf", "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2:black",
+            "-c:v", "libx264",
+            # Se codifica una vez: se puede pagar el preset lento
+            "-preset", "slow",
+            "-tune", "stillimage",
+            "-pix_fmt", "yuv420p",
+            "-r", str(RADIO_FPS),
+            "-g", str(RADIO_GOP),
+            "-keyint_min", str(RADIO_GOP),
+            "-sc_threshold", "0",
+            "-b:v", "300k",
+            "-maxrate", "300k",
+            "-bufsize", "600k",
+            "-an",
+            "-movflags", "+faststart",
+            temporal,
+        ]
+
+        resultado = subprocess.run(cmd, capture_output=True, timeout=120)
+        if resultado.returncode != 0:
+            raise RuntimeError(
+                f"[RADIO] No se pudo codificar la imagen: "
+                f"{resultado.stderr.decode(errors='replace')[-300:]}"
+            )
+
+        os.replace(temporal, clip)
+
+    logger.info(f"[RADIO] Clip de radio cacheado: {clip}")
+    return clip
+
+
+def clip_cacheado(imagen_path):
     """
-    from core.models import CanalTransmision
+    Clip de la imagen si ya está codificado, o None (y se codifica en
+    segundo plano para la próxima). Nunca codifica en el camino del corte.
+    """
+    if not imagen_path or not os.path.isfile(imagen_path):
+        return None
+    clip = _ruta_clip(imagen_path)
+    if os.path.isfile(clip):
+        return clip
+    precalentar_clip_radio(imagen_path)
+    return None
 
-    FFMPEG_BIN = settings.FFMPEG_BIN_PATH
-    RTMP_HOST  = settings.RTMP_SERVER_HOST_INTERNAL
-    RTMP_PORT  = settings.RTMP_SERVER_PORT_INTERNAL
+
+def precalentar_clip_radio(imagen_path):
+    """Codifica el clip en segundo plano (al subir la imagen)."""
+    def _codificar():
+        try:
+            clip_radio(imagen_path)
+        except Exception as e:
+            logger.warning(f"[RADIO] Error pre-codificando imagen: {e}")
+
+    threading.Thread(target=_codificar, daemon=True).start()
+
+
+def imagen_del_canal(user):
+    """Imagen de radio del canal (o la de settings); error si no hay o no está en disco."""
+    from core.models import CanalTransmision
 
     canal = CanalTransmision.objects.filter(usuario=user).first()
     imagen_path = canal.get_imagen_radio() if canal else ""
@@ -71,15 +154,34 @@ def start_radio_feeder(user, stream_key):
             f"Volvé a subir la imagen desde Ajustes > Perfil."
         )
 
+    return imagen_path
+
+
+def start_radio_feeder(user, stream_key):
+    """
+    Lanza un feeder FFmpeg con imagen estática + audio RTMP
+    hacia /program_switch.
+
+    La imagen se lee desde CanalTransmision.get_imagen_radio()
+    que devuelve radio_imagen_path del usuario o el fallback de settings.
+    """
+    FFMPEG_BIN = settings.FFMPEG_BIN_PATH
+    RTMP_HOST  = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT  = settings.RTMP_SERVER_PORT_INTERNAL
+
+    imagen_path = imagen_del_canal(user)
+
     input_rtmp  = f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}"
     output_rtmp = f"rtmp://{RTMP_HOST}:{RTMP_PORT}/program_switch/{user.username}"
 
+    clip = clip_radio(imagen_path)
+
     cmd = [
         FFMPEG_BIN,
-        # ── Fuente 1: imagen estática en loop ───────────────────────
-        "-loop", "1",
-        "-framerate", "25",
-        "-i", imagen_path,
+        # ── Fuente 1: clip pre-codificado en loop, a tiempo real ─────
+        "-re",
+        "-stream_loop", "-1",
+        "-i", clip,
         # ── Fuente 2: RTMP live (solo audio) ────────────────────────
         "-fflags", "+genpts",
         "-use_wallclock_as_timestamps", "1",
@@ -87,19 +189,8 @@ def start_radio_feeder(user, stream_key):
         # ── Mapeo: video de [0], audio de [1] ───────────────────────
         "-map", "0:v",
         "-map", "1:a",
-        # ── Video: escalar a 1280x720 con letterbox ──────────────────
-        "-vf", "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2:black",
-        "-c:v", "libx264",
-        "-preset", "ultrafast",
-        "-tune", "stillimage",
-        "-pix_fmt", "yuv420p",
-        "-r", "25",
-        "-g", "50",
-        "-keyint_min", "50",
-        "-sc_threshold", "0",
-        "-b:v", "300k",
-        "-maxrate", "300k",
-        "-bufsize", "600k",
+        # ── Video: COPY, sin encoder ────────────────────────────────
+        "-c:v", "copy",
         # ── Audio: resync para evitar disco rayado ───────────────────
         "-c:a", "aac",
         "-af", "aresample=async=1000",
@@ -116,36 +207,103 @@ def start_radio_feeder(user, stream_key):
     log_path = os.path.join(tempfile.gettempdir(), f"radio_feeder_{user.username}.log")
     logger.info(f"[RADIO] Iniciando feeder radio para {user.username} | imagen={imagen_path}")
 
-    log_file = open(log_path, "w")
-    new_proc = subprocess.Popen(
-        cmd,
-        stdout=log_file,
-        stderr=log_file,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0,
-    )
-    RADIO_FEEDER_PROCESSES[user.id] = new_proc
+    new_proc = RADIO_FEEDER_PROCESSES.lanzar(user.id, cmd, log_path)
 
-    if old and old.poll() is None:
-        _kill_after_delay(old, delay_seconds=2, label=f"radio-feeder-viejo-{user.username}")
+    if esta_vivo(old):
+        retirar_despues(old, 2)
 
     return new_proc
 
 
-def stop_radio_feeder(user):
-    proc = RADIO_FEEDER_PROCESSES.pop(user.id, None)
-    if proc and proc.poll() is None:
+def stop_radio_feeder(user, esperar=False):
+    proc = RADIO_FEEDER_PROCESSES.pop(user.id)
+    if esta_vivo(proc):
         logger.info(f"[RADIO] Deteniendo feeder radio para {user.username}")
         try:
-            proc.terminate()
-            proc.wait(timeout=5)
+            # esperar=True solo si otro publicador necesita el slot de nginx
+            detener(proc, esperar=esperar)
         except Exception as e:
             logger.warning(f"[RADIO] Error al terminar feeder radio: {e}")
-            try:
-                proc.kill()
-            except Exception:
-                pass
+
+
+# ============================================================
+# TRANSICIONES RADIO ↔ VIDEO
+# ============================================================
+
+def activar_radio(user, stream_key):
+    """
+    Cambia la fuente del programa a radio. Con el switcher al aire es un
+    corte al clip. Si no, feeder propio: sin sleeps, cada paso espera la
+    salida real del proceso anterior (libera el slot de nginx) y el HLS
+    maestro se relanza sobre la MISMA playlist (append_list).
+    """
+    from core.services.ffmpeg_manager import (
+        detener_fuente_programa,
+        radio_por_switcher,
+        reiniciar_program_hls,
+    )
+
+    if radio_por_switcher(user, stream_key, True):
+        return
+
+    detener_fuente_programa(user)
+    start_radio_feeder(user, stream_key)
+    reiniciar_program_hls(user)
+
+
+def desactivar_radio(user, stream_key=None):
+    """Vuelve al video de la cámara al aire (si hay)."""
+    from core.services.ffmpeg_manager import (
+        radio_por_switcher,
+        reiniciar_program_hls,
+        switch_program_camera,
+    )
+
+    if not is_radio_feeder_active(user) and radio_por_switcher(user, stream_key, False):
+        return
+
+    stop_radio_feeder(user, esperar=True)
+    if stream_key:
+        switch_program_camera(user, stream_key)
+    reiniciar_program_hls(user)
+
+
+def _transicion_radio(user, activar, stream_key):
+    from core.models import CanalTransmision
+    from core.services.notificaciones_tiempo_real import notificar_modo_radio
+
+    canal = CanalTransmision.objects.get(usuario=user)
+    try:
+        if activar:
+            activar_radio(user, stream_key)
+            canal.activar_modo_radio()
+        else:
+            desactivar_radio(user, stream_key)
+            canal.desactivar_modo_radio()
+        logger.info(f"[RADIO] Modo radio {'ACTIVADO' if activar else 'DESACTIVADO'} para {user.username}")
+    except Exception:
+        if activar and stream_key:
+            # Volver a la cámara: el programa no puede quedar sin fuente
+            desactivar_radio(user, stream_key)
+        raise
+    finally:
+        canal.refresh_from_db()
+        notificar_modo_radio(user.id, modo_radio=canal.modo_radio)
+
+    return {"modo_radio": canal.modo_radio}
+
+
+@trabajo("radio_on")
+def _trabajo_radio_on(user, avance, stream_key):
+    avance("Pasando a modo radio")
+    return _transicion_radio(user, True, stream_key)
+
+
+@trabajo("radio_off")
+def _trabajo_radio_off(user, avance, stream_key=None):
+    avance("Volviendo a video")
+    return _transicion_radio(user, False, stream_key)
 
 
 def is_radio_feeder_active(user):
-    proc = RADIO_FEEDER_PROCESSES.get(user.id)
-    return proc is not None and proc.poll() is None
\ No newline at end of file
+    return esta_vivo(RADIO_FEEDER_PROCESSES.get(user.id))
\ No newline at end of file
@@ -0,0 +1,390 @@
+"""
+RECONCILIACIÓN DE ARRANQUE
+==========================
+Tras un deploy o un crash los registros de procesos arrancan vacíos,
+pero los FFmpeg (lanzados con start_new_session) siguen publicando en
+/program_switch y escribiendo HLS. Al arrancar, el dueño de los procesos
+(el worker en modo local, el daemon en modo supervisor):
+
+  1. Recorre /proc buscando NUESTROS FFmpeg (y empalmadores) por su
+     línea de comando
+  2. Los asigna a un usuario por nombre de playlist / stream
+  3. Adopta el que corresponde a un canal vivo y mata el resto
+     (canal apagado, duplicados, huérfanos de cámaras que ya no están)
+  4. Corrige CanalTransmision y EstadoRetransmision para que reflejen
+     los procesos que realmente quedaron
+
+Un proceso por slot: entre duplicados se queda el lanzado más tarde, y
+feeder / switcher / radio comparten el slot /program_switch del usuario.
+"""
+
+import io
+import os
+import logging
+import contextlib
+import threading
+from django.conf import settings
+from django.utils import timezone
+
+from core.services.procesos import (
+    RegistroProcesos,
+    modo_supervisor,
+    pids_registrados,
+    esta_vivo,
+    detener_varios,
+)
+from core.services import empalme_flv
+from core.services.tabla_procesos import inicio_proceso
+
+logger = logging.getLogger(__name__)
+
+# Rol descartable: los huérfanos se adoptan acá solo para detenerlos
+# con el mismo escalamiento SIGTERM → SIGKILL que el resto
+_HUERFANOS = RegistroProcesos("huerfano")
+
+EMPALMADOR = os.path.basename(empalme_flv.__file__)
+
+
+# ============================================================
+# ESCANEO DE /proc
+# ============================================================
+
+def _es_empalmador(argv):
+    # python .../empalme_flv.py --ffmpeg ... (ver mezzanine.iniciar_empalme)
+    return any(os.path.basename(a) == EMPALMADOR for a in argv[1:2])
+
+
+def _procesos_ffmpeg():
+    """(pid, inicio, argv) de cada FFmpeg o empalmador vivo de la máquina."""
+    binario = os.path.basename(settings.FFMPEG_BIN_PATH)
+
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit():
+            continue
+        pid = int(nombre)
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                argv = f.read().decode(errors="replace").split("\0")[:-1]
+        except OSError:
+            continue
+
+        if not argv or os.path.basename(argv[0]) != binario and not _es_empalmador(argv):
+            continue
+
+        inicio = inicio_proceso(pid)
+        if inicio is not None:
+            yield pid, inicio, argv
+
+
+def clasificar(argv):
+    """
+    Reconoce un comando FFmpeg lanzado por los managers. Devuelve
+    {"rol", "username" | "stream_key", ...} o None si no es nuestro.
+    """
+    from core.services.program_switcher import ProgramSwitcher
+    from multistream.services.stream_manager import StreamManager
+
+    rtmp = f"rtmp://{settings.RTMP_SERVER_HOST_INTERNAL}:{settings.RTMP_SERVER_PORT_INTERNAL}"
+
+    if _es_empalmador(argv):
+        return _clasificar_empalmador(argv, f"{rtmp}/program_switch/")
+
+    salida = argv[-1]
+    entradas = [argv[i + 1] for i, a in enumerate(argv[:-1]) if a == "-i"]
+
+    # Fuentes y publicador del empalmador (pipe:1 / pipe:0): viven y
+    # mueren con él, que es lo que se adopta o se mata
+    if salida == "pipe:1" or "pipe:0" in entradas:
+        return None
+
+    # HLS maestro: escribe HLS_PATH/program/<username>.m3u8
+    # (en ABR, <username>_%v.m3u8 + master <username>.m3u8)
+    program_dir = os.path.join(settings.HLS_PATH, "program")
+    if salida.endswith(".m3u8") and os.path.dirname(salida) == program_dir:
+        nombre = os.path.basename(salida)[:-len(".m3u8")]
+        return {"rol": "hls", "username": nombre.removesuffix("_%v")}
+
+    # Publicadores de /program_switch/<username>
+    prefijo = f"{rtmp}/program_switch/"
+    if salida.startswith(prefijo):
+        username = salida[len(prefijo):]
+        # El switcher también puede llevar el clip de radio en loop: va primero
+        if "-filter_complex" in argv and ProgramSwitcher.FILTRO_VIDEO in " ".join(argv):
+            camaras = f"{rtmp}/live/"
+            radio = [e for e in entradas if not e.startswith(camaras)]
+            return {
+                "rol": "switcher",
+                "username": username,
+                "stream_keys": [e[len(camaras):] for e in entradas if e.startswith(camaras)],
+                "radio": radio[0] if radio else None,
+            }
+        if "-stream_loop" in argv or "-loop" in argv:
+            return {"rol": "radio", "username": username}
+        return {"rol": "feeder", "username": username}
+
+    # Relay de retransmisiones: UDP local → /<app relay>/<username>
+    prefijo = f"{rtmp}/{settings.RESTREAM_RELAY_APP}/"
+    if salida.startswith(prefijo):
+        return {"rol": "relay", "username": salida[len(prefijo):]}
+
+    # Mezzanine: /live/<stream_key> → /<app>/<stream_key>
+    prefijo = f"{rtmp}/{settings.RTMP_MEZZANINE_APP}/"
+    if salida.startswith(prefijo):
+        return {"rol": "mezzanine", "stream_key": salida[len(prefijo):]}
+
+    # Retransmisión: lee el programa del usuario y sale a sus plataformas (tee)
+    for entrada in entradas:
+        username = None
+        if entrada.startswith((f"{rtmp}/program_switch/", f"{rtmp}/{settings.RESTREAM_RELAY_APP}/")):
+            username = entrada.rsplit("/", 1)[1]
+        elif entrada.endswith(".m3u8") and "/program/" in entrada:
+            username = entrada.rsplit("/", 1)[1][:-len(".m3u8")]
+        if username:
+            plataformas = StreamManager.platforms_for_destination(salida)
+            if plataformas:
+                return {"rol": "restream", "username": username, "plataformas": plataformas}
+
+    return None
+
+
+def _clasificar_empalmador(argv, prefijo):
+    try:
+        # argparse escribe el uso a stderr antes de salir: no ensuciar el log
+        with contextlib.redirect_stderr(io.StringIO()):
+            args = empalme_flv.argumentos(argv[2:])
+    except SystemExit:
+        return None   # línea de comando de otra versión
+    if not args.salida.startswith(prefijo):
+        return None
+    return {
+        "rol": "empalme",
+        "username": args.salida[len(prefijo):],
+        "stream_keys": list(dict.fromkeys([args.activa, *args.fuentes])),
+        "progress": args.progress,
+    }
+
+
+# ============================================================
+# DECISIÓN
+# ============================================================
+
+def _destino(info):
+    """
+    A qué registro/clave va el proceso, o None si hay que matarlo.
+    Devuelve (registro, clave, meta, slots): los slots que ocupa.
+    """
+    from django.contrib.auth.models import User
+    from core.models import CanalTransmision, StreamConnection
+    from core.services.ffmpeg_manager import (
+        PROGRAM_HLS_PROCESSES,
+        PROGRAM_FEEDER_PROCESSES,
+        PROGRAM_RELAY_PROCESSES,
+    )
+    from core.services.program_switcher import SWITCHER_PROCESSES
+    from core.services.mezzanine import MEZZANINE_PROCESSES, EMPALME_PROCESSES
+    from core.services.radio_manager import RADIO_FEEDER_PROCESSES
+    from multistream.models import EstadoRetransmision
+    from multistream.services.base_streamer import RESTREAM_PROCESSES, clave_retransmision
+
+    rol = info["rol"]
+
+    if rol == "mezzanine":
+        # La mezzanine vive mientras la cámara esté autorizada, haya o no programa
+        conn = StreamConnection.objects.filter(
+            stream_key=info["stream_key"],
+            authorized=True,
+            status__in=[StreamConnection.Status.READY, StreamConnection.Status.ON_AIR],
+        ).first()
+        if not conn:
+            return None
+        return MEZZANINE_PROCESSES, conn.stream_key, {"user_id": conn.user_id}, [("mezzanine", conn.stream_key)]
+
+    user = User.objects.filter(username=info["username"]).first()
+    canal = CanalTransmision.objects.filter(usuario=user).first() if user else None
+    if not canal or not canal.en_vivo:
+        return None
+
+    slot_programa = [("program_switch", user.id)]
+
+    if rol == "hls":
+        return PROGRAM_HLS_PROCESSES, user.id, {}, [("hls", user.id)]
+
+    if rol == "relay":
+        return PROGRAM_RELAY_PROCESSES, user.id, {}, [("relay", user.id)]
+
+    if rol == "radio":
+        if not canal.modo_radio:
+            return None
+        return RADIO_FEEDER_PROCESSES, user.id, {}, slot_programa
+
+    if canal.modo_radio and (rol in ("feeder", "empalme") or rol == "switcher" and not info.get("radio")):
+        return None
+
+    if rol == "feeder":
+        return PROGRAM_FEEDER_PROCESSES, user.id, {}, slot_programa
+
+    if rol == "switcher":
+        # La entrada activa no está en el comando (cambia por stdin):
+        # la verdad es la cámara ON_AIR en la base
+        activa = StreamConnection.objects.filter(
+            user=user, status=StreamConnection.Status.ON_AIR
+        ).values_list("stream_key", flat=True).first()
+        if activa not in info["stream_keys"]:
+            return None
+        meta = {
+            "stream_keys": info["stream_keys"],
+            "activa": activa,
+            "radio": info.get("radio"),
+            "modo_radio": canal.modo_radio,
+        }
+        return SWITCHER_PROCESSES, user.id, meta, slot_programa
+
+    if rol == "empalme":
+        # Igual que el switcher: la activa cambia por stdin, manda la base
+        activa = StreamConnection.objects.filter(
+            user=user, status=StreamConnection.Status.ON_AIR
+        ).values_list("stream_key", flat=True).first()
+        if activa not in info["stream_keys"]:
+            return None
+        meta = {"fuentes": info["stream_keys"], "activa": activa}
+        return EMPALME_PROCESSES, user.id, meta, slot_programa
+
+    if rol == "restream":
+        # El tee del canal se adopta si todas sus plataformas siguen abiertas
+        abiertas = set(
+            EstadoRetransmision.objects.filter(usuario=user, detenido_en__isnull=True)
+            .values_list("plataforma", flat=True)
+        )
+        if not abiertas.issuperset(info["plataformas"]):
+            return None
+        meta = {"slaves": info["plataformas"]}
+        return RESTREAM_PROCESSES, clave_retransmision(user.id), meta, [("restream", user.id)]
+
+    return None
+
+
+# ============================================================
+# RECONCILIACIÓN
+# ============================================================
+
+def reconciliar():
+    """Adopta o mata los FFmpeg sobrevivientes y corrige la base. Idempotente."""
+    propios = pids_registrados()
+
+    candidatos = []
+    for pid, inicio, argv in _procesos_ffmpeg():
+        if pid in propios:
+            continue
+        info = clasificar(argv)
+        if info:
+            if "-progress" in argv:
+                # La telemetría del adoptado sigue donde estaba
+                info["progress"] = argv[argv.index("-progress") + 1]
+            candidatos.append((inicio, pid, info))
+
+    # Más nuevo primero: ante duplicados gana el último lanzado
+    candidatos.sort(key=lambda c: c[0], reverse=True)
+
+    ocupados = set()
+    adoptados = 0
+    huerfanos = []
+
+    for _, pid, info in candidatos:
+        destino = _destino(info)
+
+        if destino:
+            registro, clave, meta, slots = destino
+            if info.get("progress"):
+                meta = {**meta, "progress": info["progress"]}
+            libre = ocupados.isdisjoint(slots) and not esta_vivo(registro.get(clave))
+            if libre:
+                try:
+                    registro.adoptar(clave, pid, meta)
+                except Exception as e:
+                    logger.warning(f"[RECONCILIACION] No se pudo adoptar PID {pid}: {e}")
+                    continue
+                ocupados.update(slots)
+                adoptados += 1
+                logger.info(f"[RECONCILIACION] Adoptado {info['rol']} {clave} (PID: {pid})")
+                continue
+
+        logger.warning(f"[RECONCILIACION] Matando {info['rol']} huérfano (PID: {pid}) {info}")
+        try:
+            huerfanos.append(_HUERFANOS.adoptar(pid, pid))
+            _HUERFANOS.pop(pid)
+        except Exception:
+            pass  # ya terminó
+
+    detener_varios(huerfanos, esperar=False)
+
+    _corregir_canales()
+    _corregir_retransmisiones()
+
+    logger.info(
+        f"[RECONCILIACION] {adoptados} adoptados, {len(huerfanos)} detenidos"
+    )
+    return {"adoptados": adoptados, "detenidos": len(huerfanos)}
+
+
+def _corregir_canales():
+    """Canal marcado en vivo sin HLS maestro corriendo → apagado."""
+    from core.models import CanalTransmision
+    from core.services.ffmpeg_manager import PROGRAM_HLS_PROCESSES
+    from core.services.notificaciones_tiempo_real import notificar_estado_canal
+
+    for canal in CanalTransmision.objects.filter(en_vivo=True).select_related("usuario"):
+        if esta_vivo(PROGRAM_HLS_PROCESSES.get(canal.usuario_id)):
+            continue
+
+        logger.warning(f"[RECONCILIACION] Canal de {canal.usuario.username} sin HLS: se apaga")
+        canal.en_vivo = False
+        canal.inicio_transmision = None
+        canal.url_hls = ""
+        canal.modo_radio = False
+        canal.save(update_fields=["en_vivo", "inicio_transmision", "url_hls", "modo_radio"])
+
+        try:
+            notificar_estado_canal(canal.usuario)
+        except Exception as e:
+            logger.warning(f"[RECONCILIACION] No se pudo notificar canal: {e}")
+
+
+def _corregir_retransmisiones():
+    """
+    Cada EstadoRetransmision abierta apunta al PID adoptado, o se cierra
+    con error: el proceso_id viejo puede ser hoy un PID reutilizado.
+    """
+    from multistream.models import EstadoRetransmision
+    from multistream.services.base_streamer import RESTREAM_PROCESSES, clave_retransmision
+
+    for estado in EstadoRetransmision.objects.filter(detenido_en__isnull=True):
+        proceso = RESTREAM_PROCESSES.get(clave_retransmision(estado.usuario_id))
+
+        if esta_vivo(proceso) and estado.plataforma in proceso.meta.get("slaves", []):
+            if estado.proceso_id != proceso.pid or estado.estado != "activo":
+                estado.proceso_id = proceso.pid
+                estado.estado = "activo"
+                estado.save(update_fields=["proceso_id", "estado"])
+            continue
+
+        estado.estado = "error"
+        estado.mensaje_error = "Proceso perdido al reiniciar el servidor"
+        estado.detenido_en = timezone.now()
+        estado.save(update_fields=["estado", "mensaje_error", "detenido_en"])
+
+
+def _reconciliar_seguro():
+    try:
+        reconciliar()
+    except Exception:
+        logger.exception("[RECONCILIACION] Falló la reconciliación de arranque")
+
+
+def reconciliar_al_iniciar():
+    """
+    Hook de arranque del worker (streaming/asgi.py). En modo supervisor
+    no hace nada: reconcilia el daemon al levantar su socket.
+    """
+    if not settings.MEDIA_RECONCILIAR_AL_INICIAR or modo_supervisor():
+        return
+    threading.Thread(target=_reconciliar_seguro, name="reconciliacion", daemon=True).start()
@@ -0,0 +1,151 @@
+"""
+SONDA DE ENTRADA
+================
+Inspecciona con ffprobe el stream /live/<stream_key> que manda OBS y
+decide si ya coincide con el perfil del programa (720p30 H.264 + AAC 44.1k
+estéreo). Si coincide, el motor "passthrough" lo pasa en COPY sin
+decodificar ni recodificar.
+
+El resultado se cachea por stream_key: la sonda tarda ~1-2 s y no puede
+estar en el camino del corte. Se lanza en segundo plano cuando la cámara
+pasa a READY; un corte que no encuentra el dato va por el switcher y
+dispara la sonda para el próximo. La cache no vence: OBS no cambia el
+encoder sin reconectar, y al desconectarse la cámara se olvida
+(olvidar_sonda desde el hook de nginx).
+"""
+
+import json
+import subprocess
+import threading
+import logging
+from fractions import Fraction
+from django.conf import settings
+
+from core.services import perfil_programa
+
+logger = logging.getLogger(__name__)
+
+_SONDAS = {}     # stream_key -> info de probar_stream
+_EN_CURSO = {}   # stream_key -> token de la sonda en vuelo
+_SONDAS_LOCK = threading.Lock()
+
+
+def _fps(valor):
+    try:
+        fps = Fraction(valor or "0")
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+    return float(fps)
+
+
+def probar_stream(stream_key):
+    """
+    Devuelve {"video": {...}, "audio": {...}} con los parámetros del
+    primer stream de cada tipo, o None si no se pudo leer la entrada.
+    """
+    RTMP_HOST = settings.RTMP_SERVER_HOST_INTERNAL
+    RTMP_PORT = settings.RTMP_SERVER_PORT_INTERNAL
+
+    cmd = [
+        settings.FFPROBE_BIN_PATH,
+        "-v", "error",
+        "-analyzeduration", "2000000",
+        "-show_entries",
+        "stream=codec_type,codec_name,width,height,pix_fmt,avg_frame_rate,r_frame_rate,sample_rate,channels",
+        "-of", "json",
+        f"rtmp://{RTMP_HOST}:{RTMP_PORT}/live/{stream_key}",
+    ]
+
+    try:
+        resultado = subprocess.run(cmd, capture_output=True, timeout=8)
+        streams = json.loads(resultado.stdout or b"{}").get("streams", [])
+    except (subprocess.TimeoutExpired, ValueError, OSError) as e:
+        logger.warning(f"[SONDA] No se pudo inspeccionar {stream_key}: {e}")
+        return None
+
+    info = {}
+    for s in streams:
+        tipo = s.get("codec_type")
+        if tipo in ("video", "audio") and tipo not in info:
+            info[tipo] = s
+
+    return info or None
+
+
+def coincide_con_perfil(info):
+    if not info or "video" not in info or "audio" not in info:
+        return False
+
+    video = info["video"]
+    audio = info["audio"]
+
+    fps = _fps(video.get("avg_frame_rate")) or _fps(video.get("r_frame_rate"))
+
+    return (
+        video.get("codec_name") == "h264"
+        and video.get("width") == perfil_programa.ANCHO
+        and video.get("height") == perfil_programa.ALTO
+        and video.get("pix_fmt") == "yuv420p"
+        and abs(fps - perfil_programa.FPS) < 0.5
+        and audio.get("codec_name") == "aac"
+        and int(audio.get("sample_rate") or 0) == perfil_programa.AUDIO_RATE
+        and audio.get("channels") == perfil_programa.AUDIO_CANALES
+    )
+
+
+# ============================================================
+# CACHE
+# ============================================================
+
+def entrada_compatible(stream_key):
+    """
+    True si la entrada puede ir en COPY según la cache. Nunca sondea en
+    el camino del corte: sin dato, lanza la sonda en segundo plano y
+    devuelve False (este corte va por el switcher).
+    """
+    info = sonda_cacheada(stream_key)
+    if info is None:
+        precalentar_sonda(stream_key)
+        return False
+    return coincide_con_perfil(info)
+
+
+def sonda_cacheada(stream_key):
+    """Último resultado de probar_stream para la cámara, o None si no hay."""
+    with _SONDAS_LOCK:
+        return _SONDAS.get(stream_key)
+
+
+def _sondear(stream_key, token):
+    try:
+        info = probar_stream(stream_key)
+    finally:
+        with _SONDAS_LOCK:
+            vigente = _EN_CURSO.get(stream_key) is token
+            if vigente:
+                del _EN_CURSO[stream_key]
+
+    # Sin datos todavía (la cámara recién conecta): el próximo corte reintenta.
+    # Olvidada mientras tanto: el resultado es de una conexión que ya no está.
+    if info is None or not vigente:
+        return
+
+    with _SONDAS_LOCK:
+        _SONDAS[stream_key] = info
+    logger.info(f"[SONDA] {stream_key}: {'COPY' if coincide_con_perfil(info) else 'ENCODE'}")
+
+
+def precalentar_sonda(stream_key):
+    """Lanza la sonda en segundo plano (una sola por cámara a la vez)."""
+    token = object()
+    with _SONDAS_LOCK:
+        if stream_key in _SONDAS or stream_key in _EN_CURSO:
+            return
+        _EN_CURSO[stream_key] = token
+    threading.Thread(target=_sondear, args=(stream_key, token), name="sonda-entrada", daemon=True).start()
+
+
+def olvidar_sonda(stream_key):
+    with _SONDAS_LOCK:
+        _SONDAS.pop(stream_key, None)
+        _EN_CURSO.pop(stream_key, None)
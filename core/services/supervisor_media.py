@@ -0,0 +1,79 @@
+"""
+SUPERVISOR DE MEDIA
+===================
+Daemon asyncio dueño de TODOS los FFmpeg (HLS maestro, feeders, switcher,
+mezzanine, radio y retransmisiones). Django le habla por un socket Unix
+local con un RPC de una línea JSON por pedido:
+
+  → {"op": "spawn", "rol": "hls", "clave": "12", "cmd": [...], "log": "/tmp/x.log", "stdin": false}
+  ← {"ok": true, "pid": 4242}
+
+Así el tier web puede correr N workers daphne y un reload de Django no
+pierde ningún handle: el estado de media vive acá.
+
+Operaciones: spawn, adoptar, get, pop, meta, renombrar, list, pids,
+poll, signal, wait, send, detener, retirar y telemetria (ver
+tabla_procesos.py).
+"""
+
+import os
+import json
+import signal
+import asyncio
+import logging
+
+from core.services.tabla_procesos import TablaProcesos
+
+logger = logging.getLogger(__name__)
+
+
+class SupervisorMedia(TablaProcesos):
+
+    def __init__(self, socket_path, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_path = socket_path
+
+    # ============================================================
+    # SERVIDOR
+    # ============================================================
+
+    async def _atender(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    pedido = json.loads(line)
+                    op = getattr(self, f"op_{pedido.pop('op')}")
+                    respuesta = {"ok": True, **(await op(**pedido))}
+                except Exception as e:
+                    respuesta = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(respuesta).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, al_iniciar=None):
+        """
+        al_iniciar: callable bloqueante que corre en un thread apenas el
+        socket acepta pedidos (p.ej. la reconciliación de arranque).
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server = await asyncio.start_unix_server(self._atender, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+
+        parar = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, parar.set)
+
+        logger.info(f"[SUPERVISOR] Escuchando en {self.socket_path}")
+
+        if al_iniciar:
+            loop.run_in_executor(None, al_iniciar)
+
+        async with server:
+            await parar.wait()
+
+        logger.info("[SUPERVISOR] Deteniendo procesos hijos")
+        await self.detener_todo()
@@ -0,0 +1,380 @@
+"""
+TABLA DE PROCESOS (ASYNCIO)
+===========================
+Ciclo de vida de todos los FFmpeg sobre un event loop asyncio:
+
+  ✔ create_subprocess_exec: cada hijo tiene una tarea que lo espera,
+    así ningún proceso reemplazado queda zombie
+  ✔ Teardown escalonado: ['q' por stdin] → SIGTERM → SIGKILL
+  ✔ Detener N procesos cuesta UNA ventana de timeout, no N
+  ✔ Retiro diferido (overlap de switch) con call_later, sin threads
+  ✔ Adopción de FFmpeg que sobrevivieron a un reinicio (reconciliacion.py):
+    no son hijos nuestros, se siguen por /proc
+  ✔ Telemetría: todo FFmpeg se lanza con -progress y una tarea junta una
+    serie de muestras por proceso (fps, speed, bitrate, drops, tamaño)
+
+La usan tanto el daemon (supervisor_media.py) como el modo local de
+procesos.py, que la corre en un thread con su propio loop.
+"""
+
+import os
+import time
+import uuid
+import signal
+import asyncio
+import logging
+from collections import deque
+
+from core.services.progreso_ffmpeg import leer_progreso, muestra
+
+logger = logging.getLogger(__name__)
+
+SENALES = {
+    "TERM": signal.SIGTERM,
+    "KILL": signal.SIGKILL,
+}
+
+
+def inicio_proceso(pid):
+    """starttime de /proc/<pid>/stat: distingue un PID reutilizado del original."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # campos[0] = estado, campos[19] = starttime
+    if campos[0] == "Z":
+        return None
+    return int(campos[19])
+
+
+class _Adoptado:
+    """
+    Proceso que NO es hijo de esta tabla (sobrevivió a un reinicio).
+    Imita la interfaz de asyncio.subprocess.Process que usa la tabla;
+    como no se puede hacer waitpid, wait() sondea /proc.
+    """
+
+    stdin = None
+
+    def __init__(self, pid, inicio):
+        self.pid = pid
+        self._inicio = inicio
+        self._returncode = None
+
+    @property
+    def returncode(self):
+        if self._returncode is None and inicio_proceso(self.pid) != self._inicio:
+            # El código real lo cosecha init; solo sabemos que terminó
+            self._returncode = -1
+        return self._returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    async def wait(self):
+        while self.returncode is None:
+            await asyncio.sleep(0.5)
+        return self._returncode
+
+
+class _Entrada:
+
+    def __init__(self, rol, clave, proc, meta, muestras=0):
+        self.rol = rol
+        self.clave = clave
+        self.proc = proc
+        self.meta = meta
+        self.muestras = deque(maxlen=muestras)
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+
+class TablaProcesos:
+
+    def __init__(self, telemetria_intervalo=2.0, telemetria_muestras=150):
+        self.procesos = {}   # pid -> _Entrada
+        self.claves = {}     # (rol, clave) -> pid
+        self._tareas = set()
+        # Cuenta + spawn de un cupo sin que otro spawn se meta en el medio
+        self._admision = asyncio.Lock()
+        self.telemetria_intervalo = telemetria_intervalo
+        self.telemetria_muestras = telemetria_muestras
+        self._telemetria = None
+
+    # ============================================================
+    # PROCESOS
+    # ============================================================
+
+    def _en_segundo_plano(self, coro):
+        tarea = asyncio.create_task(coro)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+    def _con_progreso(self, cmd, log, meta):
+        """Agrega -progress a un comando FFmpeg y anota el archivo en meta."""
+        if not os.path.basename(cmd[0]).startswith("ffmpeg"):
+            return cmd
+        if "-progress" in cmd:
+            meta.setdefault("progress", cmd[cmd.index("-progress") + 1])
+            return cmd
+        # Único por lanzamiento: en un overlap el viejo y el nuevo comparten log
+        progreso = f"{os.path.splitext(log)[0]}.{uuid.uuid4().hex[:8]}.progress"
+        meta["progress"] = progreso
+        globales = ["-progress", progreso]
+        if "-stats_period" not in cmd:
+            globales += ["-stats_period", str(self.telemetria_intervalo)]
+        return [cmd[0], *globales, *cmd[1:]]
+
+    async def _spawn(self, rol, clave, cmd, log, stdin=False, meta=None):
+        meta = dict(meta or {})
+        cmd = self._con_progreso(cmd, log, meta)
+
+        with open(log, "wb") as log_file:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,
+            )
+
+        self.procesos[proc.pid] = _Entrada(rol, clave, proc, meta, self.telemetria_muestras)
+        self.claves[(rol, clave)] = proc.pid
+        self._en_segundo_plano(self._reap(proc))
+        self._iniciar_telemetria()
+
+        logger.info(f"[PROCESOS] {rol}:{clave} iniciado (PID: {proc.pid})")
+        return {"pid": proc.pid, "meta": meta}
+
+    async def _reap(self, proc):
+        returncode = await proc.wait()
+        logger.info(f"[PROCESOS] PID {proc.pid} terminó ({returncode})")
+        entrada = self.procesos.get(proc.pid)
+        if entrada and entrada.meta.get("progress"):
+            try:
+                os.remove(entrada.meta["progress"])
+            except OSError:
+                pass
+        # Si ninguna clave lo referencia ya no hace falta recordarlo
+        if proc.pid not in self.claves.values():
+            self.procesos.pop(proc.pid, None)
+
+    def _olvidar_si_termino(self, pid):
+        entrada = self.procesos.get(pid)
+        if entrada and entrada.returncode is not None and pid not in self.claves.values():
+            self.procesos.pop(pid, None)
+
+    async def _terminar(self, entrada, timeout, salida=None):
+        """
+        Escalamiento de un proceso: salida limpia por stdin (si se pide),
+        SIGTERM y por último SIGKILL. Siempre espera al hijo (sin zombies).
+        """
+        proc = entrada.proc
+        pasos = []
+        if salida and proc.stdin:
+            pasos.append(lambda: proc.stdin.write(salida.encode()))
+        pasos += [proc.terminate, proc.kill]
+
+        for paso in pasos:
+            if proc.returncode is not None:
+                break
+            try:
+                paso()
+            except (ProcessLookupError, ConnectionResetError, BrokenPipeError):
+                pass
+            try:
+                await asyncio.wait_for(asyncio.shield(proc.wait()), timeout)
+            except asyncio.TimeoutError:
+                continue
+
+        await proc.wait()
+        return proc.returncode
+
+    async def _terminar_varios(self, pids, timeout, salida=None):
+        entradas = [self.procesos[pid] for pid in pids if pid in self.procesos]
+        # En paralelo: diez procesos comparten la misma ventana de timeout
+        await asyncio.gather(*(self._terminar(e, timeout, salida) for e in entradas))
+
+    # ============================================================
+    # OPERACIONES
+    # ============================================================
+
+    async def op_spawn(self, rol, clave, cmd, log, stdin=False, meta=None, cupo=None):
+        """
+        Con cupo: devuelve el proceso vivo de la clave si lo hay, o
+        {"pid": None} si el rol ya tiene `cupo` procesos vivos.
+        """
+        if cupo is None:
+            return await self._spawn(rol, clave, cmd, log, stdin, meta)
+
+        async with self._admision:
+            vivos = {
+                c: pid for (r, c), pid in self.claves.items()
+                if r == rol and pid in self.procesos and self.procesos[pid].returncode is None
+            }
+            if clave in vivos:
+                entrada = self.procesos[vivos[clave]]
+                return {"pid": vivos[clave], "meta": entrada.meta}
+            if len(vivos) >= cupo:
+                return {"pid": None}
+            return await self._spawn(rol, clave, cmd, log, stdin, meta)
+
+    async def op_adoptar(self, rol, clave, pid, meta=None):
+        """Registra un FFmpeg huérfano ya corriendo (ver reconciliacion.py)."""
+        inicio = inicio_proceso(pid)
+        if inicio is None:
+            raise ProcessLookupError(f"PID {pid} no está vivo")
+
+        proc = _Adoptado(pid, inicio)
+        self.procesos[pid] = _Entrada(rol, clave, proc, meta or {})
+        self.claves[(rol, clave)] = pid
+        self._en_segundo_plano(self._reap(proc))
+
+        logger.info(f"[PROCESOS] {rol}:{clave} adoptado (PID: {pid})")
+        return {"pid": pid}
+
+    async def op_pids(self):
+        return {"pids": [pid for pid, e in self.procesos.items() if e.returncode is None]}
+
+    async def op_get(self, rol, clave):
+        pid = self.claves.get((rol, clave))
+        if pid is None or pid not in self.procesos:
+            return {"pid": None}
+        entrada = self.procesos[pid]
+        return {"pid": pid, "returncode": entrada.returncode, "meta": entrada.meta}
+
+    async def op_pop(self, rol, clave):
+        respuesta = await self.op_get(rol, clave)
+        pid = self.claves.pop((rol, clave), None)
+        if pid is not None:
+            self._olvidar_si_termino(pid)
+        return respuesta
+
+    async def op_meta(self, rol, clave, cambios):
+        pid = self.claves.get((rol, clave))
+        if pid in self.procesos:
+            self.procesos[pid].meta.update(cambios)
+        return {}
+
+    async def op_renombrar(self, rol, clave, nueva):
+        """Mueve el proceso a otra clave del mismo rol, sin tocarlo."""
+        pid = self.claves.pop((rol, clave), None)
+        if pid in self.procesos:
+            self.claves[(rol, nueva)] = pid
+            self.procesos[pid].clave = nueva
+        return {}
+
+    async def op_list(self, rol):
+        return {"procesos": [
+            [clave, pid, self.procesos[pid].returncode, self.procesos[pid].meta]
+            for (r, clave), pid in self.claves.items()
+            if r == rol and pid in self.procesos
+        ]}
+
+    async def op_poll(self, pid):
+        entrada = self.procesos.get(pid)
+        # PID olvidado = ya terminó y fue cosechado
+        return {"returncode": entrada.returncode if entrada else -1}
+
+    async def op_signal(self, pid, sig):
+        entrada = self.procesos.get(pid)
+        if entrada and entrada.returncode is None:
+            entrada.proc.send_signal(SENALES[sig])
+        return {}
+
+    async def op_wait(self, pid, espera):
+        entrada = self.procesos.get(pid)
+        if entrada is None:
+            return {"returncode": -1}
+        try:
+            returncode = await asyncio.wait_for(asyncio.shield(entrada.proc.wait()), espera)
+        except asyncio.TimeoutError:
+            return {"timeout": True}
+        return {"returncode": returncode}
+
+    async def op_send(self, pid, data):
+        entrada = self.procesos.get(pid)
+        if entrada is None or entrada.proc.stdin is None:
+            raise KeyError(f"PID sin stdin: {pid}")
+        entrada.proc.stdin.write(data.encode())
+        await entrada.proc.stdin.drain()
+        return {}
+
+    async def op_detener(self, pids, timeout=5, salida=None, esperar=True):
+        """
+        Detiene varios procesos en paralelo. Con esperar=False devuelve
+        enseguida y el escalamiento sigue en el loop.
+        """
+        tarea = self._en_segundo_plano(self._terminar_varios(pids, timeout, salida))
+        if esperar:
+            await tarea
+        return {}
+
+    async def op_retirar(self, pid, demora, timeout=5):
+        """Detiene el proceso dentro de `demora` segundos (overlap de switch)."""
+        async def _retirar():
+            await asyncio.sleep(demora)
+            await self._terminar_varios([pid], timeout)
+
+        self._en_segundo_plano(_retirar())
+        return {}
+
+    # ============================================================
+    # TELEMETRÍA
+    # ============================================================
+
+    def _iniciar_telemetria(self):
+        if self._telemetria is None or self._telemetria.done():
+            self._telemetria = asyncio.create_task(self._muestrear())
+
+    async def _muestrear(self):
+        while True:
+            await asyncio.sleep(self.telemetria_intervalo)
+            ahora = time.monotonic()
+            for entrada in list(self.procesos.values()):
+                progreso = entrada.meta.get("progress")
+                if not progreso or entrada.returncode is not None:
+                    continue
+                # Lectura de la cola (4 KB): no amerita salir del loop
+                bloque = leer_progreso(progreso)
+                if not bloque:
+                    continue
+                anterior = entrada.muestras[-1] if entrada.muestras else None
+                actual = muestra(bloque, anterior, ahora - anterior["_m"] if anterior else None)
+                actual["_m"] = ahora
+                actual["t"] = round(time.time(), 1)
+                entrada.muestras.append(actual)
+
+    async def op_telemetria(self, rol=None, ultimas=None):
+        """Series de los procesos vivos; `ultimas` recorta cada serie."""
+        procesos = []
+        for (r, clave), pid in self.claves.items():
+            entrada = self.procesos.get(pid)
+            if entrada is None or entrada.returncode is not None or (rol and r != rol):
+                continue
+            muestras = list(entrada.muestras)
+            if ultimas:
+                muestras = muestras[-ultimas:]
+            procesos.append({
+                "rol": r,
+                "clave": clave,
+                "pid": pid,
+                "meta": entrada.meta,
+                "muestras": [{k: v for k, v in m.items() if k != "_m"} for m in muestras],
+            })
+        return {"procesos": procesos}
+
+    async def detener_todo(self, timeout=5):
+        vivos = [pid for pid, e in self.procesos.items() if e.returncode is None]
+        await self._terminar_varios(vivos, timeout)
@@ -0,0 +1,100 @@
+"""
+TELEMETRÍA DE FFMPEG
+====================
+Cada FFmpeg que lanza la tabla de procesos escribe -progress y la tabla
+guarda una serie por proceso (tabla_procesos.py). Este módulo la lleva
+al operador:
+
+  tabla ──► telemetria_usuario(user_id) ──► GET /telemetria/
+        └─► thread cada TELEMETRIA_PUSH_INTERVALO ──► WebSocket "telemetria"
+
+Un proceso en vivo con speed < TELEMETRIA_VELOCIDAD_MINIMA se marca
+"lento": el feeder ya no alcanza tiempo real y los viewers van a notarlo
+en segundos.
+"""
+
+import time
+import threading
+import logging
+from collections import defaultdict
+from django.conf import settings
+
+from core.services.procesos import telemetria, modo_supervisor
+from core.services.notificaciones_tiempo_real import notificar_telemetria
+
+logger = logging.getLogger(__name__)
+
+# Procesos sin dueño (reconciliacion.py): no van a ningún panel
+ROLES_OCULTOS = {"huerfano"}
+
+_LOCK = threading.Lock()
+_THREAD = None
+
+
+def usuario_de(clave, meta):
+    """user_id dueño de un proceso: meta["user_id"] o el prefijo de la clave."""
+    if meta.get("user_id") is not None:
+        return meta["user_id"]
+    prefijo = str(clave).split(":", 1)[0]
+    return int(prefijo) if prefijo.isdigit() else None
+
+
+def _resumen(proceso):
+    muestras = proceso["muestras"]
+    ultima = muestras[-1] if muestras else None
+    return {
+        "rol": proceso["rol"],
+        "clave": proceso["clave"],
+        "pid": proceso["pid"],
+        "lento": bool(ultima) and ultima["speed"] < settings.TELEMETRIA_VELOCIDAD_MINIMA,
+        "muestras": muestras,
+    }
+
+
+def _por_usuario(ultimas=None):
+    agrupados = defaultdict(list)
+    for proceso in telemetria(ultimas=ultimas):
+        if proceso["rol"] in ROLES_OCULTOS:
+            continue
+        user_id = usuario_de(proceso["clave"], proceso["meta"])
+        if user_id is not None:
+            agrupados[user_id].append(_resumen(proceso))
+    return agrupados
+
+
+def telemetria_usuario(user_id, ultimas=None):
+    """Series de los FFmpeg del usuario (ver procesos.telemetria)."""
+    return _por_usuario(ultimas).get(user_id, [])
+
+
+# ============================================================
+# PUSH AL PANEL
+# ============================================================
+
+def _loop():
+    while True:
+        time.sleep(settings.TELEMETRIA_PUSH_INTERVALO)
+        try:
+            for user_id, procesos in _por_usuario(ultimas=1).items():
+                notificar_telemetria(user_id, procesos)
+        except Exception:
+            logger.exception("[TELEMETRIA] Falló el envío de telemetría")
+
+
+def iniciar_telemetria():
+    """Arranca el thread de envío al panel (idempotente)."""
+    global _THREAD
+    with _LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _THREAD = threading.Thread(target=_loop, name="telemetria-ffmpeg", daemon=True)
+            _THREAD.start()
+
+
+def iniciar_telemetria_al_iniciar():
+    """
+    Hook de arranque del worker (streaming/asgi.py). En modo supervisor
+    envía el daemon media_supervisor: un solo emisor aunque haya N workers.
+    """
+    if modo_supervisor():
+        return
+    iniciar_telemetria()
@@ -0,0 +1,288 @@
+"""
+TRABAJOS DE CONTROL
+===================
+Las operaciones de control que lanzan procesos o esperan (switch de
+cámara, modo radio, retransmisiones) no corren dentro del request:
+
+  vista ──► encolar(user, "switch", cam_index=2) ──► 202 {"job_id": ...}
+                 │
+                 └─► TrabajoControl (base) ──► drenador ──► handler ──► WebSocket "trabajo"
+                                                             (en_cola, corriendo, avances, ok / error)
+
+La cola es la tabla TrabajoControl, no la memoria del worker: cualquier
+proceso consulta un trabajo por id y el orden por usuario vale entre
+todos los workers. Los trabajos de un mismo usuario corren en orden, uno
+por vez: para tomar el siguiente, el drenador bloquea la fila del
+usuario (select_for_update) y solo lo toma si no hay otro corriendo. Los
+de usuarios distintos corren en paralelo, hasta
+settings.TRABAJOS_MAX_WORKERS por proceso.
+
+Si el proceso que corría un trabajo muere, el trabajo no traba la cola
+del usuario: se da por interrumpido (pid muerto en este host, o sin
+novedades en TRABAJOS_VENCIMIENTO_SEGUNDOS). Al arrancar,
+reanudar_trabajos() drena lo que quedó en cola.
+
+Los handlers se registran con @trabajo("tipo") en el servicio que
+corresponde y reciben (user, avance, **params); avance(mensaje) empuja
+un paso intermedio al panel. Params y resultado van a un JSONField. Un
+ValueError es un error "de negocio" y su mensaje llega al operador;
+cualquier otra excepción se loguea.
+"""
+
+import os
+import time
+import socket
+import importlib
+import threading
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Módulos que registran handlers con @trabajo; se importan al crear la cola
+MODULOS_HANDLERS = (
+    "core.services.estado_transmision",
+    "core.services.radio_manager",
+    "multistream.services.stream_manager",
+)
+
+# Cada cuánto un proceso borra los trabajos terminados viejos
+LIMPIEZA_INTERVALO = 3600
+
+_HANDLERS = {}
+
+
+def trabajo(tipo):
+    """Decorador: registra el handler de un tipo de trabajo."""
+    def registrar(funcion):
+        _HANDLERS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def _worker():
+    # Se calcula en cada uso: los workers de uvicorn/daphne hacen fork después del import
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _como_dict(job):
+    return {
+        "id": job.id.hex,
+        "trabajo": job.tipo,
+        "estado": job.estado,
+        "mensaje": job.mensaje,
+        "resultado": job.resultado,
+    }
+
+
+def _publicar(job):
+    from core.services.notificaciones_tiempo_real import notificar_trabajo
+    notificar_trabajo(job.usuario_id, _como_dict(job))
+
+
+class ColaTrabajos:
+
+    def __init__(self, max_workers):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trabajos")
+        self._lock = threading.Lock()
+        self._drenando = set()      # user_id con drenador en este proceso
+        self._otra_vuelta = set()   # user_id que recibió trabajos mientras se drenaba
+        self._ultima_limpieza = 0.0
+
+    def encolar(self, user, tipo, **params):
+        from core.models import TrabajoControl
+
+        if tipo not in _HANDLERS:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+
+        job = TrabajoControl.objects.create(usuario=user, tipo=tipo, params=params)
+        _publicar(job)
+        self.drenar(user.id)
+        return job
+
+    def drenar(self, user_id):
+        """Lanza el drenador del usuario en este proceso (si no hay uno ya)."""
+        with self._lock:
+            if user_id in self._drenando:
+                self._otra_vuelta.add(user_id)
+                return
+            self._drenando.add(user_id)
+        self._pool.submit(self._drenar, user_id)
+
+    def _drenar(self, user_id):
+        """Corre los trabajos del usuario hasta que no quede ninguno para tomar."""
+        try:
+            while True:
+                job = self._tomar_siguiente(user_id)
+                if job is None:
+                    with self._lock:
+                        # Lo encolado mientras se tomaba: una vuelta más
+                        if user_id in self._otra_vuelta:
+                            self._otra_vuelta.discard(user_id)
+                            continue
+                        self._drenando.discard(user_id)
+                        return
+                self._ejecutar(job)
+        except Exception:
+            logger.exception(f"[TRABAJOS] Falló el drenador de user {user_id}")
+            with self._lock:
+                self._drenando.discard(user_id)
+                self._otra_vuelta.discard(user_id)
+        finally:
+            # El thread del pool vive más que el trabajo
+            close_old_connections()
+            self._limpiar_viejos()
+
+    def _tomar_siguiente(self, user_id):
+        """
+        El trabajo en cola más viejo del usuario, ya marcado como
+        corriendo, o None si no hay o si otro proceso corre uno.
+        """
+        from django.contrib.auth.models import User
+        from core.models import TrabajoControl
+
+        Estado = TrabajoControl.Estado
+        vencimiento = timezone.now() - timedelta(seconds=settings.TRABAJOS_VENCIMIENTO_SEGUNDOS)
+        cerrados = []
+        tomado = None
+
+        with transaction.atomic():
+            # Serializa la toma entre workers: uno por usuario a la vez
+            User.objects.select_for_update().filter(pk=user_id).first()
+
+            activos = TrabajoControl.objects.filter(
+                usuario_id=user_id,
+                estado__in=[Estado.EN_COLA, Estado.CORRIENDO],
+            ).select_related("usuario").order_by("creado_en")
+
+            for job in activos:
+                if job.estado == Estado.CORRIENDO and not self._abandonado(job, vencimiento):
+                    break  # sigue en otro proceso: ese drenador toma el siguiente
+                if job.estado == Estado.CORRIENDO or job.creado_en < vencimiento:
+                    job.mensaje = (
+                        "Interrumpido: el proceso que lo corría terminó"
+                        if job.estado == Estado.CORRIENDO else "Vencido sin correr"
+                    )
+                    job.estado = Estado.ERROR
+                    job.save(update_fields=["estado", "mensaje", "actualizado_en"])
+                    cerrados.append(job)
+                    continue
+
+                job.estado = Estado.CORRIENDO
+                job.worker = _worker()
+                job.save(update_fields=["estado", "worker", "actualizado_en"])
+                tomado = job
+                break
+
+        for job in cerrados:
+            logger.warning(f"[TRABAJOS] {job.tipo} de user {user_id}: {job.mensaje}")
+            _publicar(job)
+        return tomado
+
+    @staticmethod
+    def _abandonado(job, vencimiento):
+        host, _, pid = job.worker.rpartition(":")
+        if host == socket.gethostname() and pid.isdigit() and not _proceso_vivo(int(pid)):
+            return True
+        return job.actualizado_en < vencimiento
+
+    def _ejecutar(self, job):
+        from core.models import TrabajoControl
+
+        Estado = TrabajoControl.Estado
+        user = job.usuario
+        _publicar(job)
+
+        def avance(mensaje):
+            job.mensaje = mensaje[:255]
+            job.save(update_fields=["mensaje", "actualizado_en"])
+            _publicar(job)
+
+        try:
+            job.resultado = _HANDLERS[job.tipo](user, avance, **job.params)
+            job.estado = Estado.OK
+        except ValueError as e:
+            job.estado = Estado.ERROR
+            job.mensaje = str(e)[:255]
+        except Exception:
+            logger.exception(f"[TRABAJOS] Falló {job.tipo} de {user.username}")
+            job.estado = Estado.ERROR
+            job.mensaje = "Error interno"
+        finally:
+            close_old_connections()
+
+        job.save(update_fields=["estado", "mensaje", "resultado", "actualizado_en"])
+        logger.info(f"[TRABAJOS] {job.tipo} de {user.username}: {job.estado}")
+        _publicar(job)
+
+    def _limpiar_viejos(self):
+        from core.models import TrabajoControl
+
+        with self._lock:
+            if time.monotonic() - self._ultima_limpieza < LIMPIEZA_INTERVALO:
+                return
+            self._ultima_limpieza = time.monotonic()
+
+        limite = timezone.now() - timedelta(hours=settings.TRABAJOS_RETENCION_HORAS)
+        TrabajoControl.objects.filter(
+            estado__in=[TrabajoControl.Estado.OK, TrabajoControl.Estado.ERROR],
+            actualizado_en__lt=limite,
+        ).delete()
+
+
+_COLA = None
+_COLA_LOCK = threading.Lock()
+
+
+def _cola():
+    global _COLA
+    with _COLA_LOCK:
+        if _COLA is None:
+            for modulo in MODULOS_HANDLERS:
+                importlib.import_module(modulo)
+            _COLA = ColaTrabajos(settings.TRABAJOS_MAX_WORKERS)
+    return _COLA
+
+
+def encolar(user, tipo, **params):
+    """Encola un trabajo de control y devuelve su id."""
+    return _cola().encolar(user, tipo, **params).id.hex
+
+
+def estado_trabajo(user, job_id):
+    """dict del trabajo si existe y es del usuario, si no None."""
+    from core.models import TrabajoControl
+
+    try:
+        job = TrabajoControl.objects.get(pk=job_id, usuario=user)
+    except (TrabajoControl.DoesNotExist, ValidationError, ValueError):
+        return None
+    return _como_dict(job)
+
+
+def reanudar_trabajos():
+    """Al arrancar: drena los usuarios con trabajos en cola (o de un proceso muerto)."""
+    from core.models import TrabajoControl
+
+    usuarios = TrabajoControl.objects.filter(
+        estado__in=[TrabajoControl.Estado.EN_COLA, TrabajoControl.Estado.CORRIENDO],
+    ).order_by().values_list("usuario_id", flat=True).distinct()
+
+    cola = _cola()
+    for user_id in usuarios:
+        cola.drenar(user_id)
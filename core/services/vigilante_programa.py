@@ -0,0 +1,93 @@
+"""
+VIGILANTE DEL PROGRAMA
+======================
+El switcher es la única fuente de /program_switch: si termina (crash,
+una entrada que no abre) o se cuelga, el canal se queda sin programa y
+ningún hook de nginx se entera. Un thread del dueño de los procesos (el
+worker en modo local, el daemon media_supervisor en modo supervisor)
+revisa cada switcher registrado cada SWITCHER_VIGILANCIA_INTERVALO:
+
+  - proceso terminado                            → se reconstruye
+  - -progress quieto SWITCHER_ESTANCADO_SEGUNDOS → se mata y se reconstruye
+
+La reconstrucción sale de la base (ver ffmpeg_manager.recuperar_switcher):
+la cámara ON_AIR más las cámaras que siguen conectadas.
+"""
+
+import time
+import threading
+import logging
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.services.procesos import esta_vivo, modo_supervisor
+from core.services.progreso_ffmpeg import VigiaAvance
+from core.services.program_switcher import SWITCHER_PROCESSES
+
+logger = logging.getLogger(__name__)
+
+_VIGIA = VigiaAvance()
+_LOCK = threading.Lock()
+_THREAD = None
+
+
+def revisar():
+    """Una pasada sobre todos los switchers registrados."""
+    from django.contrib.auth.models import User
+    from core.services.ffmpeg_manager import recuperar_switcher
+
+    for clave, proceso in SWITCHER_PROCESSES.items():
+        if esta_vivo(proceso):
+            if not _VIGIA.estancado(
+                proceso.pid, proceso.meta.get("progress"), settings.SWITCHER_ESTANCADO_SEGUNDOS
+            ):
+                continue
+            motivo = "sin avance (estancado)"
+        else:
+            motivo = f"terminó ({proceso.poll()})"
+
+        _VIGIA.olvidar(proceso.pid)
+        user = User.objects.filter(pk=int(clave)).first()
+        if user is None:
+            SWITCHER_PROCESSES.pop(clave)
+            continue
+
+        logger.warning(f"[SWITCHER] Switcher de {user.username} {motivo}: se reconstruye")
+        try:
+            recuperar_switcher(user, proceso)
+        except Exception:
+            logger.exception(f"[SWITCHER] No se pudo recuperar el switcher de {user.username}")
+
+
+# ============================================================
+# LOOP
+# ============================================================
+
+def _loop():
+    while True:
+        time.sleep(settings.SWITCHER_VIGILANCIA_INTERVALO)
+        try:
+            revisar()
+        except Exception:
+            logger.exception("[SWITCHER] Falló la revisión de switchers")
+        finally:
+            close_old_connections()
+
+
+def iniciar_vigilante():
+    """Arranca el thread de revisión (idempotente)."""
+    global _THREAD
+    with _LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _THREAD = threading.Thread(target=_loop, name="vigilante-programa", daemon=True)
+            _THREAD.start()
+
+
+def iniciar_vigilante_al_iniciar():
+    """
+    Hook de arranque del worker (streaming/asgi.py). En modo supervisor
+    lo arranca el daemon media_supervisor, dueño de los procesos.
+    """
+    if modo_supervisor():
+        return
+    iniciar_vigilante()
@@ -9,6 +9,60 @@ function getCSRFToken() {
     return cookieValue;
 }
 
+// ===================================
+// TRABAJOS DE CONTROL (202 + WS)
+// ===================================
+// Las vistas de control devuelven {job_id}; el resultado llega por
+// WebSocket como {tipo: "trabajo", id, estado, mensaje, resultado}.
+// Si el WS no trae el final a tiempo, se consulta /trabajos/<id>/.
+const trabajosTerminados = new Map();
+const trabajosEsperando = new Map();
+
+document.addEventListener('ws:mensaje', (e) => {
+  const data = e.detail;
+  if (data.tipo !== 'trabajo' || (data.estado !== 'ok' && data.estado !== 'error')) return;
+
+  const resolver = trabajosEsperando.get(data.id);
+  if (resolver) {
+    trabajosEsperando.delete(data.id);
+    resolver(data);
+  } else {
+    // Puede llegar antes que la respuesta del POST
+    trabajosTerminados.set(data.id, data);
+  }
+});
+
+function esperarTrabajo(jobId, timeoutMs = 30000) {
+  if (trabajosTerminados.has(jobId)) {
+    const data = trabajosTerminados.get(jobId);
+    trabajosTerminados.delete(jobId);
+    return Promise.resolve(data);
+  }
+
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(async () => {
+      trabajosEsperando.delete(jobId);
+      try {
+        const res = await fetch(`/trabajos/${jobId}/`);
+        const data = await res.json();
+        if (data.ok && (data.estado === 'ok' || data.estado === 'error')) {
+          resolve(data);
+        } else {
+          reject(new Error('El trabajo no terminó a tiempo'));
+        }
+      } catch (err) {
+        reject(err);
+      }
+    }, timeoutMs);
+
+    trabajosEsperando.set(jobId, (data) => {
+      clearTimeout(timer);
+      resolve(data);
+    });
+  });
+}
+window.esperarTrabajo = esperarTrabajo;
+
 // ===================================
 // CAMERA STATE MANAGER (SNAPSHOT + WS)
 // ===================================
@@ -34,6 +88,7 @@ class CameraStatePoller {
       if (data.ok && data.cameras) {
         this.allCameras = data.cameras;
         this.syncCameras(this.allCameras);
+        this.setBajaLatencia(Boolean(data.canal && data.canal.baja_latencia));
 
         const currentOnAirCam = Object.values(data.cameras).find(cam => cam.status === 'on_air');
         
@@ -43,7 +98,7 @@ class CameraStatePoller {
           }, 300);
         } else if (data.canal && data.canal.en_vivo && data.canal.hls_url) {
           setTimeout(() => {
-            this.syncPreview({ status: 'on_air', hls_url: data.canal.hls_url });
+            this.syncPreview({ status: 'on_air', hls_url: data.canal.hls_url, baja_latencia: data.canal.baja_latencia });
           }, 300);
         } else {
           this.syncPreview(null);
@@ -80,10 +135,14 @@ class CameraStatePoller {
     }
 
     try {
-      await fetch(`/poner-al-aire/${camIndex}/`, {
+      const res = await fetch(`/poner-al-aire/${camIndex}/`, {
         method: 'POST',
         headers: { 'X-CSRFToken': getCSRFToken() }
       });
+      const { job_id } = await res.json();
+
+      const trabajo = await esperarTrabajo(job_id);
+      if (trabajo.estado === 'error') throw new Error(trabajo.mensaje);
       console.log(`✅ Cámara ${camIndex} puesta al aire`);
     } catch (e) {
       console.error('❌ Error poniendo cámara al aire', e);
@@ -218,7 +277,9 @@ class CameraStatePoller {
         lowLatencyMode: true,
         enableWorker: true,
         maxBufferLength: 10,
-        maxMaxBufferLength: 20
+        maxMaxBufferLength: 20,
+        // Segmentos de 1 s: reproducir a ~2 segmentos del borde en vivo
+        ...(cam.baja_latencia ? { liveSyncDurationCount: 2, liveMaxLatencyDurationCount: 4 } : {})
       });
       hls.loadSource(cam.hls_url);
       hls.attachMedia(video);
@@ -249,6 +310,16 @@ class CameraStatePoller {
     }
   }
 
+  setBajaLatencia(activa) {
+    const btn = document.getElementById('btnBajaLatencia');
+    if (btn) btn.classList.toggle('active', activa);
+    // El empaquetado cambió: el player se recrea con la config nueva
+    if (this.bajaLatencia !== undefined && this.bajaLatencia !== activa) {
+      this.destroyPreview();
+    }
+    this.bajaLatencia = activa;
+  }
+
   destroyPreview() {
     const video = document.getElementById('mainPreviewVideo');
     const empty = document.getElementById('previewEmpty');
@@ -665,12 +736,69 @@ document.addEventListener('DOMContentLoaded', () => {
         break;
 
       case 'estado_canal':
-        const canalData = data.en_vivo ? { status: 'on_air', hls_url: data.hls_url } : null;
+        window.cameraPoller.setBajaLatencia(Boolean(data.baja_latencia));
+        const canalData = data.en_vivo ? { status: 'on_air', hls_url: data.hls_url, baja_latencia: data.baja_latencia } : null;
         window.cameraPoller.syncPreview(canalData);
         break;
+
+      case 'lote_estado': {
+        // Varios cambios de una transacción: un solo syncCameras
+        const poller = window.cameraPoller;
+        Object.assign(poller.allCameras, data.cameras || {});
+        (data.eliminadas || []).forEach(idx => {
+          const wrapper = document.querySelector(`.camera-wrapper[data-camera="${idx}"]`);
+          if (wrapper) wrapper.remove();
+          delete poller.lastState[idx];
+          delete poller.allCameras[idx];
+        });
+
+        console.log(`📡 WebSocket: lote de ${Object.keys(data.cameras || {}).length} cámaras`);
+        poller.syncCameras(poller.allCameras);
+
+        if (data.canal) {
+          poller.setBajaLatencia(Boolean(data.canal.baja_latencia));
+          poller.syncPreview(data.canal.en_vivo
+            ? { status: 'on_air', hls_url: data.canal.hls_url, baja_latencia: data.canal.baja_latencia }
+            : null);
+        } else {
+          const alAire = Object.values(data.cameras || {}).find(c => c.status === 'on_air' && c.hls_url);
+          if (alAire) {
+            setTimeout(() => poller.syncPreview({ status: 'on_air', hls_url: alAire.hls_url }), 200);
+          }
+        }
+        break;
+      }
+
+      case 'telemetria':
+        mostrarTelemetria(data.procesos || []);
+        break;
     }
   };
 
+  // Velocidad del proceso más lento: < 1.00x = ya no alcanza tiempo real
+  function mostrarTelemetria(procesos) {
+    const stat = document.getElementById('telemetriaStat');
+    const valor = document.getElementById('telemetriaVelocidad');
+    if (!stat || !valor) return;
+
+    const conMuestra = procesos.filter(p => p.muestras && p.muestras.length);
+    if (!conMuestra.length) {
+      valor.textContent = '--';
+      stat.classList.remove('lento');
+      stat.title = 'Sin procesos';
+      return;
+    }
+
+    const ultima = (p) => p.muestras[p.muestras.length - 1];
+    const peor = conMuestra.reduce((a, b) => (ultima(b).speed < ultima(a).speed ? b : a));
+    valor.textContent = ultima(peor).speed.toFixed(2) + 'x';
+    stat.classList.toggle('lento', conMuestra.some(p => p.lento));
+    stat.title = conMuestra.map(p => {
+      const m = ultima(p);
+      return `${p.rol} ${p.clave}: ${m.speed.toFixed(2)}x, ${m.fps} fps, ${m.bitrate_kbps} kbps, drop ${m.drop_frames}, dup ${m.dup_frames}`;
+    }).join('\n');
+  }
+
   const stopBtn = document.getElementById('btnStopStream');
   const volume = document.getElementById('previewVolume');
   const video = document.getElementById('mainPreviewVideo');
@@ -688,6 +816,23 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
+  const latencyBtn = document.getElementById('btnBajaLatencia');
+  if (latencyBtn) {
+    latencyBtn.addEventListener('click', async () => {
+      const activar = !latencyBtn.classList.contains('active');
+      latencyBtn.disabled = true;
+      try {
+        await fetch('/canal/baja-latencia/', {
+          method: 'POST',
+          headers: { 'X-CSRFToken': getCSRFToken() },
+          body: new URLSearchParams({ activar: activar ? '1' : '0' })
+        });
+      } finally {
+        latencyBtn.disabled = false;
+      }
+    });
+  }
+
   if (volume && video) {
     volume.addEventListener('input', (e) => {
       video.muted = false;
@@ -137,6 +137,33 @@
         empty.style.display = "block";
       });
 
+    function mostrarPreview(url) {
+      thumb.src = url + "?t=" + Date.now();
+      preview.style.display = "block";
+      empty.style.display = "none";
+    }
+
+    // La normalización corre en segundo plano: consultar hasta que termine
+    function esperarImagenProcesada(intentos = 30) {
+      fetch(URLS.imagenEstado)
+        .then(r => r.json())
+        .then(data => {
+          if (data.procesando && intentos > 0) {
+            setTimeout(() => esperarImagenProcesada(intentos - 1), 1000);
+            return;
+          }
+          if (data.tiene_imagen) {
+            mostrarPreview(data.url_preview);
+            msg.style.color = "#00ff88";
+            msg.textContent = "✅ Imagen guardada correctamente";
+          } else {
+            msg.style.color = "#ff3b30";
+            msg.textContent = "❌ No se pudo procesar la imagen";
+          }
+        })
+        .catch(() => setTimeout(() => esperarImagenProcesada(intentos - 1), 1000));
+    }
+
     // Abrir selector de archivo
     btnSeleccionar.addEventListener("click", () => inputFile.click());
 
@@ -168,10 +195,12 @@
       .then(data => {
         if (data.ok) {
           msg.style.color = "#00ff88";
-          msg.textContent = "✅ " + data.mensaje;
-          thumb.src = data.url_preview + "?t=" + Date.now();
-          preview.style.display = "block";
-          empty.style.display = "none";
+          msg.textContent = (data.procesando ? "⏳ " : "✅ ") + data.mensaje;
+          if (data.procesando) {
+            esperarImagenProcesada();
+          } else {
+            mostrarPreview(data.url_preview);
+          }
           fileName.textContent = "";
           btnSubir.style.display = "none";
           inputFile.value = "";
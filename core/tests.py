@@ -1,3 +1,2091 @@
-from django.test import TestCase
+import io
+import os
+import json
+import time
+import queue
+import logging
+import asyncio
+import tempfile
+import subprocess
+import threading
+from types import SimpleNamespace
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.consumers import PanelConsumer
+from core.management.commands._bench import crear_usuarios_bench
+from core.models import CanalTransmision, Cliente, StreamConnection, TrabajoControl
+from core.services import (
+    bitacora, estado_transmision, ffmpeg_manager, imagenes_radio, metricas, mezzanine, program_switcher,
+    procesos, radio_manager, reconciliacion, sonda_entrada, telemetria, trabajos,
+)
+from core.services import notificaciones_tiempo_real as notificaciones
+from core.services.empalme_flv import AUDIO, CABECERA_FLV, VIDEO, Empalme, Tag, leer_tags
+from core.services.planificador import PlanificadorDiferido
+from core.services.program_switcher import ProgramSwitcher
+from core.services.progreso_ffmpeg import VigiaAvance, decimal, entero, leer_progreso, muestra, paquetes_escritos
+from core.services.supervisor_media import SupervisorMedia
+from core.services.tabla_procesos import TablaProcesos
+from multistream.models import EstadoRetransmision
+from multistream.services import base_streamer
+
+
+class _ProcesoFalso:
+    """Handle de procesos.Proceso sin tabla: registra lo que llega por stdin."""
+
+    def __init__(self, pid=4242, returncode=None, meta=None):
+        self.pid = pid
+        self.returncode = returncode
+        self.meta = meta or {}
+        self.enviado = []
+
+    def poll(self):
+        return self.returncode
+
+    def enviar(self, texto):
+        self.enviado.append(texto)
+
+
+class _RegistroEnMemoria:
+    """RegistroProcesos en memoria: adoptar() devuelve un handle vivo."""
+
+    def __init__(self):
+        self.procesos = {}
+
+    def get(self, clave):
+        return self.procesos.get(clave)
+
+    def adoptar(self, clave, pid, meta=None):
+        self.procesos[clave] = _ProcesoFalso(pid=pid, meta=meta)
+        return self.procesos[clave]
+
+    def pop(self, clave):
+        return self.procesos.pop(clave, None)
+
+
+# ============================================================
+# SWITCHER
+# ============================================================
+
+@override_settings(
+    FFMPEG_BIN_PATH="ffmpeg",
+    RTMP_SERVER_HOST_INTERNAL="127.0.0.1",
+    RTMP_SERVER_PORT_INTERNAL=1935,
+    SWITCHER_ENTRADA_TIMEOUT=5,
+)
+class ComandoSwitcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.user = SimpleNamespace(id=7, username="canal")
+
+    def test_una_entrada_por_camara_con_timeout(self):
+        cmd = ProgramSwitcher.build_ffmpeg_command(self.user, ["a", "b", "c"], "b")
+
+        entradas = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-i"]
+        self.assertEqual(entradas, [f"rtmp://127.0.0.1:1935/live/{k}" for k in "abc"])
+        self.assertEqual(cmd.count("-rw_timeout"), 3)
+        self.assertEqual(cmd[cmd.index("-rw_timeout") + 1], "5000000")
+        self.assertEqual(cmd[-1], "rtmp://127.0.0.1:1935/program_switch/canal")
+
+    def test_selector_arranca_en_la_activa_y_rellena_entradas(self):
+        cmd = ProgramSwitcher.build_ffmpeg_command(self.user, ["a", "b", "c"], "b")
+        grafo = cmd[cmd.index("-filter_complex") + 1]
+
+        self.assertIn("[v0][v1][v2]streamselect@vsel=inputs=3:map=1[vout]", grafo)
+        self.assertIn("[a0][a1][a2]astreamselect@asel=inputs=3:map=1[aout]", grafo)
+        # Una entrada que termina no corta el grafo
+        self.assertEqual(grafo.count("tpad=stop=-1:stop_mode=clone"), 3)
+        self.assertEqual(grafo.count(",apad["), 3)
+
+    def test_corte_por_stdin(self):
+        proceso = _ProcesoFalso(meta={"stream_keys": ["a", "b", "c"], "activa": "a"})
+        switcher = ProgramSwitcher(self.user, proceso)
+
+        with mock.patch("core.services.program_switcher.SWITCHER_PROCESSES") as registro:
+            self.assertTrue(switcher.seleccionar("c"))
+
+        self.assertEqual(proceso.enviado, [
+            "cstreamselect@vsel -1 map 2\n"
+            "castreamselect@asel -1 map 2\n"
+        ])
+        registro.actualizar_meta.assert_called_once_with(7, activa="c", modo_radio=False)
+        self.assertEqual(switcher.stream_key_activa, "c")
+
+    def test_corte_a_camara_ajena_pide_reconstruir(self):
+        proceso = _ProcesoFalso(meta={"stream_keys": ["a", "b"], "activa": "a"})
+
+        self.assertFalse(ProgramSwitcher(self.user, proceso).seleccionar("z"))
+        self.assertEqual(proceso.enviado, [])
+
+
+@override_settings(
+    FFMPEG_BIN_PATH="ffmpeg",
+    RTMP_SERVER_HOST_INTERNAL="127.0.0.1",
+    RTMP_SERVER_PORT_INTERNAL=1935,
+    SWITCHER_ENTRADA_TIMEOUT=5,
+)
+class RadioEnSwitcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.user = SimpleNamespace(id=7, username="canal")
+        self.registro = mock.patch("core.services.program_switcher.SWITCHER_PROCESSES").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _switcher(self, modo_radio=False, radio="/cache/clip.mp4"):
+        proceso = _ProcesoFalso(meta={
+            "stream_keys": ["a", "b"], "activa": "a", "radio": radio, "modo_radio": modo_radio,
+        })
+        return ProgramSwitcher(self.user, proceso), proceso
+
+    def test_clip_como_entrada_de_video_sin_audio(self):
+        cmd = ProgramSwitcher.build_ffmpeg_command(
+            self.user, ["a", "b"], "b", radio="/cache/clip.mp4", modo_radio=True
+        )
+        grafo = cmd[cmd.index("-filter_complex") + 1]
+
+        clip = cmd.index("/cache/clip.mp4")
+        self.assertEqual(cmd[clip - 4:clip], ["-re", "-stream_loop", "-1", "-i"])
+        self.assertIn("[2:v:0]fps=30,format=yuv420p,setsar=1[v2]", grafo)
+        # Al aire en radio: video del clip, audio de la cámara activa
+        self.assertIn("[v0][v1][v2]streamselect@vsel=inputs=3:map=2[vout]", grafo)
+        self.assertIn("[a0][a1]astreamselect@asel=inputs=2:map=1[aout]", grafo)
+
+    def test_pasar_a_radio_y_volver_son_cortes(self):
+        switcher, proceso = self._switcher()
+
+        self.assertTrue(switcher.cambiar_modo_radio(True, "b"))
+        # Un corte de cámara en radio solo mueve el audio
+        self.assertTrue(switcher.seleccionar("a"))
+        self.assertTrue(switcher.cambiar_modo_radio(False, "a"))
+
+        self.assertEqual(proceso.enviado, [
+            "cstreamselect@vsel -1 map 2\ncastreamselect@asel -1 map 1\n",
+            "cstreamselect@vsel -1 map 2\ncastreamselect@asel -1 map 0\n",
+            "cstreamselect@vsel -1 map 0\ncastreamselect@asel -1 map 0\n",
+        ])
+        self.assertFalse(switcher.modo_radio)
+
+    def test_sin_clip_no_hay_radio_por_comando(self):
+        switcher, proceso = self._switcher(radio=None)
+
+        self.assertFalse(switcher.cambiar_modo_radio(True, "a"))
+        self.assertEqual(proceso.enviado, [])
+
+    def test_activar_radio_no_relanza_el_hls(self):
+        from core.services import radio_manager
+
+        switcher, proceso = self._switcher()
+        mock.patch.object(ffmpeg_manager, "get_switcher", return_value=switcher).start()
+        reiniciar = mock.patch.object(ffmpeg_manager, "reiniciar_program_hls").start()
+        detener = mock.patch.object(ffmpeg_manager, "detener_fuente_programa").start()
+
+        radio_manager.activar_radio(self.user, "b")
+        radio_manager.desactivar_radio(self.user, "b")
+
+        self.assertEqual(len(proceso.enviado), 2)
+        reiniciar.assert_not_called()
+        detener.assert_not_called()
+
+
+@override_settings(SWITCHER_ARRANQUE_MINIMO=15)
+class RecuperarSwitcherTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        CanalTransmision.objects.create(usuario=self.user, en_vivo=True)
+        for i, (key, status) in enumerate([
+            ("k0", StreamConnection.Status.READY),
+            ("k1", StreamConnection.Status.ON_AIR),
+            ("k2", StreamConnection.Status.READY),
+        ]):
+            StreamConnection.objects.create(
+                user=self.user, cam_index=i, stream_key=key, status=status, authorized=True,
+            )
+
+        self.registro = mock.patch.object(ffmpeg_manager, "SWITCHER_PROCESSES").start()
+        self.reconstruir = mock.patch.object(ffmpeg_manager, "reconstruir_switcher").start()
+        self.stop = mock.patch.object(ffmpeg_manager, "stop_switcher").start()
+        self.clip = mock.patch.object(ffmpeg_manager, "_clip_radio", return_value=None).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _caido(self, vivio, **meta):
+        return _ProcesoFalso(returncode=1, meta={
+            "stream_keys": ["k0", "k1", "k2"], "activa": "k1", "inicio": time.time() - vivio, **meta,
+        })
+
+    def test_switcher_muerto_se_reconstruye_con_la_camara_al_aire(self):
+        caido = self._caido(vivio=300)
+        self.registro.get.return_value = caido
+
+        ffmpeg_manager.actualizar_entradas_programa(self.user)
+
+        self.stop.assert_called_once_with(self.user)
+        self.reconstruir.assert_called_once_with(self.user, ["k0", "k1", "k2"], "k1", None, False)
+
+    def test_caida_al_arrancar_vuelve_solo_con_la_activa(self):
+        caido = self._caido(vivio=2)
+        self.registro.get.return_value = caido
+
+        ffmpeg_manager.recuperar_switcher(self.user, caido)
+
+        self.reconstruir.assert_called_once_with(self.user, ["k1"], "k1", None, False)
+
+    def test_en_radio_vuelve_con_el_clip(self):
+        CanalTransmision.objects.filter(usuario=self.user).update(modo_radio=True)
+        self.clip.return_value = "/cache/clip.mp4"
+        caido = self._caido(vivio=300, modo_radio=True)
+        self.registro.get.return_value = caido
+
+        ffmpeg_manager.recuperar_switcher(self.user, caido)
+
+        self.reconstruir.assert_called_once_with(
+            self.user, ["k0", "k1", "k2"], "k1", "/cache/clip.mp4", True
+        )
+
+    def test_en_radio_por_feeder_no_se_reconstruye(self):
+        CanalTransmision.objects.filter(usuario=self.user).update(modo_radio=True)
+        caido = self._caido(vivio=300)
+        self.registro.get.return_value = caido
+
+        ffmpeg_manager.recuperar_switcher(self.user, caido)
+
+        self.reconstruir.assert_not_called()
+
+    def test_canal_apagado_no_se_reconstruye(self):
+        CanalTransmision.objects.filter(usuario=self.user).update(en_vivo=False)
+        caido = self._caido(vivio=300)
+        self.registro.get.return_value = caido
+
+        ffmpeg_manager.recuperar_switcher(self.user, caido)
+
+        self.stop.assert_called_once_with(self.user)
+        self.reconstruir.assert_not_called()
+
+    def test_ya_reconstruido_por_otro_worker(self):
+        caido = self._caido(vivio=300)
+        self.registro.get.return_value = _ProcesoFalso(pid=caido.pid + 1)
+
+        ffmpeg_manager.recuperar_switcher(self.user, caido)
+
+        self.stop.assert_not_called()
+        self.reconstruir.assert_not_called()
+
+
+# ============================================================
+# PROGRESO DE FFMPEG
+# ============================================================
+
+class ProgresoFFmpegTests(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.progreso = tempfile.mkstemp(suffix=".progress")
+        os.close(fd)
+        self.addCleanup(os.remove, self.progreso)
+
+    def _escribir(self, texto):
+        with open(self.progreso, "a") as f:
+            f.write(texto)
+
+    def test_ultimo_bloque_completo(self):
+        self._escribir("frame=10\nout_time_us=333333\ntotal_size=1000\nprogress=continue\n")
+        self._escribir("frame=40\nout_time_us=1333333\ntotal_size=N/A\nprogress=continue\n")
+        # Bloque a medio escribir: todavía no cuenta
+        self._escribir("frame=70\nout_time_us=2333")
+
+        bloque = leer_progreso(self.progreso)
+
+        self.assertEqual(bloque["frame"], "40")
+        self.assertEqual(bloque["out_time_us"], "1333333")
+        self.assertEqual(bloque["progress"], "continue")
+        self.assertEqual(entero(bloque, "total_size"), 0)
+
+    def test_sin_bloque_cerrado_ni_archivo(self):
+        self._escribir("frame=1\nout_time_us=0\n")
+        self.assertEqual(leer_progreso(self.progreso), {})
+        self.assertEqual(leer_progreso(None), {})
+        self.assertEqual(leer_progreso(self.progreso + ".no"), {})
+
+    def test_solo_lee_la_cola(self):
+        for i in range(500):
+            self._escribir(f"frame={i}\nout_time_us={i * 33333}\nprogress=continue\n")
+        self._escribir("frame=500\nout_time_us=16666500\nprogress=end\n")
+
+        bloque = leer_progreso(self.progreso)
+
+        self.assertGreater(os.path.getsize(self.progreso), 4096)
+        self.assertEqual(bloque, {"frame": "500", "out_time_us": "16666500", "progress": "end"})
+
+    def test_paquetes_escritos(self):
+        self.assertFalse(paquetes_escritos({}))
+        self.assertFalse(paquetes_escritos({"out_time_us": "N/A", "total_size": "0"}))
+        self.assertTrue(paquetes_escritos({"out_time_us": "N/A", "total_size": "48"}))
+        self.assertTrue(paquetes_escritos({"out_time_us": "33333"}))
+
+    def test_decimal_con_unidad(self):
+        bloque = {"speed": "1.01x", "bitrate": "2450.3kbits/s", "fps": "N/A"}
+        self.assertEqual(decimal(bloque, "speed", "x"), 1.01)
+        self.assertEqual(decimal(bloque, "bitrate", "kbits/s"), 2450.3)
+        self.assertEqual(decimal(bloque, "fps"), 0.0)
+
+    def test_muestra_sobre_el_ultimo_intervalo(self):
+        anterior = muestra({"frame": "300", "out_time_us": "10000000", "total_size": "1000000"})
+        actual = muestra(
+            {
+                "frame": "330", "out_time_us": "11000000", "total_size": "1250000",
+                "fps": "30.0", "speed": "1.00x", "bitrate": "800.0kbits/s",
+            },
+            anterior, dt=2.0,
+        )
+
+        # 30 cuadros y 1 s de medios en 2 s de reloj: el feeder va a mitad de tiempo real
+        self.assertEqual(actual["fps"], 15.0)
+        self.assertEqual(actual["speed"], 0.5)
+        self.assertEqual(actual["bitrate_kbps"], 2000.0)
+
+    def test_muestra_sin_anterior_usa_los_promedios(self):
+        actual = muestra({"frame": "30", "fps": "29.97", "speed": "1.02x", "bitrate": "N/A"})
+        self.assertEqual((actual["fps"], actual["speed"], actual["bitrate_kbps"]), (29.97, 1.02, 0.0))
+
+
+class VigiaAvanceTests(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.progreso = tempfile.mkstemp(suffix=".progress")
+        os.close(fd)
+        self.addCleanup(os.remove, self.progreso)
+
+    def _escribir(self, out_time_us, total_size):
+        with open(self.progreso, "a") as f:
+            f.write(f"out_time_us={out_time_us}\ntotal_size={total_size}\nprogress=continue\n")
+
+    def test_estancado_solo_si_no_avanza_en_la_ventana(self):
+        vigia = VigiaAvance()
+        self._escribir(1_000_000, 5000)
+
+        self.assertFalse(vigia.estancado(1, self.progreso, 10, ahora=100))
+        self.assertFalse(vigia.estancado(1, self.progreso, 10, ahora=109))
+        self.assertTrue(vigia.estancado(1, self.progreso, 10, ahora=111))
+
+        # Un avance reinicia la ventana
+        self._escribir(2_000_000, 9000)
+        self.assertFalse(vigia.estancado(1, self.progreso, 10, ahora=112))
+        self.assertFalse(vigia.estancado(1, self.progreso, 10, ahora=121))
+        self.assertTrue(vigia.estancado(1, self.progreso, 10, ahora=123))
+
+    def test_sin_progress_no_se_juzga(self):
+        self.assertFalse(VigiaAvance().estancado(1, None, 0, ahora=100))
+
+
+# ============================================================
+# SONDA DE ENTRADA
+# ============================================================
+
+INFO_720P = {
+    "video": {
+        "codec_name": "h264", "width": 1280, "height": 720,
+        "pix_fmt": "yuv420p", "avg_frame_rate": "30/1",
+    },
+    "audio": {"codec_name": "aac", "sample_rate": "44100", "channels": 2},
+}
+
+
+class SondaEntradaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.liberar = threading.Event()
+        self.terminada = threading.Event()
+        self.llamadas = []
+
+        def probar(stream_key):
+            self.llamadas.append(stream_key)
+            self.liberar.wait(5)
+            self.terminada.set()
+            return INFO_720P
+
+        mock.patch.object(sonda_entrada, "probar_stream", probar).start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(sonda_entrada.olvidar_sonda, "cam")
+        self.addCleanup(self.liberar.set)
+
+    def _esperar_fin(self):
+        self.liberar.set()
+        self.assertTrue(self.terminada.wait(5))
+        # _sondear guarda apenas probar_stream devuelve
+        for _ in range(100):
+            if sonda_entrada.sonda_cacheada("cam") is not None:
+                return
+            time.sleep(0.01)
+
+    def test_sin_cache_no_bloquea_el_corte(self):
+        inicio = time.monotonic()
+        self.assertFalse(sonda_entrada.entrada_compatible("cam"))
+        self.assertLess(time.monotonic() - inicio, 1)
+
+        # Los cortes siguientes no lanzan otra sonda mientras hay una en vuelo
+        self.assertFalse(sonda_entrada.entrada_compatible("cam"))
+        self._esperar_fin()
+
+        self.assertEqual(self.llamadas, ["cam"])
+        self.assertTrue(sonda_entrada.entrada_compatible("cam"))
+
+    def test_olvidada_en_vuelo_descarta_el_resultado(self):
+        sonda_entrada.precalentar_sonda("cam")
+        sonda_entrada.olvidar_sonda("cam")
+        self.liberar.set()
+        self.assertTrue(self.terminada.wait(5))
+        time.sleep(0.05)
+
+        self.assertIsNone(sonda_entrada.sonda_cacheada("cam"))
+
+
+class CorteConCopiaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.orden = []
+        self.user = SimpleNamespace(id=7, username="canal")
+        registro = mock.patch.object(ffmpeg_manager, "PROGRAM_FEEDER_PROCESSES").start()
+        registro.pop.return_value = viejo = _ProcesoFalso()
+        registro.lanzar.side_effect = lambda *a, **k: self.orden.append("lanzar")
+        self.viejo = viejo
+        mock.patch.object(
+            ffmpeg_manager, "detener", side_effect=lambda p, **k: self.orden.append(("detener", p)),
+        ).start()
+        self.retirar = mock.patch.object(ffmpeg_manager, "retirar_despues").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_el_publicador_viejo_sale_antes_de_lanzar_el_nuevo(self):
+        ffmpeg_manager._switch_con_copia(self.user, "k2")
+
+        # nginx-rtmp no admite dos publicadores en /program_switch
+        self.assertEqual(self.orden, [("detener", self.viejo), "lanzar"])
+        self.retirar.assert_not_called()
+
+
+# ============================================================
+# HLS ABR
+# ============================================================
+
+def _info_altura(alto):
+    return {"video": {"height": alto}, "audio": {}}
+
+
+@override_settings(PROGRAM_HLS_ABR=True, PROGRAM_HLS_RENDITIONS="1080,720,480,360")
+class EscaleraHLSTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.sondas = {}
+        self.precalentadas = []
+        mock.patch.object(ffmpeg_manager, "_entradas_programa", lambda user: ["a", "b"]).start()
+        mock.patch.object(ffmpeg_manager, "sonda_cacheada", self.sondas.get).start()
+        mock.patch.object(ffmpeg_manager, "precalentar_sonda", self.precalentadas.append).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_nunca_por_encima_del_programa(self):
+        self.assertEqual(ffmpeg_manager._escalera_hls(self.user), [720, 480, 360])
+        # Sin sondas rige ALTO y se lanzan para el próximo arranque
+        self.assertEqual(self.precalentadas, ["a", "b"])
+
+    def test_tope_en_la_camara_mas_alta(self):
+        self.sondas.update(a=_info_altura(480), b=_info_altura(360))
+        self.assertEqual(ffmpeg_manager._escalera_hls(self.user), [480, 360])
+
+        self.sondas["b"] = _info_altura(1080)
+        self.assertEqual(ffmpeg_manager._escalera_hls(self.user), [720, 480, 360])
+
+    @override_settings(PROGRAM_HLS_RENDITIONS="1080")
+    def test_sin_rendiciones_validas_vuelve_a_copy(self):
+        self.assertEqual(ffmpeg_manager._escalera_hls(self.user), [720])
+
+    def test_filtro_en_cascada(self):
+        self.assertEqual(
+            ffmpeg_manager._filtro_escalera([480, 360]),
+            "[0:v:0]scale=854:480,split=2[v480][c480];[c480]scale=640:360[v360]",
+        )
+
+
+# ============================================================
+# HLS DE BAJA LATENCIA
+# ============================================================
+
+def _opcion(cmd, nombre):
+    return cmd[cmd.index(nombre) + 1]
+
+
+@override_settings(
+    FFMPEG_BIN_PATH="ffmpeg",
+    RTMP_SERVER_HOST_INTERNAL="127.0.0.1",
+    RTMP_SERVER_PORT_INTERNAL=1935,
+    RESTREAM_RELAY_PUERTO_BASE=20000,
+    PROGRAM_HLS_ABR=False,
+)
+class HLSBajaLatenciaTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(HLS_PATH=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.program_dir = os.path.join(directorio.name, "program")
+
+        self.user = User.objects.create_user("canal")
+        self.canal = CanalTransmision.objects.create(usuario=self.user, en_vivo=True)
+        self.registro = mock.patch.object(ffmpeg_manager, "PROGRAM_HLS_PROCESSES").start()
+        self.registro.get.return_value = None
+        self.addCleanup(mock.patch.stopall)
+
+    def _comando(self):
+        ffmpeg_manager.start_program_hls(self.user)
+        self.registro.lanzar.assert_called_once()
+        return self.registro.lanzar.call_args.args[1]
+
+    def test_por_defecto_mpegts_de_2s(self):
+        cmd = self._comando()
+
+        self.assertNotIn("-hls_segment_type", cmd)
+        self.assertEqual((_opcion(cmd, "-hls_time"), _opcion(cmd, "-hls_list_size")), ("2", "10"))
+        self.assertEqual(_opcion(cmd, "-hls_segment_filename"), os.path.join(self.program_dir, "canal_%05d.ts"))
+
+    def test_baja_latencia_fmp4_de_1s(self):
+        self.canal.baja_latencia = True
+        self.canal.save()
+
+        cmd = self._comando()
+
+        self.assertEqual(_opcion(cmd, "-hls_segment_type"), "fmp4")
+        self.assertEqual(_opcion(cmd, "-hls_fmp4_init_filename"), "canal_init.mp4")
+        self.assertEqual((_opcion(cmd, "-hls_time"), _opcion(cmd, "-hls_list_size")), ("1", "4"))
+        self.assertEqual(_opcion(cmd, "-hls_segment_filename"), os.path.join(self.program_dir, "canal_%05d.m4s"))
+        # Sigue siendo COPY y la playlist no cambia de nombre: el reproductor no se entera
+        self.assertEqual(_opcion(cmd, "-c"), "copy")
+        self.assertEqual(cmd[-1], os.path.join(self.program_dir, "canal.m3u8"))
+        self.assertIn("append_list", _opcion(cmd, "-hls_flags"))
+        # El relay de retransmisiones no depende del empaquetado
+        self.assertIn(f"udp://127.0.0.1:{20000 + self.user.id}?pkt_size=1316", cmd)
+
+    @override_settings(PROGRAM_HLS_ABR=True, PROGRAM_HLS_RENDITIONS="720,480")
+    def test_baja_latencia_con_escalera(self):
+        self.canal.baja_latencia = True
+        self.canal.save()
+        mock.patch.object(ffmpeg_manager, "_entradas_programa", lambda user: []).start()
+
+        cmd = self._comando()
+
+        self.assertEqual(_opcion(cmd, "-hls_segment_type"), "fmp4")
+        self.assertEqual(_opcion(cmd, "-hls_fmp4_init_filename"), "canal_%v_init.mp4")
+        self.assertEqual(
+            _opcion(cmd, "-hls_segment_filename"), os.path.join(self.program_dir, "canal_%v_%05d.m4s")
+        )
+
+    def test_cambiar_el_modo_relanza_solo_el_hls(self):
+        self.client.force_login(self.user)
+        with mock.patch("core.views.reiniciar_program_hls") as reiniciar, \
+                mock.patch("core.views.notificar_estado_canal") as notificar:
+            respuesta = self.client.post(reverse("baja_latencia_canal"), {"activar": "1"})
+            self.client.post(reverse("baja_latencia_canal"), {"activar": "1"})
+
+        self.assertEqual(respuesta.json(), {"ok": True, "baja_latencia": True})
+        self.canal.refresh_from_db()
+        self.assertTrue(self.canal.baja_latencia)
+        # Pedir el mismo modo otra vez no relanza nada
+        reiniciar.assert_called_once_with(self.user)
+        notificar.assert_called_once_with(self.user)
+
+
+# ============================================================
+# RELAY DE RETRANSMISIONES
+# ============================================================
+
+@override_settings(
+    FFMPEG_BIN_PATH="ffmpeg",
+    RTMP_SERVER_HOST_INTERNAL="127.0.0.1",
+    RTMP_SERVER_PORT_INTERNAL=1935,
+    RESTREAM_RELAY_PUERTO_BASE=20000,
+    RESTREAM_RELAY_APP="relay",
+)
+class RelayRetransmisionesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.user = SimpleNamespace(id=7, username="canal")
+        self.relay = _RegistroEnMemoria()
+        self.relay.lanzar = mock.Mock(side_effect=self._lanzar)
+        mock.patch.object(ffmpeg_manager, "PROGRAM_RELAY_PROCESSES", self.relay).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _lanzar(self, clave, cmd, log):
+        self.relay.procesos[clave] = _ProcesoFalso(pid=5000 + self.relay.lanzar.call_count)
+        return self.relay.procesos[clave]
+
+    def test_lee_el_udp_del_maestro_y_publica_en_el_relay(self):
+        ffmpeg_manager.asegurar_relay(self.user)
+
+        clave, cmd, log = self.relay.lanzar.call_args.args
+        self.assertEqual((clave, log), (7, "/tmp/relay_canal.log"))
+        self.assertEqual(_opcion(cmd, "-i"), "udp://127.0.0.1:20007?fifo_size=1000000&overrun_nonfatal=1")
+        # Reloj al llegar: un relanzamiento del maestro no hace retroceder los timestamps
+        self.assertEqual(_opcion(cmd, "-use_wallclock_as_timestamps"), "1")
+        self.assertEqual((_opcion(cmd, "-c"), _opcion(cmd, "-f")), ("copy", "flv"))
+        self.assertEqual(cmd[-1], "rtmp://127.0.0.1:1935/relay/canal")
+        self.assertEqual(ffmpeg_manager.url_relay(self.user), cmd[-1])
+
+    def test_el_maestro_manda_al_mismo_puerto(self):
+        self.assertIn("udp://127.0.0.1:20007?pkt_size=1316", ffmpeg_manager._salida_relay(self.user))
+
+    def test_uno_solo_por_canal_y_vuelve_si_murio(self):
+        ffmpeg_manager.asegurar_relay(self.user)
+        ffmpeg_manager.asegurar_relay(self.user)
+        self.assertEqual(self.relay.lanzar.call_count, 1)
+
+        self.relay.get(7).returncode = 1
+        ffmpeg_manager.asegurar_relay(self.user)
+        self.assertEqual(self.relay.lanzar.call_count, 2)
+
+    def test_sobrevive_al_relanzamiento_del_maestro(self):
+        ffmpeg_manager.asegurar_relay(self.user)
+        relay = self.relay.get(7)
+
+        with mock.patch.object(ffmpeg_manager, "detener") as detener, \
+                mock.patch.object(ffmpeg_manager, "PROGRAM_HLS_PROCESSES") as hls, \
+                mock.patch.object(ffmpeg_manager, "start_program_hls"):
+            ffmpeg_manager.reiniciar_program_hls(self.user)
+
+        detener.assert_called_once_with(hls.pop.return_value)
+        self.assertIs(self.relay.get(7), relay)
+
+    def test_se_detiene_con_el_programa(self):
+        ffmpeg_manager.asegurar_relay(self.user)
+        relay = self.relay.get(7)
+
+        for nombre in ("PROGRAM_FEEDER_PROCESSES", "SWITCHER_PROCESSES", "PROGRAM_HLS_PROCESSES"):
+            mock.patch.object(ffmpeg_manager, nombre).start().pop.return_value = None
+        with mock.patch.object(ffmpeg_manager, "detener_varios") as detener_varios, \
+                mock.patch.object(ffmpeg_manager, "detener_empalme"):
+            ffmpeg_manager.stop_program_hls(self.user)
+
+        self.assertIn(relay, detener_varios.call_args.args[0])
+        self.assertIsNone(self.relay.get(7))
+
+
+# ============================================================
+# MEZZANINE: EMPALME Y ADMISIÓN
+# ============================================================
+
+def _cabecera_video(sps=b"sps"):
+    return Tag(VIDEO, 0, bytes([0x17, 0, 0, 0, 0]) + sps)
+
+
+def _keyframe(ts):
+    return Tag(VIDEO, ts, bytes([0x17, 1, 0, 0, 0]) + b"idr")
+
+
+def _cuadro(ts):
+    return Tag(VIDEO, ts, bytes([0x27, 1, 0, 0, 0]) + b"p")
+
+
+def _cabecera_audio():
+    return Tag(AUDIO, 0, bytes([0xAF, 0, 0x12, 0x10]))
+
+
+def _audio(ts):
+    return Tag(AUDIO, ts, bytes([0xAF, 1]) + b"aac")
+
+
+class EmpalmeFLVTests(SimpleTestCase):
+
+    def setUp(self):
+        self.salida = io.BytesIO()
+        self.empalme = Empalme(self.salida, activa="a")
+        for fuente in ("a", "b"):
+            self.empalme.recibir(fuente, _cabecera_video())
+            self.empalme.recibir(fuente, _cabecera_audio())
+
+    def _escrito(self):
+        return [
+            (tag.tipo, tag.ts, tag.es_cabecera, tag.es_keyframe)
+            for tag in leer_tags(io.BytesIO(self.salida.getvalue()))
+        ]
+
+    def test_arranca_en_keyframe_con_la_linea_de_tiempo_en_cero(self):
+        self.empalme.recibir("a", _cuadro(10))      # antes del primer keyframe: afuera
+        self.empalme.recibir("a", _keyframe(100))
+        self.empalme.recibir("a", _audio(120))
+        self.empalme.recibir("b", _keyframe(5000))  # no está al aire
+
+        self.assertEqual(self._escrito(), [
+            (VIDEO, 0, True, False),
+            (AUDIO, 0, True, False),
+            (VIDEO, 0, False, True),
+            (AUDIO, 20, False, False),
+        ])
+
+    def test_corte_entra_en_keyframe_sin_hueco_ni_retroceso(self):
+        self.empalme.recibir("a", _keyframe(100))
+        self.empalme.recibir("a", _audio(120))
+
+        self.empalme.cortar("b")
+        self.empalme.recibir("a", _cuadro(133))     # sigue la saliente hasta el keyframe
+        self.empalme.recibir("b", _cuadro(5033))    # la entrante espera su keyframe
+        self.empalme.recibir("b", _keyframe(6000))
+        self.empalme.recibir("a", _cuadro(166))     # la saliente ya no sale
+        self.empalme.recibir("b", _audio(5990))     # audio previo al keyframe de entrada
+        self.empalme.recibir("b", _audio(6010))
+
+        escrito = self._escrito()[2:]  # sin las cabeceras iniciales
+        self.assertEqual(escrito, [
+            (VIDEO, 0, False, True),
+            (AUDIO, 20, False, False),
+            (VIDEO, 33, False, False),
+            # Mismas cabeceras en ambas mezzanines: no se repiten
+            (VIDEO, 66, False, True),
+            (AUDIO, 76, False, False),
+        ])
+        self.assertEqual(self.empalme.activa, "b")
+
+    def test_cabecera_distinta_se_reenvia_al_cortar(self):
+        self.empalme.recibir("b", _cabecera_video(b"otro sps"))
+        self.empalme.recibir("a", _keyframe(100))
+        self.empalme.cortar("b")
+        self.empalme.recibir("b", _keyframe(700))
+
+        self.assertEqual(self._escrito()[3:], [
+            (VIDEO, 0, True, False),
+            (VIDEO, 33, False, True),
+        ])
+
+    def test_activa_reconectada_reentra_en_keyframe(self):
+        self.empalme.recibir("a", _keyframe(100))
+        self.empalme.recibir("a", _cuadro(5000))
+
+        # La mezzanine se reinició: su línea de tiempo vuelve a cero
+        self.empalme.reconectada("a")
+        self.empalme.recibir("a", _cabecera_video())
+        self.empalme.recibir("a", _cuadro(10))      # sin keyframe todavía: afuera
+        self.empalme.recibir("a", _keyframe(40))
+        self.empalme.recibir("a", _cuadro(73))
+
+        self.assertEqual(self._escrito()[2:], [
+            (VIDEO, 0, False, True),
+            (VIDEO, 4900, False, False),
+            (VIDEO, 4933, False, True),
+            (VIDEO, 4966, False, False),
+        ])
+
+    def test_timestamps_de_32_bits(self):
+        tag = _cuadro(0)
+        leido = next(leer_tags(io.BytesIO(CABECERA_FLV + tag.serializar(0x01ABCDEF))))
+        self.assertEqual(leido.ts, 0x01ABCDEF)
+        self.assertEqual(leido.datos, tag.datos)
+
+
+class AdmisionTablaTests(SimpleTestCase):
+
+    def test_cupo_por_rol_y_clave_existente(self):
+        async def escenario(log):
+            tabla = TablaProcesos()
+            try:
+                cmd = ["sleep", "30"]
+                a = await tabla.op_spawn("mezzanine", "a", cmd, log, cupo=2)
+                otra_vez = await tabla.op_spawn("mezzanine", "a", cmd, log, cupo=2)
+                b = await tabla.op_spawn("mezzanine", "b", cmd, log, cupo=2)
+                sin_cupo = await tabla.op_spawn("mezzanine", "c", cmd, log, cupo=2)
+                # Otro rol no comparte el cupo
+                otro_rol = await tabla.op_spawn("hls", "c", cmd, log, cupo=2)
+
+                await tabla.op_detener([b["pid"]])
+                con_cupo = await tabla.op_spawn("mezzanine", "c", cmd, log, cupo=2)
+                return a, otra_vez, b, sin_cupo, otro_rol, con_cupo
+            finally:
+                await tabla.detener_todo(timeout=1)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            a, otra_vez, b, sin_cupo, otro_rol, con_cupo = asyncio.run(
+                escenario(os.path.join(directorio, "x.log"))
+            )
+
+        self.assertEqual(otra_vez["pid"], a["pid"])
+        self.assertNotEqual(b["pid"], a["pid"])
+        self.assertIsNone(sin_cupo["pid"])
+        self.assertIsNotNone(otro_rol["pid"])
+        self.assertIsNotNone(con_cupo["pid"])
+
+
+class TeardownParaleloTests(SimpleTestCase):
+
+    def test_varios_que_ignoran_q_caen_en_una_sola_ventana(self):
+        timeout = 1.0
+
+        async def escenario(log):
+            tabla = TablaProcesos()
+            try:
+                # sleep no lee stdin: la 'q' no lo detiene, recién SIGTERM
+                pids = [
+                    (await tabla.op_spawn("prueba", str(i), ["sleep", "30"], log, stdin=True))["pid"]
+                    for i in range(5)
+                ]
+                inicio = time.monotonic()
+                await tabla.op_detener(pids, timeout=timeout, salida="q\n")
+                return pids, time.monotonic() - inicio, [tabla.procesos[p].returncode for p in pids]
+            finally:
+                await tabla.detener_todo(timeout=1)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            pids, duracion, codigos = asyncio.run(escenario(os.path.join(directorio, "x.log")))
+
+        # Uno por uno serían 5 ventanas de 'q'; en paralelo, una
+        self.assertGreaterEqual(duracion, timeout)
+        self.assertLess(duracion, 2 * timeout)
+        self.assertEqual(codigos, [-15] * 5)
+        # Cosechados: ningún zombie
+        for pid in pids:
+            self.assertFalse(os.path.exists(f"/proc/{pid}"))
+
+    @override_settings(MEDIA_SUPERVISOR_SOCKET="")
+    def test_detener_varios_desde_django(self):
+        registro = procesos.RegistroProcesos("prueba")
+        with tempfile.TemporaryDirectory() as directorio:
+            lanzados = [
+                registro.lanzar(i, ["sleep", "30"], os.path.join(directorio, f"{i}.log"), stdin=True)
+                for i in range(5)
+            ]
+            inicio = time.monotonic()
+            procesos.detener_varios(lanzados, timeout=1, salida="q\n")
+            duracion = time.monotonic() - inicio
+
+        self.assertLess(duracion, 2)
+        for clave, proceso in enumerate(lanzados):
+            self.assertEqual(registro.pop(clave).poll(), -15)
+            self.assertFalse(os.path.exists(f"/proc/{proceso.pid}"))
+
+
+# ============================================================
+# SUPERVISOR DE MEDIA (RPC)
+# ============================================================
+
+class SupervisorMediaRPCTests(SimpleTestCase):
+    """Ida y vuelta real por el socket Unix del daemon, con hijos `sleep`."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        self.socket = os.path.join(directorio.name, "media.sock")
+
+        self.loop = asyncio.new_event_loop()
+        # serve() instala handlers de señales, que solo existen en el hilo principal
+        self.loop.add_signal_handler = lambda *args: None
+        hilo = threading.Thread(target=self.loop.run_forever, daemon=True)
+        hilo.start()
+
+        self.supervisor = SupervisorMedia(self.socket, telemetria_intervalo=0.2)
+        asyncio.run_coroutine_threadsafe(self.supervisor.serve(), self.loop)
+        limite = time.monotonic() + 5
+        while not os.path.exists(self.socket) and time.monotonic() < limite:
+            time.sleep(0.01)
+
+        async def apagar():
+            await self.supervisor.detener_todo(timeout=1)
+            tareas = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            # Las conexiones terminan solas con el EOF del cliente; el resto se cancela
+            for tarea in tareas:
+                if tarea.get_coro().__name__ != "_atender":
+                    tarea.cancel()
+            await asyncio.wait_for(asyncio.gather(*tareas, return_exceptions=True), 5)
+
+        def cerrar():
+            asyncio.run_coroutine_threadsafe(apagar(), self.loop).result(10)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            hilo.join(5)
+            self.loop.close()
+
+        self.addCleanup(cerrar)
+        ajustes = override_settings(MEDIA_SUPERVISOR_SOCKET=self.socket)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_spawn_poll_telemetria_y_detener(self):
+        registro = procesos.RegistroProcesos("prueba")
+
+        proceso = registro.lanzar("1", ["sleep", "30"], os.path.join(self.directorio, "x.log"), meta={"a": 1})
+
+        self.assertEqual(proceso.meta, {"a": 1})
+        visto = registro.get("1")
+        self.assertEqual((visto.pid, visto.meta), (proceso.pid, {"a": 1}))
+        self.assertTrue(procesos.esta_vivo(visto))
+        self.assertIn(proceso.pid, procesos.pids_registrados())
+        self.assertEqual(
+            [(p["rol"], p["clave"], p["pid"]) for p in procesos.telemetria(rol="prueba")],
+            [("prueba", "1", proceso.pid)],
+        )
+
+        procesos.detener(proceso, timeout=1)
+
+        self.assertIsNotNone(registro.get("1").poll())
+        self.assertIsNotNone(procesos.Proceso(proceso.pid, meta={}).wait(timeout=1))
+        self.assertEqual(procesos.telemetria(rol="prueba"), [])
+
+    def test_operacion_invalida_vuelve_como_error(self):
+        with self.assertRaisesRegex(procesos.SupervisorNoDisponible, "op_inexistente"):
+            procesos._llamar("inexistente")
+
+    def test_daemon_caido(self):
+        with override_settings(MEDIA_SUPERVISOR_SOCKET=os.path.join(self.directorio, "no.sock")):
+            with self.assertRaises(procesos.SupervisorNoDisponible):
+                procesos.RegistroProcesos("prueba").get("1")
+
+
+class PollCacheadoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.ahora = 100.0
+        mock.patch("core.services.procesos.time", SimpleNamespace(monotonic=lambda: self.ahora)).start()
+        self.llamar = mock.patch.object(procesos, "_llamar", return_value={"returncode": None}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_un_rpc_por_vigencia(self):
+        proceso = procesos.Proceso(4242)
+
+        # Recién salido de la tabla: no pregunta
+        self.assertIsNone(proceso.poll())
+        self.assertIsNone(proceso.poll())
+        self.llamar.assert_not_called()
+
+        self.ahora += procesos.POLL_VIGENCIA
+        self.assertIsNone(proceso.poll())
+        self.assertIsNone(proceso.poll())
+        self.assertEqual(self.llamar.call_count, 1)
+
+        self.llamar.return_value = {"returncode": 0}
+        self.ahora += procesos.POLL_VIGENCIA
+        self.assertEqual(proceso.poll(), 0)
+        self.ahora += procesos.POLL_VIGENCIA
+        self.assertEqual(proceso.poll(), 0)
+        self.assertEqual(self.llamar.call_count, 2)
+
+    def test_senal_invalida_el_cache(self):
+        proceso = procesos.Proceso(4242)
+        proceso.terminate()
+        self.llamar.return_value = {"returncode": -15}
+
+        self.assertEqual(proceso.poll(), -15)
+
+
+# ============================================================
+# RECONCILIACIÓN DE ARRANQUE
+# ============================================================
+
+RTMP = "rtmp://127.0.0.1:1935"
+YOUTUBE = "[f=flv:onfail=ignore]rtmp://a.rtmp.youtube.com/live2/yt"
+FACEBOOK = "[f=flv:flvflags=no_duration_filesize:onfail=ignore]rtmps://live-api-s.facebook.com:443/rtmp/fb"
+
+
+def _argv_hls(username):
+    return ["ffmpeg", "-i", f"{RTMP}/program_switch/{username}", "-c", "copy", "-f", "hls",
+            "-progress", f"/tmp/hls_{username}.progress", f"/hls/program/{username}.m3u8"]
+
+
+def _argv_switcher(username, keys):
+    entradas = [a for k in keys for a in ("-i", f"{RTMP}/live/{k}")]
+    return ["ffmpeg", *entradas, "-filter_complex", "[v0][v1]streamselect@vsel=inputs=2:map=0[vout]",
+            "-f", "flv", f"{RTMP}/program_switch/{username}"]
+
+
+def _argv_empalme(username, activa, *fuentes):
+    return ["/usr/bin/python3", "/srv/app/core/services/empalme_flv.py", "--ffmpeg", "ffmpeg",
+            "--origen", f"{RTMP}/mezzanine", "--salida", f"{RTMP}/program_switch/{username}",
+            "--progress", f"/tmp/empalme_{username}.progress", "--activa", activa, *fuentes]
+
+
+@override_settings(
+    FFMPEG_BIN_PATH="ffmpeg",
+    HLS_PATH="/hls",
+    RTMP_SERVER_HOST_INTERNAL="127.0.0.1",
+    RTMP_SERVER_PORT_INTERNAL=1935,
+    RESTREAM_RELAY_APP="relay",
+    RTMP_MEZZANINE_APP="mezzanine",
+)
+class ReconciliacionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.canal = CanalTransmision.objects.create(usuario=self.user, en_vivo=True)
+        for i, (key, status) in enumerate([
+            ("k0", StreamConnection.Status.READY),
+            ("k1", StreamConnection.Status.ON_AIR),
+        ]):
+            StreamConnection.objects.create(
+                user=self.user, cam_index=i, stream_key=key, status=status, authorized=True,
+            )
+
+        self.registros = {}
+        for modulo, nombre in [
+            (ffmpeg_manager, "PROGRAM_HLS_PROCESSES"),
+            (ffmpeg_manager, "PROGRAM_FEEDER_PROCESSES"),
+            (ffmpeg_manager, "PROGRAM_RELAY_PROCESSES"),
+            (program_switcher, "SWITCHER_PROCESSES"),
+            (mezzanine, "MEZZANINE_PROCESSES"),
+            (mezzanine, "EMPALME_PROCESSES"),
+            (radio_manager, "RADIO_FEEDER_PROCESSES"),
+            (base_streamer, "RESTREAM_PROCESSES"),
+        ]:
+            self.registros[nombre] = mock.patch.object(modulo, nombre, _RegistroEnMemoria()).start()
+        mock.patch.object(reconciliacion, "_HUERFANOS", _RegistroEnMemoria()).start()
+        mock.patch.object(reconciliacion, "pids_registrados", return_value=set()).start()
+        self.detener = mock.patch.object(reconciliacion, "detener_varios").start()
+        self.notificar = mock.patch.object(notificaciones, "notificar_estado_canal").start()
+        self.vivos = []
+        mock.patch.object(reconciliacion, "_procesos_ffmpeg", lambda: iter(self.vivos)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _reconciliar(self, *procesos):
+        """procesos: (pid, argv); el inicio crece con el pid (el último es el más nuevo)."""
+        self.vivos = [(pid, pid, argv) for pid, argv in procesos]
+        return reconciliacion.reconciliar()
+
+    def _adoptado(self, nombre, clave):
+        proceso = self.registros[nombre].get(clave)
+        return proceso.pid if proceso else None
+
+    def _matados(self):
+        return sorted(p.pid for llamada in self.detener.call_args_list for p in llamada.args[0])
+
+    # ---------- clasificar ----------
+
+    def test_clasifica_cada_rol_por_su_comando(self):
+        casos = [
+            (_argv_hls("canal"), {"rol": "hls", "username": "canal"}),
+            (["ffmpeg", "-i", "x", "/hls/program/canal_%v.m3u8"], {"rol": "hls", "username": "canal"}),
+            (["ffmpeg", "-i", f"{RTMP}/live/k1", "-c", "copy", "-f", "flv", f"{RTMP}/program_switch/canal"],
+             {"rol": "feeder", "username": "canal"}),
+            (["ffmpeg", "-stream_loop", "-1", "-i", "/cache/clip.mp4", "-f", "flv", f"{RTMP}/program_switch/canal"],
+             {"rol": "radio", "username": "canal"}),
+            (["ffmpeg", "-i", "udp://127.0.0.1:20000", "-f", "flv", f"{RTMP}/relay/canal"],
+             {"rol": "relay", "username": "canal"}),
+            (["ffmpeg", "-i", f"{RTMP}/live/k0", "-f", "flv", f"{RTMP}/mezzanine/k0"],
+             {"rol": "mezzanine", "stream_key": "k0"}),
+            (["ffmpeg", "-i", f"{RTMP}/relay/canal", "-c", "copy", "-f", "tee", f"{YOUTUBE}|{FACEBOOK}"],
+             {"rol": "restream", "username": "canal", "plataformas": ["youtube", "facebook"]}),
+            (_argv_switcher("canal", ["k0", "k1"]),
+             {"rol": "switcher", "username": "canal", "stream_keys": ["k0", "k1"], "radio": None}),
+            (_argv_empalme("canal", "k1", "k0", "k1"),
+             {"rol": "empalme", "username": "canal", "stream_keys": ["k1", "k0"],
+              "progress": "/tmp/empalme_canal.progress"}),
+        ]
+        for argv, esperado in casos:
+            with self.subTest(argv=argv[-1]):
+                self.assertEqual(reconciliacion.clasificar(argv), esperado)
+
+    def test_ignora_lo_ajeno_y_los_hijos_del_empalmador(self):
+        for argv in [
+            ["ffmpeg", "-i", "/videos/a.mp4", "/videos/b.mp4"],
+            ["ffmpeg", "-i", f"{RTMP}/mezzanine/k0", "-c", "copy", "-f", "flv", "pipe:1"],
+            ["ffmpeg", "-f", "flv", "-i", "pipe:0", "-c", "copy", "-f", "flv", f"{RTMP}/program_switch/canal"],
+            ["/usr/bin/python3", "/srv/app/core/services/empalme_flv.py", "--version-vieja"],
+        ]:
+            with self.subTest(argv=argv):
+                self.assertIsNone(reconciliacion.clasificar(argv))
+
+    # ---------- adoptar o matar ----------
+
+    def test_adopta_el_canal_vivo_con_su_progress(self):
+        resultado = self._reconciliar(
+            (100, _argv_hls("canal")),
+            (101, _argv_switcher("canal", ["k0", "k1"])),
+            (102, ["ffmpeg", "-i", f"{RTMP}/live/k0", "-f", "flv", f"{RTMP}/mezzanine/k0"]),
+        )
+
+        self.assertEqual(resultado, {"adoptados": 3, "detenidos": 0})
+        hls = self.registros["PROGRAM_HLS_PROCESSES"].get(self.user.id)
+        self.assertEqual(hls.pid, 100)
+        self.assertEqual(hls.meta["progress"], "/tmp/hls_canal.progress")
+        switcher = self.registros["SWITCHER_PROCESSES"].get(self.user.id)
+        self.assertEqual((switcher.pid, switcher.meta["activa"]), (101, "k1"))
+        self.assertEqual(self._adoptado("MEZZANINE_PROCESSES", "k0"), 102)
+        self.assertEqual(self._matados(), [])
+
+    def test_canal_apagado_se_mata_todo(self):
+        self.canal.en_vivo = False
+        self.canal.save()
+
+        resultado = self._reconciliar(
+            (100, _argv_hls("canal")),
+            (101, _argv_switcher("canal", ["k0", "k1"])),
+            (102, ["ffmpeg", "-i", "udp://127.0.0.1:20000", "-f", "flv", f"{RTMP}/relay/canal"]),
+        )
+
+        self.assertEqual(resultado, {"adoptados": 0, "detenidos": 3})
+        self.assertEqual(self._matados(), [100, 101, 102])
+
+    def test_entre_duplicados_gana_el_mas_nuevo(self):
+        self._reconciliar((100, _argv_hls("canal")), (105, _argv_hls("canal")))
+
+        self.assertEqual(self._adoptado("PROGRAM_HLS_PROCESSES", self.user.id), 105)
+        self.assertEqual(self._matados(), [100])
+
+    def test_un_solo_publicador_en_program_switch(self):
+        self._reconciliar(
+            (100, _argv_hls("canal")),
+            (101, ["ffmpeg", "-i", f"{RTMP}/live/k1", "-f", "flv", f"{RTMP}/program_switch/canal"]),
+            (102, _argv_switcher("canal", ["k0", "k1"])),
+        )
+
+        self.assertEqual(self._adoptado("SWITCHER_PROCESSES", self.user.id), 102)
+        self.assertIsNone(self._adoptado("PROGRAM_FEEDER_PROCESSES", self.user.id))
+        self.assertEqual(self._matados(), [101])
+
+    def test_mezzanine_de_una_camara_que_ya_no_esta(self):
+        self._reconciliar(
+            (100, ["ffmpeg", "-i", f"{RTMP}/live/borrada", "-f", "flv", f"{RTMP}/mezzanine/borrada"]),
+        )
+
+        self.assertIsNone(self._adoptado("MEZZANINE_PROCESSES", "borrada"))
+        self.assertEqual(self._matados(), [100])
+
+    def test_switcher_sin_la_camara_al_aire(self):
+        StreamConnection.objects.filter(stream_key="k1").update(status=StreamConnection.Status.READY)
+        StreamConnection.objects.create(
+            user=self.user, cam_index=2, stream_key="k2", status=StreamConnection.Status.ON_AIR, authorized=True,
+        )
+
+        self._reconciliar((100, _argv_hls("canal")), (101, _argv_switcher("canal", ["k0", "k1"])))
+
+        self.assertIsNone(self._adoptado("SWITCHER_PROCESSES", self.user.id))
+        self.assertEqual(self._matados(), [101])
+
+    def test_empalmador_se_adopta_con_su_activa(self):
+        self._reconciliar(
+            (100, _argv_hls("canal")),
+            (101, _argv_empalme("canal", "k0", "k0", "k1")),
+            # Sus hijos no cuentan: mueren con él
+            (102, ["ffmpeg", "-f", "flv", "-i", "pipe:0", "-c", "copy", "-f", "flv", f"{RTMP}/program_switch/canal"]),
+        )
+
+        empalme = self.registros["EMPALME_PROCESSES"].get(self.user.id)
+        self.assertEqual(empalme.pid, 101)
+        self.assertEqual(empalme.meta, {
+            "fuentes": ["k0", "k1"], "activa": "k1", "progress": "/tmp/empalme_canal.progress",
+        })
+        self.assertEqual(self._matados(), [])
+
+    def test_empalmador_en_modo_radio_se_mata(self):
+        self.canal.modo_radio = True
+        self.canal.save()
+
+        self._reconciliar((100, _argv_hls("canal")), (101, _argv_empalme("canal", "k1", "k0")))
+
+        self.assertIsNone(self._adoptado("EMPALME_PROCESSES", self.user.id))
+        self.assertEqual(self._matados(), [101])
+
+    def test_tee_con_una_plataforma_cerrada_se_mata(self):
+        EstadoRetransmision.objects.create(usuario=self.user, plataforma="youtube", estado="activo")
+        tee = ["ffmpeg", "-i", f"{RTMP}/relay/canal", "-c", "copy", "-f", "tee", f"{YOUTUBE}|{FACEBOOK}"]
+
+        self._reconciliar((100, _argv_hls("canal")), (101, tee))
+
+        self.assertIsNone(self._adoptado("RESTREAM_PROCESSES", str(self.user.id)))
+        self.assertEqual(self._matados(), [101])
+
+    # ---------- corrección de la base ----------
+
+    def test_canal_sin_hls_se_apaga(self):
+        self.canal.url_hls = "/hls/program/canal.m3u8"
+        self.canal.modo_radio = True
+        self.canal.save()
+
+        self._reconciliar()
+
+        self.canal.refresh_from_db()
+        self.assertFalse(self.canal.en_vivo)
+        self.assertFalse(self.canal.modo_radio)
+        self.assertEqual(self.canal.url_hls, "")
+        self.notificar.assert_called_once_with(self.user)
+
+    def test_retransmision_adoptada_apunta_al_pid_nuevo(self):
+        estado = EstadoRetransmision.objects.create(
+            usuario=self.user, plataforma="youtube", estado="reconectando", proceso_id=1,
+        )
+        tee = ["ffmpeg", "-i", f"{RTMP}/relay/canal", "-c", "copy", "-f", "tee", YOUTUBE]
+
+        self._reconciliar((100, _argv_hls("canal")), (101, tee))
+
+        estado.refresh_from_db()
+        self.assertEqual((estado.estado, estado.proceso_id, estado.detenido_en), ("activo", 101, None))
+        self.assertTrue(CanalTransmision.objects.get(pk=self.canal.pk).en_vivo)
+
+    def test_retransmision_sin_tee_queda_en_error(self):
+        estado = EstadoRetransmision.objects.create(
+            usuario=self.user, plataforma="facebook", estado="activo", proceso_id=1,
+        )
+
+        self._reconciliar((100, _argv_hls("canal")))
+
+        estado.refresh_from_db()
+        self.assertEqual(estado.estado, "error")
+        self.assertIsNotNone(estado.detenido_en)
+
+
+# ============================================================
+# IMÁGENES DE RADIO
+# ============================================================
+
+class ImagenesPendientesTests(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.entrantes = os.path.join(directorio.name, "radio_images", "entrantes")
+        os.makedirs(self.entrantes)
+
+        ajustes = override_settings(MEDIA_ROOT=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.encoladas = []
+        mock.patch.object(
+            imagenes_radio, "_encolar", lambda *args: self.encoladas.append(args)
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+        # pid de un proceso que ya terminó
+        muerto = subprocess.Popen(["true"])
+        muerto.wait()
+        self.muerto = muerto.pid
+
+    def _archivo(self, nombre, antiguedad=0):
+        ruta = os.path.join(self.entrantes, nombre)
+        with open(ruta, "wb") as f:
+            f.write(b"img")
+        mtime = time.time() - antiguedad
+        os.utime(ruta, (mtime, mtime))
+        return ruta
+
+    def test_subidas_simultaneas_no_se_pisan(self):
+        archivo = SimpleNamespace(name="foto.PNG", chunks=lambda: [b"uno"])
+        otro = SimpleNamespace(name="foto.png", chunks=lambda: [b"dos"])
+        user = SimpleNamespace(id=3, username="canal")
+
+        self.assertFalse(imagenes_radio.recibir_imagen(user, archivo))
+        self.assertFalse(imagenes_radio.recibir_imagen(user, otro))
+
+        pendientes = sorted(ruta for _, _, ruta in self.encoladas)
+        self.assertEqual(len(set(pendientes)), 2)
+        for ruta in pendientes:
+            self.assertTrue(os.path.isfile(ruta))
+            self.assertTrue(ruta.endswith(f".{os.getpid()}.png"))
+        self.assertEqual([n for n in os.listdir(self.entrantes) if n.startswith(".")], [])
+
+    def test_reclama_las_de_un_proceso_muerto(self):
+        self._archivo(f"5_{'a' * 64}.{self.muerto}.jpg", antiguedad=20)
+        self._archivo(f"5_{'b' * 64}.{self.muerto}.png", antiguedad=10)
+        self._archivo(f"6_{'c' * 64}.jpg")                          # formato viejo, sin dueño
+        ajena = self._archivo(f"7_{'d' * 64}.{os.getppid()}.jpg")  # en la cola de otro proceso vivo
+
+        imagenes_radio.reanudar_imagenes_pendientes()
+
+        encoladas = sorted((user_id, digest[0]) for user_id, digest, _ in self.encoladas)
+        self.assertEqual(encoladas, [(5, "b"), (6, "c")])
+        for _, _, ruta in self.encoladas:
+            self.assertTrue(ruta.endswith(f".{os.getpid()}.{ruta.rsplit('.', 1)[-1]}"))
+            self.assertTrue(os.path.isfile(ruta))
+        # La más vieja del mismo usuario ya no se iba a ver
+        self.assertFalse(os.path.exists(os.path.join(self.entrantes, f"5_{'a' * 64}.{self.muerto}.jpg")))
+        self.assertTrue(os.path.isfile(ajena))
+
+    def test_borra_subidas_abandonadas(self):
+        vieja = self._archivo(".subiendo_abc.png", antiguedad=imagenes_radio.SUBIDA_ABANDONADA_SEGUNDOS + 5)
+        en_curso = self._archivo(".subiendo_def.png")
+
+        imagenes_radio.reanudar_imagenes_pendientes()
+
+        self.assertFalse(os.path.exists(vieja))
+        self.assertTrue(os.path.isfile(en_curso))
+        self.assertEqual(self.encoladas, [])
+
+
+class _FinCola(Exception):
+    pass
+
+
+class ImagenesCompartidasTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.user = User.objects.create_user("canal")
+        self.otro = User.objects.create_user("otro")
+        mock.patch("core.services.radio_manager.precalentar_clip_radio").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _normalizada(self, digest):
+        os.makedirs(os.path.dirname(imagenes_radio.ruta_imagen(digest)), exist_ok=True)
+        for ruta in (imagenes_radio.ruta_imagen(digest), imagenes_radio.ruta_miniatura(digest)):
+            with open(ruta, "wb") as f:
+                f.write(b"jpg")
+        return imagenes_radio.ruta_imagen(digest)
+
+    def _procesar(self, *trabajos):
+        cola = mock.Mock()
+        cola.get.side_effect = [*trabajos, _FinCola]
+        with mock.patch.object(imagenes_radio, "_COLA", cola), \
+                mock.patch.object(imagenes_radio, "close_old_connections") as cerrar:
+            with self.assertRaises(_FinCola):
+                imagenes_radio._procesar_cola()
+        return cerrar
+
+    def test_compartida_no_se_borra_hasta_el_ultimo_canal(self):
+        imagen = self._normalizada("a" * 64)
+        self.assertTrue(imagenes_radio._asignar(self.user.id, "a" * 64))
+        self.assertTrue(imagenes_radio._asignar(self.otro.id, "a" * 64))
+
+        self._normalizada("b" * 64)
+        imagenes_radio._asignar(self.user.id, "b" * 64)
+        self.assertTrue(os.path.isfile(imagen))
+
+        imagenes_radio._asignar(self.otro.id, "b" * 64)
+        self.assertFalse(os.path.exists(imagen))
+        self.assertFalse(os.path.exists(imagenes_radio.ruta_miniatura("a" * 64)))
+
+    def test_no_asigna_una_imagen_liberada(self):
+        self.assertFalse(imagenes_radio._asignar(self.user.id, "a" * 64))
+        self.assertFalse(CanalTransmision.objects.filter(usuario=self.user).exists())
+
+    def test_liberada_entre_normalizar_y_asignar_se_vuelve_a_normalizar(self):
+        digest = "a" * 64
+        llamadas = []
+
+        def normalizar(origen, d):
+            self._normalizada(d)
+            llamadas.append(origen)
+            if len(llamadas) == 1:
+                # Otro canal la suelta justo después de que se escribió
+                imagenes_radio.liberar_imagen(imagenes_radio.ruta_imagen(d))
+
+        origen = os.path.join(settings.MEDIA_ROOT, "subida.png")
+        with open(origen, "wb") as f:
+            f.write(b"png")
+
+        with mock.patch.object(imagenes_radio, "normalizar", normalizar):
+            cerrar = self._procesar((self.user.id, digest, origen))
+
+        self.assertEqual(len(llamadas), 2)
+        canal = CanalTransmision.objects.get(usuario=self.user)
+        self.assertEqual(canal.radio_imagen_path, imagenes_radio.ruta_imagen(digest))
+        self.assertTrue(os.path.isfile(canal.radio_imagen_path))
+        self.assertFalse(os.path.exists(origen))
+        cerrar.assert_called_once_with()
+
+    def test_cierra_las_conexiones_aunque_falle(self):
+        with mock.patch.object(imagenes_radio, "normalizar", side_effect=RuntimeError("ffmpeg")):
+            cerrar = self._procesar((self.user.id, "a" * 64, "/no/existe.png"))
+
+        cerrar.assert_called_once_with()
+
+
+# ============================================================
+# PLANIFICADOR DIFERIDO (FIN DE TRANSMISIÓN)
+# ============================================================
+
+class PlanificadorDiferidoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.planificador = PlanificadorDiferido()
+        self.corridas = []
+        self.hecho = threading.Event()
+
+    def _tarea(self, valor):
+        self.corridas.append(valor)
+        self.hecho.set()
+
+    def test_reprogramar_reemplaza_la_pendiente(self):
+        for i in range(5):
+            self.planificador.programar("fin", 0.05, self._tarea, i)
+
+        self.assertTrue(self.hecho.wait(2))
+        time.sleep(0.1)
+        # Una ráfaga de hooks corre una sola vez, con los argumentos del último
+        self.assertEqual(self.corridas, [4])
+        self.assertFalse(self.planificador.pendiente("fin"))
+
+    def test_reprogramar_reinicia_la_demora(self):
+        inicio = time.monotonic()
+        self.planificador.programar("fin", 0.1, self._tarea, "a")
+        time.sleep(0.07)
+        self.planificador.programar("fin", 0.1, self._tarea, "b")
+
+        self.assertTrue(self.hecho.wait(2))
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.17)
+        self.assertEqual(self.corridas, ["b"])
+
+    def test_cancelar(self):
+        self.planificador.programar("fin", 0.05, self._tarea, 1)
+
+        self.assertTrue(self.planificador.cancelar("fin"))
+        self.assertFalse(self.planificador.cancelar("fin"))
+        self.assertFalse(self.hecho.wait(0.2))
+        self.assertEqual(self.corridas, [])
+
+    def test_claves_independientes_en_orden_de_vencimiento(self):
+        terminadas = threading.Barrier(3, timeout=2)
+
+        def tarea(valor):
+            self.corridas.append(valor)
+            terminadas.wait()
+
+        self.planificador.programar(("fin", 1), 0.15, tarea, "tarde")
+        self.planificador.programar(("fin", 2), 0.05, tarea, "temprano")
+
+        terminadas.wait()
+        self.assertEqual(self.corridas, ["temprano", "tarde"])
+
+    def test_una_tarea_que_falla_no_frena_el_reloj(self):
+        def falla():
+            raise RuntimeError("boom")
+
+        with self.assertLogs("core.services.planificador", "ERROR"):
+            self.planificador.programar("a", 0.01, falla)
+            self.planificador.programar("b", 0.05, self._tarea, "sigue")
+            self.assertTrue(self.hecho.wait(2))
+        self.assertEqual(self.corridas, ["sigue"])
+
+    def test_cierra_las_conexiones_viejas_despues_de_cada_tarea(self):
+        def falla():
+            raise RuntimeError("boom")
+
+        with mock.patch("core.services.planificador.close_old_connections") as cerrar:
+            with self.assertLogs("core.services.planificador", "ERROR"):
+                PlanificadorDiferido._ejecutar("a", falla, ())
+            PlanificadorDiferido._ejecutar("b", self._tarea, ("ok",))
+
+        self.assertEqual(cerrar.call_count, 2)
+
+
+@override_settings(STREAM_FIN_DEBOUNCE_SEGUNDOS=0.05)
+class FinTransmisionDiferidoTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.detener = mock.patch.object(estado_transmision, "detener_transmision_usuario").start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(estado_transmision.cancelar_fin_transmision, self.user)
+
+    def test_camara_al_aire_cancela_el_fin(self):
+        estado_transmision.programar_fin_transmision(self.user)
+        estado_transmision.cancelar_fin_transmision(self.user)
+        time.sleep(0.2)
+
+        self.detener.assert_not_called()
+
+    def test_sin_camara_al_aire_finaliza(self):
+        estado_transmision._finalizar_si_nada_al_aire(self.user.id)
+
+        self.detener.assert_called_once_with(self.user)
+
+    def test_otra_camara_al_aire_no_finaliza(self):
+        StreamConnection.objects.create(
+            user=self.user, cam_index=0, stream_key="k0", authorized=True,
+            status=StreamConnection.Status.ON_AIR,
+        )
+        estado_transmision._finalizar_si_nada_al_aire(self.user.id)
+
+        self.detener.assert_not_called()
+
+
+@override_settings(PROGRAM_SWITCH_ENGINE="mezzanine", PROGRAM_HLS_ABR=False)
+class HooksCamaraTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.programar = mock.patch.object(ffmpeg_manager.PLANIFICADOR, "programar").start()
+        self.actualizar = mock.patch.object(ffmpeg_manager, "actualizar_entradas_programa").start()
+        self.iniciar = mock.patch.object(ffmpeg_manager, "iniciar_mezzanine", return_value=True).start()
+        self.sumar = mock.patch.object(ffmpeg_manager, "sumar_al_empalme").start()
+        self.quitar = mock.patch.object(ffmpeg_manager, "quitar_del_empalme").start()
+        self.detener_mezzanine = mock.patch.object(ffmpeg_manager, "detener_mezzanine").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _correr_programada(self):
+        clave, demora, funcion, *args = self.programar.call_args.args
+        funcion(*args)
+
+    def test_los_hooks_no_tocan_procesos_en_el_request(self):
+        ffmpeg_manager.camara_autorizada(self.user, "k1")
+        ffmpeg_manager.camara_cerrada(self.user, "k1")
+
+        self.iniciar.assert_not_called()
+        self.detener_mezzanine.assert_not_called()
+        self.actualizar.assert_not_called()
+        # Misma clave: el cierre reemplaza a la autorización pendiente
+        claves = [c.args[0] for c in self.programar.call_args_list]
+        self.assertEqual(claves, [("camara", "k1"), ("camara", "k1")])
+
+    def test_autorizada_prepara_la_mezzanine_y_las_entradas(self):
+        ffmpeg_manager.camara_autorizada(self.user, "k1")
+        self._correr_programada()
+
+        self.iniciar.assert_called_once_with(self.user, "k1")
+        self.sumar.assert_called_once_with(self.user, "k1")
+        self.actualizar.assert_called_once_with(self.user)
+
+    def test_cerrada_retira_la_camara_y_actualiza_las_entradas(self):
+        ffmpeg_manager.camara_cerrada(self.user, "k1")
+        self._correr_programada()
+
+        self.quitar.assert_called_once_with(self.user, "k1")
+        self.detener_mezzanine.assert_called_once_with("k1")
+        self.actualizar.assert_called_once_with(self.user)
+
+
+# ============================================================
+# COLA DE TRABAJOS (EN LA BASE)
+# ============================================================
+
+@override_settings(TRABAJOS_VENCIMIENTO_SEGUNDOS=300)
+class ColaTrabajosTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.corridos = []
+        mock.patch.dict(trabajos._HANDLERS, {"prueba": self._handler}).start()
+        self.publicados = []
+        mock.patch.object(trabajos, "_publicar", lambda job: self.publicados.append(job.estado)).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.cola = trabajos.ColaTrabajos(max_workers=1)
+        self.addCleanup(self.cola._pool.shutdown)
+        # Los drenadores se corren a mano, en este thread
+        mock.patch.object(self.cola, "drenar").start()
+
+    def _handler(self, user, avance, n):
+        avance(f"paso {n}")
+        if n < 0:
+            raise ValueError("negativo")
+        self.corridos.append(n)
+        return {"n": n}
+
+    def test_el_estado_se_consulta_desde_la_base(self):
+        job = self.cola.encolar(self.user, "prueba", n=1)
+        otro = User.objects.create_user("otro")
+
+        self.assertEqual(trabajos.estado_trabajo(self.user, job.id.hex)["estado"], "en_cola")
+        self.assertIsNone(trabajos.estado_trabajo(otro, job.id.hex))
+        self.assertIsNone(trabajos.estado_trabajo(self.user, "no-es-un-uuid"))
+        self.cola.drenar.assert_called_once_with(self.user.id)
+
+    def test_uno_por_vez_y_en_orden(self):
+        primero = self.cola.encolar(self.user, "prueba", n=1)
+        self.cola.encolar(self.user, "prueba", n=2)
+
+        tomado = self.cola._tomar_siguiente(self.user.id)
+        self.assertEqual(tomado.pk, primero.pk)
+        # Otro drenador (otro worker) no toma el segundo mientras el primero corre
+        self.assertIsNone(self.cola._tomar_siguiente(self.user.id))
+
+        self.cola._ejecutar(tomado)
+        self.cola._ejecutar(self.cola._tomar_siguiente(self.user.id))
+        self.assertIsNone(self.cola._tomar_siguiente(self.user.id))
+
+        self.assertEqual(self.corridos, [1, 2])
+        primero.refresh_from_db()
+        self.assertEqual((primero.estado, primero.mensaje, primero.resultado), ("ok", "paso 1", {"n": 1}))
+
+    def test_error_de_negocio_llega_al_operador(self):
+        self.cola.encolar(self.user, "prueba", n=-1)
+        job = self.cola._tomar_siguiente(self.user.id)
+        self.cola._ejecutar(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.estado, job.mensaje), ("error", "negativo"))
+
+    def test_trabajo_de_un_proceso_muerto_no_traba_la_cola(self):
+        muerto = subprocess.Popen(["true"])
+        muerto.wait()
+        colgado = TrabajoControl.objects.create(
+            usuario=self.user, tipo="prueba", params={"n": 1},
+            estado=TrabajoControl.Estado.CORRIENDO, worker=f"{trabajos.socket.gethostname()}:{muerto.pid}",
+        )
+        siguiente = self.cola.encolar(self.user, "prueba", n=2)
+
+        self.assertEqual(self.cola._tomar_siguiente(self.user.id).pk, siguiente.pk)
+        colgado.refresh_from_db()
+        self.assertEqual(colgado.estado, "error")
+
+    def test_en_cola_vencido_no_corre(self):
+        viejo = self.cola.encolar(self.user, "prueba", n=1)
+        TrabajoControl.objects.filter(pk=viejo.pk).update(
+            creado_en=timezone.now() - timedelta(seconds=301)
+        )
+
+        self.assertIsNone(self.cola._tomar_siguiente(self.user.id))
+        viejo.refresh_from_db()
+        self.assertEqual((viejo.estado, viejo.mensaje), ("error", "Vencido sin correr"))
+
+
+class DrenadorTrabajosTests(TransactionTestCase):
+
+    def test_drena_en_orden_en_otro_thread(self):
+        user = User.objects.create_user("canal")
+        corridos = []
+        terminados = threading.Semaphore(0)
+
+        def handler(user, avance, n):
+            corridos.append(n)
+            terminados.release()
+
+        mock.patch.dict(trabajos._HANDLERS, {"prueba": handler}).start()
+        mock.patch.object(trabajos, "_publicar").start()
+        self.addCleanup(mock.patch.stopall)
+        cola = trabajos.ColaTrabajos(max_workers=2)
+        self.addCleanup(cola._pool.shutdown)
+
+        ids = [cola.encolar(user, "prueba", n=n).pk for n in range(4)]
+        for _ in ids:
+            self.assertTrue(terminados.acquire(timeout=5))
+        cola._pool.shutdown(wait=True)
+
+        self.assertEqual(corridos, [0, 1, 2, 3])
+        self.assertEqual(
+            set(TrabajoControl.objects.filter(pk__in=ids).values_list("estado", flat=True)), {"ok"}
+        )
+
+
+# ============================================================
+# MÉTRICAS
+# ============================================================
+
+class MetricasTests(TestCase):
+
+    def setUp(self):
+        # Las métricas de prueba no quedan en el registro del proceso
+        mock.patch.object(metricas, "_METRICAS", []).start()
+        mock.patch.object(metricas, "_RECOLECTORES", []).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _en_threads(self, funcion, n=4):
+        hilos = [threading.Thread(target=funcion) for _ in range(n)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+    def test_contador_suma_los_shards_de_todos_los_threads(self):
+        contador = metricas.Contador("prueba_total", "Prueba", etiquetas=("tipo",))
+
+        def incrementar():
+            for _ in range(1000):
+                contador.inc("a")
+            contador.inc("b", valor=5)
+
+        self._en_threads(incrementar)
+        contador.inc("a")
+
+        # Los shards de los threads que ya terminaron siguen contando
+        self.assertEqual(len(contador._shards), 5)
+        self.assertEqual(contador.exponer(), [
+            "# HELP prueba_total Prueba",
+            "# TYPE prueba_total counter",
+            'prueba_total{tipo="a"} 4001',
+            'prueba_total{tipo="b"} 20',
+        ])
+
+    def test_histograma_acumula_buckets_entre_threads(self):
+        histograma = metricas.Histograma("prueba_segundos", "Prueba", buckets=(0.1, 1))
+
+        def observar():
+            histograma.observar(0.05)
+            histograma.observar(0.1)    # el límite entra en su bucket (le)
+            histograma.observar(3)
+
+        self._en_threads(observar, n=2)
+
+        self.assertEqual(histograma.exponer()[2:], [
+            'prueba_segundos_bucket{le="0.1"} 4',
+            'prueba_segundos_bucket{le="1.0"} 4',
+            'prueba_segundos_bucket{le="+Inf"} 6',
+            "prueba_segundos_sum 6.3",
+            "prueba_segundos_count 6",
+        ])
+
+    def test_etiquetas_escapadas(self):
+        contador = metricas.Contador("prueba_total", "Prueba", etiquetas=("hook",))
+        contador.inc('a"b\\c\nd')
+        self.assertEqual(contador.exponer()[2], 'prueba_total{hook="a\\"b\\\\c\\nd"} 1')
+
+    def test_recolector_caido_no_tira_la_exposicion(self):
+        metricas.Contador("prueba_total", "Prueba").inc()
+
+        @metricas.registrar_recolector
+        def _caido():
+            raise RuntimeError("sin supervisor")
+
+        @metricas.registrar_recolector
+        def _vivo():
+            return [("prueba_vivos", "gauge", "Vivos", [({"rol": "hls"}, 2)])]
+
+        with self.assertLogs("core.services.metricas", "ERROR"):
+            texto = metricas.exponer()
+
+        self.assertIn("prueba_total 1\n", texto)
+        self.assertIn('# TYPE prueba_vivos gauge\nprueba_vivos{rol="hls"} 2\n', texto)
+
+    def test_fallas_de_retransmision_es_gauge_de_filas_actuales(self):
+        from multistream.models import EstadoRetransmision, IntentoRetransmision
+
+        user = User.objects.create_user("canal")
+        caida = EstadoRetransmision.objects.create(usuario=user, plataforma="youtube", estado="activo")
+        for numero in (1, 2):
+            IntentoRetransmision.objects.create(
+                retransmision=caida, numero=numero, motivo="El proceso FFmpeg terminó", espera_segundos=2,
+            )
+        EstadoRetransmision.objects.create(usuario=user, plataforma="facebook", estado="error")
+
+        [(nombre, tipo, _, muestras)] = metricas._fallas_retransmision()
+
+        self.assertEqual((nombre, tipo), ("streaming_retransmision_fallas", "gauge"))
+        self.assertEqual(sorted(muestras, key=lambda m: m[0]["plataforma"]), [
+            ({"plataforma": "facebook", "tipo": "error"}, 1),
+            ({"plataforma": "youtube", "tipo": "caida"}, 2),
+        ])
+
+        # Borrar filas baja el valor: por eso no es counter
+        caida.delete()
+        [(_, _, _, muestras)] = metricas._fallas_retransmision()
+        self.assertEqual(muestras, [({"plataforma": "facebook", "tipo": "error"}, 1)])
+
+
+# ============================================================
+# BENCHMARKS
+# ============================================================
+
+class UsuariosBenchTests(TestCase):
+
+    def test_crea_usuarios_nuevos_sin_contrasena(self):
+        usuarios = crear_usuarios_bench("bench_", 3)
+
+        self.assertEqual([u.username for u in usuarios], ["bench_1", "bench_2", "bench_3"])
+        self.assertFalse(any(u.has_usable_password() for u in usuarios))
+        self.assertEqual(Cliente.objects.filter(user__in=usuarios).count(), 3)
+
+    def test_no_adopta_una_cuenta_existente(self):
+        real = User.objects.create_user("bench_2", password="secreta")
+
+        with self.assertRaises(CommandError):
+            crear_usuarios_bench("bench_", 3)
+
+        # Ni la cuenta real ni usuarios a medio crear
+        real.refresh_from_db()
+        self.assertTrue(real.check_password("secreta"))
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["bench_2"])
+
+    def test_falla_a_mitad_de_camino_borra_lo_creado(self):
+        Cliente.objects.create(
+            user=User.objects.create_user("otro"), nombre="Real", apellido="Cliente", dni="bench_2",
+        )
+
+        with self.assertRaises(Exception):
+            crear_usuarios_bench("bench_", 3)
+
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["otro"])
+
+
+# ============================================================
+# LOTE DE NOTIFICACIONES
+# ============================================================
+
+class LoteNotificacionesTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.otro = User.objects.create_user("otro")
+        CanalTransmision.objects.create(usuario=self.user, en_vivo=True, url_hls="http://hls/canal.m3u8")
+        for user in (self.user, self.otro):
+            for i in (1, 2, 3):
+                StreamConnection.objects.create(
+                    user=user, cam_index=i, stream_key=f"{user.username}-cam{i}",
+                    status=StreamConnection.Status.READY, authorized=True,
+                )
+        self.enviar = mock.patch.object(notificaciones, "_enviar").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _enviados(self):
+        return {grupo: evento for (grupo, evento), _ in self.enviar.call_args_list}
+
+    def test_un_mensaje_por_usuario_despues_del_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic(), notificaciones.lote_notificaciones():
+                for i in (1, 2):
+                    notificaciones.notificar_camara_actualizada(self.user, i)
+                notificaciones.notificar_estado_canal(self.user)
+                notificaciones.notificar_camara_eliminada(self.otro, 3)
+                self.enviar.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.enviar.call_count, 2)
+        enviados = self._enviados()
+
+        lote = enviados[f"usuario_{self.user.id}"]
+        self.assertEqual(lote["type"], "lote_estado")
+        self.assertEqual(sorted(lote["cameras"]), ["1", "2"])
+        self.assertEqual(lote["canal"], {"en_vivo": True, "hls_url": "http://hls/canal.m3u8", "baja_latencia": False})
+
+        lote = enviados[f"usuario_{self.otro.id}"]
+        self.assertEqual((lote["cameras"], lote["eliminadas"], lote["canal"]), ({}, [3], None))
+
+    def test_rollback_no_envia_nada(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic(), notificaciones.lote_notificaciones():
+                    notificaciones.notificar_actualizacion_camara(self.user)
+                    raise RuntimeError("falla a mitad del cambio")
+
+        self.assertEqual(callbacks, [])
+        self.enviar.assert_not_called()
+
+    def test_lotes_anidados_envian_al_salir_del_externo(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic(), notificaciones.lote_notificaciones():
+                with notificaciones.lote_notificaciones():
+                    notificaciones.notificar_camara_actualizada(self.user, 1)
+                self.assertEqual(callbacks, [])
+                notificaciones.notificar_camara_actualizada(self.user, 2)
+
+        self.assertEqual(self.enviar.call_count, 1)
+        self.assertEqual(sorted(self._enviados()[f"usuario_{self.user.id}"]["cameras"]), ["1", "2"])
+
+    def test_gana_el_ultimo_cambio_de_cada_camara(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), notificaciones.lote_notificaciones():
+                notificaciones.notificar_actualizacion_camara(self.user)
+                notificaciones.notificar_camara_eliminada(self.user, 2)
+
+        lote = self._enviados()[f"usuario_{self.user.id}"]
+        self.assertEqual(sorted(lote["cameras"]), ["1", "3"])
+        self.assertEqual(lote["eliminadas"], [2])
+
+    def test_una_consulta_de_camaras_por_usuario(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic(), notificaciones.lote_notificaciones():
+                for i in (1, 2, 3):
+                    notificaciones.notificar_camara_actualizada(self.user, i)
+                notificaciones.notificar_estado_canal(self.user)
+
+        with self.assertNumQueries(2):   # cámaras + canal
+            callbacks[0]()
+
+    def test_fuera_de_un_lote_se_envia_en_el_momento(self):
+        notificaciones.notificar_camara_actualizada(self.user, 1)
+
+        self.enviar.assert_called_once()
+        grupo, evento = self.enviar.call_args.args
+        self.assertEqual((grupo, evento["type"], evento["cam_index"]), (f"usuario_{self.user.id}", "camara_actualizada", 1))
+
+
+# ============================================================
+# TELEMETRÍA
+# ============================================================
+
+class _FinLoop(Exception):
+    pass
+
+
+def _serie(rol, clave, pid, *velocidades, **meta):
+    return {
+        "rol": rol, "clave": clave, "pid": pid, "meta": meta,
+        "muestras": [{"t": i, "speed": v, "fps": 30.0} for i, v in enumerate(velocidades)],
+    }
+
+
+@override_settings(TELEMETRIA_VELOCIDAD_MINIMA=0.95, TELEMETRIA_PUSH_INTERVALO=5)
+class TelemetriaTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        self.otro = User.objects.create_user("otro")
+        self.series = [
+            _serie("hls", self.user.id, 100, 1.0, 0.9),
+            _serie("restream", str(self.user.id), 101, 1.0),
+            _serie("mezzanine", "k1", 102, 1.0, user_id=self.user.id),
+            _serie("hls", self.otro.id, 103, 1.0),
+            _serie("huerfano", self.user.id, 104, 1.0),
+            _serie("switcher", self.user.id, 105),
+        ]
+        self.telemetria = mock.patch.object(telemetria, "telemetria", side_effect=self._telemetria).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _telemetria(self, rol=None, ultimas=None):
+        return [{**s, "muestras": s["muestras"][-ultimas:] if ultimas else s["muestras"]} for s in self.series]
+
+    def test_vista_solo_los_procesos_del_usuario(self):
+        self.client.force_login(self.user)
+
+        respuesta = self.client.get(reverse("telemetria_procesos"), {"ultimas": 1})
+
+        datos = respuesta.json()
+        self.assertTrue(datos["ok"])
+        self.assertEqual([(p["rol"], p["pid"]) for p in datos["procesos"]], [
+            ("hls", 100), ("restream", 101), ("mezzanine", 102), ("switcher", 105),
+        ])
+        hls = datos["procesos"][0]
+        self.assertEqual([m["speed"] for m in hls["muestras"]], [0.9])
+        # Por debajo de tiempo real = lento; sin muestras todavía no se juzga
+        self.assertEqual([p["lento"] for p in datos["procesos"]], [True, False, False, False])
+        self.telemetria.assert_called_once_with(ultimas=1)
+
+    def test_vista_valida_ultimas_y_pide_login(self):
+        self.assertEqual(self.client.get(reverse("telemetria_procesos")).status_code, 302)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("telemetria_procesos"), {"ultimas": "x"}).status_code, 400)
+        self.client.get(reverse("telemetria_procesos"))
+        self.telemetria.assert_called_with(ultimas=None)
+
+    def test_push_por_usuario_con_la_ultima_muestra(self):
+        esperas = []
+
+        def dormir(segundos):
+            esperas.append(segundos)
+            if len(esperas) > 1:
+                raise _FinLoop
+
+        with mock.patch.object(telemetria, "time", SimpleNamespace(sleep=dormir)), \
+                mock.patch.object(telemetria, "notificar_telemetria") as notificar:
+            with self.assertRaises(_FinLoop):
+                telemetria._loop()
+
+        self.assertEqual(esperas, [5, 5])
+        enviados = {user_id: procesos for (user_id, procesos), _ in notificar.call_args_list}
+        self.assertEqual(sorted(enviados), sorted([self.user.id, self.otro.id]))
+        self.assertEqual([len(p["muestras"]) for p in enviados[self.user.id]], [1, 1, 1, 0])
+
+    def test_push_sigue_si_falla_una_vuelta(self):
+        vueltas = []
+
+        def dormir(segundos):
+            vueltas.append(segundos)
+            if len(vueltas) > 2:
+                raise _FinLoop
+
+        self.telemetria.side_effect = [procesos.SupervisorNoDisponible("caído"), self.series]
+        with mock.patch.object(telemetria, "time", SimpleNamespace(sleep=dormir)), \
+                mock.patch.object(telemetria, "notificar_telemetria") as notificar, \
+                self.assertLogs("core.services.telemetria", "ERROR"):
+            with self.assertRaises(_FinLoop):
+                telemetria._loop()
+
+        self.assertEqual(notificar.call_count, 2)
+
+    def test_consumer_reenvia_al_panel(self):
+        consumer = PanelConsumer()
+        consumer.send_json = mock.AsyncMock()
+
+        asyncio.run(consumer.telemetria_ffmpeg({"type": "telemetria_ffmpeg", "procesos": [{"pid": 1}]}))
+
+        consumer.send_json.assert_awaited_once_with({"tipo": "telemetria", "procesos": [{"pid": 1}]})
+
+
+# ============================================================
+# BITÁCORA
+# ============================================================
+
+class _Capturador(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.registros = []
+
+    def emit(self, record):
+        self.registros.append(record)
+
+
+class BitacoraTests(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, "niveles.json")
+        ajustes = override_settings(LOG_NIVELES_ARCHIVO=self.ruta)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.logger = logging.getLogger("core.prueba_bitacora")
+        self.logger.setLevel(logging.WARNING)
+        self.addCleanup(self.logger.setLevel, logging.NOTSET)
+        self.cambios = 0
+
+    def _registro(self, nivel=logging.WARNING, **extra):
+        return self.logger.makeRecord(self.logger.name, nivel, "x.py", 1, "hola %s", ("mundo",), None, extra=extra)
+
+    def _nivel_log(self, *args):
+        call_command("nivel_log", *args, stdout=io.StringIO())
+        # mtime distinto aunque dos escrituras caigan en el mismo tick
+        self.cambios += 1
+        os.utime(self.ruta, (1000 + self.cambios, 1000 + self.cambios))
+
+    def test_cola_llena_descarta_y_cuenta(self):
+        with mock.patch.object(metricas, "_METRICAS", []):
+            contador = metricas.Contador("descartados_total", "prueba", etiquetas=("nivel",))
+        handler = bitacora.ColaHandler(queue.Queue(1))
+        handler._en_marcha = True   # sin listener: la cola no se vacía
+
+        with mock.patch.object(bitacora, "LOGS_DESCARTADOS", contador):
+            for _ in range(3):
+                handler.handle(self._registro())
+            handler.handle(self._registro(logging.ERROR))
+
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(contador.exponer()[2:], [
+            'descartados_total{nivel="ERROR"} 1',
+            'descartados_total{nivel="WARNING"} 2',
+        ])
+
+    def test_override_se_aplica_y_se_quita(self):
+        listener = bitacora.ColaListener(queue.Queue())
+
+        self._nivel_log(self.logger.name, "debug")
+        listener._revisar_niveles()
+        self.assertEqual(self.logger.level, logging.DEBUG)
+
+        self._nivel_log(self.logger.name, "--quitar")
+        listener._revisar_niveles()
+        self.assertEqual(self.logger.level, logging.WARNING)
+        self.assertEqual(bitacora.leer_niveles(self.ruta), {})
+
+    def test_archivo_roto_no_tira_el_listener(self):
+        capturador = _Capturador()
+        cola = queue.Queue()
+        listener = bitacora.ColaListener(cola, capturador)
+        for contenido in ('{"core.prueba_bitacora": "FOO"}', '{"core.prueba_'):
+            with open(self.ruta, "w") as f:
+                f.write(contenido)
+            listener._mtime = None
+            listener._proxima_revision = 0.0
+
+            with self.assertLogs("core.services.bitacora", "WARNING"):
+                listener.start()
+                cola.put(self._registro())
+                listener.stop()
+
+        self.assertEqual(len(capturador.registros), 2)
+        self.assertEqual(self.logger.level, logging.WARNING)
+
+    def test_formato_json_con_extra(self):
+        linea = bitacora.FormatoJSON().format(self._registro(usuario="canal", cam_index=2))
+
+        datos = json.loads(linea)
+        self.assertEqual(datos["mensaje"], "hola mundo")
+        self.assertEqual((datos["nivel"], datos["logger"]), ("WARNING", "core.prueba_bitacora"))
+        self.assertEqual((datos["usuario"], datos["cam_index"]), ("canal", 2))
+        self.assertNotIn("args", datos)
 
-# Create your tests here.
@@ -55,6 +55,10 @@ urlpatterns = [
     path("poner-al-aire/<int:cam_index>/", views.poner_al_aire, name="poner_al_aire"),
     path("detener-transmision/", views.detener_transmision, name="detener_transmision"),
     path("cerrar-camara/<int:cam_index>/", views.cerrar_camara, name="cerrar_camara"),
+    path("canal/baja-latencia/", views.baja_latencia_canal, name="baja_latencia_canal"),
+    path("trabajos/<str:job_id>/", views.estado_trabajo_control, name="estado_trabajo_control"),
+    path("telemetria/", views.telemetria_procesos, name="telemetria_procesos"),
+    path("metrics", views.metricas, name="metricas"),
 
     # --- EXTRAS ---
     path("audio/", views.audio, name="audio"),
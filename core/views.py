@@ -1,6 +1,7 @@
 import qrcode
 import io
 import base64
+import logging
 from datetime import timedelta
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
@@ -24,14 +25,21 @@ from .models import Cliente, StreamConnection, CanalTransmision
 # Servicios Websocket y Lógica
 from core.services.notificaciones_tiempo_real import notificar_camara_actualizada, notificar_camara_eliminada, notificar_estado_canal
 from core.services.estado_transmision import (
-    poner_camara_al_aire,
     detener_transmision_usuario,
     cerrar_camara_usuario,
-    limpiar_conexiones_huerfanas
+    limpiar_conexiones_huerfanas,
+    programar_fin_transmision,
 )
+from core.services.ffmpeg_manager import camara_autorizada, reiniciar_program_hls
+from core.services.sonda_entrada import olvidar_sonda
+from core.services.trabajos import encolar, estado_trabajo
+from core.services.telemetria import telemetria_usuario
+from core.services.metricas import HOOK_SEGUNDOS, medir, exponer
 # Solo necesitamos stop para cuando Nginx avisa directamente
 # from core.services.ffmpeg_manager import stop_program_stream 
 
+logger = logging.getLogger(__name__)
+
 
 # ==============================================================================
 # SECCIÓN 1: AUTENTICACIÓN Y SEGURIDAD (Sin cambios)
@@ -157,6 +165,7 @@ from urllib.parse import urlparse
 
 
 @csrf_exempt
+@medir(HOOK_SEGUNDOS, "validar_publicacion")
 def validar_publicacion(request):
     tcurl = request.POST.get("tcurl", "")
     stream_key = request.POST.get("name") or request.GET.get("name")
@@ -170,7 +179,7 @@ def validar_publicacion(request):
         allowed_host = settings.RTMP_SERVER_HOST_PUBLIC
 
         if host and host != allowed_host:
-            print(f"[ALERTA] Intento de conexión desde host no permitido: {host}")
+            logger.warning("Intento de conexión desde host no permitido: %s", host)
             return HttpResponseForbidden("Dominio RTMP no permitido")
 
     # ---------------------------------------------------------
@@ -208,6 +217,9 @@ def validar_publicacion(request):
         }
     )
 
+    # Publicación nueva: OBS pudo cambiar resolución/codec
+    olvidar_sonda(stream_key)
+
     # Notificar al frontend
     notificar_camara_actualizada(user, cam_index)
 
@@ -215,6 +227,7 @@ def validar_publicacion(request):
 
 
 @csrf_exempt
+@medir(HOOK_SEGUNDOS, "stream_finalizado")
 def stream_finalizado(request):
     stream_key = request.POST.get("name") or request.GET.get("name")
     if not stream_key:
@@ -228,28 +241,20 @@ def stream_finalizado(request):
         # Solo cerramos la cámara
         cerrar_camara_usuario(user, cam_index)
 
-        # Chequeo inmediato
         hay_on_air = StreamConnection.objects.filter(
             user=user,
             status=StreamConnection.Status.ON_AIR,
         ).exists()
 
         if not hay_on_air:
-            # Debounce: esperar un instante por si hay un switch en curso
-            import time
-            time.sleep(0.5)  # 500 ms
-            hay_on_air = StreamConnection.objects.filter(
-                user=user,
-                status=StreamConnection.Status.ON_AIR,
-            ).exists()
-
-        if not hay_on_air:
-            detener_transmision_usuario(user)
+            # Debounce fuera del request: si hay un switch en curso, el
+            # próximo ON_AIR cancela el fin agendado
+            programar_fin_transmision(user)
 
-        print(f"[DEBUG] stream_finalizado OK: {username} cam {cam_index}")
+        logger.debug("stream_finalizado OK: %s cam %s", username, cam_index)
 
     except Exception as e:
-        print(f"[ERROR] stream_finalizado: {e}")
+        logger.error("stream_finalizado: %s", e)
 
     return HttpResponse("OK")
 
@@ -274,7 +279,10 @@ def autorizar_camara(request, cam_index):
         # 🔔 Notificación WebSocket
         notificar_camara_actualizada(request.user, cam_index)
 
-        print(f"[DEBUG] autorizar_camara: usuario {request.user.username} cam {cam_index} READY")
+        # 🎛️ Preparar la cámara para el motor de switch
+        camara_autorizada(request.user, conn.stream_key)
+
+        logger.debug("autorizar_camara: usuario %s cam %s READY", request.user.username, cam_index)
         return JsonResponse({"ok": True})
 
     except StreamConnection.DoesNotExist:
@@ -284,25 +292,66 @@ def autorizar_camara(request, cam_index):
 @login_required
 @require_POST
 def poner_al_aire(request, cam_index):
+    """Encola el switch; el resultado llega por WebSocket (tipo "trabajo")."""
+    job_id = encolar(request.user, "switch", cam_index=cam_index)
+    logger.debug("poner_al_aire: usuario %s cam %s encolado (%s)", request.user.username, cam_index, job_id)
+    return JsonResponse({"ok": True, "job_id": job_id}, status=202)
+
+
+@login_required
+def estado_trabajo_control(request, job_id):
+    """Consulta de respaldo para un trabajo encolado (si el WebSocket se cortó)."""
+    trabajo = estado_trabajo(request.user, job_id)
+    if trabajo is None:
+        return JsonResponse({"ok": False, "error": "Trabajo no encontrado"}, status=404)
+    return JsonResponse({"ok": True, **trabajo})
+
+
+@login_required
+def telemetria_procesos(request):
+    """Series de telemetría de los FFmpeg del usuario (?ultimas=N recorta)."""
     try:
-        poner_camara_al_aire(request.user, cam_index)
-        print(f"[DEBUG] poner_al_aire: usuario {request.user.username} cam {cam_index} ON_AIR")
-        return JsonResponse({"ok": True})
-    except ValueError as e:
-        return JsonResponse({"ok": False, "error": str(e)}, status=400)
-    except Exception as e:
-        print(f"[ERROR] poner_al_aire: {e}")
-        return JsonResponse({"ok": False, "error": "Error interno"}, status=500)
+        ultimas = int(request.GET.get("ultimas", 0)) or None
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "ultimas inválido"}, status=400)
+    return JsonResponse({"ok": True, "procesos": telemetria_usuario(request.user.id, ultimas)})
+
+
+def metricas(request):
+    """Métricas del plano de control para Prometheus (core/services/metricas.py)."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICAS_IPS:
+        return HttpResponseForbidden("Prohibido")
+    return HttpResponse(exponer(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @login_required
 @require_POST
 def detener_transmision(request):
     detener_transmision_usuario(request.user)
-    print(f"[DEBUG] detener_transmision: usuario {request.user.username}")
+    logger.debug("detener_transmision: usuario %s", request.user.username)
     return JsonResponse({"ok": True})
 
 
+@login_required
+@require_POST
+def baja_latencia_canal(request):
+    """
+    Frontend -> Django. Activa/desactiva el HLS de baja latencia del canal.
+    Si está en vivo se relanza solo el HLS maestro (el programa no se corta).
+    """
+    activar = request.POST.get("activar") in ("1", "true", "on")
+
+    canal, _ = CanalTransmision.objects.get_or_create(usuario=request.user)
+    if canal.baja_latencia != activar:
+        canal.baja_latencia = activar
+        canal.save(update_fields=["baja_latencia"])
+        if canal.en_vivo:
+            reiniciar_program_hls(request.user)
+        notificar_estado_canal(request.user)
+
+    return JsonResponse({"ok": True, "baja_latencia": canal.baja_latencia})
+
+
 @login_required
 @require_POST
 def rechazar_camara(request, cam_index):
@@ -356,6 +405,7 @@ def estado_camaras(request):
         canal = {
             "en_vivo": bool(canal_obj.en_vivo),
             "hls_url": canal_obj.url_hls,
+            "baja_latencia": canal_obj.baja_latencia,
             "inicio": canal_obj.inicio_transmision.isoformat() if canal_obj.inicio_transmision else None,
         }
 
@@ -363,6 +413,7 @@ def estado_camaras(request):
 
 
 @csrf_exempt
+@medir(HOOK_SEGUNDOS, "autorizar_program_switch")
 def autorizar_program_switch(request):
     """
     Autoriza o rechaza escritura en /program_switch.
@@ -384,20 +435,20 @@ def autorizar_program_switch(request):
     try:
         user = User.objects.get(username=stream_name)
     except User.DoesNotExist:
-        print(f"[RTMP] program_switch RECHAZADO: usuario {stream_name} no existe")
+        logger.warning("[RTMP] program_switch RECHAZADO: usuario %s no existe", stream_name)
         return HttpResponse("Usuario inexistente", status=403)
 
     try:
         canal = CanalTransmision.objects.get(usuario=user)
     except CanalTransmision.DoesNotExist:
-        print(f"[RTMP] program_switch RECHAZADO: canal inexistente ({user.username})")
+        logger.warning("[RTMP] program_switch RECHAZADO: canal inexistente (%s)", user.username)
         return HttpResponse("Canal inexistente", status=403)
 
     if not canal.en_vivo:
-        print(f"[RTMP] program_switch BLOQUEADO: {user.username} no está EN VIVO")
+        logger.warning("[RTMP] program_switch BLOQUEADO: %s no está EN VIVO", user.username)
         return HttpResponse("Canal no en vivo", status=403)
 
-    print(f"[RTMP] program_switch AUTORIZADO para {user.username}")
+    logger.info("[RTMP] program_switch AUTORIZADO para %s", user.username)
     return HttpResponse("OK", status=200)
 
 
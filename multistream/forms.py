@@ -25,4 +25,11 @@ class CuentaFacebookForm(forms.ModelForm):
             'url_ingestion': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'rtmps://live-api-s.facebook.com:443/rtmp/'}),
             'clave_transmision': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'clave-de-ejemplo'}),
             'activo': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        }
\ No newline at end of file
+        }
+
+    def clean_url_ingestion(self):
+        url = self.cleaned_data.get('url_ingestion', '').strip()
+        # Facebook solo acepta RTMPS: la clave no puede viajar en claro
+        if not url.startswith('rtmps://'):
+            raise forms.ValidationError("Facebook requiere una URL rtmps://")
+        return url
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multistream', '0003_cuentafacebook'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='estadoretransmision',
+            name='estado',
+            field=models.CharField(choices=[('iniciando', 'Iniciando'), ('activo', 'Activo'), ('reconectando', 'Reconectando'), ('error', 'Error'), ('detenido', 'Detenido')], default='iniciando', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='IntentoRetransmision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('motivo', models.CharField(max_length=255)),
+                ('espera_segundos', models.FloatField(help_text='Backoff aplicado antes de reintentar')),
+                ('exito', models.BooleanField(help_text='None mientras el intento está pendiente', null=True)),
+                ('mensaje_error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('retransmision', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intentos', to='multistream.estadoretransmision')),
+            ],
+            options={
+                'verbose_name': 'Intento de Retransmisión',
+                'verbose_name_plural': 'Intentos de Retransmisión',
+                'ordering': ['-creado_en'],
+            },
+        ),
+    ]
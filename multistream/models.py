@@ -71,6 +71,7 @@ class EstadoRetransmision(models.Model):
     ESTADO_CHOICES = [
         ('iniciando', 'Iniciando'),
         ('activo', 'Activo'),
+        ('reconectando', 'Reconectando'),
         ('error', 'Error'),
         ('detenido', 'Detenido'),
     ]
@@ -102,6 +103,33 @@ class EstadoRetransmision(models.Model):
         return f"{self.usuario.username} - {self.plataforma} ({self.estado})"
 
 
+class IntentoRetransmision(models.Model):
+    """
+    Cada reconexión automática de una retransmisión caída
+    (multistream/services/supervisor_retransmisiones.py).
+    """
+    retransmision = models.ForeignKey(
+        EstadoRetransmision,
+        on_delete=models.CASCADE,
+        related_name='intentos'
+    )
+    numero = models.PositiveIntegerField()
+    motivo = models.CharField(max_length=255)
+    espera_segundos = models.FloatField(help_text="Backoff aplicado antes de reintentar")
+    exito = models.BooleanField(null=True, help_text="None mientras el intento está pendiente")
+    mensaje_error = models.TextField(blank=True)
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Intento de Retransmisión"
+        verbose_name_plural = "Intentos de Retransmisión"
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"{self.retransmision} - intento {self.numero}"
+
+
 # ===========================================
 # AGREGAR AL FINAL DE models.py
 # ============================================
@@ -1,119 +1,56 @@
 """
 BASE STREAMER - Clase abstracta base para todas las plataformas
 
-CRÍTICO: FFmpeg escribe a archivo de log, NO a PIPE.
-Con PIPE, si nadie lee el pipe se llena y FFmpeg se bloquea/muere.
-Con archivo, FFmpeg puede escribir indefinidamente sin bloquearse.
+Cada plataforma describe su destino (URL + opciones de salida); el
+proceso del canal lo arma FanoutStreamer (fanout_streamer.py).
+
+RESTREAM_PROCESSES: "<user_id>" -> FFmpeg tee del canal
+meta = {"log": ruta del log, "slaves": plataformas en el orden del tee,
+        "progress": archivo -progress (lo agrega la tabla de procesos)}
 """
 
 from abc import ABC, abstractmethod
-import subprocess
 import logging
-import os
+
+from core.services.procesos import RegistroProcesos
 
 logger = logging.getLogger(__name__)
 
+# "user_id" -> FFmpeg tee que reparte el programa a todas sus plataformas
+RESTREAM_PROCESSES = RegistroProcesos("restream")
+
+
+def clave_retransmision(user_id):
+    return str(user_id)
+
 
 class BaseStreamer(ABC):
+    """
+    Un destino de retransmisión. No lanza procesos: FanoutStreamer junta
+    los destinos del canal en un solo FFmpeg con el muxer tee.
+    """
 
     PLATFORM_NAME = None
+    # Fragmentos del destino que identifican la plataforma en un comando
+    # FFmpeg ya corriendo (reconciliación de arranque)
+    DESTINATION_MARKERS = ()
+    # Opciones del esclavo tee (formato y flags del muxer de salida)
+    TEE_OPTIONS = "f=flv"
 
-    def __init__(self, user, source_url):
+    def __init__(self, user):
         self.user = user
-        self.source_url = source_url
-        self.process = None
-        self._log_file = None
 
     @abstractmethod
     def get_rtmp_destination_url(self):
         pass
 
-    @abstractmethod
-    def build_ffmpeg_command(self, destination_url):
-        pass
-
     @abstractmethod
     def validate_account_credentials(self):
         pass
 
-    def start(self):
-        logger.info(f"🚀 Iniciando transmisión a {self.PLATFORM_NAME}")
-
-        self.validate_account_credentials()
-        destination_url = self.get_rtmp_destination_url()
-        command = self.build_ffmpeg_command(destination_url)
-
-        logger.info(f"🔧 Comando FFmpeg COMPLETO:")
-        logger.info(f"   {' '.join(command)}")
-
-        # Escribir logs a archivo para que FFmpeg nunca se bloquee
-        log_dir = '/tmp/ffmpeg_logs'
-        os.makedirs(log_dir, exist_ok=True)
-        log_path = f"{log_dir}/ffmpeg_{self.PLATFORM_NAME}_{self.user.username}.log"
-
-        # Abrir en modo binario - FFmpeg escribe bytes, no texto
-        self._log_file = open(log_path, 'wb')
-
-        logger.info(f"📝 Log FFmpeg: {log_path}")
-
-        self.process = subprocess.Popen(
-            command,
-            stdin=subprocess.DEVNULL,
-            stdout=self._log_file,
-            stderr=subprocess.STDOUT,
-            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
-        )
-
-        logger.info(f"✅ Proceso FFmpeg iniciado (PID: {self.process.pid})")
-
-        import time
-        time.sleep(1)
-
-        if self.process.poll() is not None:
-            self._log_file.flush()
-            self._log_file.close()
-            try:
-                with open(log_path, 'rb') as f:
-                    error_msg = f.read().decode('utf-8', errors='replace')
-            except Exception:
-                error_msg = "no se pudo leer el log"
-            logger.error(f"❌ FFmpeg falló inmediatamente: {error_msg[-500:]}")
-            raise Exception(f"FFmpeg falló al iniciar. Ver: {log_path}")
-
-        logger.info(f"✅ FFmpeg corriendo correctamente")
-        return self.process
-
-    def stop(self):
-        if not self.process:
-            logger.warning(f"⚠️ No hay proceso activo para {self.PLATFORM_NAME}")
-            return
-
-        if self.process.poll() is not None:
-            logger.info(f"ℹ️ Proceso ya estaba detenido (PID: {self.process.pid})")
-            self._close_log()
-            return
-
-        logger.info(f"🛑 Deteniendo {self.PLATFORM_NAME} (PID: {self.process.pid})")
-
-        try:
-            self.process.terminate()
-            self.process.wait(timeout=5)
-            logger.info(f"✅ Proceso detenido correctamente")
-        except subprocess.TimeoutExpired:
-            self.process.kill()
-            self.process.wait()
-            logger.info(f"✅ Proceso forzado a detenerse")
-        finally:
-            self._close_log()
-
-    def _close_log(self):
-        if self._log_file and not self._log_file.closed:
-            self._log_file.close()
-
-    def is_running(self):
-        if not self.process:
-            return False
-        return self.process.poll() is None
-
-    def get_pid(self):
-        return self.process.pid if self.process else None
\ No newline at end of file
+    def tee_slave(self):
+        """
+        Salida del tee para este destino. onfail=ignore: si la plataforma
+        corta, el tee la descarta y el resto sigue transmitiendo.
+        """
+        return f"[{self.TEE_OPTIONS}:onfail=ignore]{self.get_rtmp_destination_url()}"
@@ -0,0 +1,222 @@
+"""
+FANOUT STREAMER
+===============
+Una retransmisión = UN FFmpeg por canal que lee el relay del programa
+una sola vez y lo reparte con el muxer tee a todas sus plataformas:
+
+  relay del programa ──► demux ──► tee ─┬─► [flv, onfail=ignore] YouTube
+  (nginx, RTMP local)                   └─► [flv, onfail=ignore] Facebook
+
+Tres plataformas cuestan un demux, no tres. onfail=ignore: si una
+plataforma corta, el tee la descarta ("Slave muxer #N failed") y las
+demás siguen al aire.
+
+FFmpeg no agrega ni quita salidas en caliente: el proceso se relanza
+solo cuando cambia el conjunto de plataformas al aire (sumar, quitar o
+reconectar una). Mientras el conjunto no cambie, pedir lo mismo no toca
+el proceso.
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from django.conf import settings
+
+from core.services.procesos import detener, esta_vivo
+from core.services.progreso_ffmpeg import leer_progreso, paquetes_escritos
+from .base_streamer import RESTREAM_PROCESSES, clave_retransmision
+
+logger = logging.getLogger(__name__)
+
+# tee con onfail=ignore: "Slave muxer #1 failed: ..., continuing with 1/2 slaves."
+ESCLAVO_CAIDO = re.compile(r"Slave muxer #(\d+) failed")
+
+# Un relanzamiento por canal a la vez (pedido del panel, reintento del supervisor)
+_LOCKS = {}
+_LOCKS_LOCK = threading.Lock()
+
+
+def _lock_canal(user_id):
+    with _LOCKS_LOCK:
+        return _LOCKS.setdefault(user_id, threading.Lock())
+
+
+class FanoutStreamer:
+
+    def __init__(self, user, streamers):
+        self.user = user
+        # Orden fijo: el índice de cada esclavo del tee es el de su plataforma
+        self.streamers = sorted(streamers, key=lambda s: s.PLATFORM_NAME)
+        self.platforms = [s.PLATFORM_NAME for s in self.streamers]
+        self.fallidas = []
+        self.process = None
+        self.log_path = None
+
+    @property
+    def clave(self):
+        return clave_retransmision(self.user.id)
+
+    def source_url(self):
+        # Relay interno: sigue publicando aunque cambie la cámara, el modo
+        # radio o se relance el HLS maestro (ver ffmpeg_manager.asegurar_relay)
+        from core.services.ffmpeg_manager import url_relay
+        return url_relay(self.user)
+
+    def build_ffmpeg_command(self):
+        destinos = "|".join(s.tee_slave() for s in self.streamers)
+
+        return [
+            settings.FFMPEG_BIN_PATH,
+            # Reportes -progress más seguidos: el arranque espera el primero con paquetes
+            '-stats_period', '0.5',
+            # ========== INPUT (relay RTMP local, una sola lectura) ==========
+            '-fflags', '+genpts+discardcorrupt',
+            '-i', self.source_url(),
+            # ========== COPY (sin recodificar) ==========
+            '-map', '0:v:0',
+            '-map', '0:a:0',
+            '-c', 'copy',
+            # ========== OUTPUT (un esclavo por plataforma) ==========
+            '-f', 'tee',
+            destinos,
+        ]
+
+    def start(self):
+        """
+        Lanza el tee y espera a que escriba los primeros paquetes (las
+        plataformas conectan en paralelo dentro del proceso). Devuelve el
+        proceso; self.fallidas queda con las plataformas cuyo handshake
+        falló mientras las demás siguen al aire.
+        """
+        logger.info(f"🚀 Iniciando retransmisión a {', '.join(self.platforms)} para {self.user.username}")
+
+        from core.services.ffmpeg_manager import asegurar_relay
+        asegurar_relay(self.user)
+
+        command = self.build_ffmpeg_command()
+
+        # Escribir logs a archivo para que FFmpeg nunca se bloquee
+        log_dir = '/tmp/ffmpeg_logs'
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_path = f"{log_dir}/ffmpeg_restream_{self.user.username}.log"
+
+        logger.info(f"📝 Log FFmpeg: {self.log_path}")
+
+        self.process = RESTREAM_PROCESSES.lanzar(
+            self.clave, command, self.log_path,
+            meta={"log": self.log_path, "slaves": self.platforms},
+        )
+
+        logger.info(f"✅ Proceso FFmpeg iniciado (PID: {self.process.pid})")
+
+        try:
+            self._esperar_paquetes(self.process.meta.get("progress"))
+        except Exception:
+            registrado = RESTREAM_PROCESSES.get(self.clave)
+            if registrado and registrado.pid == self.process.pid:
+                RESTREAM_PROCESSES.pop(self.clave)
+            detener(self.process, esperar=False)
+            logger.error(f"❌ FFmpeg no arrancó: {_cola_log(self.log_path)[-500:]}")
+            raise
+
+        # El tee siguió con el resto: las caídas quedan en el log
+        self.fallidas = esclavos_caidos(_cola_log(self.log_path), self.platforms)
+        if self.fallidas:
+            logger.warning(f"⚠️ No conectaron: {self.fallidas}")
+
+        logger.info(f"✅ FFmpeg transmitiendo a {', '.join(p for p in self.platforms if p not in self.fallidas)}")
+        return self.process
+
+    def _esperar_paquetes(self, progress_path):
+        limite = time.monotonic() + settings.RESTREAM_ARRANQUE_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise Exception("FFmpeg terminó durante el arranque (handshake rechazado o sin fuente)")
+            if paquetes_escritos(leer_progreso(progress_path)):
+                return
+            if time.monotonic() >= limite:
+                raise Exception(f"Sin paquetes a los {settings.RESTREAM_ARRANQUE_TIMEOUT:.0f}s de arrancar")
+            time.sleep(0.1)
+
+
+def esclavos_caidos(texto, slaves):
+    """Plataformas que el tee reporta caídas en un trozo de log."""
+    if isinstance(texto, bytes):
+        texto = texto.decode(errors="replace")
+    return list(dict.fromkeys(
+        slaves[int(i)] for i in ESCLAVO_CAIDO.findall(texto)
+        if int(i) < len(slaves)
+    ))
+
+
+def esclavos_cortados(proceso):
+    """Plataformas que el tee del proceso ya descartó (según su log)."""
+    return esclavos_caidos(_cola_log(proceso.meta.get("log")), proceso.meta.get("slaves", []))
+
+
+def al_aire(proceso):
+    """Plataformas que el tee del proceso sigue transmitiendo."""
+    if not esta_vivo(proceso):
+        return []
+    cortados = esclavos_cortados(proceso)
+    return [p for p in proceso.meta.get("slaves", []) if p not in cortados]
+
+
+def relanzar(user, streamers, forzar=False):
+    """
+    Deja el tee del canal transmitiendo exactamente a estos destinos.
+    Si ya transmite a ese conjunto no lo toca (salvo forzar); si no,
+    detiene el actual y lanza uno nuevo. Devuelve {plataforma: proceso |
+    excepción}.
+    """
+    resultados = {}
+    validos = []
+    for streamer in streamers:
+        try:
+            streamer.validate_account_credentials()
+            validos.append(streamer)
+        except ValueError as e:
+            resultados[streamer.PLATFORM_NAME] = e
+
+    clave = clave_retransmision(user.id)
+    plataformas = sorted(s.PLATFORM_NAME for s in validos)
+
+    with _lock_canal(user.id):
+        actual = RESTREAM_PROCESSES.get(clave)
+        if not forzar and actual is not None and al_aire(actual) == plataformas == actual.meta.get("slaves"):
+            resultados.update({p: actual for p in plataformas})
+            return resultados
+
+        if actual is not None:
+            RESTREAM_PROCESSES.pop(clave)
+            # Esperar la salida: la plataforma rechaza dos publicaciones con la misma clave
+            detener(actual, esperar=True)
+
+        if not validos:
+            return resultados
+
+        fanout = FanoutStreamer(user, validos)
+        try:
+            proceso = fanout.start()
+        except Exception as e:
+            resultados.update({p: e for p in plataformas})
+            return resultados
+
+    for plataforma in fanout.platforms:
+        resultados[plataforma] = (
+            Exception("La plataforma rechazó la conexión") if plataforma in fanout.fallidas
+            else proceso
+        )
+    return resultados
+
+
+def _cola_log(log_path, max_bytes=65536):
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - max_bytes))
+            return f.read().decode('utf-8', errors='replace')
+    except (OSError, TypeError):
+        return "no se pudo leer el log"
@@ -1,6 +1,9 @@
 """
-STREAM MANAGER - ORIGINAL
-Sin auto-restart. Facebook streamer maneja los timestamps con N/FR/TB.
+STREAM MANAGER
+Un FFmpeg tee por canal reparte el programa a todas sus plataformas (ver
+fanout_streamer.py). Sumar o quitar una plataforma relanza el tee con el
+conjunto nuevo; pedir una que ya está al aire no lo toca. Las caídas las
+reconecta supervisor_retransmisiones.py.
 """
 
 import logging
@@ -8,12 +11,17 @@ from datetime import datetime
 from django.conf import settings
 from multistream.models import EstadoRetransmision
 from core.models import CanalTransmision
+from core.services.procesos import esta_vivo, detener
+from core.services.trabajos import trabajo
+from .base_streamer import RESTREAM_PROCESSES, clave_retransmision
+from .fanout_streamer import al_aire, relanzar
 from .youtube_streamer import YouTubeStreamer
 from .facebook_streamer import FacebookStreamer
 
 logger = logging.getLogger(__name__)
 
-ACTIVE_PROCESSES = {}
+# Vive en el registro de procesos: en modo supervisor lo comparten todos los workers
+ACTIVE_PROCESSES = RESTREAM_PROCESSES
 
 
 class StreamManager:
@@ -25,20 +33,32 @@ class StreamManager:
 
     @classmethod
     def start_stream(cls, user, platform, force=False):
-        try:
+        return cls.start_streams(user, [platform], force=force)[0]
+
+    @classmethod
+    def start_streams(cls, user, platforms, force=False):
+        """
+        Suma las plataformas pedidas al tee del canal (un solo relanzamiento
+        para todas). Devuelve un resultado por plataforma, en el mismo orden.
+        """
+        resultados = {}
+
+        if not cls._get_channel_hls_url(user):
+            return [
+                {'success': False, 'message': "No hay transmisión activa en tu canal"}
+                for _ in platforms
+            ]
+
+        nuevas = []
+        forzar = False
+        for platform in dict.fromkeys(platforms):
             if platform not in cls.AVAILABLE_STREAMERS:
                 available = ', '.join(cls.AVAILABLE_STREAMERS.keys())
-                return {
+                resultados[platform] = {
                     'success': False,
                     'message': f"Plataforma '{platform}' no soportada. Disponibles: {available}"
                 }
-
-            source_url = cls._get_channel_hls_url(user)
-            if not source_url:
-                return {
-                    'success': False,
-                    'message': "No hay transmisión activa en tu canal"
-                }
+                continue
 
             existing_stream = EstadoRetransmision.objects.filter(
                 usuario=user,
@@ -49,88 +69,71 @@ class StreamManager:
             if existing_stream:
                 if not force:
                     logger.warning(f"⚠️ {platform} ya está activo para {user.username}")
-                    return {
+                    resultados[platform] = {
                         'success': False,
                         'requires_confirmation': True,
                         'message': f'Ya hay una transmisión activa en {platform.title()}. ¿Deseas detenerla e iniciar una nueva?'
                     }
-                else:
-                    logger.info(f"🔄 Forzando nueva transmisión en {platform}")
-                    cls.stop_stream(user, platform)
-
-            streamer_class = cls.AVAILABLE_STREAMERS[platform]
-            streamer = streamer_class(user, source_url)
-
-            logger.info(f"🎬 Iniciando {platform} para {user.username}")
-
-            process = streamer.start()
+                    continue
+                logger.info(f"🔄 Forzando nueva transmisión en {platform}")
+                # El tee se relanza igual: la plataforma vuelve a conectar
+                cls._cerrar_estado(user, platform)
+                forzar = True
 
-            if user.id not in ACTIVE_PROCESSES:
-                ACTIVE_PROCESSES[user.id] = {}
+            try:
+                cls.AVAILABLE_STREAMERS[platform](user).validate_account_credentials()
+            except ValueError as e:
+                # Una cuenta mal configurada no frena al resto
+                logger.warning(f"⚠️ Error de validación en {platform}: {e}")
+                cls._registrar_error(user, platform, str(e))
+                resultados[platform] = {'success': False, 'message': str(e)}
+                continue
 
-            ACTIVE_PROCESSES[user.id][platform] = {
-                'process': process,
-                'streamer': streamer
-            }
+            nuevas.append(platform)
 
-            EstadoRetransmision.objects.create(
-                usuario=user,
-                plataforma=platform,
-                proceso_id=process.pid,
-                estado='activo'
-            )
+        if nuevas:
+            destinos = set(cls._plataformas_abiertas(user)) | set(nuevas)
+            arranque = cls._relanzar(user, destinos, forzar=forzar)
 
-            logger.info(f"✅ {platform.title()} iniciado correctamente (PID: {process.pid})")
+            for platform in nuevas:
+                resultado = arranque[platform]
+                if isinstance(resultado, Exception):
+                    logger.error(f"❌ No arrancó {platform} para {user.username}: {resultado}")
+                    mensaje = (
+                        str(resultado) if isinstance(resultado, ValueError)
+                        else f"No se pudo iniciar {platform.title()}: {resultado}"
+                    )
+                    cls._registrar_error(user, platform, mensaje)
+                    resultados[platform] = {'success': False, 'message': mensaje}
+                    continue
 
-            return {
-                'success': True,
-                'pid': process.pid
-            }
+                EstadoRetransmision.objects.create(
+                    usuario=user,
+                    plataforma=platform,
+                    proceso_id=resultado.pid,
+                    estado='activo'
+                )
+                resultados[platform] = {'success': True, 'pid': resultado.pid}
+                logger.info(f"✅ {platform} iniciado correctamente (PID: {resultado.pid})")
 
-        except ValueError as e:
-            logger.warning(f"⚠️ Error de validación en {platform}: {e}")
-            EstadoRetransmision.objects.create(
-                usuario=user,
-                plataforma=platform,
-                estado='error',
-                mensaje_error=str(e),
-                detenido_en=datetime.now()
-            )
-            return {'success': False, 'message': str(e)}
-
-        except Exception as e:
-            logger.exception(f"❌ Error inesperado iniciando {platform}")
-            EstadoRetransmision.objects.create(
-                usuario=user,
-                plataforma=platform,
-                estado='error',
-                mensaje_error=f"Error interno: {str(e)}",
-                detenido_en=datetime.now()
-            )
-            return {'success': False, 'message': f"Error interno al iniciar {platform}"}
+        return [resultados[platform] for platform in platforms]
 
     @classmethod
-    def stop_stream(cls, user, platform):
+    def stop_stream(cls, user, platform, esperar=False):
         try:
-            process_data = ACTIVE_PROCESSES.get(user.id, {}).get(platform)
+            cls._cerrar_estado(user, platform)
 
-            if process_data:
-                streamer = process_data['streamer']
-                streamer.stop()
-                ACTIVE_PROCESSES[user.id].pop(platform, None)
-                if not ACTIVE_PROCESSES[user.id]:
-                    del ACTIVE_PROCESSES[user.id]
-
-            estado = EstadoRetransmision.objects.filter(
-                usuario=user,
-                plataforma=platform,
-                detenido_en__isnull=True
-            ).first()
-
-            if estado:
-                estado.estado = 'detenido'
-                estado.detenido_en = datetime.now()
-                estado.save()
+            process = ACTIVE_PROCESSES.get(clave_retransmision(user.id))
+            if process and platform in al_aire(process):
+                restantes = cls._plataformas_abiertas(user)
+                if restantes:
+                    # El tee sigue con las que quedan (relanzado sin esta)
+                    logger.info(f"🛑 Quitando {platform} del tee de {user.username}")
+                    cls._relanzar(user, restantes)
+                else:
+                    ACTIVE_PROCESSES.pop(clave_retransmision(user.id))
+                    logger.info(f"🛑 Deteniendo retransmisión (PID: {process.pid})")
+                    detener(process, esperar=esperar)
 
             logger.info(f"🛑 {platform.title()} detenido para {user.username}")
             return {'success': True}
@@ -139,44 +142,101 @@ class StreamManager:
             logger.exception(f"❌ Error deteniendo {platform}")
             return {'success': False, 'message': str(e)}
 
+    @classmethod
+    def _relanzar(cls, user, platforms, forzar=False):
+        """
+        Relanza el tee del canal con estas plataformas (si el conjunto
+        cambió) y apunta al proceso nuevo las retransmisiones abiertas que
+        siguen al aire. Devuelve {plataforma: proceso | excepción}.
+        """
+        resultados = relanzar(
+            user, [cls.AVAILABLE_STREAMERS[p](user) for p in sorted(platforms)], forzar=forzar,
+        )
+        for platform, resultado in resultados.items():
+            if not isinstance(resultado, Exception):
+                EstadoRetransmision.objects.filter(
+                    usuario=user, plataforma=platform, detenido_en__isnull=True
+                ).exclude(proceso_id=resultado.pid).update(proceso_id=resultado.pid)
+        return resultados
+
+    @staticmethod
+    def _plataformas_abiertas(user):
+        return list(
+            EstadoRetransmision.objects.filter(usuario=user, detenido_en__isnull=True)
+            .values_list('plataforma', flat=True)
+        )
+
+    @staticmethod
+    def _cerrar_estado(user, platform):
+        EstadoRetransmision.objects.filter(
+            usuario=user,
+            plataforma=platform,
+            detenido_en__isnull=True
+        ).update(estado='detenido', detenido_en=datetime.now())
+
+    @staticmethod
+    def _registrar_error(user, platform, mensaje):
+        EstadoRetransmision.objects.create(
+            usuario=user,
+            plataforma=platform,
+            estado='error',
+            mensaje_error=mensaje,
+            detenido_en=datetime.now()
+        )
+
     @classmethod
     def get_active_streams(cls, user):
-        active = []
-        user_processes = ACTIVE_PROCESSES.get(user.id, {})
-        for platform, data in user_processes.items():
-            streamer = data['streamer']
-            active.append({
+        process = ACTIVE_PROCESSES.get(clave_retransmision(user.id))
+        if process is None:
+            return []
+        vivo = esta_vivo(process)
+        en_aire = al_aire(process)
+        return [
+            {
                 'plataforma': platform,
-                'pid': streamer.get_pid(),
-                'activo': streamer.is_running()
-            })
-        return active
+                'pid': process.pid,
+                'activo': vivo and platform in en_aire
+            }
+            for platform in process.meta.get('slaves', [])
+        ]
 
     @classmethod
     def cleanup_dead_processes(cls):
         cleaned = 0
-        for user_id in list(ACTIVE_PROCESSES.keys()):
-            for platform in list(ACTIVE_PROCESSES[user_id].keys()):
-                streamer = ACTIVE_PROCESSES[user_id][platform]['streamer']
-                if not streamer.is_running():
-                    logger.warning(f"⚠️ Proceso huérfano: User {user_id} - {platform}")
-                    ACTIVE_PROCESSES[user_id].pop(platform)
-                    cleaned += 1
-                    EstadoRetransmision.objects.filter(
-                        usuario_id=user_id,
-                        plataforma=platform,
-                        detenido_en__isnull=True
-                    ).update(
-                        estado='error',
-                        mensaje_error='Proceso terminado inesperadamente',
-                        detenido_en=datetime.now()
-                    )
-            if not ACTIVE_PROCESSES[user_id]:
-                del ACTIVE_PROCESSES[user_id]
+        for clave, process in ACTIVE_PROCESSES.items():
+            if esta_vivo(process):
+                continue
+            user_id = clave
+            logger.warning(f"⚠️ Proceso huérfano: User {user_id} - {process.meta.get('slaves')}")
+            ACTIVE_PROCESSES.pop(clave)
+            cleaned += 1
+            EstadoRetransmision.objects.filter(
+                usuario_id=user_id,
+                plataforma__in=process.meta.get('slaves', []),
+                detenido_en__isnull=True
+            ).update(
+                estado='error',
+                mensaje_error='Proceso terminado inesperadamente',
+                detenido_en=datetime.now()
+            )
         if cleaned > 0:
             logger.info(f"🧹 Limpiados {cleaned} procesos huérfanos")
         return cleaned
 
+    @classmethod
+    def platforms_for_destination(cls, destination):
+        """
+        Plataformas de una salida ya armada, en el orden del tee:
+        "[opciones]url|[opciones]url" (o una URL sola de versiones anteriores).
+        """
+        platforms = []
+        for salida in destination.split("|"):
+            for platform, streamer_class in cls.AVAILABLE_STREAMERS.items():
+                if any(m in salida for m in streamer_class.DESTINATION_MARKERS):
+                    platforms.append(platform)
+                    break
+        return platforms
+
     @staticmethod
     def _get_channel_hls_url(user):
         try:
@@ -194,3 +254,37 @@ class StreamManager:
         except CanalTransmision.DoesNotExist:
             logger.error(f"❌ No existe canal para {user.username}")
             return None
+
+
+# ============================================================
+# TRABAJOS DE CONTROL
+# ============================================================
+
+@trabajo("restream_start")
+def _trabajo_restream_start(user, avance, platforms, force=False):
+    avance(f"Iniciando {', '.join(platforms)}")
+    resultados = [
+        {
+            "platform": platform,
+            "success": resultado["success"],
+            "message": resultado.get("message", ""),
+            "requires_confirmation": resultado.get("requires_confirmation", False),
+        }
+        for platform, resultado in zip(platforms, StreamManager.start_streams(user, platforms, force=force))
+    ]
+
+    # OK si al menos una tuvo éxito (mismo contrato que la vista síncrona)
+    return {
+        "ok": any(r["success"] for r in resultados),
+        "resultados": resultados,
+    }
+
+
+@trabajo("restream_stop")
+def _trabajo_restream_stop(user, avance, platform):
+    resultado = StreamManager.stop_stream(user, platform)
+    return {
+        "ok": resultado["success"],
+        "platform": platform,
+        "message": resultado.get("message", ""),
+    }
@@ -0,0 +1,290 @@
+"""
+SUPERVISOR DE RETRANSMISIONES
+=============================
+Una caída del uplink no puede terminar la retransmisión en silencio.
+Un thread del dueño de los procesos (el worker en modo local, el daemon
+media_supervisor en modo supervisor) revisa cada retransmisión cada
+settings.RESTREAM_SUPERVISOR_INTERVALO segundos:
+
+  - proceso terminado            → se reintentan todas sus plataformas
+  - -progress quieto N segundos  → estancado (out_time_us y total_size
+                                   sin moverse): se mata y se reintenta
+  - "Slave muxer #N failed"      → el tee descartó esa plataforma y sigue
+                                   con las demás: se reintenta solo esa
+
+Reintentar una plataforma caída relanza el tee del canal con el conjunto
+completo (FFmpeg no suma salidas en caliente): las que seguían al aire
+reconectan en el mismo relanzamiento.
+
+Reintentos con backoff exponencial con jitter, presupuesto por destino
+(RESTREAM_REINTENTOS_MAX) que se recupera tras RESTREAM_ESTABLE_SEGUNDOS
+al aire, un IntentoRetransmision por intento y estado en vivo al panel
+(restream_update).
+"""
+
+import time
+import random
+import threading
+import logging
+from datetime import datetime
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.services.procesos import esta_vivo, detener, modo_supervisor
+from core.services.progreso_ffmpeg import VigiaAvance
+from core.services.planificador import PlanificadorDiferido
+from core.services.notificaciones_tiempo_real import notificar_retransmision
+from multistream.models import EstadoRetransmision, IntentoRetransmision
+from .base_streamer import RESTREAM_PROCESSES
+from .fanout_streamer import esclavos_cortados
+
+logger = logging.getLogger(__name__)
+
+# (user_id, plataforma) -> [fallos consecutivos, monotonic del último relanzamiento]
+_FALLOS = {}
+# pid del tee -> plataformas cuya caída ya se reportó
+_REPORTADAS = {}
+_VIGIA = VigiaAvance()
+_LOCK = threading.Lock()
+_THREAD = None
+
+# Pool propio: un reintento espera hasta RESTREAM_ARRANQUE_TIMEOUT el
+# primer paquete y no puede demorar los fines de transmisión del PLANIFICADOR
+_REINTENTOS = PlanificadorDiferido(max_workers=4, nombre="reintentos-restream")
+
+
+def _backoff(intento):
+    """Exponencial con jitter: 2, 4, 8... hasta el máximo, ±50%."""
+    techo = min(settings.RESTREAM_BACKOFF_MAX, settings.RESTREAM_BACKOFF_BASE * 2 ** (intento - 1))
+    return techo * random.uniform(0.5, 1.5)
+
+
+# ============================================================
+# DETECCIÓN
+# ============================================================
+
+def _estancado(proceso):
+    # El log solo crece con warnings: una copia sana puede pasar minutos sin
+    # escribirlo. Lo que mide el avance es el -progress (paquetes escritos)
+    return _VIGIA.estancado(
+        proceso.pid, proceso.meta.get("progress"), settings.RESTREAM_ESTANCADO_SEGUNDOS
+    )
+
+
+def revisar():
+    """Una pasada sobre todas las retransmisiones abiertas."""
+    # Antes que los procesos: una activa creada después ya tiene su proceso listado
+    activas = list(
+        EstadoRetransmision.objects.filter(detenido_en__isnull=True, estado='activo')
+        .values_list('usuario_id', 'plataforma')
+    )
+    cubiertas = set()
+    vivos = set()
+
+    for clave, proceso in RESTREAM_PROCESSES.items():
+        user_id = int(clave)
+        slaves = proceso.meta.get("slaves", [])
+        reportadas = _REPORTADAS.setdefault(proceso.pid, set())
+        vivos.add(proceso.pid)
+
+        if not esta_vivo(proceso):
+            RESTREAM_PROCESSES.pop(clave)
+            _olvidar(proceso.pid)
+            _caida(user_id, [p for p in slaves if p not in reportadas], "El proceso FFmpeg terminó")
+            continue
+
+        if _estancado(proceso):
+            RESTREAM_PROCESSES.pop(clave)
+            _olvidar(proceso.pid)
+            detener(proceso, esperar=False)
+            _caida(user_id, [p for p in slaves if p not in reportadas], "Sin progreso (estancado)")
+            continue
+
+        # onfail=ignore: el tee sigue con el resto y deja la caída en el log
+        cortadas = [p for p in esclavos_cortados(proceso) if p not in reportadas]
+        if cortadas:
+            reportadas.update(cortadas)
+            _caida(user_id, cortadas, "La plataforma cortó la conexión")
+
+        for plataforma in slaves:
+            if plataforma not in reportadas:
+                cubiertas.add((user_id, plataforma))
+                _registrar_estable(user_id, plataforma)
+
+    for pid in set(_REPORTADAS) - vivos:
+        _olvidar(pid)
+
+    # Abiertas sin proceso ni reintento en curso (p.ej. perdidas en un reinicio)
+    for user_id, plataforma in activas:
+        if (user_id, plataforma) not in cubiertas:
+            _caida(user_id, [plataforma], "Proceso perdido")
+
+
+def _olvidar(pid):
+    _VIGIA.olvidar(pid)
+    _REPORTADAS.pop(pid, None)
+
+
+def _registrar_estable(user_id, plataforma):
+    with _LOCK:
+        fallos = _FALLOS.get((user_id, plataforma))
+        if fallos and time.monotonic() - fallos[1] > settings.RESTREAM_ESTABLE_SEGUNDOS:
+            del _FALLOS[(user_id, plataforma)]
+
+
+# ============================================================
+# REINTENTOS
+# ============================================================
+
+def _caida(user_id, plataformas, motivo):
+    """Programa el reintento de las plataformas caídas (o las da por perdidas)."""
+    reintentar = []
+    espera = 0
+
+    for plataforma in plataformas:
+        estado = EstadoRetransmision.objects.filter(
+            usuario_id=user_id, plataforma=plataforma, detenido_en__isnull=True
+        ).first()
+        if not estado:
+            continue  # el usuario la detuvo
+
+        with _LOCK:
+            fallos = _FALLOS.setdefault((user_id, plataforma), [0, time.monotonic()])
+            fallos[0] += 1
+            intento = fallos[0]
+
+        if intento > settings.RESTREAM_REINTENTOS_MAX:
+            logger.error(f"❌ {plataforma} de user {user_id}: sin reintentos ({motivo})")
+            mensaje = f"Se agotaron los reintentos: {motivo}"
+            with _LOCK:
+                _FALLOS.pop((user_id, plataforma), None)
+            if _actualizar_abierta(estado, estado='error', mensaje_error=mensaje, detenido_en=datetime.now()):
+                notificar_retransmision(user_id, plataforma, "error", mensaje=mensaje)
+            continue
+
+        demora = _backoff(intento)
+        espera = max(espera, demora)
+
+        if not _actualizar_abierta(estado, estado='reconectando', mensaje_error=motivo):
+            continue  # el usuario la detuvo mientras tanto
+        IntentoRetransmision.objects.create(
+            retransmision=estado, numero=intento, motivo=motivo, espera_segundos=round(demora, 1)
+        )
+        logger.warning(f"⚠️ {plataforma} de user {user_id}: {motivo}; intento {intento} en {demora:.1f}s")
+        notificar_retransmision(
+            user_id, plataforma, "status_update", "reconnecting",
+            intento=intento, reintento_en=round(demora, 1), mensaje=motivo,
+        )
+        reintentar.append(plataforma)
+
+    if reintentar:
+        # Las que cayeron juntas vuelven en un solo relanzamiento del tee
+        _REINTENTOS.programar(
+            ("restream", user_id, tuple(reintentar)), espera, _reintentar, user_id, reintentar
+        )
+
+
+def _reintentar(user_id, plataformas):
+    from django.contrib.auth.models import User
+    from .stream_manager import StreamManager
+
+    try:
+        # Solo las que siguen esperando: si el usuario la detuvo o la
+        # reinició a mano mientras tanto, el reintento ya no corresponde
+        estados = {
+            e.plataforma: e
+            for e in EstadoRetransmision.objects.filter(
+                usuario_id=user_id, plataforma__in=plataformas,
+                detenido_en__isnull=True, estado='reconectando'
+            )
+        }
+        if not estados:
+            return
+
+        user = User.objects.get(pk=user_id)
+
+        if not StreamManager._get_channel_hls_url(user):
+            # Terminó la transmisión del canal: nada que reconectar
+            for plataforma, estado in estados.items():
+                if _actualizar_abierta(estado, estado='detenido', detenido_en=datetime.now()):
+                    notificar_retransmision(user_id, plataforma, "stopped")
+            return
+
+        # El tee vuelve con todas las abiertas: las caídas y las que seguían al aire
+        destinos = set(StreamManager._plataformas_abiertas(user)) | set(estados)
+        resultados = StreamManager._relanzar(user, destinos)
+        fallidas = []
+        detenidas = False
+        ahora = time.monotonic()
+
+        for plataforma, estado in estados.items():
+            resultado = resultados.get(plataforma, Exception("Sin destino"))
+            if isinstance(resultado, Exception):
+                logger.warning(f"⚠️ Reintento de {plataforma} falló: {resultado}")
+                estado.intentos.filter(exito__isnull=True).update(exito=False, mensaje_error=str(resultado))
+                fallidas.append(plataforma)
+                continue
+
+            if not _actualizar_abierta(estado, estado='activo', proceso_id=resultado.pid, mensaje_error=''):
+                detenidas = True  # la detuvieron durante el relanzamiento
+                continue
+            estado.intentos.filter(exito__isnull=True).update(exito=True)
+            with _LOCK:
+                if (user_id, plataforma) in _FALLOS:
+                    _FALLOS[(user_id, plataforma)][1] = ahora
+            notificar_retransmision(user_id, plataforma, "status_update", "streaming")
+            logger.info(f"✅ {plataforma} reconectado para {user.username} (PID: {resultado.pid})")
+
+        if detenidas:
+            # El tee salió con una plataforma que ya no está abierta: sin ella
+            StreamManager._relanzar(user, StreamManager._plataformas_abiertas(user))
+
+        if fallidas:
+            _caida(user_id, fallidas, "El reintento falló")
+    finally:
+        close_old_connections()
+
+
+def _actualizar_abierta(fila, **campos):
+    """
+    Actualiza la fila solo si sigue abierta: un stop_stream concurrente
+    no puede volver a quedar 'reconectando' o 'activo'. False si ya estaba
+    cerrada.
+    """
+    return EstadoRetransmision.objects.filter(
+        pk=fila.pk, detenido_en__isnull=True
+    ).update(**campos) == 1
+
+
+# ============================================================
+# LOOP
+# ============================================================
+
+def _loop():
+    while True:
+        time.sleep(settings.RESTREAM_SUPERVISOR_INTERVALO)
+        try:
+            revisar()
+        except Exception:
+            logger.exception("[RESTREAM] Falló la revisión de retransmisiones")
+        finally:
+            close_old_connections()
+
+
+def iniciar_supervisor():
+    """Arranca el thread de revisión (idempotente)."""
+    global _THREAD
+    with _LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _THREAD = threading.Thread(target=_loop, name="supervisor-retransmisiones", daemon=True)
+            _THREAD.start()
+
+
+def iniciar_supervisor_al_iniciar():
+    """
+    Hook de arranque del worker (streaming/asgi.py). En modo supervisor
+    lo arranca el daemon media_supervisor, dueño de los procesos.
+    """
+    if modo_supervisor():
+        return
+    iniciar_supervisor()
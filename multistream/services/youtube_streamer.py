@@ -1,15 +1,10 @@
 """
-YOUTUBE STREAMER - OPTIMIZADO V3
-Gestiona la retransmisión específica a YouTube Live.
-
-OPTIMIZACIONES:
-- Copy mode (sin recodificar) - ahorro ~70% CPU
-- SIN opciones de reconnect (incompatibles con FFmpeg 6.1.1)
-- Buffers optimizados
+YOUTUBE STREAMER
+Destino de retransmisión a YouTube Live (copy, FLV sobre RTMP).
+El proceso lo arma FanoutStreamer junto con el resto de los destinos.
 """
 
 import logging
-from django.conf import settings
 from multistream.models import CuentaYouTube
 from .base_streamer import BaseStreamer
 
@@ -28,6 +23,7 @@ class YouTubeStreamer(BaseStreamer):
     """
     
     PLATFORM_NAME = 'youtube'
+    DESTINATION_MARKERS = ('youtube.com',)
     
     def get_rtmp_destination_url(self):
         """
@@ -91,61 +87,3 @@ class YouTubeStreamer(BaseStreamer):
                 f"No existe cuenta de YouTube activa para {self.user.username}. "
                 f"Configure sus credenciales en Ajustes > Retransmisión."
             )
-    
-    def build_ffmpeg_command(self, destination_url):
-        """
-        Construye el comando FFmpeg optimizado para YouTube Live.
-        
-        Lee RTMP interno (program_switch) y lo reenvía a YouTube.
-        Usa copy mode para máxima eficiencia.
-        
-        Args:
-            destination_url (str): URL RTMP de YouTube
-        
-        Returns:
-            list: Comando FFmpeg completo
-        """
-        ffmpeg_path = settings.FFMPEG_BIN_PATH
-        
-        # Construir URL RTMP interna (program_switch)
-        rtmp_host = getattr(settings, 'RTMP_SERVER_HOST_INTERNAL', '127.0.0.1')
-        rtmp_port = getattr(settings, 'RTMP_SERVER_PORT_INTERNAL', '9000')
-        
-        # El stream en program_switch se llama igual que el username
-        rtmp_source = f"rtmp://{rtmp_host}:{rtmp_port}/program_switch/{self.user.username}"
-        
-        logger.info(f"📡 RTMP fuente: {rtmp_source}")
-        logger.info(f"📡 RTMP destino: {destination_url[:50]}...****")
-        
-        command = [
-            ffmpeg_path,
-            
-            # ==========================================
-            # INPUT (RTMP program_switch)
-            # ==========================================
-            '-i', rtmp_source,
-            
-            # ==========================================
-            # VIDEO - Copy sin recodificar
-            # AHORRO: ~70% CPU vs recodificar
-            # ==========================================
-            '-c:v', 'copy',
-            
-            # ==========================================
-            # AUDIO - Copy sin recodificar
-            # ==========================================
-            '-c:a', 'copy',
-            
-            # ==========================================
-            # OUTPUT - FLV para RTMP
-            # ==========================================
-            '-f', 'flv',
-            
-            destination_url
-        ]
-        
-        logger.info(f"🔧 Comando FFmpeg OPTIMIZADO (copy mode)")
-        logger.info(f"   Ahorro estimado de CPU: ~70% vs recodificar")
-        logger.info(f"   {' '.join(command)}")
-        
-        return command
\ No newline at end of file
@@ -177,6 +177,9 @@ class MultistreamManager {
 
       case 'status_update':
         this.updatePlatformStatus(platform, status);
+        if (status === 'reconnecting') {
+          console.log(`🔁 ${platform}: ${data.mensaje} (intento ${data.intento}, en ${data.reintento_en}s)`);
+        }
         break;
     }
   }
@@ -321,7 +324,13 @@ class MultistreamManager {
         throw new Error(`Error HTTP ${response.status}`);
       }
 
-      const data = await response.json();
+      const { job_id } = await response.json();
+      const trabajo = await window.esperarTrabajo(job_id, 60000);
+      if (trabajo.estado === 'error') {
+        throw new Error(trabajo.mensaje || 'Error desconocido');
+      }
+
+      const data = trabajo.resultado;
       console.log('✅ Respuesta:', data);
 
       // Verificar si alguna plataforma requiere confirmación
@@ -474,6 +483,8 @@ class MultistreamManager {
         ? `<span class="platform-status-dot streaming"></span>` 
         : data.status === 'error'
         ? `<span class="platform-status-dot error"></span>`
+        : data.status === 'reconnecting'
+        ? `<span class="platform-status-dot reconnecting"></span>`
         : `<span class="platform-status-dot"></span>`;
 
       badge.innerHTML = `
@@ -516,7 +527,13 @@ class MultistreamManager {
         }
       });
 
-      const data = await response.json();
+      const { job_id } = await response.json();
+      const trabajo = await window.esperarTrabajo(job_id);
+      if (trabajo.estado === 'error') {
+        throw new Error(trabajo.mensaje || 'Error desconocido');
+      }
+
+      const data = trabajo.resultado;
 
       if (data.ok) {
         console.log(`✅ ${platform} detenido correctamente`);
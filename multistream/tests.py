@@ -1,3 +1,536 @@
-from django.test import TestCase
+import os
+import ssl
+import shutil
+import socket
+import struct
+import tempfile
+import datetime
+import threading
+import subprocess
+from itertools import count
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import CanalTransmision
+from multistream.models import CuentaFacebook, CuentaYouTube, EstadoRetransmision
+from multistream.services import fanout_streamer, stream_manager, supervisor_retransmisiones
+from multistream.services.facebook_streamer import FacebookStreamer
+from multistream.services.fanout_streamer import FanoutStreamer
+from multistream.services.stream_manager import StreamManager
+from multistream.services.youtube_streamer import YouTubeStreamer
+
+
+class _ProcesoFalso:
+
+    def __init__(self, pid, cmd, returncode=None, meta=None):
+        self.pid = pid
+        self.cmd = cmd
+        self.returncode = returncode
+        self.meta = meta or {}
+
+    def poll(self):
+        return self.returncode
+
+
+class _RegistroFalso:
+    """
+    RegistroProcesos en memoria. Las plataformas de `rechazadas` fallan en
+    el handshake: el tee las deja en su log y sigue con las demás (o
+    termina si no queda ninguna).
+    """
+
+    def __init__(self):
+        self.procesos = {}
+        self.rechazadas = set()
+        self.logs = {}
+        self._pids = count(1000)
+
+    def lanzar(self, clave, cmd, log_path, stdin=False, meta=None, cupo=None):
+        slaves = (meta or {}).get("slaves", [])
+        caidas = [i for i, p in enumerate(slaves) if p in self.rechazadas]
+        self.logs[log_path] = "".join(f"[tee] Slave muxer #{i} failed: I/O error\n" for i in caidas)
+        returncode = 1 if slaves and len(caidas) == len(slaves) else None
+        proceso = _ProcesoFalso(next(self._pids), cmd, returncode, {**(meta or {}), "progress": None})
+        self.procesos[clave] = proceso
+        return proceso
+
+    def cola_log(self, log_path):
+        return self.logs.get(log_path, "")
+
+    def get(self, clave, default=None):
+        return self.procesos.get(clave, default)
+
+    def pop(self, clave, default=None):
+        return self.procesos.pop(clave, default)
+
+    def items(self):
+        return list(self.procesos.items())
+
+
+# ============================================================
+# RETRANSMISIÓN POR TEE
+# ============================================================
+
+@override_settings(FFMPEG_BIN_PATH="ffmpeg", RESTREAM_ARRANQUE_TIMEOUT=1)
+class RetransmisionTeeTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        CanalTransmision.objects.create(usuario=self.user, en_vivo=True, url_hls="http://hls/canal.m3u8")
+        CuentaYouTube.objects.create(
+            usuario=self.user, clave_transmision="yt-key", url_ingestion="rtmp://a.rtmp.youtube.com/live2",
+        )
+        CuentaFacebook.objects.create(
+            usuario=self.user, clave_transmision="fb-key",
+            url_ingestion="rtmps://live-api-s.facebook.com:443/rtmp/",
+        )
+
+        self.registro = _RegistroFalso()
+        for modulo in (fanout_streamer, stream_manager):
+            mock.patch.object(modulo, "RESTREAM_PROCESSES", self.registro, create=True).start()
+        mock.patch.object(stream_manager, "ACTIVE_PROCESSES", self.registro).start()
+        mock.patch.object(fanout_streamer, "_cola_log", self.registro.cola_log).start()
+        self.asegurar_relay = mock.patch("core.services.ffmpeg_manager.asegurar_relay").start()
+        mock.patch("core.services.ffmpeg_manager.url_relay", return_value="rtmp://127.0.0.1/relay/canal").start()
+        mock.patch.object(fanout_streamer, "paquetes_escritos", return_value=True).start()
+        self.detener_tee = mock.patch.object(fanout_streamer, "detener").start()
+        self.detener = mock.patch.object(stream_manager, "detener").start()
+        self.addCleanup(mock.patch.stopall)
+
+    @property
+    def tee(self):
+        return self.registro.procesos.get(str(self.user.id))
+
+    def _abiertas(self):
+        return dict(
+            EstadoRetransmision.objects.filter(detenido_en__isnull=True)
+            .values_list("plataforma", "proceso_id")
+        )
+
+    def test_comando_un_demux_y_un_esclavo_por_plataforma(self):
+        cmd = FanoutStreamer(self.user, [YouTubeStreamer(self.user), FacebookStreamer(self.user)]).build_ffmpeg_command()
+
+        self.assertEqual(cmd.count("-i"), 1)
+        self.assertEqual(cmd[cmd.index("-i") + 1], "rtmp://127.0.0.1/relay/canal")
+        self.assertEqual(cmd[cmd.index("-c") + 1], "copy")
+        self.assertEqual(cmd[cmd.index("-f") + 1], "tee")
+        self.assertEqual(cmd[-1], (
+            "[f=flv:flvflags=no_duration_filesize:onfail=ignore]rtmps://live-api-s.facebook.com:443/rtmp/fb-key"
+            "|[f=flv:onfail=ignore]rtmp://a.rtmp.youtube.com/live2/yt-key"
+        ))
+
+    def test_todas_las_plataformas_en_un_solo_proceso(self):
+        youtube, facebook = StreamManager.start_streams(self.user, ["youtube", "facebook"])
+
+        self.assertTrue(youtube["success"] and facebook["success"])
+        self.assertEqual(list(self.registro.procesos), [str(self.user.id)])
+        self.assertEqual(self.tee.meta["slaves"], ["facebook", "youtube"])
+        self.assertEqual(youtube["pid"], self.tee.pid)
+        self.assertEqual(facebook["pid"], self.tee.pid)
+        self.assertEqual(self._abiertas(), {"youtube": self.tee.pid, "facebook": self.tee.pid})
+
+    def test_el_tee_arranca_con_el_relay_asegurado(self):
+        self.asegurar_relay.side_effect = lambda user: self.assertIsNone(self.tee)
+
+        StreamManager.start_stream(self.user, "youtube")
+
+        self.asegurar_relay.assert_called_once_with(self.user)
+        self.assertIsNotNone(self.tee)
+
+    def test_sumar_una_relanza_el_tee_con_el_conjunto_nuevo(self):
+        StreamManager.start_stream(self.user, "youtube")
+        viejo = self.tee
+
+        self.assertTrue(StreamManager.start_stream(self.user, "facebook")["success"])
+
+        self.detener_tee.assert_called_once_with(viejo, esperar=True)
+        self.assertEqual(self.tee.meta["slaves"], ["facebook", "youtube"])
+        self.assertEqual(self._abiertas(), {"youtube": self.tee.pid, "facebook": self.tee.pid})
+
+    def test_mismo_conjunto_no_relanza(self):
+        StreamManager.start_streams(self.user, ["youtube", "facebook"])
+        tee = self.tee
+
+        with mock.patch.object(self.registro, "lanzar") as lanzar:
+            resultados = StreamManager._relanzar(self.user, ["facebook", "youtube"])
+
+        lanzar.assert_not_called()
+        self.detener_tee.assert_not_called()
+        self.assertEqual(resultados, {"facebook": tee, "youtube": tee})
+
+    def test_quitar_una_relanza_con_las_que_quedan(self):
+        StreamManager.start_streams(self.user, ["youtube", "facebook"])
+        viejo = self.tee
+
+        self.assertTrue(StreamManager.stop_stream(self.user, "facebook")["success"])
+
+        self.detener_tee.assert_called_once_with(viejo, esperar=True)
+        self.assertEqual(self.tee.meta["slaves"], ["youtube"])
+        self.assertEqual(self._abiertas(), {"youtube": self.tee.pid})
+
+    def test_quitar_la_ultima_detiene_el_tee(self):
+        StreamManager.start_stream(self.user, "youtube")
+        tee = self.tee
+
+        StreamManager.stop_stream(self.user, "youtube")
+
+        self.detener.assert_called_once_with(tee, esperar=False)
+        self.assertEqual(self.registro.procesos, {})
+        self.assertEqual(self._abiertas(), {})
+
+    def test_rechazo_de_una_sigue_con_las_demas(self):
+        self.registro.rechazadas.add("facebook")
+
+        youtube, facebook = StreamManager.start_streams(self.user, ["youtube", "facebook"])
+
+        self.assertTrue(youtube["success"])
+        self.assertFalse(facebook["success"])
+        self.assertEqual(EstadoRetransmision.objects.get(plataforma="facebook").estado, "error")
+        self.assertEqual(
+            StreamManager.get_active_streams(self.user),
+            [
+                {"plataforma": "facebook", "pid": self.tee.pid, "activo": False},
+                {"plataforma": "youtube", "pid": self.tee.pid, "activo": True},
+            ],
+        )
+
+    def test_quitar_una_ya_caida_no_relanza(self):
+        self.registro.rechazadas.add("facebook")
+        StreamManager.start_streams(self.user, ["youtube", "facebook"])
+        tee = self.tee
+
+        StreamManager.stop_stream(self.user, "facebook")
+
+        self.detener_tee.assert_not_called()
+        self.assertIs(self.tee, tee)
+
+    def test_todas_rechazadas_no_queda_proceso(self):
+        self.registro.rechazadas.update({"youtube", "facebook"})
+
+        resultados = StreamManager.start_streams(self.user, ["youtube", "facebook"])
+
+        self.assertFalse(any(r["success"] for r in resultados))
+        self.assertEqual(self.registro.procesos, {})
+        self.assertEqual(StreamManager.get_active_streams(self.user), [])
+
+
+# ============================================================
+# SUPERVISOR DE RETRANSMISIONES
+# ============================================================
+
+@override_settings(RESTREAM_BACKOFF_BASE=2, RESTREAM_BACKOFF_MAX=60, RESTREAM_ESTANCADO_SEGUNDOS=20)
+class SupervisorRetransmisionesTests(TestCase):
+
+    def setUp(self):
+        self.registro = _RegistroFalso()
+        mock.patch.object(supervisor_retransmisiones, "RESTREAM_PROCESSES", self.registro).start()
+        mock.patch.object(supervisor_retransmisiones, "_VIGIA", supervisor_retransmisiones.VigiaAvance()).start()
+        mock.patch.object(supervisor_retransmisiones, "_REPORTADAS", {}).start()
+        self.detener = mock.patch.object(supervisor_retransmisiones, "detener").start()
+        self.caida = mock.patch.object(supervisor_retransmisiones, "_caida").start()
+        # Reloj del vigía (solo en progreso_ffmpeg, no el time global)
+        self.reloj = SimpleNamespace(ahora=1000.0)
+        mock.patch("core.services.progreso_ffmpeg.time", SimpleNamespace(monotonic=lambda: self.reloj.ahora)).start()
+        self.addCleanup(mock.patch.stopall)
+
+        fd, self.progreso = tempfile.mkstemp(suffix=".progress")
+        os.close(fd)
+        self.addCleanup(os.remove, self.progreso)
+        fd, self.log = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, self.log)
+
+    def _escribir(self, out_time_us, total_size):
+        with open(self.progreso, "a") as f:
+            f.write(f"out_time_us={out_time_us}\ntotal_size={total_size}\nprogress=continue\n")
+
+    def _registrar(self, slaves=("youtube",)):
+        return self.registro.lanzar("7", ["ffmpeg"], self.log, meta={"log": self.log, "slaves": list(slaves)})
+
+    def test_backoff_exponencial_hasta_el_maximo(self):
+        with mock.patch.object(supervisor_retransmisiones.random, "uniform", return_value=1.0):
+            esperas = [supervisor_retransmisiones._backoff(i) for i in range(1, 8)]
+        self.assertEqual(esperas, [2, 4, 8, 16, 32, 60, 60])
+
+    def test_backoff_con_jitter_de_mas_menos_la_mitad(self):
+        with mock.patch.object(supervisor_retransmisiones.random, "uniform", side_effect=lambda a, b: a):
+            self.assertEqual(supervisor_retransmisiones._backoff(3), 4)
+        with mock.patch.object(supervisor_retransmisiones.random, "uniform", side_effect=lambda a, b: b):
+            self.assertEqual(supervisor_retransmisiones._backoff(3), 12)
+
+    def test_progress_quieto_es_estancado_aunque_el_log_cambie(self):
+        proceso = self._registrar()
+        proceso.meta["progress"] = self.progreso
+        self._escribir(1_000_000, 5000)
+
+        supervisor_retransmisiones.revisar()
+        self.reloj.ahora = 1025.0
+        with open(self.log, "a") as f:
+            f.write("warning\n")   # el log se mueve, los paquetes no
+        supervisor_retransmisiones.revisar()
+
+        self.detener.assert_called_once_with(proceso, esperar=False)
+        self.caida.assert_called_once_with(7, ["youtube"], "Sin progreso (estancado)")
+        self.assertEqual(self.registro.procesos, {})
+
+    def test_progress_que_avanza_no_es_estancado_aunque_el_log_no_cambie(self):
+        proceso = self._registrar()
+        proceso.meta["progress"] = self.progreso
+        os.utime(self.log, (0, 0))
+        self._escribir(1_000_000, 5000)
+
+        supervisor_retransmisiones.revisar()
+        self.reloj.ahora = 1025.0
+        self._escribir(26_000_000, 130000)
+        supervisor_retransmisiones.revisar()
+
+        self.detener.assert_not_called()
+        self.caida.assert_not_called()
+        self.assertIn("7", self.registro.procesos)
+
+    def test_esclavo_caido_se_reintenta_solo_y_una_vez(self):
+        proceso = self._registrar(["facebook", "youtube"])
+        proceso.meta["progress"] = self.progreso
+        self._escribir(1_000_000, 5000)
+
+        supervisor_retransmisiones.revisar()
+        with open(self.log, "a") as f:
+            f.write("[tee] Slave muxer #0 failed: Broken pipe, continuing with 1/2 slaves.\n")
+        self._escribir(2_000_000, 10000)
+        supervisor_retransmisiones.revisar()
+        supervisor_retransmisiones.revisar()
+
+        self.caida.assert_called_once_with(7, ["facebook"], "La plataforma cortó la conexión")
+        self.detener.assert_not_called()
+        self.assertIs(self.registro.procesos["7"], proceso)
+
+
+@override_settings(RESTREAM_REINTENTOS_MAX=3)
+class ReintentosRetransmisionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("canal")
+        CanalTransmision.objects.create(usuario=self.user, en_vivo=True, url_hls="http://hls/canal.m3u8")
+        self.estado = EstadoRetransmision.objects.create(usuario=self.user, plataforma="youtube", estado="activo")
+        self.reintentos = mock.patch.object(supervisor_retransmisiones, "_REINTENTOS").start()
+        self.notificar = mock.patch.object(supervisor_retransmisiones, "notificar_retransmision").start()
+        mock.patch.object(supervisor_retransmisiones, "_FALLOS", {}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _detener(self, *args, **kwargs):
+        EstadoRetransmision.objects.filter(pk=self.estado.pk).update(estado="detenido", detenido_en=timezone.now())
+
+    def test_el_reintento_va_a_su_propio_pool(self):
+        with mock.patch("core.services.planificador.PLANIFICADOR") as compartido:
+            supervisor_retransmisiones._caida(self.user.id, ["youtube"], "corte")
+
+        compartido.programar.assert_not_called()
+        clave, demora, funcion, *args = self.reintentos.programar.call_args.args
+        self.assertEqual((clave, funcion, args), (
+            ("restream", self.user.id, ("youtube",)), supervisor_retransmisiones._reintentar,
+            [self.user.id, ["youtube"]],
+        ))
+        self.estado.refresh_from_db()
+        self.assertEqual(self.estado.estado, "reconectando")
+        self.assertEqual(self.estado.intentos.count(), 1)
+
+    def test_caida_no_reabre_una_detenida_en_el_medio(self):
+        # El stop_stream llega entre la lectura de la fila y su actualización
+        with mock.patch.object(supervisor_retransmisiones, "_backoff", side_effect=lambda i: self._detener() or 2):
+            supervisor_retransmisiones._caida(self.user.id, ["youtube"], "corte")
+
+        self.estado.refresh_from_db()
+        self.assertEqual(self.estado.estado, "detenido")
+        self.assertEqual(self.estado.intentos.count(), 0)
+        self.reintentos.programar.assert_not_called()
+
+    def test_reintento_no_reactiva_una_detenida_durante_el_relanzamiento(self):
+        EstadoRetransmision.objects.filter(pk=self.estado.pk).update(estado="reconectando")
+        tee = SimpleNamespace(pid=1234)
+
+        def relanzar(user, platforms, forzar=False):
+            if platforms:
+                self._detener()
+            return {p: tee for p in platforms}
+
+        with mock.patch.object(StreamManager, "_relanzar", side_effect=relanzar) as relanzado:
+            supervisor_retransmisiones._reintentar(self.user.id, ["youtube"])
+
+        self.estado.refresh_from_db()
+        self.assertEqual(self.estado.estado, "detenido")
+        # El tee se vuelve a armar sin la plataforma detenida
+        self.assertEqual(relanzado.call_args_list[-1].args, (self.user, []))
+
+    def test_sin_reintentos_no_pisa_una_detenida(self):
+        supervisor_retransmisiones._FALLOS[(self.user.id, "youtube")] = [3, 0]
+        self._detener()
+
+        supervisor_retransmisiones._caida(self.user.id, ["youtube"], "corte")
+
+        self.estado.refresh_from_db()
+        self.assertEqual(self.estado.estado, "detenido")
+        self.notificar.assert_not_called()
+
+
+# ============================================================
+# FACEBOOK POR RTMPS
+# ============================================================
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+def _certificado_autofirmado(directorio):
+    """(cert, key) PEM de un certificado autofirmado para 127.0.0.1."""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    clave = ec.generate_private_key(ec.SECP256R1())
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(nombre).issuer_name(nombre)
+        .public_key(clave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(ahora).not_valid_after(ahora + datetime.timedelta(days=1))
+        .sign(clave, hashes.SHA256())
+    )
+    ruta_cert = os.path.join(directorio, "cert.pem")
+    ruta_key = os.path.join(directorio, "key.pem")
+    with open(ruta_cert, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(ruta_key, "wb") as f:
+        f.write(clave.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ))
+    return ruta_cert, ruta_key
+
+
+class _IngestaRTMPS(threading.Thread):
+    """
+    Ingesta RTMPS mínima: TLS, handshake RTMP y _result del connect.
+    Con eso el publicador manda releaseStream/FCPublish con la clave de
+    transmisión, que queda en self.recibido.
+    """
+
+    HANDSHAKE = 1536
+
+    def __init__(self, cert, key):
+        super().__init__(daemon=True)
+        self.contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.contexto.load_cert_chain(cert, key)
+        self.escucha = socket.create_server(("127.0.0.1", 0))
+        self.escucha.settimeout(15)
+        self.puerto = self.escucha.getsockname()[1]
+        self.recibido = b""
+        self.version_tls = None
+        self.error = None
+
+    def run(self):
+        try:
+            conexion, _ = self.escucha.accept()
+            with self.contexto.wrap_socket(conexion, server_side=True) as tls:
+                tls.settimeout(15)
+                self.version_tls = tls.version()
+                c0c1 = self._leer(tls, 1 + self.HANDSHAKE)
+                s1 = bytes(8) + os.urandom(self.HANDSHAKE - 8)
+                tls.sendall(b"\x03" + s1 + c0c1[1:])
+                self._leer(tls, self.HANDSHAKE)   # C2
+
+                self._leer_hasta(tls, b"connect")
+                tls.sendall(self._resultado_connect())
+                self._leer_hasta(tls, b"FCPublish")
+                self._leer_hasta(tls, b"createStream")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.escucha.close()
+
+    def _leer(self, tls, n):
+        datos = b""
+        while len(datos) < n:
+            parte = tls.recv(n - len(datos))
+            if not parte:
+                raise ConnectionError("el publicador cerró la conexión")
+            datos += parte
+        return datos
+
+    def _leer_hasta(self, tls, marca):
+        while marca not in self.recibido:
+            parte = tls.recv(4096)
+            if not parte:
+                raise ConnectionError("el publicador cerró la conexión")
+            self.recibido += parte
+
+    @staticmethod
+    def _resultado_connect():
+        def cadena(texto):
+            return len(texto).to_bytes(2, "big") + texto.encode()
+
+        cuerpo = (
+            b"\x02" + cadena("_result")
+            + b"\x00" + struct.pack(">d", 1.0)     # transacción del connect
+            + b"\x05"                               # propiedades: null
+            + b"\x03" + cadena("code") + b"\x02" + cadena("NetConnection.Connect.Success")
+            + b"\x00\x00\x09"
+        )
+        # Chunk tipo 0 en el chunk stream 3: comando AMF0 (0x14) del stream 0
+        return b"\x03" + bytes(3) + len(cuerpo).to_bytes(3, "big") + b"\x14" + bytes(4) + cuerpo
+
+
+@skipUnless(FFMPEG, "ffmpeg no está instalado")
+class FacebookRTMPSTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.cert, self.key = _certificado_autofirmado(directorio)
+
+        # Fuente corta en FLV: hace de relay del programa
+        self.fuente = os.path.join(directorio, "programa.flv")
+        subprocess.run(
+            [
+                FFMPEG, "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "testsrc=size=320x240:rate=30",
+                "-f", "lavfi", "-i", "sine=frequency=440",
+                "-t", "2", "-c:v", "flv1", "-c:a", "aac",
+                "-f", "flv", self.fuente,
+            ],
+            check=True, timeout=30,
+        )
+
+        self.user = User.objects.create_user("canal")
+        self.ingesta = _IngestaRTMPS(self.cert, self.key)
+        self.addCleanup(self.ingesta.escucha.close)
+        CuentaFacebook.objects.create(
+            usuario=self.user, clave_transmision="fb-key",
+            url_ingestion=f"rtmps://127.0.0.1:{self.ingesta.puerto}/rtmp/",
+        )
+        mock.patch("core.services.ffmpeg_manager.url_relay", return_value=self.fuente).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_publica_por_tls_con_la_clave_de_transmision(self):
+        with override_settings(FFMPEG_BIN_PATH=FFMPEG):
+            comando = FanoutStreamer(self.user, [FacebookStreamer(self.user)]).build_ffmpeg_command()
+
+        self.ingesta.start()
+        publicador = subprocess.Popen(
+            comando, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.ingesta.join(20)
+        finally:
+            publicador.kill()
+            publicador.wait()
+
+        self.assertIsNone(self.ingesta.error)
+        self.assertIsNotNone(self.ingesta.version_tls)
+        # releaseStream y FCPublish llevan la clave: la URL llegó entera por TLS
+        self.assertIn(b"\x02\x00\x09FCPublish", self.ingesta.recibido)
+        self.assertEqual(self.ingesta.recibido.count(b"\x02\x00\x06fb-key"), 2)
@@ -14,7 +14,7 @@ from django.views.decorators.http import require_http_methods
 
 from multistream.forms import CuentaYouTubeForm, CuentaFacebookForm
 from multistream.models import CuentaYouTube, CuentaFacebook, EstadoRetransmision
-from multistream.services import StreamManager
+from core.services.trabajos import encolar
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +83,10 @@ def iniciar_retransmision(request):
             "force": false  // Opcional: true para forzar si hay transmisión activa
         }
     
-    Response:
+    Response (202): {"ok": true, "job_id": "..."}
+
+    El resultado llega por WebSocket ({"tipo": "trabajo", "id": job_id, ...})
+    cuando el trabajo termina:
         {
             "ok": true/false,
             "resultados": [
@@ -111,25 +114,8 @@ def iniciar_retransmision(request):
 
         logger.info(f"🎬 {request.user.username} solicita retransmisión en: {platforms} (force={force})")
 
-        # Iniciar cada plataforma
-        resultados = []
-        for platform in platforms:
-            resultado = StreamManager.start_stream(request.user, platform, force=force)
-            
-            resultados.append({
-                "platform": platform,
-                "success": resultado["success"],
-                "message": resultado.get("message", ""),
-                "requires_confirmation": resultado.get("requires_confirmation", False)
-            })
-        
-        # Respuesta general: OK si al menos una tuvo éxito
-        success_count = sum(1 for r in resultados if r["success"])
-        
-        return JsonResponse({
-            "ok": success_count > 0,
-            "resultados": resultados
-        })
+        job_id = encolar(request.user, "restream_start", platforms=platforms, force=force)
+        return JsonResponse({"ok": True, "job_id": job_id}, status=202)
 
     except json.JSONDecodeError:
         logger.error("❌ JSON inválido en solicitud de retransmisión")
@@ -155,7 +141,9 @@ def detener_retransmision(request, platform):
     Request:
         POST /multistream/api/restream/stop/<platform>/
     
-    Response:
+    Response (202): {"ok": true, "job_id": "..."}
+
+    Resultado del trabajo (por WebSocket):
         {
             "ok": true/false,
             "platform": "youtube",
@@ -164,14 +152,9 @@ def detener_retransmision(request, platform):
     """
     try:
         logger.info(f"🛑 {request.user.username} solicita detener {platform}")
-        
-        resultado = StreamManager.stop_stream(request.user, platform)
 
-        return JsonResponse({
-            "ok": resultado["success"],
-            "platform": platform,
-            "message": resultado.get("message", "")
-        })
+        job_id = encolar(request.user, "restream_stop", platform=platform)
+        return JsonResponse({"ok": True, "platform": platform, "job_id": job_id}, status=202)
 
     except Exception as e:
         logger.exception(f"❌ Error deteniendo {platform}")
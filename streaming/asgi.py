@@ -9,6 +9,30 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "streaming.settings")
 
 django_asgi_app = get_asgi_application()
 
+# FFmpeg que sobrevivieron al reinicio: adoptar o matar (modo local)
+from core.services.reconciliacion import reconciliar_al_iniciar
+reconciliar_al_iniciar()
+
+# Reconexión automática de retransmisiones caídas (modo local)
+from multistream.services.supervisor_retransmisiones import iniciar_supervisor_al_iniciar
+iniciar_supervisor_al_iniciar()
+
+# Reconstrucción del switcher caído o colgado (modo local)
+from core.services.vigilante_programa import iniciar_vigilante_al_iniciar
+iniciar_vigilante_al_iniciar()
+
+# Trabajos de control que quedaron en cola (la cola vive en la base)
+from core.services.trabajos import reanudar_trabajos
+reanudar_trabajos()
+
+# Imágenes de radio que quedaron en la cola de un proceso muerto
+from core.services.imagenes_radio import reanudar_imagenes_pendientes
+reanudar_imagenes_pendientes()
+
+# Telemetría de los FFmpeg al panel (modo local)
+from core.services.telemetria import iniciar_telemetria_al_iniciar
+iniciar_telemetria_al_iniciar()
+
 # Protocolo principal
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # ======================================================
 MIDDLEWARE = [
+    "core.middleware.ConsultasDBMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -179,9 +180,102 @@ RTMP_SERVER_PORT           = int(os.getenv("RTMP_SERVER_PORT",      "9000"))
 RTMP_SERVER_HOST_INTERNAL  = os.getenv("RTMP_SERVER_HOST_INTERNAL", "127.0.0.1")
 RTMP_SERVER_PORT_INTERNAL  = int(os.getenv("RTMP_SERVER_PORT_INTERNAL", "9000"))
 
+FFPROBE_BIN_PATH           = os.getenv("FFPROBE_BIN_PATH", "ffprobe")
+
+# Motor de cambio de cámara hacia /program_switch:
+#   "switcher"    → un encoder persistente por canal, corte por comando
+#   "passthrough" → COPY si la cámara ya llega en 720p30 H.264 + AAC 44.1k
+#   "mezzanine"   → cada cámara READY se normaliza una vez, corte en COPY
+#   "feeder"      → legacy, un feeder nuevo por cada corte
+PROGRAM_SWITCH_ENGINE      = os.getenv("PROGRAM_SWITCH_ENGINE", "switcher")
+
+# Switcher: una entrada sin datos falla tras ENTRADA_TIMEOUT segundos (y
+# se rellena, no frena el programa); el vigilante revisa cada INTERVALO y
+# reconstruye el que terminó o lleva ESTANCADO segundos sin avanzar. Si
+# cae antes de ARRANQUE_MINIMO, vuelve solo con la cámara al aire.
+SWITCHER_ENTRADA_TIMEOUT      = float(os.getenv("SWITCHER_ENTRADA_TIMEOUT", "5"))
+SWITCHER_VIGILANCIA_INTERVALO = float(os.getenv("SWITCHER_VIGILANCIA_INTERVALO", "3"))
+SWITCHER_ESTANCADO_SEGUNDOS   = float(os.getenv("SWITCHER_ESTANCADO_SEGUNDOS", "10"))
+SWITCHER_ARRANQUE_MINIMO      = float(os.getenv("SWITCHER_ARRANQUE_MINIMO", "15"))
+
+# Supervisor de media (manage.py media_supervisor). Vacío = los FFmpeg
+# viven dentro del worker (solo sirve con UN worker daphne).
+MEDIA_SUPERVISOR_SOCKET    = os.getenv("MEDIA_SUPERVISOR_SOCKET", "")
+
+# Debounce del hook on_done de nginx: si tras este tiempo no hay cámara
+# ON_AIR, la transmisión se finaliza (un switch en curso lo cancela)
+STREAM_FIN_DEBOUNCE_SEGUNDOS = float(os.getenv("STREAM_FIN_DEBOUNCE_SEGUNDOS", "2"))
+
+# Modo radio: clips de video pre-codificados de cada imagen (por hash)
+RADIO_CACHE_DIR            = os.getenv("RADIO_CACHE_DIR", os.path.join(str(BASE_DIR), "media", "radio_cache"))
+
+# HLS maestro adaptativo: master playlist con una rendición por altura.
+# Cada Cliente puede definir las suyas (Cliente.hls_renditions).
+PROGRAM_HLS_ABR            = os.getenv("PROGRAM_HLS_ABR", "0") == "1"
+PROGRAM_HLS_RENDITIONS     = os.getenv("PROGRAM_HLS_RENDITIONS", "720,480,360")
+
+# Trabajos de control (switch, radio, retransmisiones) fuera del request:
+# en orden por usuario, hasta N usuarios en paralelo (trabajos.py)
+TRABAJOS_MAX_WORKERS       = int(os.getenv("TRABAJOS_MAX_WORKERS", "4"))
+# La cola vive en la base (TrabajoControl): uno corriendo o en cola sin
+# novedades por más de esto se da por interrumpido / vencido, y los
+# terminados se borran pasadas estas horas
+TRABAJOS_VENCIMIENTO_SEGUNDOS = int(os.getenv("TRABAJOS_VENCIMIENTO_SEGUNDOS", "300"))
+TRABAJOS_RETENCION_HORAS   = int(os.getenv("TRABAJOS_RETENCION_HORAS", "24"))
+
+# /metrics (formato Prometheus): solo desde estas IPs, separadas por coma
+METRICAS_IPS = [ip.strip() for ip in os.getenv("METRICAS_IPS", "127.0.0.1,::1").split(",") if ip.strip()]
+
+# Telemetría de FFmpeg (-progress): una muestra cada INTERVALO segundos,
+# MUESTRAS por proceso en memoria (150 × 2 s = 5 min), envío al panel
+# cada PUSH_INTERVALO; speed por debajo del mínimo = proceso "lento"
+TELEMETRIA_INTERVALO         = float(os.getenv("TELEMETRIA_INTERVALO", "2"))
+TELEMETRIA_MUESTRAS          = int(os.getenv("TELEMETRIA_MUESTRAS", "150"))
+TELEMETRIA_PUSH_INTERVALO    = float(os.getenv("TELEMETRIA_PUSH_INTERVALO", "5"))
+TELEMETRIA_VELOCIDAD_MINIMA  = float(os.getenv("TELEMETRIA_VELOCIDAD_MINIMA", "0.95"))
+
+# Relay interno de retransmisiones: el HLS maestro copia el programa por
+# UDP local (puerto BASE + user_id) y el relay lo publica en esta app RTMP
+RESTREAM_RELAY_APP            = os.getenv("RESTREAM_RELAY_APP", "relay")
+RESTREAM_RELAY_PUERTO_BASE    = int(os.getenv("RESTREAM_RELAY_PUERTO_BASE", "20000"))
+
+# Supervisor de retransmisiones: reintentos con backoff exponencial
+# (BASE * 2^n hasta MAX, con jitter) y presupuesto por destino que se
+# recupera tras ESTABLE segundos al aire (supervisor_retransmisiones.py).
+# Estancado: el -progress no avanza (out_time_us, total_size) en N segundos
+RESTREAM_SUPERVISOR_INTERVALO = float(os.getenv("RESTREAM_SUPERVISOR_INTERVALO", "5"))
+RESTREAM_ESTANCADO_SEGUNDOS   = float(os.getenv("RESTREAM_ESTANCADO_SEGUNDOS", "20"))
+RESTREAM_BACKOFF_BASE         = float(os.getenv("RESTREAM_BACKOFF_BASE", "2"))
+RESTREAM_BACKOFF_MAX          = float(os.getenv("RESTREAM_BACKOFF_MAX", "60"))
+RESTREAM_REINTENTOS_MAX       = int(os.getenv("RESTREAM_REINTENTOS_MAX", "8"))
+RESTREAM_ESTABLE_SEGUNDOS     = float(os.getenv("RESTREAM_ESTABLE_SEGUNDOS", "60"))
+
+# Arranque de una retransmisión: se espera hasta que FFmpeg escriba paquetes
+# (salida -progress) en vez de dormir a ciegas; pasado este tiempo falla
+RESTREAM_ARRANQUE_TIMEOUT = float(os.getenv("RESTREAM_ARRANQUE_TIMEOUT", "15"))
+
+# Al arrancar, adoptar o matar los FFmpeg que sobrevivieron al reinicio
+# y corregir CanalTransmision / EstadoRetransmision (reconciliacion.py)
+MEDIA_RECONCILIAR_AL_INICIAR = os.getenv("MEDIA_RECONCILIAR_AL_INICIAR", "1") == "1"
+
+# Motor mezzanine: app RTMP intermedia (debe existir en nginx) y cupo
+# máximo de normalizaciones simultáneas (≈ 1 encode 720p por núcleo)
+RTMP_MEZZANINE_APP         = os.getenv("RTMP_MEZZANINE_APP", "mezzanine")
+MEZZANINE_MAX_PROCESOS     = int(os.getenv("MEZZANINE_MAX_PROCESOS", str(os.cpu_count() or 1)))
+
 # ======================================================
 # LOGGING
 # ======================================================
+# Los loggers de la app escriben a una cola; un thread de fondo formatea
+# y escribe a consola y archivo (core/services/bitacora.py). Con el nivel
+# en INFO, un logger.debug() del camino caliente no cuesta casi nada.
+# Las claves "queue"/"listener" del handler "cola" requieren Python 3.12+.
+LOG_NIVEL_CORE = os.getenv("LOG_NIVEL_CORE", "INFO")
+# "texto" o "json" (una línea JSON por registro en django.log)
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto")
+# Overrides por módulo en caliente: `manage.py nivel_log <logger> <nivel>`
+LOG_NIVELES_ARCHIVO = os.getenv("LOG_NIVELES_ARCHIVO", "/tmp/streaming_log_niveles.json")
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -195,6 +289,10 @@ LOGGING = {
             "format": "[{levelname}] {message}",
             "style": "{",
         },
+        "json": {
+            "()": "core.services.bitacora.FormatoJSON",
+            "datefmt": "%Y-%m-%dT%H:%M:%S%z",
+        },
     },
     "handlers": {
         "console": {
@@ -206,22 +304,29 @@ LOGGING = {
             "level": "DEBUG",
             "class": "logging.FileHandler",
             "filename": BASE_DIR / "django.log",
-            "formatter": "verbose",
+            "formatter": "json" if LOG_FORMATO == "json" else "verbose",
+        },
+        "cola": {
+            "class": "core.services.bitacora.ColaHandler",
+            "queue": "core.services.bitacora.cola_acotada",
+            "listener": "core.services.bitacora.ColaListener",
+            "handlers": ["console", "file"],
+            "respect_handler_level": True,
         },
     },
     "loggers": {
         "multistream": {
-            "handlers": ["console", "file"],
+            "handlers": ["cola"],
             "level": "INFO",
             "propagate": False,
         },
         "core": {
-            "handlers": ["console", "file"],
-            "level": "DEBUG",
+            "handlers": ["cola"],
+            "level": LOG_NIVEL_CORE,
             "propagate": False,
         },
         "django": {
-            "handlers": ["console", "file"],
+            "handlers": ["cola"],
             "level": "INFO",
             "propagate": False,
         },